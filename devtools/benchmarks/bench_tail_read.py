@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Benchmark for reading the last line of Gaussian output files, as done when checking for normal termination
+(check_gauss -t, run_gauss). Writes synthetic logs of increasing size to a temporary directory, then times reading
+their last lines with readlines() (the previous approach) and with gw_common.read_tail_lines.
+
+Usage: python devtools/benchmarks/bench_tail_read.py [-n NUM_FILES] [-s SIZE_MB [SIZE_MB ...]]
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from gaussian_wrangler.gw_common import read_tail_lines
+
+FILLER_LINE = " SCF Done:  E(RM062X) =  -535.578434128     A.U. after    1 cycles\n"
+LAST_LINE = " Normal termination of Gaussian 16 at Mon Jan 13 14:49:32 2020.\n"
+
+
+def write_synthetic_logs(log_dir, num_files, size_mb):
+    num_filler_lines = int(size_mb * 1024 * 1024 / len(FILLER_LINE))
+    block = FILLER_LINE * 1000
+    log_files = []
+    for file_num in range(num_files):
+        log_file = os.path.join(log_dir, f"synthetic_{size_mb}mb_{file_num}.log")
+        with open(log_file, 'w') as f:
+            for _ in range(num_filler_lines // 1000):
+                f.write(block)
+            f.write(FILLER_LINE * (num_filler_lines % 1000))
+            f.write(LAST_LINE)
+        log_files.append(log_file)
+    return log_files
+
+
+def readlines_last_line(log_file):
+    with open(log_file, 'r') as fh:
+        return fh.readlines()[-1].strip()
+
+
+def tail_last_line(log_file):
+    return read_tail_lines(log_file)[-1].strip()
+
+
+def time_reader(reader, log_files):
+    start = time.perf_counter()
+    for log_file in log_files:
+        if reader(log_file) != LAST_LINE.strip():
+            raise ValueError(f"Unexpected last line read from {log_file}")
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times reading the last line of synthetic Gaussian logs.")
+    parser.add_argument("-n", "--num_files", help="Number of logs of each size. The default is 20.", type=int,
+                        default=20)
+    parser.add_argument("-s", "--sizes", help="Log sizes in MB. The default is 1 10 100.", type=float, nargs='+',
+                        default=[1, 10, 100])
+    args = parser.parse_args(argv)
+
+    log_dir = tempfile.mkdtemp(prefix="gw_bench_tail_")
+    try:
+        print(f"{'size (MB)':>10} {'readlines (ms/file)':>20} {'read_tail_lines (ms/file)':>26}")
+        for size_mb in args.sizes:
+            log_files = write_synthetic_logs(log_dir, args.num_files, size_mb)
+            # the logs were just written, so both readers read from the page cache
+            old_time = time_reader(readlines_last_line, log_files)
+            new_time = time_reader(tail_last_line, log_files)
+            print(f"{size_mb:>10g} {1000 * old_time / args.num_files:>20.3f} "
+                  f"{1000 * new_time / args.num_files:>26.3f}")
+            for log_file in log_files:
+                os.remove(log_file)
+    finally:
+        shutil.rmtree(log_dir)
+
+
+if __name__ == '__main__':
+    main()
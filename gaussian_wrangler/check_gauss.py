@@ -7,21 +7,27 @@ If appears to have failed, add to a text file for investigation.
 import os
 import re
 import sys
+import csv
+import json
 import argparse
-import matplotlib.pyplot as plt
+import functools
 import numpy as np
-import warnings
-from scipy.optimize import curve_fit, OptimizeWarning
 from scipy.interpolate import make_interp_spline
 from scipy.signal import argrelmin, argrelmax
-from operator import itemgetter
 from configparser import MissingSectionHeaderError
 from common_wrangler.common import (GOOD_RET, INPUT_ERROR, IO_ERROR, INVALID_DATA, EHPART_TO_KCAL_MOL, COLOR_SEQUENCE,
                                     InvalidDataError, warning, create_out_fname, write_csv, check_for_files,
                                     assign_color)
 
 from gaussian_wrangler.gw_common import (MAX_FORCE, RMS_FORCE, MAX_DISPL, RMS_DISPL, CONVERG, CONVERG_ERR,
-                                         process_gausslog_file, CONVERG_STEP_DICT, ENERGY, SCAN_DICT)
+                                         CONVERG_STEP_DICT, SCAN_DICT, SCAN_PARAMS, STEP_NUM, NEGLIGIBLE_FORCES,
+                                         NEGLIGIBLE_FORCES_ERR, converg_step_array, read_tail_text, map_in_order,
+                                         call_capturing_output, print_captured_output, strip_compression_ext,
+                                         scan_dir_files)
+from gaussian_wrangler.log_cache import (get_gausslog_content, read_termination_states, write_termination_states,
+                                         NO_CACHE_HELP)
+from gaussian_wrangler.gw_plots import (CONVERG_PLOT, SCAN_PLOT, FIT_PLOT, CONTOUR_PLOT, CONVERG_PLOT_TITLES,
+                                        POINTS_STYLE, CURVE_STYLE, curve_style, render_plot, PlotRenderer)
 from gaussian_wrangler import __version__
 
 
@@ -37,17 +43,74 @@ FAIL_LEN_PAT = re.compile(r"File lengths (MBytes): {2}RWF=.*")
 FAIL_LEN = re.compile(r"File lengths (MBytes)*")
 FAIL_PAT_LIST = [FAIL_OPEN_FILE, FAIL_LEN_PAT, FAIL_RDCARD, FAIL_NTR, FAIL_LEN]
 
+# termination status
+COMPLETED = 'completed'
+LIKELY_FAILED = 'likely_failed'
+PERHAPS_RUNNING = 'perhaps_running'
+# For classifying failures from the end of an output file
+ERROR_TERM_PAT = re.compile(r"Error termination via Lnk1e in .*?(l\d+)\.exe")
+ERROR_TERM_LINK_PAT = re.compile(r"Error termination request processed by link (\d+)")
+# messages printed when a job is stopped, with the name of each kind of failure; the messages from the queueing
+#     system when killing a job only appear if its output is written to the log
+STOPPED_PATS = [(re.compile(r"DUE TO TIME LIMIT|PBS: job killed: walltime|TIME LIMIT EXCEEDED", re.I), 'walltime'),
+                (re.compile(r"CANCELLED AT|PBS: job killed|Killed by signal|Received signal|^Killed$"), 'killed'),
+                (re.compile(r"Erroneous (write|read)|open-new-file|In source file rdcard|NtrErr Called from FileIO"),
+                 'file_error'),
+                ]
+# messages explaining an error termination (some are only warnings in jobs that did not fail), checked after those
+#     above, in this order
+ERROR_PATS = STOPPED_PATS + [
+    (re.compile(r"Convergence failure -- run terminated"), 'scf_convergence_failure'),
+    (re.compile(r"FormBX had a problem"), 'formbx_problem'),
+    (re.compile(r"Error in internal coordinate system"), 'internal_coordinate_error'),
+    (re.compile(r"Linear angle in (Bend|Tors)"), 'linear_angle'),
+    (re.compile(r"Number of steps exceeded"), 'steps_exceeded'),
+    (re.compile(r"Error imposing constraints|New curvilinear step not converged"), 'constraint_error'),
+    (re.compile(r"Out-of-memory error|galloc: +could not allocate memory"), 'out_of_memory'),
+    (re.compile(r"The combination of multiplicity +\d+ and +\d+ electrons is impossible"), 'charge_multiplicity'),
+    (re.compile(r"Small interatomic distances encountered|Atoms too close"), 'atoms_too_close'),
+    (re.compile(r"Problem with the distance matrix"), 'distance_matrix'),
+    (re.compile(r"Inaccurate quadrature in CalDSu"), 'inaccurate_quadrature'),
+    (re.compile(r"Route card not found|End of file in ZSymb|SYNTAX ERROR|Unrecognized atomic symbol"), 'input_error'),
+]
+# for an error termination without a known message, a link that usually means a known kind of failure
+LINK_FAILURES = {'l9999': 'optimization_not_converged'}
+UNKNOWN_FAILURE = 'unknown'
+TERM_FILE = 'File'
+TERM_STATUS = 'Status'
+TERM_LINK = 'Link'
+TERM_ERROR = 'Error'
+TERM_MESSAGE = 'Message'
+TERM_SUMMARY_HEADERS = [TERM_FILE, TERM_STATUS, TERM_LINK, TERM_ERROR, TERM_MESSAGE]
+SUMMARY_EXTS = ['.json', '.csv']
+
 DEF_COMPLETE_DIR = 'for_hartree'
 DEF_EXT = '.log'
+DEF_JOBS = 1
 OUT_BASE_DIR = 'output_directory'
 
 # For convergence check
-STEP_NUM = 'step_number'
 F_NAME = 'File Name'
 STEP_CONVERG_HEADERS = [F_NAME, STEP_NUM, MAX_FORCE, RMS_FORCE, MAX_DISPL, RMS_DISPL, CONVERG, CONVERG_ERR]
 FINAL_CONVERG_HEADERS = [F_NAME, CONVERG, CONVERG_ERR]
 
+# For combining scans: values closer than SCAN_TOL are the same scan point; dihedrals are periodic
+SCAN_TOL = 0.002
+DIHE_PERIOD = 360.
 N_DIHE = np.asarray([1, 2, 3, 4, 6])
+# For batches of scans (--scan_list)
+SCAN_NAME = 'Scan'
+NUM_POINTS = 'Num_Points'
+FIT_N = 'CHARMM_n'
+FIT_RMSE = 'CHARMM_RMSE'
+FIT_OFFSET = 'CHARMM_Offset'
+MAX_BARRIER = 'Max_Barrier'
+BARRIERS = 'Barriers'
+# the sets of CHARMM dihedral multiplicities (as 0 or 1 for each N_DIHE value) fit to scan energies
+CHARMM_N_MULTIPLIERS = np.asarray([[1, 1, 1, 1, 1], [0, 1, 1, 1, 1], [1, 1, 1, 1, 0], [1, 1, 1, 0, 0],
+                                   [1, 1, 0, 0, 0], [1, 0, 0, 0, 0], [0, 1, 0, 1, 1], [1, 0, 1, 0, 0]])
+SCAN_FIT_HEADERS = [SCAN_NAME, NUM_POINTS, FIT_N, FIT_RMSE, FIT_OFFSET] + \
+                   [f'{param}{n}' for n in N_DIHE for param in ['k', 'd']] + [MAX_BARRIER, BARRIERS]
 
 
 def parse_cmdline(argv):
@@ -72,18 +135,40 @@ def parse_cmdline(argv):
                                                      "for normal termination, including checking in subdirectories.",
                         metavar="path", default=None)
     parser.add_argument("-e", "--extension", help="The extension of the Gaussian output file(s) to look for when "
-                                                  "searching a directory for output files. The default is '{}'."
-                                                  "".format(DEF_EXT), metavar="ext", default=DEF_EXT)
+                                                  "searching a directory for output files; compressed files "
+                                                  "with this extension followed by '.gz', '.xz', '.bz2', or '.zst' "
+                                                  "are also read. The default is '{}'.".format(DEF_EXT),
+                        metavar="ext", default=DEF_EXT)
     parser.add_argument("-f", "--file_name", help="A file name (with path, if not the current directory) to check for "
                                                   "either normal termination or convergence. If used, this option "
                                                   "overrides the '-d' option, and no searching for files is "
                                                   "performed.", metavar="path", default=None)
+    parser.add_argument("--follow", help="For files that are still being written, only read what was written since "
+                                         "the last check with this option, continuing from the start of the last "
+                                         "step read then. The position in each file is saved in the same cache "
+                                         "database as used without the '--no_cache' option. Applies to convergence "
+                                         "('-a', '-b', '-s', '-t', '-z') and '--scan' checks.", action="store_true",
+                        default=False)
+    parser.add_argument("-j", "--jobs", help="The number of processes to use to read and check Gaussian output files "
+                                             "in parallel. The output is the same as when one process is used (the "
+                                             "default is {}).".format(DEF_JOBS), metavar="int", type=int,
+                        default=DEF_JOBS)
     parser.add_argument("-l", "--file_list", help="A file name (with path, if not the current directory) with a "
                                                   "list of files (also with path, if not the current directory)  "
                                                   "overrides the '-d' option, and no searching for files is to check "
                                                   "for either normal termination or convergence. If used, this "
                                                   "option overrides the '-d' option, and no searching for files is "
                                                   "performed.", metavar="path", default=None)
+    parser.add_argument("--no_plots", help="Do not make plots: of the convergence of each step (with the '-s' option) "
+                                           "or of a scan (with the '--scan' option).", action="store_true",
+                        default=False)
+    parser.add_argument("--plots_only_failed", help="With the '-s' option, only plot the convergence of each step for "
+                                                    "files whose last step did not meet the convergence criteria.",
+                        action="store_true", default=False)
+    parser.add_argument("--no_cache", help=NO_CACHE_HELP + " The termination status of each file found when "
+                                                           "searching a directory ('-d' or '-ds' option) is also "
+                                                           "saved, so that only new or changed files are read when "
+                                                           "checking again.", action="store_true", default=False)
     parser.add_argument("-o", "--output_directory", help="The directory where to put Gaussian output files that have "
                                                          "terminated normally. The default is '{}'."
                                                          "".format(DEF_COMPLETE_DIR), metavar="path",
@@ -93,6 +178,10 @@ def parse_cmdline(argv):
                                                      "this option is chosen, the check for normal termination is "
                                                      "skipped. The default is False.",
                         action="store_true", default=False)
+    parser.add_argument("--summary", help="When checking for normal termination, also write the status of each file, "
+                                          "and for files that failed, the failing link and the kind of failure "
+                                          "found at the end of the file, to this file: a '.json' file (a list of "
+                                          "objects) or a '.csv' file.", metavar="path", default=None)
     parser.add_argument("-t", "--to_step", help="Check convergence of each step only to provided step number, and "
                                                 "before printing to standard out, sort by convergence.",
                         default=False)
@@ -104,6 +193,15 @@ def parse_cmdline(argv):
     parser.add_argument("--scan", help="Read output file(s) from a scan and writes the converged energies from each "
                                        "point of the scan to a csv file and creates a plot saved as the given file "
                                        "name.", metavar="path", default=None)
+    parser.add_argument("--scan_list", help="A file listing many scans to process, one per line: a name for the scan, "
+                                            "followed by the output file(s) of that scan (with path, if not the "
+                                            "current directory), separated by spaces. The scans are read and fit "
+                                            "(using the '-j' option to process several at once), and one table of "
+                                            "the best CHARMM dihedral parameters and energy barriers of each scan is "
+                                            "written, named after this file.", metavar="path", default=None)
+    parser.add_argument("--scan_plots", help="With the '--scan_list' option, also plot each scan, after the table is "
+                                             "written, in a file named after the scan in the directory of the scan "
+                                             "list.", action="store_true", default=False)
     args = None
     try:
         args = parser.parse_args(argv)
@@ -116,6 +214,21 @@ def parse_cmdline(argv):
                 raise InvalidDataError("When the '-t' option is used, an integer must be provided.")
         if args.step_converg and args.final_converg:
             raise InvalidDataError("Choose either the '-a', '-b', '-s', '-t', or '-z' option.")
+        if args.scan and args.scan_list:
+            raise InvalidDataError("Choose either the '--scan' or '--scan_list' option.")
+        if args.scan_plots and not args.scan_list:
+            raise InvalidDataError("The '--scan_plots' option is only used with the '--scan_list' option.")
+        if args.no_plots and (args.plots_only_failed or args.scan_plots):
+            raise InvalidDataError("Choose either the '--no_plots' option, or the '--plots_only_failed' or "
+                                   "'--scan_plots' option.")
+        if args.plots_only_failed and not args.step_converg:
+            raise InvalidDataError("The '--plots_only_failed' option is only used with the '-s' option.")
+        if args.summary and os.path.splitext(args.summary)[1].lower() not in SUMMARY_EXTS:
+            raise InvalidDataError("The summary file name ('--summary' option) must end in '.json' or '.csv'.")
+        if args.follow and args.no_cache:
+            raise InvalidDataError("Choose either the '--follow' or '--no_cache' option.")
+        if args.jobs < 1:
+            raise InvalidDataError("The number of jobs ('-j' option) must be a positive integer.")
         # make the default output directory a subdirectory of the directory to search
         if args.output_directory == DEF_COMPLETE_DIR:
             if args.dir_subdirs:
@@ -133,32 +246,174 @@ def parse_cmdline(argv):
     return args, GOOD_RET
 
 
-def check_file_termination(output_file, good_output_dir, completed_list, likely_failed_list, perhaps_running_list):
-    try:
-        with open(output_file, 'r') as fh:
-            last_line = fh.readlines()[-1].strip()
-    except IndexError:
-        warning("Could not read the last line (may be blank) of file: {}".format(output_file))
-        return
+def classify_termination(output_file):
+    """
+    Reads the end of a Gaussian output file (see read_tail_text) to find whether the job terminated normally, and if
+        it failed, the link that failed and why, as far as can be told from the end of the file
+    :param output_file: str, the file name
+    :return: dict with the TERM_SUMMARY_HEADERS: the status (one of COMPLETED, LIKELY_FAILED, or PERHAPS_RUNNING, or
+        None if the last line could not be read), the failing link (e.g. 'l9999', or None), the kind of failure (the
+        name from ERROR_PATS or LINK_FAILURES, UNKNOWN_FAILURE, or None), and the line that shows the failure
+        (or None)
+    """
+    termination = {TERM_FILE: os.path.relpath(output_file), TERM_STATUS: None, TERM_LINK: None, TERM_ERROR: None,
+                   TERM_MESSAGE: None}
+    tail_lines = [line.strip() for line in read_tail_text(output_file)]
+    if len(tail_lines) == 0:
+        return termination
+    last_line = tail_lines[-1]
     if NORM_TERM_PAT.match(last_line):
+        termination[TERM_STATUS] = COMPLETED
+        return termination
+    # only look at what was written after the last step (if any) of a multi-step job that terminated normally
+    end_idx = len(tail_lines)
+    start_idx = 0
+    for line_idx in range(end_idx - 1, -1, -1):
+        line = tail_lines[line_idx]
+        if NORM_TERM_PAT.match(line):
+            start_idx = line_idx + 1
+            break
+        link_match = ERROR_TERM_PAT.match(line)
+        if link_match:
+            termination[TERM_LINK] = link_match.group(1)
+            end_idx = line_idx
+        elif termination[TERM_LINK] is None:
+            link_match = ERROR_TERM_LINK_PAT.match(line)
+            if link_match:
+                termination[TERM_LINK] = 'l' + link_match.group(1)
+                end_idx = line_idx
+    if termination[TERM_LINK]:
+        # the reason for the error is printed before the error termination
+        failure_pats = ERROR_PATS
+        job_lines = tail_lines[start_idx:end_idx]
+    else:
+        failure_pats = STOPPED_PATS
+        job_lines = tail_lines[start_idx:]
+    for pattern, failure in failure_pats:
+        # the message closest to the end is the most likely explanation
+        for line in reversed(job_lines):
+            if pattern.search(line):
+                termination[TERM_ERROR] = failure
+                termination[TERM_MESSAGE] = line
+                break
+        if termination[TERM_ERROR]:
+            break
+    if termination[TERM_LINK] and termination[TERM_ERROR] is None:
+        if termination[TERM_LINK] in LINK_FAILURES:
+            termination[TERM_ERROR] = LINK_FAILURES[termination[TERM_LINK]]
+        else:
+            termination[TERM_ERROR] = UNKNOWN_FAILURE
+            messages = [line for line in job_lines if line and not ERROR_TERM_LINK_PAT.match(line)]
+            if messages:
+                termination[TERM_MESSAGE] = messages[-1]
+    if termination[TERM_LINK] or termination[TERM_ERROR]:
+        termination[TERM_STATUS] = LIKELY_FAILED
+    elif any(pattern.match(last_line) for pattern in FAIL_PAT_LIST):
+        termination[TERM_STATUS] = LIKELY_FAILED
+        termination[TERM_ERROR] = UNKNOWN_FAILURE
+        termination[TERM_MESSAGE] = last_line
+    else:
+        termination[TERM_STATUS] = PERHAPS_RUNNING
+    return termination
+
+
+def get_termination_status(output_file):
+    """
+    Checks the end of a Gaussian output file for normal termination or signs of failure
+    :param output_file: str, the file name
+    :return: one of COMPLETED, LIKELY_FAILED, or PERHAPS_RUNNING, or None if the last line could not be read
+    """
+    return classify_termination(output_file)[TERM_STATUS]
+
+
+def file_termination_from_status(output_file, status, good_output_dir, completed_list, likely_failed_list,
+                                 perhaps_running_list):
+    if status is None:
+        warning("Could not read the last line (may be blank) of file: {}".format(output_file))
+    elif status == COMPLETED:
         base_name = os.path.basename(output_file)
         completed_list.append(output_file)
         os.rename(output_file, os.path.join(good_output_dir, base_name))
-        return
-    for pattern in FAIL_PAT_LIST:
-        if pattern.match(last_line):
-            likely_failed_list.append(output_file)
-            return
-    perhaps_running_list.append(output_file)
+    elif status == LIKELY_FAILED:
+        likely_failed_list.append(output_file)
+    else:
+        perhaps_running_list.append(output_file)
+
+
+def check_file_termination(output_file, good_output_dir, completed_list, likely_failed_list, perhaps_running_list):
+    file_termination_from_status(output_file, get_termination_status(output_file), good_output_dir, completed_list,
+                                 likely_failed_list, perhaps_running_list)
+
+
+def write_termination_summary(out_fname, terminations):
+    """
+    Writes the termination status (and reason for failure, if found) of each file, for use by other programs
+    :param out_fname: str, the file name, ending in '.json' (for a list of dicts) or '.csv'
+    :param terminations: list of dicts returned by classify_termination
+    :return: n/a, saves file
+    """
+    if os.path.splitext(out_fname)[1].lower() == '.json':
+        with open(out_fname, 'w') as f:
+            json.dump(terminations, f, indent=1)
+        print(f"Wrote file: {os.path.relpath(out_fname)}")
+    else:
+        write_csv(terminations, out_fname, TERM_SUMMARY_HEADERS)
 
 
-def check_termination(args, check_file_list):
+def classify_dir_terminations(found_files, use_cache=True, jobs=DEF_JOBS):
+    """
+    Classifies the termination of files found in a directory search, reusing the classification saved by an earlier
+        run (in the cache database of each directory) for each file with the same size and modification time as
+        then, so that only new or changed files are read. The saved classifications are then replaced with those of
+        the files found.
+    :param found_files: dict of directories to lists of (file name, os.stat_result), as returned by scan_dir_files
+    :param use_cache: Boolean; if true, read and save the classifications in each directory's cache database
+    :param jobs: int, the number of processes to use to read files
+    :return: a list of file names (relative paths), sorted, and a list of the dict returned by classify_termination
+        for each of these files
+    """
+    file_stats = {}
+    terminations = {}
+    dir_states = {}
+    for dir_name, dir_files in found_files.items():
+        saved_states = read_termination_states(dir_name) if use_cache else {}
+        dir_states[dir_name] = {}
+        for base_name, file_stat in dir_files:
+            fname = os.path.relpath(os.path.join(dir_name, base_name))
+            file_stats[fname] = dir_name, base_name, file_stat
+            saved_state = saved_states.get(base_name)
+            if saved_state is not None and saved_state[:2] == (file_stat.st_size, file_stat.st_mtime_ns):
+                # the saved file name is relative to the directory where the earlier run was started
+                terminations[fname] = dict(saved_state[2], **{TERM_FILE: fname})
+    check_file_list = sorted(file_stats)
+    to_read = [fname for fname in check_file_list if fname not in terminations]
+    terminations.update(zip(to_read, map_in_order(classify_termination, to_read, jobs=jobs)))
+    if use_cache:
+        for fname, (dir_name, base_name, file_stat) in file_stats.items():
+            dir_states[dir_name][base_name] = file_stat.st_size, file_stat.st_mtime_ns, terminations[fname]
+        for dir_name, file_states in dir_states.items():
+            write_termination_states(dir_name, file_states)
+    return check_file_list, [terminations[fname] for fname in check_file_list]
+
+
+def check_termination(args, check_file_list, terminations=None):
+    """
+    Reports the termination status of each file, moving those that completed normally to args.output_directory
+    :param args: the parsed command-line arguments
+    :param check_file_list: list of file names
+    :param terminations: None, to read each file, or a list of the dict returned by classify_termination for each file
+    :return: n/a, prints the status of each file, and if args.summary is given, saves a summary file
+    """
     completed_list = []
     perhaps_running_list = []
     likely_failed_list = []
 
-    for fname in check_file_list:
-        check_file_termination(fname, args.output_directory, completed_list, likely_failed_list, perhaps_running_list)
+    # only reading the files is done in parallel; moving them and reporting stays in this process, in file order
+    if terminations is None:
+        terminations = list(map_in_order(classify_termination, check_file_list, jobs=args.jobs))
+    for fname, termination in zip(check_file_list, terminations):
+        file_termination_from_status(fname, termination[TERM_STATUS], args.output_directory, completed_list,
+                                     likely_failed_list, perhaps_running_list)
     # sort if list is at least 2 long:
     for file_list in [completed_list, likely_failed_list, perhaps_running_list]:
         if len(file_list) > 1:
@@ -177,38 +432,58 @@ def check_termination(args, check_file_list):
         print("The following files may still be running:")
         for fname in perhaps_running_list:
             print("    {}".format(os.path.relpath(fname)))
+    if args.summary:
+        write_termination_summary(args.summary, terminations)
 
 
-def create_convergence_plots(out_fname, step_list):
+def convergence_plot_lines(step_array):
     """
     To allow easy viewing of convergence
-    :param out_fname: This is the name of the base csv file
-    :param step_list: list of dicts with data re convergence
-    :return: n/a, save file
-    """
-    png_out = create_out_fname(out_fname, prefix='', ext='.png')
-
-    png_titles = [CONVERG, ENERGY, MAX_FORCE, RMS_FORCE, MAX_DISPL, RMS_DISPL]
-    num_lists = len(png_titles)
-    png_lists = [[] for _ in range(num_lists)]
-    steps = []
-
-    for s_dict in step_list:
-        steps.append(s_dict[STEP_NUM])
-        for list_id in range(num_lists):
-            png_lists[list_id].append(s_dict[png_titles[list_id]])
-    fig, axs = plt.subplots(num_lists, figsize=(7, 11.5))
-    for list_id in range(num_lists):
-        axs[list_id].plot(steps, png_lists[list_id])
-        axs[list_id].set_title(png_titles[list_id])
-    plt.subplots_adjust(hspace=0.4)
-    plt.xlabel("Step number")
-    plt.savefig(png_out, transparent=True, bbox_inches='tight',)
-    plt.close()
-    print(f"Wrote file: {os.path.relpath(png_out)}")
-
-
-def check_convergence(check_file_list, step_converg, last_step, best_conv, all_steps_to_stdout):
+    :param step_array: np structured array with data re convergence (see converg_step_array)
+    :return: lines for a CONVERG_PLOT: for each plot title, the value of each step
+    """
+    return [[(step_array[STEP_NUM], step_array[title], CURVE_STYLE)] for title in CONVERG_PLOT_TITLES]
+
+
+def lowest_converg_steps(converg, num_steps):
+    """
+    Finds the steps with the lowest convergence values without sorting all steps
+    :param converg: 1D np array of the convergence of each step
+    :param num_steps: int, the most steps to return
+    :return: 1D int np array of the indices of up to num_steps steps, in order of increasing convergence (and in
+        the order read for equal values)
+    """
+    if num_steps < len(converg):
+        kth_converg = converg[np.argpartition(converg, num_steps - 1)[num_steps - 1]]
+        candidates = np.flatnonzero(converg <= kth_converg)
+    else:
+        candidates = np.arange(len(converg))
+    return candidates[np.argsort(converg[candidates], kind='stable')][:num_steps]
+
+
+def write_step_converg_csv(out_fname, fname, step_array, round_digits=6):
+    """
+    Writes the convergence of each step, with the STEP_CONVERG_HEADERS, from the columns of step_array
+    :param out_fname: str, the csv file name
+    :param fname: str, the Gaussian output file name to write in each row
+    :param step_array: np structured array with data re convergence (see converg_step_array)
+    :param round_digits: int, decimals to round floats to
+    :return: n/a, saves file
+    """
+    converg_errs = np.where(step_array[NEGLIGIBLE_FORCES], NEGLIGIBLE_FORCES_ERR,
+                            step_array[CONVERG_ERR].astype(object))
+    columns = [step_array[STEP_NUM].tolist()] + \
+              [np.round(step_array[header], round_digits).tolist() for header in STEP_CONVERG_HEADERS[2:-1]] + \
+              [converg_errs.tolist()]
+    with open(out_fname, 'w') as csv_file:
+        writer = csv.writer(csv_file, quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerow(STEP_CONVERG_HEADERS)
+        writer.writerows(zip([fname] * len(step_array), *columns))
+    print(f"Wrote file: {os.path.relpath(out_fname)}")
+
+
+def check_convergence(check_file_list, step_converg, last_step, best_conv, all_steps_to_stdout, use_cache=True,
+                      jobs=DEF_JOBS, follow=False, make_plots=True, plots_only_failed=False):
     """
     Reads a Gaussian output file to check convergence
     :param all_steps_to_stdout: Boolean to print convergence to standard out
@@ -216,6 +491,11 @@ def check_convergence(check_file_list, step_converg, last_step, best_conv, all_s
     :param step_converg: boolean; if True, capture convergence of each step. If false, only the final convergence.
     :param last_step: None or int; if int, the last step number to check for convergence
     :param best_conv: Boolean; if true, print ten steps with the best convergence
+    :param use_cache: Boolean; if true, reuse parsed results for files that have not changed since last parsed
+    :param jobs: int, the number of processes to use to check the files
+    :param follow: Boolean; if true, only parse what was written to the files since last checked with this option
+    :param make_plots: Boolean; if true, plot the convergence of each step when saving it to a file
+    :param plots_only_failed: Boolean; if true, only make these plots for files whose last step did not converge
     :return: nothing: either saves a file or prints to stdout
     """
     fname_str_length = 36
@@ -225,72 +505,79 @@ def check_convergence(check_file_list, step_converg, last_step, best_conv, all_s
             fname_str_length = len(os.path.basename(fname))
 
     print(f"{F_NAME:{fname_str_length}} {CONVERG:{conv_str_length}} {CONVERG_ERR}")
+    # the output for each file is captured and printed here, so that it is in file order even when run in parallel
+    check_one_file = functools.partial(call_capturing_output, check_file_convergence, step_converg=step_converg,
+                                       last_step=last_step, best_conv=best_conv,
+                                       all_steps_to_stdout=all_steps_to_stdout, fname_str_length=fname_str_length,
+                                       use_cache=use_cache, follow=follow, plots_only_failed=plots_only_failed)
+    # plots are rendered in the background while the next files are checked
+    with PlotRenderer(jobs=jobs, skip=not make_plots) as renderer:
+        for captured in map_in_order(check_one_file, check_file_list, jobs=jobs):
+            plot_job = print_captured_output(captured)
+            if plot_job:
+                renderer.submit(CONVERG_PLOT, *plot_job)
+
+
+def check_file_convergence(fname, step_converg, last_step, best_conv, all_steps_to_stdout, fname_str_length,
+                           use_cache=True, follow=False, plots_only_failed=False):
+    """
+    Reads one Gaussian output file to check convergence; see check_convergence for the other parameters
+    :param fname: str, the file name
+    :param fname_str_length: int, width of the file name column of the printed table
+    :return: None, or, when the convergence of each step was saved to a file, the name of the png file and the lines
+        to plot (see convergence_plot_lines); also either saves a file or prints to stdout
+    """
+    conv_str_length = 11
+    log_content = get_gausslog_content(fname, use_cache=use_cache, follow=follow, find_converg=True,
+                                       find_step_converg=step_converg, last_step_to_read=last_step)
+    log_content[F_NAME] = os.path.basename(fname)
     if step_converg:
-        headers = STEP_CONVERG_HEADERS
-    else:
-        headers = FINAL_CONVERG_HEADERS
-    for fname in check_file_list:
-        log_content = process_gausslog_file(fname, find_converg=True, find_step_converg=step_converg,
-                                            last_step_to_read=last_step)
-        log_content[F_NAME] = os.path.basename(fname)
-        if step_converg:
-            # all_steps_to_stdout doesn't need an out_fname, but doesn't hurt either
+        # all_steps_to_stdout doesn't need an out_fname, but doesn't hurt either
+        if last_step:
+            out_fname = sys.stdout
+        else:
+            out_fname = create_out_fname(strip_compression_ext(fname), prefix='', suffix='_conv_steps', ext='.csv')
+
+        step_array = converg_step_array(log_content[CONVERG_STEP_DICT])
+
+        # different output depending on which step_converg option
+        if last_step or best_conv:
+            if len(step_array) == 0:
+                print("No convergence data found for file: {}".format(log_content[F_NAME]))
+                return
             if last_step:
-                out_fname = sys.stdout
+                print("Steps sorted by convergence to step number {} for file: {}".format(last_step,
+                                                                                          log_content[F_NAME]))
+                stop_step = last_step
             else:
-                out_fname = create_out_fname(fname, prefix='', suffix='_conv_steps', ext='.csv')
-
-            # create list of dicts for each step, for all step_converg options
-            step_list = []
-            for step_num in log_content[CONVERG_STEP_DICT].keys():
-                # not sure necessary to make this new dict, but it is fast enough and clearer for next steps
-                step_list.append({F_NAME: log_content[F_NAME], STEP_NUM: step_num,
-                                  ENERGY: log_content[CONVERG_STEP_DICT][step_num][ENERGY],
-                                  MAX_FORCE: log_content[CONVERG_STEP_DICT][step_num][MAX_FORCE],
-                                  RMS_FORCE: log_content[CONVERG_STEP_DICT][step_num][RMS_FORCE],
-                                  MAX_DISPL: log_content[CONVERG_STEP_DICT][step_num][MAX_DISPL],
-                                  RMS_DISPL: log_content[CONVERG_STEP_DICT][step_num][RMS_DISPL],
-                                  CONVERG: log_content[CONVERG_STEP_DICT][step_num][CONVERG],
-                                  CONVERG_ERR: log_content[CONVERG_STEP_DICT][step_num][CONVERG_ERR],
-                                  })
-
-            # different output depending on which step_converg option
-            if last_step or best_conv:
-                if len(step_list) == 0:
-                    print("No convergence data found for file: {}".format(log_content[F_NAME]))
-                    continue
-                sorted_by_converg = sorted(step_list, key=itemgetter(CONVERG))
-                if last_step:
-                    print("Steps sorted by convergence to step number {} for file: {}".format(last_step,
-                                                                                              log_content[F_NAME]))
-                    stop_step = last_step
-                else:
-                    print("Best (up to 10) steps sorted by convergence for file: {}".format(log_content[F_NAME]))
-                    stop_step = 10
-                print("    StepNum  Convergence")
-                for print_num, step_dict in enumerate(sorted_by_converg):
-                    if print_num == stop_step:
-                        # break this for, and go to next file if there is one
-                        break
-                    print("    {:7} {:10.3f}".format(step_dict[STEP_NUM], step_dict[CONVERG]))
-            elif all_steps_to_stdout:
-                # print all steps to stdout, not sorted by convergence
-                print("Convergence of all steps for file: {}".format(log_content[F_NAME]))
-                print("    StepNum  Convergence")
-                for step_dict in step_list:
-                    print("    {:7} {:10.3f}".format(step_dict[STEP_NUM], step_dict[CONVERG]))
-            else:
-                # save all steps, not sorted by convergence
-                print(f"{log_content[F_NAME]:{fname_str_length}} {step_list[-1][CONVERG]:{conv_str_length}.4f} "
-                      f"{step_list[-1][CONVERG_ERR]}")
-                write_csv(step_list, out_fname, headers, extrasaction="ignore", round_digits=6)
-                # also make plots of step versus convergence
-                create_convergence_plots(out_fname, step_list)
+                print("Best (up to 10) steps sorted by convergence for file: {}".format(log_content[F_NAME]))
+                stop_step = 10
+            print("    StepNum  Convergence")
+            for step_row in step_array[lowest_converg_steps(step_array[CONVERG], stop_step)]:
+                print("    {:7} {:10.3f}".format(step_row[STEP_NUM], step_row[CONVERG]))
+        elif all_steps_to_stdout:
+            # print all steps to stdout, not sorted by convergence
+            print("Convergence of all steps for file: {}".format(log_content[F_NAME]))
+            print("    StepNum  Convergence")
+            if len(step_array) > 0:
+                print("\n".join(["    {:7} {:10.3f}".format(step_num, converg) for step_num, converg
+                                 in zip(step_array[STEP_NUM].tolist(), step_array[CONVERG].tolist())]))
         else:
-            # this is the printing for final termination step only (not step_converg)
-            fname = log_content[headers[0]]
-            print(f"{fname:{fname_str_length}} {log_content[headers[1]]:{conv_str_length}.4f} "
-                  f"{log_content[headers[2]]}")
+            # save all steps, not sorted by convergence
+            last_converg_err = NEGLIGIBLE_FORCES_ERR if step_array[NEGLIGIBLE_FORCES][-1] else \
+                step_array[CONVERG_ERR][-1]
+            print(f"{log_content[F_NAME]:{fname_str_length}} {step_array[CONVERG][-1]:{conv_str_length}.4f} "
+                  f"{last_converg_err}")
+            write_step_converg_csv(out_fname, log_content[F_NAME], step_array)
+            # also make plots of step versus convergence
+            if step_array[CONVERG_ERR][-1] or not plots_only_failed:
+                return create_out_fname(out_fname, prefix='', ext='.png'), convergence_plot_lines(step_array)
+    else:
+        # this is the printing for final termination step only (not step_converg)
+        headers = FINAL_CONVERG_HEADERS
+        fname = log_content[headers[0]]
+        print(f"{fname:{fname_str_length}} {log_content[headers[1]]:{conv_str_length}.4f} "
+              f"{log_content[headers[2]]}")
 
 
 def process_scan_array(scan_array):
@@ -300,71 +587,153 @@ def process_scan_array(scan_array):
     :param scan_array: a numpy array with at least two rows and 1 column
     :return: difference in values, accounting for possible angle periodicity in degrees
     """
-    prev_val = scan_array[0][0]
-    # next line to make ide happy (removes chance trying to return an undefined value)
-    first_vals_diff = scan_array[1][0] - prev_val
-
-    for idx in range(1, len(scan_array)):
-        current_val = scan_array[idx][0]
-        val_diff = current_val - prev_val
-        if val_diff > 300.:
-            val_diff -= 360.
-            current_val -= 360.
-        elif val_diff < -300:
-            val_diff += 360.
-            current_val += 360.
-        if idx == 1:
-            first_vals_diff = val_diff
-        # will catch case of small negative number
-        if abs(current_val) < 0.002:
-            current_val = 0.0
-        scan_array[idx][0] = current_val
-        prev_val = current_val
-    return first_vals_diff
-
-
-def collect_output_scan_steps(check_file_list):
-    """
-    Looks for scan values in one or more files.
-    Current functionality: returns one scan, or combines two scans if they search in opposite directions
+    scan_vals = np.unwrap(scan_array[:, 0], discont=300., period=DIHE_PERIOD)
+    # will catch case of small negative number
+    scan_vals[np.abs(scan_vals) < SCAN_TOL] = 0.0
+    scan_array[:, 0] = scan_vals
+    if len(scan_vals) < 2:
+        return 0.
+    return scan_vals[1] - scan_vals[0]
+
+
+def group_close_values(vals, tol=SCAN_TOL):
+    """
+    Groups values that are within tol of their neighbor when sorted
+    :param vals: 1D np array
+    :param tol: float, the largest difference between values in the same group
+    :return: 1D int np array of the group index of each value, with groups numbered in increasing order of value
+    """
+    order = np.argsort(vals, kind='stable')
+    group_ids = np.empty(len(vals), dtype=int)
+    group_ids[order] = np.concatenate(([0], np.cumsum(np.diff(vals[order]) > tol)))
+    return group_ids
+
+
+def keep_lowest_energy(scan_vals, energies):
+    """
+    Merges points of a 1D scan that are at the same scan value, keeping the lowest energy
+    :param scan_vals: 1D np array of scan values
+    :param energies: 1D np array of energies
+    :return: a 2D numpy array with the scan values (in increasing order) and energies
+    """
+    group_ids = group_close_values(scan_vals)
+    order = np.lexsort((energies, group_ids))
+    sorted_groups = group_ids[order]
+    first_in_group = order[np.concatenate(([True], sorted_groups[1:] != sorted_groups[:-1]))]
+    return np.column_stack((scan_vals[first_in_group], energies[first_in_group]))
+
+
+def find_period_shift(prev_vals, scan_vals):
+    """
+    Finds the whole number of periods to shift a scan of a dihedral so that it lines up with values already found: the
+        shift that keeps the combined values in the smallest range, and, if more than one does, that puts the first
+        scan value closest to a value already found
+    :param prev_vals: 1D np array of dihedral values already found
+    :param scan_vals: 1D np array of unwrapped dihedral values, in the order scanned
+    :return: float, the shift in degrees
+    """
+    low_shift = np.floor((prev_vals.min() - scan_vals.max()) / DIHE_PERIOD)
+    high_shift = np.ceil((prev_vals.max() - scan_vals.min()) / DIHE_PERIOD)
+    shifts = DIHE_PERIOD * np.arange(low_shift, high_shift + 1)
+    spans = (np.maximum(prev_vals.max(), scan_vals.max() + shifts) -
+             np.minimum(prev_vals.min(), scan_vals.min() + shifts))
+    gaps = np.min(np.abs(prev_vals[:, None] - (scan_vals[0] + shifts)), axis=0)
+    gaps[spans > spans.min() + SCAN_TOL] = np.inf
+    return shifts[np.argmin(gaps)]
+
+
+def combine_scan_segments(scan_arrays, periodic=True):
+    """
+    Combines any number of scans of one parameter, which may have been run in either direction and may overlap
+    :param scan_arrays: list of 2D np arrays with scan values in the 1st column and energies in the 2nd
+    :param periodic: Boolean; if true, scan values are in degrees and the scans are unwrapped and shifted by whole
+        periods to line up with each other
+    :return: a 2D numpy array with the scan values (in increasing order) and energies (in the units provided); where
+        scans overlap, the lowest energy found at that scan value is kept
+    """
+    combined = []
+    for scan_array in scan_arrays:
+        scan_array = np.array(scan_array, dtype=float)
+        if periodic:
+            process_scan_array(scan_array)
+            if combined:
+                scan_array[:, 0] += find_period_shift(np.concatenate([segment[:, 0] for segment in combined]),
+                                                      scan_array[:, 0])
+        combined.append(scan_array)
+    combined = np.vstack(combined)
+    return keep_lowest_energy(combined[:, 0], combined[:, 1])
+
+
+def grid_scan_points(scan_points, periodic=(True, True)):
+    """
+    Arranges the points of a scan of two parameters on a grid
+    :param scan_points: 2D np array with the values of the two scan parameters in the first two columns and
+        energies in the 3rd
+    :param periodic: tuple of Booleans; for each parameter, if true the values are dihedral angles in degrees, which
+        are wrapped to [0, 360)
+    :return: np array of shape [3, n1, n2]: the values of the 1st and 2nd scan parameters, and the energies (nan where
+        no energy was found); where more than one energy was found for a grid point, the lowest is kept
+    """
+    axes = []
+    indices = []
+    for col, is_periodic in enumerate(periodic):
+        scan_vals = scan_points[:, col]
+        if is_periodic:
+            scan_vals = np.mod(scan_vals, DIHE_PERIOD)
+            scan_vals[scan_vals > DIHE_PERIOD - SCAN_TOL] = 0.0
+        group_ids = group_close_values(scan_vals)
+        axis_vals = np.empty(group_ids.max() + 1)
+        axis_vals[group_ids] = scan_vals
+        axes.append(axis_vals)
+        indices.append(group_ids)
+    energies = np.full((len(axes[0]), len(axes[1])), np.nan)
+    np.fmin.at(energies, tuple(indices), scan_points[:, 2])
+    return np.stack((*np.meshgrid(*axes, indexing='ij'), energies))
+
+
+def collect_output_scan_steps(check_file_list, use_cache=True, jobs=DEF_JOBS, follow=False):
+    """
+    Looks for scan values in one or more files, which are combined: files of a scan of one parameter may be in any
+        order, have been run in either direction, and overlap (the lowest energy at each scan value is kept)
     :param check_file_list:
-    :return: a 2D numpy array with the scan values and energy differences in kcal/mol
+    :param use_cache: Boolean; if true, reuse parsed results for files that have not changed since last parsed
+    :param jobs: int, the number of processes to use to read the files
+    :param follow: Boolean; if true, only parse what was written to the files since last read with this option
+    :return: for a scan of one parameter, a 2D numpy array with the scan values (in increasing order) and energy
+        differences in kcal/mol; for a scan of two parameters, the grid returned by grid_scan_points, with energy
+        differences in kcal/mol
     """
     scan_arrays = []
-    for fname in check_file_list:
-        log_content = process_gausslog_file(fname, collect_scan_steps=True)
-        if len(log_content[SCAN_DICT]) > 0:
-            scan_arrays.append(np.array(list(log_content[SCAN_DICT].items()), dtype=float))
-    num_arrays = len(scan_arrays)
-    # if only one scan file, return it
-    if num_arrays == 1:
-        return_array = scan_arrays[0]
-    elif num_arrays == 0:
+    scan_params = None
+    read_one_file = functools.partial(call_capturing_output, get_gausslog_content, use_cache=use_cache,
+                                      follow=follow, collect_scan_steps=True)
+    for fname, captured in zip(check_file_list, map_in_order(read_one_file, check_file_list, jobs=jobs)):
+        log_content = print_captured_output(captured)
+        scan_dict = log_content[SCAN_DICT]
+        if len(scan_dict) == 0:
+            continue
+        if scan_params is None:
+            scan_params = log_content[SCAN_PARAMS]
+        elif log_content[SCAN_PARAMS] != scan_params:
+            raise InvalidDataError(f"The program cannot combine scans of different parameters: "
+                                   f"{', '.join(scan_params)} and {', '.join(log_content[SCAN_PARAMS])} "
+                                   f"(in file: {os.path.relpath(fname)})")
+        scan_vals = np.array(list(scan_dict.keys()), dtype=float).reshape(len(scan_dict), -1)
+        scan_arrays.append(np.column_stack((scan_vals, list(scan_dict.values()))))
+    if len(scan_arrays) == 0:
         raise InvalidDataError("No scan information found.")
-    elif num_arrays == 2:
-        first_array = scan_arrays[0]
-        second_array = scan_arrays[1]
-        first_diff = process_scan_array(first_array)
-        second_diff = process_scan_array(second_array)
-        # check if the first entry is in common, as for scan in two directions
-        if abs(first_array[0][0] - second_array[0][0]) < 0.002:
-            if first_diff < 0 < second_diff:
-                first_array = np.flip(first_array, 0)
-                return_array = np.vstack((first_array[:-1, :], second_array))
-            elif first_diff > 0 > second_diff:
-                second_array = np.flip(second_array, 0)
-                return_array = np.vstack((second_array[:-1, :], first_array))
-            else:
-                raise InvalidDataError("Check how the scans are to be combined.")
-        else:
-            raise InvalidDataError("The program cannot currently handle these files. Check input, and if correct, "
-                                   "please open an issue on github.")
-    # convert dict to array
+    periodic = [param.startswith('D') for param in scan_params]
+    if len(scan_params) == 1:
+        return_array = combine_scan_segments(scan_arrays, periodic=periodic[0])
+        energies = return_array[:, 1]
+    elif len(scan_params) == 2:
+        return_array = grid_scan_points(np.vstack(scan_arrays), periodic=periodic)
+        energies = return_array[2]
     else:
-        raise InvalidDataError("The program can't yet handle this number of files. Please open an issue.")
+        raise InvalidDataError(f"The program cannot currently handle scans of more than two parameters (found: "
+                               f"{', '.join(scan_params)}). Please open an issue on github.")
     # find lowest energy and convert to differences in kcal/mol
-    min_e = np.min(return_array[:, 1])
-    return_array[:, 1] = (return_array[:, 1] - min_e) * EHPART_TO_KCAL_MOL
+    energies[:] = (energies - np.nanmin(energies)) * EHPART_TO_KCAL_MOL
     return return_array
 
 
@@ -400,6 +769,55 @@ def charmm_dihedral(phi, k1, k2, k3, k4, k6, d1, d2, d3, d4, d6, n1, n2, n3, n4,
     return np.add.reduce(result_vec_list)
 
 
+def fit_charmm_dihedral(x_vals, y_vals, n_multipliers=CHARMM_N_MULTIPLIERS):
+    """
+    Fits the CHARMM dihedral formula (see charmm_dihedral), plus a constant energy offset, to scan energies for each
+        set of multiplicities. As k * (1 + cos(n * phi - d)) = k + a * cos(n * phi) + b * sin(n * phi), with
+        a = k * cos(d) and b = k * sin(d), the fit is linear in the offset and the a and b values, so all sets are
+        solved exactly at once with the pseudo-inverse of a design matrix whose columns for unused n values are zero
+    :param x_vals: np array, dihedral angles in degrees
+    :param y_vals: np array, energies at these angles
+    :param n_multipliers: np array of shape (number of sets, len(N_DIHE)), with 1 for each n value to use in a fit
+    :return: np arrays of k values and of d values (in radians), each with shape (number of sets, len(N_DIHE)) and
+        zero for unused n values, and of the offsets to add to charmm_dihedral and of the root mean squared errors,
+        each with shape (number of sets,)
+    """
+    n_phi = np.outer(np.deg2rad(x_vals), N_DIHE)
+    design = np.hstack((np.ones((len(x_vals), 1)), np.cos(n_phi), np.sin(n_phi)))
+    n_used = np.asarray(n_multipliers, dtype=bool)
+    col_mask = np.hstack((np.ones((len(n_used), 1), dtype=bool), n_used, n_used))
+    designs = design * col_mask[:, np.newaxis, :]
+    coeffs = np.linalg.pinv(designs) @ y_vals
+    y_from_fits = np.einsum('sij,sj->si', designs, coeffs)
+    resids = np.sqrt(np.mean(np.square(y_from_fits - y_vals), axis=1))
+    num_n = len(N_DIHE)
+    a_vals = coeffs[:, 1:num_n + 1]
+    b_vals = coeffs[:, num_n + 1:]
+    k_vals = np.hypot(a_vals, b_vals)
+    d_vals = np.where(n_used, np.arctan2(b_vals, a_vals), 0.)
+    offsets = coeffs[:, 0] - np.sum(k_vals, axis=1)
+    return k_vals, d_vals, offsets, resids
+
+
+def print_charmm_fit(x_vals, y_vals):
+    """
+    Prints the CHARMM dihedral parameters of the set of multiplicities (from CHARMM_N_MULTIPLIERS) that best fits
+        the scan energies
+    :param x_vals: np array, dihedral angles in degrees
+    :param y_vals: np array, energies in kcal/mol
+    :return: n/a, prints results to stdout
+    """
+    k_vals, d_vals, offsets, resids = fit_charmm_dihedral(x_vals, y_vals)
+    best_idx = np.argmin(resids)
+    print(f"CHARMM dihedral parameters for the best fit (RMSE {resids[best_idx]:.2f} kcal/mol; energy offset "
+          f"{offsets[best_idx]:.4f} kcal/mol):")
+    print("    n  k (kcal/mol)  d (degrees)")
+    for n, k, d, n_use in zip(N_DIHE, k_vals[best_idx], d_vals[best_idx], CHARMM_N_MULTIPLIERS[best_idx]):
+        if n_use:
+            # adding zero so that a rounded negative zero is printed as 0.00
+            print(f"    {n}  {k:12.4f}  {np.round(np.rad2deg(d), 2) + 0.:11.2f}")
+
+
 def find_good_fit(x_vals, y_vals, x_fit, png_fname=None):
     """
     Find a good functional fit for scan data
@@ -414,31 +832,15 @@ def find_good_fit(x_vals, y_vals, x_fit, png_fname=None):
 
     print("Residuals from curve fitting:")
 
-    charmm_n_multipliers = [np.ones(5, dtype=int), np.asarray([0, 1, 1, 1, 1]),
-                            np.asarray([1, 1, 1, 1, 0]), np.asarray([1, 1, 1, 0, 0]),
-                            np.asarray([1, 1, 0, 0, 0]), np.asarray([1, 0, 0, 0, 0]),
-                            np.asarray([0, 1, 0, 1, 1]), np.asarray([1, 0, 1, 0, 0])]
-    if png_fname:
-        plt.plot(x_vals, y_vals, '.', label='data')
-
-    for idx, multipliers in enumerate(charmm_n_multipliers):
+    data_line = (x_vals, y_vals, POINTS_STYLE)
+    charmm_lines = [data_line]
+    k_vals, d_vals, offsets, resids = fit_charmm_dihedral(x_vals, y_vals)
+    for idx, multipliers in enumerate(CHARMM_N_MULTIPLIERS):
         n_vals = multipliers * N_DIHE
-        # fit curve
-        ini_vals = np.ones(len(N_DIHE) * 2)
-        with warnings.catch_warnings():
-            warnings.simplefilter("error", OptimizeWarning)
-            try:
-                popt, pcov = curve_fit(f=lambda x, *params: charmm_dihedral(x, *params, *multipliers),
-                                       xdata=x_vals, ydata=y_vals, p0=ini_vals)
-            except OptimizeWarning:
-                pass
-
-        y_fit = charmm_dihedral(x_fit, *popt, *multipliers)
-        if png_fname:
-            plt.plot(x_fit, y_fit, '-', color=assign_color(idx), label=f'fit: {multipliers}')
+        y_fit = charmm_dihedral(x_fit, *k_vals[idx], *d_vals[idx], *multipliers) + offsets[idx]
+        charmm_lines.append((x_fit, y_fit, curve_style(assign_color(idx))))
 
-        y_from_fit = charmm_dihedral(x_vals, *popt, *multipliers)
-        resid = np.sqrt(np.mean(np.square(y_from_fit - y_vals)))  # Root Mean Squared Error
+        resid = resids[idx]  # Root Mean Squared Error
         print(f'    CHARMM dihedral eq with n = {",".join([str(x) for x in n_vals[n_vals != 0]]) + ":":10} '
               f'{resid:5.2f}')
         if resid < smallest_resid:
@@ -446,22 +848,16 @@ def find_good_fit(x_vals, y_vals, x_fit, png_fname=None):
             best_y_fit = y_fit
 
     if png_fname:
-        # plt.legend()
         charmm_fname = create_out_fname(png_fname, suffix="_charmm")
-        plt.savefig(charmm_fname, transparent=True, bbox_inches='tight',)
-        plt.close()
+        render_plot(FIT_PLOT, charmm_fname, [charmm_lines])
         print(f"Saved: {charmm_fname}")
 
-    if png_fname:
-        plt.plot(x_vals, y_vals, '.', label='data')
-
+    poly_lines = [data_line]
     for idx, order in enumerate(range(1, 12)):
         # noinspection PyTupleAssignmentBalance
         p, residuals, rank, singular_values, rcond = np.polyfit(x_vals, y_vals, order, full=True)
         y_fit = np.polyval(p, x_fit)
-
-        if png_fname:
-            plt.plot(x_fit, y_fit, '-', color=COLOR_SEQUENCE[idx], label=f'fit: poly order {order}')
+        poly_lines.append((x_fit, y_fit, curve_style(COLOR_SEQUENCE[idx])))
 
         y_from_fit = np.polyval(p, x_vals)
         resid = np.sqrt(np.mean(np.square(y_from_fit - y_vals)))
@@ -472,61 +868,176 @@ def find_good_fit(x_vals, y_vals, x_fit, png_fname=None):
             best_y_fit = y_fit
 
     if png_fname:
-        # plt.legend()
         poly_fname = create_out_fname(png_fname, suffix="_poly")
-        plt.savefig(poly_fname, transparent=True, bbox_inches='tight',)
-        plt.close()
+        render_plot(FIT_PLOT, poly_fname, [poly_lines])
         print(f"Saved: {poly_fname}")
 
     return best_y_fit
 
 
-def plot_scan(scan_array, png_out_fname):
+def spline_scan(x_vals, y_vals):
     """
-    Given a 2D array of x and y values, plot with fitting for a dihedral scan
-    :param scan_array: np array of shape [2, n]
-    :param png_out_fname: str, path
-    :return: n/a, saves plot
+    Interpolates scan energies with a B-spline
+    :param x_vals: np array, e.g. values from dihedral scan in degrees
+    :param y_vals: np array, energies at these values
+    :return: np arrays of 50 evenly spaced x values across the scan, and the interpolated y values at these
     """
-    x_vals = scan_array[:, 0]
-    y_vals = scan_array[:, 1]
-    plt.plot(x_vals, y_vals, '.')
-
     b_spline = make_interp_spline(x_vals, y_vals)
     x_fit = np.linspace(min(x_vals), max(x_vals), 50)
-    y_fit = b_spline(x_fit)
-    plt.plot(x_fit, y_fit, '-', color=COLOR_SEQUENCE[0])
+    return x_fit, b_spline(x_fit)
+
+
+def scan_plot_lines(scan_array):
+    """
+    Given a 2D array of x and y values, find the lines to plot for a dihedral scan
+    :param scan_array: np array of shape [n, 2]
+    :return: lines for a SCAN_PLOT (the scan values and a spline through them), and the x and y values of the spline
+    """
+    x_vals = scan_array[:, 0]
+    y_vals = scan_array[:, 1]
+    x_fit, y_fit = spline_scan(x_vals, y_vals)
+    return [[(x_vals, y_vals, POINTS_STYLE), (x_fit, y_fit, curve_style(COLOR_SEQUENCE[0]))]], x_fit, y_fit
 
-    axis_font_size = 14
-    plt.xlabel("Dihedral Scan (degrees)", fontsize=axis_font_size)
-    plt.ylabel("Change in Energy (kcal/mol)", fontsize=axis_font_size)
 
-    plt.savefig(png_out_fname, transparent=True, bbox_inches='tight',)
-    plt.close()
+def plot_scan(scan_array, png_out_fname):
+    """
+    Given a 2D array of x and y values, plot with fitting for a dihedral scan
+    :param scan_array: np array of shape [n, 2]
+    :param png_out_fname: str, path
+    :return: the x and y values of the spline through the scan values; also saves plot
+    """
+    plot_lines, x_fit, y_fit = scan_plot_lines(scan_array)
+    render_plot(SCAN_PLOT, png_out_fname, plot_lines)
     print(f"Wrote file: {os.path.relpath(png_out_fname)}")
 
     return x_fit, y_fit
 
 
-def find_stable_points(x_fit, y_fit):
+def plot_scan_2d(scan_grid, png_out_fname):
     """
-    Find x values for local min and max of y-values, and return differences in heights;
-    Output formatting assumes the y-values correspond to energy in kcal/mol, and x-values are degrees
+    Given a grid of scan values and energies from a scan of two parameters, plot energy contours
+    :param scan_grid: np array of shape [3, n1, n2] (see grid_scan_points)
+    :param png_out_fname: str, path
+    :return: n/a, saves plot
+    """
+    render_plot(CONTOUR_PLOT, png_out_fname, *scan_grid)
+    print(f"Wrote file: {os.path.relpath(png_out_fname)}")
+
+
+def find_barriers(x_fit, y_fit):
+    """
+    Find x values for local min and max of y-values, and the differences in heights between them
     :param x_fit: np array, e.g. values from dihedral scan in degrees
     :param y_fit: np array, e.g. energies from a dihedral scan in kcal/mol
-    :return: n/a, prints results to stdout
+    :return: list of (start x value, end x value, absolute difference in y values) tuples, from the first to the last
+        x value, through each local min and max
     """
     # argrelmin, argrelmax, and argrelextrema return tuples, even for 1-D data
     local_max_idxs = argrelmin(y_fit)[0]
     local_min_idxs = argrelmax(y_fit)[0]
     stable_points = np.sort(np.hstack((local_max_idxs, local_min_idxs)))
-    print("Barriers in kcal/mol:")
+    barriers = []
     previous_idx = None
     for idx in [0] + list(stable_points) + [-1]:
         if previous_idx is not None:
-            print(f"{x_fit[previous_idx]:8.1f} to {x_fit[idx]:5.1f} degrees: "
-                  f"{abs(y_fit[idx] - y_fit[previous_idx]):5.1f} kcal/mol")
+            barriers.append((x_fit[previous_idx], x_fit[idx], abs(y_fit[idx] - y_fit[previous_idx])))
         previous_idx = idx
+    return barriers
+
+
+def find_stable_points(x_fit, y_fit):
+    """
+    Find x values for local min and max of y-values, and return differences in heights;
+    Output formatting assumes the y-values correspond to energy in kcal/mol, and x-values are degrees
+    :param x_fit: np array, e.g. values from dihedral scan in degrees
+    :param y_fit: np array, e.g. energies from a dihedral scan in kcal/mol
+    :return: n/a, prints results to stdout
+    """
+    print("Barriers in kcal/mol:")
+    for x_start, x_end, barrier in find_barriers(x_fit, y_fit):
+        print(f"{x_start:8.1f} to {x_end:5.1f} degrees: {barrier:5.1f} kcal/mol")
+
+
+def read_scan_list(scan_list_fname):
+    """
+    Reads a file listing scans to process, one per line, as a name followed by the output file names of the scan
+    :param scan_list_fname: str, file name
+    :return: list of (scan name, list of file names) tuples
+    """
+    scan_groups = []
+    with open(scan_list_fname) as f:
+        for line in f:
+            split_line = line.split()
+            if len(split_line) == 0 or split_line[0].startswith('#'):
+                continue
+            if len(split_line) < 2:
+                raise InvalidDataError(f"Expected a scan name followed by one or more file names on each line of "
+                                       f"'{scan_list_fname}'; found: {line.strip()}")
+            scan_groups.append((split_line[0], split_line[1:]))
+    if len(scan_groups) == 0:
+        raise InvalidDataError(f"No scans found in file: {scan_list_fname}")
+    return scan_groups
+
+
+def fit_scan_group(scan_group, use_cache=True, follow=False):
+    """
+    Reads one scan and finds its energy barriers and best CHARMM dihedral fit, without plotting
+    :param scan_group: tuple of the scan name and the list of its output file names
+    :param use_cache: Boolean; if true, reuse parsed results for files that have not changed since last parsed
+    :param follow: Boolean; if true, only parse what was written to the files since last read with this option
+    :return: dict of values for SCAN_FIT_HEADERS, and the scan array (see collect_output_scan_steps)
+    """
+    scan_name, scan_files = scan_group
+    scan_array = collect_output_scan_steps(scan_files, use_cache=use_cache, follow=follow)
+    if scan_array.ndim != 2:
+        raise InvalidDataError("CHARMM dihedral parameters can only be fit to a scan of one parameter.")
+    x_vals = scan_array[:, 0]
+    y_vals = scan_array[:, 1]
+    barriers = [barrier for _, _, barrier in find_barriers(*spline_scan(x_vals, y_vals))]
+    k_vals, d_vals, offsets, resids = fit_charmm_dihedral(x_vals, y_vals)
+    best_idx = np.argmin(resids)
+    n_used = CHARMM_N_MULTIPLIERS[best_idx]
+    fit_row = {SCAN_NAME: scan_name, NUM_POINTS: len(scan_array),
+               FIT_N: ",".join([str(n) for n in N_DIHE[n_used != 0]]), FIT_RMSE: resids[best_idx],
+               FIT_OFFSET: offsets[best_idx], MAX_BARRIER: max(barriers),
+               BARRIERS: ";".join([f"{barrier:.2f}" for barrier in barriers])}
+    for n, k, d, n_use in zip(N_DIHE, k_vals[best_idx], d_vals[best_idx], n_used):
+        fit_row[f'k{n}'] = k if n_use else np.nan
+        fit_row[f'd{n}'] = np.rad2deg(d) if n_use else np.nan
+    return fit_row, scan_array
+
+
+def process_scan_list(scan_list_fname, use_cache=True, jobs=DEF_JOBS, follow=False, make_plots=False):
+    """
+    Fits each scan listed in the scan list file (see read_scan_list) and writes one table of the results; scans that
+        cannot be read are reported and skipped. Plots, if requested, are made after the table is written.
+    :param scan_list_fname: str, file name
+    :param use_cache: Boolean; if true, reuse parsed results for files that have not changed since last parsed
+    :param jobs: int, the number of processes to use to process scans
+    :param follow: Boolean; if true, only parse what was written to the files since last read with this option
+    :param make_plots: Boolean; if true, plot each scan
+    :return: n/a, writes files
+    """
+    scan_groups = read_scan_list(scan_list_fname)
+    fit_one_scan = functools.partial(call_capturing_output, fit_scan_group, use_cache=use_cache, follow=follow)
+    fit_rows = []
+    plot_args = []
+    out_dir = os.path.dirname(scan_list_fname)
+    for scan_group, captured in zip(scan_groups, map_in_order(fit_one_scan, scan_groups, jobs=jobs)):
+        try:
+            fit_row, scan_array = print_captured_output(captured)
+        except (InvalidDataError, ValueError, OSError) as e:
+            warning(f"Skipping scan '{scan_group[0]}':", e)
+            continue
+        fit_rows.append(fit_row)
+        plot_args.append((create_out_fname(scan_group[0], ext='.png', base_dir=out_dir), scan_array))
+    if len(fit_rows) == 0:
+        raise InvalidDataError(f"No scans could be read from the files listed in: {scan_list_fname}")
+    out_fname = create_out_fname(scan_list_fname, suffix='_fits', ext='.csv')
+    write_csv(fit_rows, out_fname, SCAN_FIT_HEADERS, round_digits=6)
+    with PlotRenderer(jobs=jobs, skip=not make_plots) as renderer:
+        for png_fname, scan_array in plot_args:
+            renderer.submit(SCAN_PLOT, png_fname, scan_plot_lines(scan_array)[0])
 
 
 def main(argv=None):
@@ -537,6 +1048,11 @@ def main(argv=None):
         return ret
 
     try:
+        if args.scan_list:
+            process_scan_list(args.scan_list, use_cache=not args.no_cache, jobs=args.jobs, follow=args.follow,
+                              make_plots=args.scan_plots)
+            return GOOD_RET
+
         # Find files to process, then process them
         check_sub_dirs = False
         search_dir = None
@@ -545,22 +1061,46 @@ def main(argv=None):
             check_sub_dirs = True
         elif args.directory:
             search_dir = args.directory
-        check_file_list = check_for_files(args.file_name, args.file_list, search_pattern=args.extension,
-                                          search_dir=search_dir, search_sub_dir=check_sub_dirs)
+        check_termination_only = not (args.step_converg or args.final_converg or args.scan)
+        terminations = None
+        if check_termination_only and args.file_name is None and args.file_list is None:
+            # a directory search for the termination check, which can skip files not changed since the last check
+            if search_dir is None:
+                search_dir = os.getcwd()
+            found_files = scan_dir_files(search_dir, args.extension, search_sub_dir=check_sub_dirs)
+            if not found_files:
+                warning(f"Could not find files with pattern '{args.extension}' in directory "
+                        f"'{os.path.relpath(search_dir)}'" + (" or its subdirectories." if check_sub_dirs else "."))
+                raise InvalidDataError("No files to process.")
+            check_file_list, terminations = classify_dir_terminations(found_files, use_cache=not args.no_cache,
+                                                                      jobs=args.jobs)
+        else:
+            check_file_list = check_for_files(args.file_name, args.file_list, search_pattern=args.extension,
+                                              search_dir=search_dir, search_sub_dir=check_sub_dirs)
 
         # now check either for convergence or termination
         if args.step_converg or args.final_converg:
-            check_convergence(check_file_list, args.step_converg, args.to_step, args.best, args.all)
+            check_convergence(check_file_list, args.step_converg, args.to_step, args.best, args.all,
+                              use_cache=not args.no_cache, jobs=args.jobs, follow=args.follow,
+                              make_plots=not args.no_plots, plots_only_failed=args.plots_only_failed)
         else:
             # If output directory does not exist, make it:
             if not os.path.exists(args.output_directory):
                 os.makedirs(args.output_directory)
             if args.scan:
-                scan_array = collect_output_scan_steps(check_file_list)
-                x_fit, y_fit = plot_scan(scan_array, args.scan)
-                find_stable_points(x_fit, y_fit)
+                scan_array = collect_output_scan_steps(check_file_list, use_cache=not args.no_cache,
+                                                       jobs=args.jobs, follow=args.follow)
+                if scan_array.ndim == 2:
+                    if args.no_plots:
+                        x_fit, y_fit = spline_scan(scan_array[:, 0], scan_array[:, 1])
+                    else:
+                        x_fit, y_fit = plot_scan(scan_array, args.scan)
+                    find_stable_points(x_fit, y_fit)
+                    print_charmm_fit(scan_array[:, 0], scan_array[:, 1])
+                elif not args.no_plots:
+                    plot_scan_2d(scan_array, args.scan)
             else:
-                check_termination(args, check_file_list)
+                check_termination(args, check_file_list, terminations=terminations)
 
     except IOError as e:
         warning("Problems reading file:", e)
@@ -0,0 +1,118 @@
+# coding=utf-8
+
+"""
+Persistent library of the unique conformations found by gausslog_unique, so that adding output files to an ensemble
+only requires reading the new files. One SQLite database holds, for each group of files with the same conformation
+(keyed by stoichiometry): what is needed to compare new files to the group (the dihedral angles, or the coordinates,
+of its first member), and the results of the file with the best convergence. The names of all files in a group are
+also kept, so that files already in the library are not read again. The content of each group is stored as
+compressed JSON (see log_cache.encode_content), so that a library shared by several people can be read without
+running code from it.
+"""
+import json
+import sqlite3
+from common_wrangler.common import InvalidDataError
+from gaussian_wrangler.log_cache import encode_content, decode_content, DECODE_ERRORS
+
+__author__ = 'hmayes'
+
+
+CREATE_SETTINGS_TABLE = "CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)"
+CREATE_GROUPS_TABLE = "CREATE TABLE IF NOT EXISTS conf_groups (group_id INTEGER PRIMARY KEY, stoich TEXT, " \
+                      "first_member TEXT, first_content BLOB, winner TEXT, winner_content BLOB)"
+CREATE_GROUPS_INDEX = "CREATE INDEX IF NOT EXISTS groups_by_stoich ON conf_groups (stoich)"
+CREATE_MEMBERS_TABLE = "CREATE TABLE IF NOT EXISTS members (fname TEXT PRIMARY KEY, group_id INTEGER)"
+
+
+def unpack(blob):
+    try:
+        return decode_content(blob)
+    except DECODE_ERRORS:
+        raise InvalidDataError("Could not read the conformations saved in the conformer library (e.g. it was made "
+                               "by an older version of gausslog_unique); start a new library.")
+
+
+class ConfGroup:
+    """
+    A group of files with the same conformation: the first member's name and the content needed to compare other
+        files to it, and the name and results of the member with the best convergence
+    """
+    def __init__(self, first_member, first_content, winner, winner_content, group_id=None, new_members=None):
+        self.group_id = group_id
+        self.first_member = first_member
+        self.first_content = first_content
+        self.winner = winner
+        self.winner_content = winner_content
+        # members not yet saved in the library
+        self.new_members = [] if new_members is None else new_members
+
+
+def open_conformer_library(lib_fname, settings):
+    """
+    Opens (creating if needed) a conformer library
+    :param lib_fname: str, the library file name
+    :param settings: dict of the options used to group conformations (e.g. tolerances), which must be the same as
+        when the library was made
+    :return: sqlite3 connection
+    """
+    try:
+        conn = sqlite3.connect(lib_fname)
+        conn.execute(CREATE_SETTINGS_TABLE)
+        conn.execute(CREATE_GROUPS_TABLE)
+        conn.execute(CREATE_GROUPS_INDEX)
+        conn.execute(CREATE_MEMBERS_TABLE)
+        saved_settings = {name: json.loads(value) for name, value in conn.execute("SELECT name, value FROM settings")}
+        if not saved_settings:
+            conn.executemany("INSERT INTO settings VALUES (?, ?)",
+                             [(name, json.dumps(value)) for name, value in settings.items()])
+        conn.commit()
+    except sqlite3.Error as e:
+        raise InvalidDataError(f"Could not use conformer library '{lib_fname}': {e}")
+    if saved_settings and saved_settings != settings:
+        conn.close()
+        changed = ", ".join(f"{name} {saved_settings.get(name)} (not {value})" for name, value in settings.items()
+                            if saved_settings.get(name) != value)
+        raise InvalidDataError(f"Conformer library '{lib_fname}' was made with {changed}; use the same options, "
+                               f"or a new library.")
+    return conn
+
+
+def read_library_members(conn):
+    """
+    :return: set of the names of all files in the library
+    """
+    return {row[0] for row in conn.execute("SELECT fname FROM members")}
+
+
+def read_library_groups(conn):
+    """
+    :return: list of ConfGroup objects, in the order the groups were started
+    """
+    return [ConfGroup(first_member, unpack(first_content), winner, unpack(winner_content), group_id=group_id)
+            for group_id, first_member, first_content, winner, winner_content in
+            conn.execute("SELECT group_id, first_member, first_content, winner, winner_content FROM conf_groups "
+                         "ORDER BY group_id")]
+
+
+def save_library_groups(conn, conf_groups, stoich_key):
+    """
+    Saves new groups, the best member of each group, and the new members of each group, in one transaction
+    :param conn: sqlite3 connection returned by open_conformer_library
+    :param conf_groups: list of ConfGroup objects; those without a group_id are added to the library, in order
+    :param stoich_key: str, the key of the stoichiometry in the first_content of a group
+    :return: n/a, updates the library
+    """
+    with conn:
+        for conf_group in conf_groups:
+            if conf_group.group_id is None:
+                conf_group.group_id = conn.execute(
+                    "INSERT INTO conf_groups (stoich, first_member, first_content, winner, winner_content) "
+                    "VALUES (?, ?, ?, ?, ?)", (conf_group.first_content[stoich_key], conf_group.first_member,
+                                               encode_content(conf_group.first_content), conf_group.winner,
+                                               encode_content(conf_group.winner_content))).lastrowid
+            elif conf_group.new_members:
+                conn.execute("UPDATE conf_groups SET winner = ?, winner_content = ? WHERE group_id = ?",
+                             (conf_group.winner, encode_content(conf_group.winner_content), conf_group.group_id))
+            conn.executemany("INSERT OR REPLACE INTO members VALUES (?, ?)",
+                             [(fname, conf_group.group_id) for fname in conf_group.new_members])
+            conf_group.new_members = []
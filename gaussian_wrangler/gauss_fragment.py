@@ -7,10 +7,11 @@ from __future__ import print_function
 import os
 import sys
 import argparse
+import numpy as np
 from configparser import ConfigParser, MissingSectionHeaderError
 from common_wrangler.common import (InvalidDataError, warning, process_cfg, create_out_fname, list_to_file,
                                     GOOD_RET, INPUT_ERROR, IO_ERROR, INVALID_DATA,
-                                    ATOM_TYPE, ATOM_COORDS, MAIN_SEC, calc_dist, SEC_ATOMS)
+                                    MAIN_SEC, SEC_ATOMS)
 from gaussian_wrangler.gw_common import process_gausscom_file, process_gausslog_file, CHARGE, MULT
 from gaussian_wrangler import __version__
 
@@ -56,11 +57,14 @@ REQ_KEYS = {CUT_ATOMS: str,
 
 # For file processing
 CUT_PAIR_LIST = 'cut_pair_list'
-FRAGMENT = 'fragment'
 MAX_BOND_DIST = 1.9  # same length units as in input and output file, here Angstroms
 MAX_H_BOND_DIST = 1.5  # same length units as in input and output file, here Angstroms
 MAX_M_BOND_DIST = 2.3  # same length units as in input and output file, here Angstroms
 METALS = ['Ti', 'Sb', 'Ge']
+# see get_bond_codes
+METAL_CODE = 1
+H_CODE = 2
+BOND_CUTOFFS = np.array([MAX_BOND_DIST, MAX_M_BOND_DIST, MAX_H_BOND_DIST])
 
 
 def read_cfg(f_loc, cfg_proc=process_cfg):
@@ -138,6 +142,28 @@ def parse_cmdline(argv):
     return args, GOOD_RET
 
 
+def get_bond_codes(atom_types):
+    """
+    Categorizes atoms for choosing bond cutoffs: a pair is bonded if closer than BOND_CUTOFFS[max(code1, code2)], so
+        that the hydrogen cutoff is used if either atom is a hydrogen, otherwise the metal cutoff if either is a metal
+    :param atom_types: list of str, in atom id order
+    :return: int array of bond codes, in atom id order
+    """
+    atom_types = np.asarray(atom_types)
+    return np.where(atom_types == 'H', H_CODE, np.where(np.isin(atom_types, METALS), METAL_CODE, 0))
+
+
+def get_bond_lengths(atoms_content, bond_codes, atom_id):
+    """
+    :param atoms_content: Geometry
+    :param bond_codes: int array from get_bond_codes
+    :param atom_id: int, starting from 1
+    :return: two arrays, in atom id order: the distance from atom_id to each atom, and the largest distance for
+        which that atom would be considered bonded to atom_id
+    """
+    return atoms_content.distances_from(atom_id), BOND_CUTOFFS[np.maximum(bond_codes, bond_codes[atom_id - 1])]
+
+
 def validate_atom_num(atom_pair, atoms_content, gauss_in_fname, ignore_max_dist):
     # check that both atom numbers are not larger than the total number of atoms,
     # and that they are close enough to be bonded
@@ -145,7 +171,7 @@ def validate_atom_num(atom_pair, atoms_content, gauss_in_fname, ignore_max_dist)
         if atom_num not in atoms_content:
             raise InvalidDataError("Found atom id {} in '{}', but there are only {} atoms in the file {}"
                                    "".format(atom_num, CUT_ATOMS, len(atoms_content), gauss_in_fname))
-    pair_dist = calc_dist(atoms_content[atom_pair[0]][ATOM_COORDS], atoms_content[atom_pair[1]][ATOM_COORDS])
+    pair_dist = atoms_content.distances_from(atom_pair[0])[atom_pair[1] - 1]
     if pair_dist > MAX_BOND_DIST and not ignore_max_dist:
         raise InvalidDataError("Atom ids {} and {} are {:.2f} Angstroms apart, which is greater than "
                                "maximum bond distance of {:.2f}".format(atom_pair[0], atom_pair[1], pair_dist,
@@ -153,10 +179,21 @@ def validate_atom_num(atom_pair, atoms_content, gauss_in_fname, ignore_max_dist)
 
 
 def fragment_molecule(atom_pair, atoms_content, ignore_max_dist):
+    """
+    Splits the atoms into two fragments by breaking the bond between the atom pair
+    :param atom_pair: tuple of two atom ids (starting from 1)
+    :param atoms_content: Geometry
+    :param ignore_max_dist: flag if not making radicals
+    :return: the lists of atom ids in the smaller and larger fragment, flags for whether a double or triple bond
+        was broken, and an int array with the fragment number (1 or 2) of each atom, in atom id order
+    """
     broke_triple_bond = False
     broke_double_bond = False
     broke_double_bond_list = [False, False]
     single_bond_atoms = ['H', 'Cl', ]
+    atom_types = atoms_content.atom_types
+    bond_codes = get_bond_codes(atom_types)
+    frag_ids = np.zeros(len(atoms_content), dtype=int)
     unassigned_atom_numbers = list(range(1, len(atoms_content)+1))
     frag1_list = []
     frag2_list = []
@@ -164,67 +201,48 @@ def fragment_molecule(atom_pair, atoms_content, ignore_max_dist):
         for atom in atom_pair:
             # Check if fragment made up of just one atom
             lonely_frag = False
-            test_atom_type = atoms_content[atom][ATOM_TYPE]
+            test_atom_type = atom_types[atom - 1]
             if test_atom_type in single_bond_atoms:
                 lonely_frag = True
             elif test_atom_type == 'O' or test_atom_type == 'N':
-                for other_atom in unassigned_atom_numbers:
-                    lonely_frag = True
-                    if test_atom_type == 'O':
-                        broke_double_bond = True
-                    else:
-                        broke_triple_bond = True
-                    if other_atom == atom_pair[0] or other_atom == atom_pair[1]:
-                        continue
-                    pair_dist = calc_dist(atoms_content[atom][ATOM_COORDS], atoms_content[other_atom][ATOM_COORDS])
-                    if atoms_content[other_atom][ATOM_TYPE] == 'H':
-                        max_dist = MAX_H_BOND_DIST
-                    elif atoms_content[other_atom][ATOM_TYPE] in METALS:
-                        max_dist = MAX_M_BOND_DIST
-                    else:
-                        max_dist = MAX_BOND_DIST
-                    if pair_dist < max_dist:
-                        lonely_frag = False
-                        if test_atom_type == 'O':
-                            broke_double_bond = False
-                        else:
-                            broke_triple_bond = False
-                        break
+                other_atoms = np.array([other_atom for other_atom in unassigned_atom_numbers
+                                        if other_atom not in atom_pair], dtype=int)
+                # with no other atoms to bond to (e.g. CO), the atom is alone once the pair's bond is broken
+                lonely_frag = True
+                if len(other_atoms) > 0:
+                    pair_dists, max_dists = get_bond_lengths(atoms_content, bond_codes, atom)
+                    lonely_frag = not np.any(pair_dists[other_atoms - 1] < max_dists[other_atoms - 1])
+                if test_atom_type == 'O':
+                    broke_double_bond = lonely_frag
+                else:
+                    broke_triple_bond = lonely_frag
             if lonely_frag:
-                atoms_content[atom][FRAGMENT] = 1
+                frag_ids[atom - 1] = 1
                 frag1_list.append(atom)
                 unassigned_atom_numbers.remove(atom)
                 frag2_list = unassigned_atom_numbers
                 for other_atom in unassigned_atom_numbers:
-                    atoms_content[other_atom][FRAGMENT] = 2
-                return frag1_list, frag2_list, broke_double_bond, broke_triple_bond
+                    frag_ids[other_atom - 1] = 2
+                return frag1_list, frag2_list, broke_double_bond, broke_triple_bond, frag_ids
 
     # Now the more difficult cases
     frag1_list.append(atom_pair[0])
     unassigned_atom_numbers.remove(atom_pair[0])
-    atoms_content[atom_pair[0]][FRAGMENT] = 1
+    frag_ids[atom_pair[0] - 1] = 1
     frag2_list.append(atom_pair[1])
     unassigned_atom_numbers.remove(atom_pair[1])
-    atoms_content[atom_pair[1]][FRAGMENT] = 2
+    frag_ids[atom_pair[1] - 1] = 2
 
     if not ignore_max_dist:
         # first check for C=C
         for counter, atom in enumerate(atom_pair):
-            if atoms_content[atom][ATOM_TYPE] == 'C':
-                bonded_to_c = []
-                for other_atom in unassigned_atom_numbers:
-                    pair_dist = calc_dist(atoms_content[atom][ATOM_COORDS], atoms_content[other_atom][ATOM_COORDS])
-                    if atoms_content[other_atom][ATOM_TYPE] == 'H':
-                        max_dist = MAX_H_BOND_DIST
-                    elif atoms_content[other_atom][ATOM_TYPE] in METALS:
-                        max_dist = MAX_M_BOND_DIST
-                    else:
-                        max_dist = MAX_BOND_DIST
-                    if pair_dist < max_dist:
-                        bonded_to_c.append(other_atom)
+            if atom_types[atom - 1] == 'C':
+                pair_dists, max_dists = get_bond_lengths(atoms_content, bond_codes, atom)
+                bonded_to_c = [other_atom for other_atom in unassigned_atom_numbers
+                               if pair_dists[other_atom - 1] < max_dists[other_atom - 1]]
                 if len(bonded_to_c) == 2:
-                    type1 = atoms_content[bonded_to_c[0]][ATOM_TYPE]
-                    type2 = atoms_content[bonded_to_c[0]][ATOM_TYPE]
+                    type1 = atom_types[bonded_to_c[0] - 1]
+                    type2 = atom_types[bonded_to_c[0] - 1]
                     if type1 == 'O' and type2 == 'O':
                         broke_double_bond_list[counter] = False
                     else:
@@ -236,64 +254,60 @@ def fragment_molecule(atom_pair, atoms_content, ignore_max_dist):
 
     # first add to frag 1
     atoms_to_check = [atom_pair[0]]
-    add_atoms_to_fragment(unassigned_atom_numbers, atoms_content, atoms_to_check, frag1_list, 1, single_bond_atoms)
+    add_atoms_to_fragment(unassigned_atom_numbers, atoms_content, atoms_to_check, frag1_list, 1, single_bond_atoms,
+                          frag_ids, atom_types, bond_codes)
     # make sure no atoms in fragment 1 are within bonding distance of any atoms remaining in the
     # unassigned_atom_numbers list
-    for f1_atom in frag1_list:
-        for atom in unassigned_atom_numbers:
-            pair_dist = calc_dist(atoms_content[atom][ATOM_COORDS], atoms_content[f1_atom][ATOM_COORDS])
-            if atoms_content[atom][ATOM_TYPE] == 'H' or atoms_content[f1_atom][ATOM_TYPE] == 'H':
-                max_dist = MAX_H_BOND_DIST
-            elif atoms_content[atom][ATOM_TYPE] in METALS or atoms_content[f1_atom][ATOM_TYPE] in METALS:
-                max_dist = MAX_M_BOND_DIST
-            else:
-                max_dist = MAX_BOND_DIST
-            if pair_dist < max_dist:
+    if len(unassigned_atom_numbers) > 0:
+        unassigned_indices = np.array(unassigned_atom_numbers) - 1
+        for f1_atom in frag1_list:
+            pair_dists, max_dists = get_bond_lengths(atoms_content, bond_codes, f1_atom)
+            bonded = np.flatnonzero(pair_dists[unassigned_indices] < max_dists[unassigned_indices])
+            if len(bonded) > 0:
                 raise InvalidDataError("Found that atom {} assigned to fragment 1 is within {} Angstroms of atom {} "
-                                       "which was not assigned to fragment 1".format(f1_atom, max_dist, atom))
+                                       "which was not assigned to fragment 1"
+                                       "".format(f1_atom, max_dists[unassigned_indices[bonded[0]]],
+                                                 unassigned_atom_numbers[bonded[0]]))
     # check that all remaining atoms are bonded to each other
     atoms_to_check = [atom_pair[1]]
-    add_atoms_to_fragment(unassigned_atom_numbers, atoms_content, atoms_to_check, frag2_list, 2, single_bond_atoms)
+    add_atoms_to_fragment(unassigned_atom_numbers, atoms_content, atoms_to_check, frag2_list, 2, single_bond_atoms,
+                          frag_ids, atom_types, bond_codes)
     if len(unassigned_atom_numbers) > 0:
         raise InvalidDataError("Atoms {} were not assigned to either fragment 1 or 2.".format(unassigned_atom_numbers))
     frag1_list.sort()
     frag2_list.sort()
     if len(frag1_list) > len(frag2_list):
-        return frag2_list, frag1_list, broke_double_bond, broke_triple_bond
+        return frag2_list, frag1_list, broke_double_bond, broke_triple_bond, frag_ids
     else:
-        return frag1_list, frag2_list, broke_double_bond, broke_triple_bond
+        return frag1_list, frag2_list, broke_double_bond, broke_triple_bond, frag_ids
 
 
-def add_atoms_to_fragment(atom_numbers, atoms_content, atoms_to_check, frag_list, frag_num, single_bond_atoms):
+def add_atoms_to_fragment(atom_numbers, atoms_content, atoms_to_check, frag_list, frag_num, single_bond_atoms,
+                          frag_ids, atom_types, bond_codes):
     add_to_atoms_to_check = []
     while len(atoms_to_check) > 0:
         for check_atom in atoms_to_check:
-            atoms_to_remove_from_atom_list = []
-            for atom in atom_numbers:
-                pair_dist = calc_dist(atoms_content[atom][ATOM_COORDS], atoms_content[check_atom][ATOM_COORDS])
-                if atoms_content[atom][ATOM_TYPE] == 'H' or atoms_content[check_atom][ATOM_TYPE] == 'H':
-                    max_dist = MAX_H_BOND_DIST
-                elif atoms_content[atom][ATOM_TYPE] in METALS or atoms_content[check_atom][ATOM_TYPE] in METALS:
-                    max_dist = MAX_M_BOND_DIST
-                else:
-                    max_dist = MAX_BOND_DIST
-                if pair_dist < max_dist:
-                    frag_list.append(atom)
-                    atoms_content[atom][FRAGMENT] = frag_num
-                    # avoid changing list while iterating
-                    atoms_to_remove_from_atom_list.append(atom)
-                    if atoms_content[atom][ATOM_TYPE] not in single_bond_atoms:
-                        add_to_atoms_to_check.append(atom)
-            for atom in atoms_to_remove_from_atom_list:
+            if len(atom_numbers) == 0:
+                break
+            pair_dists, max_dists = get_bond_lengths(atoms_content, bond_codes, check_atom)
+            candidate_indices = np.array(atom_numbers) - 1
+            bonded_atoms = [atom_numbers[i] for i in
+                            np.flatnonzero(pair_dists[candidate_indices] < max_dists[candidate_indices])]
+            for atom in bonded_atoms:
+                frag_list.append(atom)
+                frag_ids[atom - 1] = frag_num
+                # avoid changing list while iterating
                 atom_numbers.remove(atom)
+                if atom_types[atom - 1] not in single_bond_atoms:
+                    add_to_atoms_to_check.append(atom)
         atoms_to_check = []
         for atom in add_to_atoms_to_check:
             atoms_to_check.append(atom)
         add_to_atoms_to_check = []
 
 
-def write_com_file(com_file_name, gauss_command, gauss_end, for_comment_line, atoms_content, broke_double_bond,
-                   broke_triple_bond, ignore_max_dist, charge, mult, frag_num=None, frag_list=None):
+def write_com_file(com_file_name, gauss_command, gauss_end, for_comment_line, atoms_content, frag_ids,
+                   broke_double_bond, broke_triple_bond, ignore_max_dist, charge, mult, frag_num=None, frag_list=None):
     """
     After figuring out the fragments, make Gaussian input files to calculate the counterpoint correction (if a non-zero
     list is passed to "frag_list". Otherwise, make a Gaussian input file to optimize any fragments with len > 1.
@@ -301,7 +315,8 @@ def write_com_file(com_file_name, gauss_command, gauss_end, for_comment_line, at
     :param gauss_command: str
     :param gauss_end: str or None
     :param for_comment_line: str
-    :param atoms_content: dictionary with atom type, atom coordinates, and fragment ID
+    :param atoms_content: Geometry
+    :param frag_ids: int array with the fragment number of each atom, in atom id order
     :param broke_double_bond: flag to change multiplicity
     :param broke_triple_bond: flag to change multiplicity
     :param ignore_max_dist: flag if not making radicals
@@ -322,12 +337,13 @@ def write_com_file(com_file_name, gauss_command, gauss_end, for_comment_line, at
         frag_charge = str(charge) + ' ' + str(mult + 1)
     if frag_list is None:
         frag_list = []
+    atom_types = atoms_content.atom_types
     if frag_num:
         # Don't bother making a separate file if just a few atoms; it would re
         if len(frag_list) < 7:
             element_list = []
             for atom_num in frag_list:
-                element_list.append(atoms_content[atom_num][ATOM_TYPE])
+                element_list.append(atom_types[atom_num - 1])
             print("Fragment {} is only {}".format(os.path.basename(com_file_name), element_list))
             return
         charge_mult = frag_charge
@@ -342,12 +358,11 @@ def write_com_file(com_file_name, gauss_command, gauss_end, for_comment_line, at
     print_list = [[gauss_command], [], [comment_begin + for_comment_line], [], [charge_mult]]
     for atom_num in frag_list:
         if frag_num:
-            atom_line = "{:7}".format(atoms_content[atom_num][ATOM_TYPE]) + \
-                        ' {:11.6f} {:11.6f} {:11.6f}'.format(*atoms_content[atom_num][ATOM_COORDS])
+            atom_line = "{:7}".format(atom_types[atom_num - 1]) + \
+                        ' {:11.6f} {:11.6f} {:11.6f}'.format(*atoms_content.coords[atom_num - 1])
         else:
-            atom_type_str = "{}(Fragment={})".format(atoms_content[atom_num][ATOM_TYPE],
-                                                     atoms_content[atom_num][FRAGMENT])
-            atom_line = '{:15}  {:11.6f} {:11.6f} {:11.6f}'.format(atom_type_str, *atoms_content[atom_num][ATOM_COORDS])
+            atom_type_str = "{}(Fragment={})".format(atom_types[atom_num - 1], frag_ids[atom_num - 1])
+            atom_line = '{:15}  {:11.6f} {:11.6f} {:11.6f}'.format(atom_type_str, *atoms_content.coords[atom_num - 1])
         print_list.append(atom_line)
     print_list.append([])
     if gauss_end:
@@ -357,23 +372,23 @@ def write_com_file(com_file_name, gauss_command, gauss_end, for_comment_line, at
     list_to_file(print_list, com_file_name)
 
 
-def print_com_files(atom_pair, atoms_content, gauss_in_fname, cfg, frag1, frag2, broke_double_bond, broke_triple_bond,
-                    ignore_max_dist, charge, mult):
+def print_com_files(atom_pair, atoms_content, frag_ids, gauss_in_fname, cfg, frag1, frag2, broke_double_bond,
+                    broke_triple_bond, ignore_max_dist, charge, mult):
     for_comment_line = 'from fragment pair {} and {}'.format(atom_pair, gauss_in_fname)
     # First print template for CP calc (the coordinates should later be replaced by further optimized coordinates,
     # if desired)
     cp_file_name = create_out_fname(gauss_in_fname, suffix='_{}_{}_cp'.format(*atom_pair),
                                     ext='.com', base_dir=cfg[OUT_BASE_DIR])
     write_com_file(cp_file_name, cfg[GAUSS_CP_COMMAND], cfg[GAUSS_CP_END], for_comment_line, atoms_content,
-                   broke_double_bond, broke_triple_bond, ignore_max_dist, charge, mult)
+                   frag_ids, broke_double_bond, broke_triple_bond, ignore_max_dist, charge, mult)
     frag1_file_name = create_out_fname(gauss_in_fname, suffix='_{}_{}_f1'.format(*atom_pair), ext='.com',
                                        base_dir=cfg[OUT_BASE_DIR])
     write_com_file(frag1_file_name, cfg[GAUSS_COMMAND], cfg[GAUSS_END], for_comment_line, atoms_content,
-                   broke_double_bond, broke_triple_bond, ignore_max_dist, charge, mult, 1, frag1)
+                   frag_ids, broke_double_bond, broke_triple_bond, ignore_max_dist, charge, mult, 1, frag1)
     frag2_file_name = create_out_fname(gauss_in_fname, suffix='_{}_{}_f2'.format(*atom_pair), ext='.com',
                                        base_dir=cfg[OUT_BASE_DIR])
     write_com_file(frag2_file_name, cfg[GAUSS_COMMAND], cfg[GAUSS_END], for_comment_line, atoms_content,
-                   broke_double_bond, broke_triple_bond, ignore_max_dist, charge, mult, 2, frag2)
+                   frag_ids, broke_double_bond, broke_triple_bond, ignore_max_dist, charge, mult, 2, frag2)
 
 
 def main(argv=None):
@@ -403,10 +418,10 @@ def main(argv=None):
         for atom_pair in cfg[CUT_PAIR_LIST]:
             validate_atom_num(atom_pair, atom_data, gauss_file, cfg[TWO_MOLECULES])
         for atom_pair in cfg[CUT_PAIR_LIST]:
-            frag1, frag2, broke_double_bond, broke_triple_bond = fragment_molecule(atom_pair, atom_data,
-                                                                                   cfg[TWO_MOLECULES])
-            print_com_files(atom_pair, atom_data, gauss_file, cfg, frag1, frag2, broke_double_bond, broke_triple_bond,
-                            cfg[TWO_MOLECULES], gauss_in_content[CHARGE], gauss_in_content[MULT])
+            frag1, frag2, broke_double_bond, broke_triple_bond, frag_ids = fragment_molecule(atom_pair, atom_data,
+                                                                                             cfg[TWO_MOLECULES])
+            print_com_files(atom_pair, atom_data, frag_ids, gauss_file, cfg, frag1, frag2, broke_double_bond,
+                            broke_triple_bond, cfg[TWO_MOLECULES], gauss_in_content[CHARGE], gauss_in_content[MULT])
     except IOError as e:
         warning("Problems reading file:", e)
         return IO_ERROR
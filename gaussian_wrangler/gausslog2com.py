@@ -10,7 +10,7 @@ import argparse
 from common_wrangler.common import (ATOM_NUM_DICT, NUM_ATOMS, GOOD_RET, INPUT_ERROR, IO_ERROR, INVALID_DATA, BASE_NAME,
                                     SEC_HEAD, SEC_ATOMS, SEC_TAIL, InvalidDataError, warning, check_for_files,
                                     create_out_fname, list_to_file)
-from gaussian_wrangler.gw_common import (GAU_COORD_PAT, GAU_SEP_PAT, GAU_E_PAT, GAU_CHARGE_PAT, GAU_STEP_PAT)
+from gaussian_wrangler.gw_common import GAU_CHARGE_PAT, iter_gausslog_steps, open_log, strip_compression_ext
 from gaussian_wrangler import __version__
 
 __author__ = 'hmayes'
@@ -27,9 +27,6 @@ OUT_BASE_DIR = 'output_directory'
 ATOM_TYPES = 'atom_type_dict'
 ATOM_HOLDER_PAT = re.compile(r"{atoms}")
 
-# For log file processing
-SEC_INITIAL_COORDINATES = 'initial_coordinates_section'
-
 
 def parse_cmdline(argv):
     """
@@ -82,127 +79,116 @@ def process_gausslog_files(gausslog_files, com_tpl_content, charge_from_log_flag
                               base_dir, out_fname)
 
 
-def process_gausslog_file(gausslog_file, com_tpl_content, charge_from_log_flag, find_low_energy, step_num,
-                          base_dir, out_fname):
-    with open(gausslog_file) as d:
-        rel_path_fname = os.path.relpath(gausslog_file)
-        # The header may be more than 5 lines long--counting from end makes sure the comment goes in the correct line
-        if find_low_energy:
-            com_tpl_content[SEC_HEAD][-3] = "Low energy conformation from file {}".format(rel_path_fname)
-        elif step_num:
-            step_num = int(step_num)
-            com_tpl_content[SEC_HEAD][-3] = "Conformation from step number {} in file {}".format(step_num,
-                                                                                                 rel_path_fname)
-        else:
-            com_tpl_content[SEC_HEAD][-3] = "Last conformation from file {}".format(rel_path_fname)
-        lowest_energy_found = 0.0
-        current_step_num = None
-        final_atoms_section = []
-        atom_type_list = []
-        section = SEC_HEAD
-        atom_id = 0
-        # so don't change the flag that is passed it, so if there is another log file it will also be checked
-        if not charge_from_log_flag:
-            find_charge = True
-        else:
-            find_charge = False
-
-        for line in d:
-            line = line.strip()
-            if len(line) == 0:
-                continue
-            # not currently keeping anything from the header
-            if section == SEC_HEAD:
-                if find_charge:
-                    if GAU_CHARGE_PAT.match(line):
-                        charge_mult = []
-                        while find_charge:
-                            split_line = line.split('=')
-                            charge_mult.append('{}  {}'.format(int(split_line[1].split()[0]),
-                                                               int(split_line[2].split()[0])))
+def read_log_charge_mult(gausslog_file):
+    """
+    Reads the charge and multiplicity line(s) near the start of a Gaussian output file
+    :param gausslog_file: str, Gaussian output file name
+    :return: a list of 'charge  multiplicity' strs (empty if none found) and, if more than one was found (e.g. for
+        counterpoise jobs), the list of atom types given in the input below them
+    """
+    charge_mult = []
+    atom_type_list = []
+    with open_log(gausslog_file) as d:
+        try:
+            for line in d:
+                line = line.strip()
+                if GAU_CHARGE_PAT.match(line):
+                    while GAU_CHARGE_PAT.match(line):
+                        split_line = line.split('=')
+                        charge_mult.append('{}  {}'.format(int(split_line[1].split()[0]),
+                                                           int(split_line[2].split()[0])))
+                        line = next(d).strip()
+                    if len(charge_mult) > 1:
+                        # originally just added whole line to final. Then found that this section prints fewer sig
+                        #   figs than the coordinate section, so only taking the atom types
+                        while len(line) > 0:
+                            atom_type_list.append(line.split()[0])
                             line = next(d).strip()
-                            if not GAU_CHARGE_PAT.match(line):
-                                if len(charge_mult) > 1:
-                                    section = SEC_INITIAL_COORDINATES
-                                    final_atoms_section = []
-                                    # already reading the next section, so grab the needed info
-                                    atom_type_list.append(line.split()[0])
-                                com_tpl_content[SEC_HEAD][-1] = '   '.join(charge_mult)
-                                find_charge = False
-                        continue
-                if step_num and GAU_STEP_PAT.match(line):
-                    split_line = line.split()
-                    current_step_num = int(split_line[2])
-                    if current_step_num == step_num:
-                        break
-
-                if GAU_COORD_PAT.match(line):
-                    atoms_section = []
-                    next(d)
-                    next(d)
-                    section = SEC_ATOMS
-                    continue
+                    break
+        except StopIteration:
+            pass
+    return charge_mult, atom_type_list
 
-            elif section == SEC_INITIAL_COORDINATES:
-                while len(line) > 0:
-                    # originally just added whole line to final. Then found that this section prints fewer sig figs
-                    #   than the coordinate section, so taking those instead
-                    atom_type_list.append(line.split()[0])
-                    line = next(d).strip()
-                while not GAU_COORD_PAT.match(line):
-                    line = next(d).strip()
-                next(d)
-                next(d)
-                line = next(d).strip()
-                while not GAU_SEP_PAT.match(line):
-                    split_line = line.split()
-                    atom_xyz = ["{:>12}".format(x) for x in split_line[3:6]]
-                    final_atoms_section.append('{:16}'.format(atom_type_list[atom_id]) + ' '.join(atom_xyz))
-                    atom_id += 1
-                    line = next(d).strip()
-                break
-            elif section == SEC_ATOMS:
-                if GAU_SEP_PAT.match(line):
-                    section = SEC_TAIL
-                    continue
 
-                split_line = line.split()
+def make_com_atoms_section(coord_table, com_tpl_content, gausslog_file):
+    """
+    Converts the coordinate table of one step of a Gaussian output file into the atoms section of a com file
+    :return: list of strs
+    """
+    atoms_section = []
+    for atom_id, line in enumerate(coord_table.splitlines()):
+        split_line = line.split()
+        try:
+            atom_type = ATOM_NUM_DICT[int(split_line[1])]
+        except KeyError:
+            raise InvalidDataError("Currently, this code only expects atom numbers up to 36 (Kr), and the "
+                                   "atomic number read was {}. Update the code to use this with your current "
+                                   "output.".format(split_line[1]))
+        if com_tpl_content[NUM_ATOMS]:
+            com_atom_type = re.split('[ (]', com_tpl_content[SEC_ATOMS][atom_id])[0].strip()
+            if com_atom_type != atom_type:
                 try:
-                    atom_type = ATOM_NUM_DICT[int(split_line[1])]
-                except KeyError:
-                    raise InvalidDataError("Currently, this code only expects atom numbers up to 36 (Kr), and the "
-                                           "atomic number read was {}. Update the code to use this with your current "
-                                           "output.".format(split_line[1]))
-                if com_tpl_content[NUM_ATOMS]:
-                    com_atom_type = re.split('[ (]', com_tpl_content[SEC_ATOMS][atom_id])[0].strip()
-                    if com_atom_type != atom_type:
-                        try:
-                            if ATOM_NUM_DICT[int(com_atom_type)] != atom_type:
-                                raise ValueError
-                        except ValueError:
-                            raise InvalidDataError("For atom number {}, {} has atom type '{}', while the template has "
-                                                   "atom type '{}'".format(atom_id+1, gausslog_file, atom_type,
-                                                                           com_atom_type))
-                    atom_type = com_tpl_content[SEC_ATOMS][atom_id]  # This keeps the "fragment" number if there
-                atom_type = '{:16}'.format(atom_type)
+                    if ATOM_NUM_DICT[int(com_atom_type)] != atom_type:
+                        raise ValueError
+                except ValueError:
+                    raise InvalidDataError("For atom number {}, {} has atom type '{}', while the template has "
+                                           "atom type '{}'".format(atom_id+1, gausslog_file, atom_type,
+                                                                   com_atom_type))
+            atom_type = com_tpl_content[SEC_ATOMS][atom_id]  # This keeps the "fragment" number if there
+        atom_type = '{:16}'.format(atom_type)
+
+        atom_xyz = ["{:>12}".format(x) for x in split_line[3:6]]
+        atoms_section.append(atom_type + ''.join(atom_xyz))
+    return atoms_section
 
+
+def process_gausslog_file(gausslog_file, com_tpl_content, charge_from_log_flag, find_low_energy, step_num,
+                          base_dir, out_fname):
+    rel_path_fname = os.path.relpath(gausslog_file)
+    # The header may be more than 5 lines long--counting from end makes sure the comment goes in the correct line
+    if find_low_energy:
+        com_tpl_content[SEC_HEAD][-3] = "Low energy conformation from file {}".format(rel_path_fname)
+    elif step_num:
+        step_num = int(step_num)
+        com_tpl_content[SEC_HEAD][-3] = "Conformation from step number {} in file {}".format(step_num,
+                                                                                             rel_path_fname)
+    else:
+        com_tpl_content[SEC_HEAD][-3] = "Last conformation from file {}".format(rel_path_fname)
+    lowest_energy_found = 0.0
+    final_atoms_section = []
+    charge_mult = []
+    atom_type_list = []
+    # so don't change the flag that is passed it, so if there is another log file it will also be checked
+    if not charge_from_log_flag:
+        charge_mult, atom_type_list = read_log_charge_mult(gausslog_file)
+        if charge_mult:
+            com_tpl_content[SEC_HEAD][-1] = '   '.join(charge_mult)
+
+    # steps are read one at a time, so that only the current one is held in memory
+    if len(charge_mult) > 1:
+        # only the initial coordinates are used, with the atom types from the input
+        for step in iter_gausslog_steps(gausslog_file):
+            for atom_id, line in enumerate(step.coord_table.splitlines()):
+                split_line = line.split()
                 atom_xyz = ["{:>12}".format(x) for x in split_line[3:6]]
-                atoms_section.append(atom_type + ''.join(atom_xyz))
-                atom_id += 1
-            elif section == SEC_TAIL:
-                if com_tpl_content[NUM_ATOMS] and atom_id != com_tpl_content[NUM_ATOMS]:
-                    raise InvalidDataError('In gausslog file: {}\n  found {} atoms, but the tpl expects '
-                                           '{} atoms'.format(gausslog_file, atom_id, com_tpl_content[NUM_ATOMS]))
-                if GAU_E_PAT.match(line):
-                    if find_low_energy:
-                        split_line = line.split()
-                        energy = float(split_line[4])
-                        if energy < lowest_energy_found:
-                            final_atoms_section = atoms_section[:]
-                    else:
-                        final_atoms_section = atoms_section[:]
-                    section = SEC_HEAD
-                    atom_id = 0
+                final_atoms_section.append('{:16}'.format(atom_type_list[atom_id]) + ' '.join(atom_xyz))
+            break
+    else:
+        for step in iter_gausslog_steps(gausslog_file):
+            atoms_section = make_com_atoms_section(step.coord_table, com_tpl_content, gausslog_file)
+            if step.scf_line is None:
+                break
+            if com_tpl_content[NUM_ATOMS] and len(atoms_section) != com_tpl_content[NUM_ATOMS]:
+                raise InvalidDataError('In gausslog file: {}\n  found {} atoms, but the tpl expects '
+                                       '{} atoms'.format(gausslog_file, len(atoms_section),
+                                                         com_tpl_content[NUM_ATOMS]))
+            if find_low_energy:
+                if step.energy < lowest_energy_found:
+                    final_atoms_section = atoms_section
+            else:
+                final_atoms_section = atoms_section
+            if step_num and step.step_num == step_num:
+                break
 
     if len(final_atoms_section) == 0:
         raise InvalidDataError("Check that the following log file has coordinates to use and/or specified step "
@@ -211,7 +197,8 @@ def process_gausslog_file(gausslog_file, com_tpl_content, charge_from_log_flag,
         f_name = create_out_fname(out_fname, base_dir=base_dir)
 
     else:
-        f_name = create_out_fname(gausslog_file, suffix='_' + com_tpl_content[BASE_NAME], ext='.com', base_dir=base_dir)
+        f_name = create_out_fname(strip_compression_ext(gausslog_file), suffix='_' + com_tpl_content[BASE_NAME],
+                                  ext='.com', base_dir=base_dir)
     list_to_file(com_tpl_content[SEC_HEAD] + final_atoms_section + com_tpl_content[SEC_TAIL], f_name)
 
     # Now that finished reading the file, first make sure didn't  exit before reaching the desired number of atoms
@@ -11,7 +11,7 @@ from configparser import ConfigParser, MissingSectionHeaderError
 from common_wrangler.common import (MAIN_SEC, SEC_HEAD, SEC_ATOMS, SEC_TAIL, PDB_FORMAT, NUM_ATOMS, ATOM_NUM_DICT,
                                     GOOD_RET, INPUT_ERROR, IO_ERROR, INVALID_DATA, InvalidDataError, warning,
                                     process_cfg, create_out_fname, list_to_file, process_pdb_file, silent_remove)
-from gaussian_wrangler.gw_common import (GAU_COORD_PAT, GAU_SEP_PAT, GAU_E_PAT)
+from gaussian_wrangler.gw_common import iter_gausslog_steps, strip_compression_ext
 from gaussian_wrangler import __version__
 
 __author__ = 'hmayes'
@@ -144,7 +144,7 @@ def process_gausscom_files(cfg, pdb_tpl_content):
             if cfg[OUTFILE_NAME]:
                 out_name = cfg[OUTFILE_NAME]
             else:
-                out_name = gausslog_file
+                out_name = strip_compression_ext(gausslog_file)
             f_name = create_out_fname(out_name, ext='.pdb', base_dir=cfg[OUT_BASE_DIR])
         process_gausslog_file(cfg, gausslog_file, pdb_tpl_content, f_name)
 
@@ -159,94 +159,82 @@ def check_and_print(cfg, atom_id, pdb_tpl_content, gausslog_file, pdb_data_secti
                  f_name, list_format=PDB_FORMAT, mode=mode, print_message=message)
 
 
+def make_pdb_data_section(cfg, coord_table, pdb_tpl_content, gausslog_file):
+    """
+    Converts the coordinate table of one step of a Gaussian output file into the atoms section of a pdb file
+    :return: the pdb atoms section (list of lists) and the number of atoms read
+    """
+    if cfg[PDB_TPL_FILE]:
+        pdb_data_section = copy.deepcopy(pdb_tpl_content[SEC_ATOMS])
+    else:
+        pdb_data_section = []
+    atom_id = 0
+    for line in coord_table.splitlines():
+        split_line = line.split()
+        if len(split_line) == 0:
+            continue
+        try:
+            element_type = ATOM_NUM_DICT[int(split_line[1])]
+        except KeyError:
+            raise InvalidDataError("Currently, this code only expects atom numbers up to 36 (Kr), and the "
+                                   "atomic number read was {}. Update the code to use this with your current "
+                                   "output.".format(split_line[1]))
+        # if working from a template, check atom type
+        if cfg[PDB_TPL_FILE]:
+            try:
+                pdb_element_type = pdb_data_section[atom_id][8].split(' ')[-1]
+            except IndexError:
+                raise InvalidDataError('Gausslog file: {}\n   has more atoms than the expected {} atoms in '
+                                       'the template file: {}'.
+                                       format(gausslog_file, pdb_tpl_content[NUM_ATOMS], cfg[PDB_TPL_FILE]))
+            if element_type != pdb_element_type:
+                warning("Atom element types do not match for atom number {}; pdb atom type is {} while "
+                        "gausscom type is {}".format(atom_id, pdb_element_type, element_type))
+        else:
+            pdb_data_section.append(atom_id)
+            atom_type = element_type
+            if cfg[ADD_NUM_TO_TYPE]:
+                # catch too long atom_type after adding number...
+                max_atom_num_length = 4 - len(atom_type)
+                atom_type += str(atom_id + 1)[:max_atom_num_length]
+            pdb_data_section[atom_id] = ['HETATM', '{:5d}'.format(atom_id + 1), ' {:4} '.format(atom_type),
+                                         'UNL  ', 1, 0.0, 0.0, 0.0,
+                                         '  1.00  0.00          {:>2}'.format(element_type)]
+        pdb_data_section[atom_id][5:8] = map(float, split_line[3:6])
+        atom_id += 1
+    return pdb_data_section, atom_id
+
+
 def process_gausslog_file(cfg, gausslog_file, pdb_tpl_content, f_name):
-    with open(gausslog_file) as d:
-        section = SEC_HEAD
-        atom_id = 0
-        lines_after_coord = 2  # blank line, description, blank line, charge & multiplicity
-        if cfg[COMBINE_LOGS]:
-            mode = 'a'
+    if cfg[COMBINE_LOGS]:
+        mode = 'a'
+    else:
+        mode = 'w'
+    message = True
+    first_pass = True
+    pdb_data_section = None
+    atom_id = 0
+
+    # steps are read one at a time, so that only the current one is held in memory
+    for step in iter_gausslog_steps(gausslog_file):
+        pdb_data_section, atom_id = make_pdb_data_section(cfg, step.coord_table, pdb_tpl_content, gausslog_file)
+        if step.scf_line is None:
+            # the file ended before the energy of these coordinates was printed; only kept for only_final_coords
+            break
+        if first_pass:
+            first_pass = False
         else:
-            mode = 'w'
-        message = True
-        coord_match = False
-        first_pass = True
-
-        for line in d:
-            line = line.strip()
-            if len(line) == 0:
-                continue
-            # not currently keeping anything from the header
-            if section == SEC_HEAD:
-                if GAU_COORD_PAT.match(line):
-                    coord_match = True
-                    if cfg[PDB_TPL_FILE]:
-                        pdb_data_section = copy.deepcopy(pdb_tpl_content[SEC_ATOMS])
-                    else:
-                        pdb_data_section = []
-                    continue
-                elif coord_match and lines_after_coord > 0:
-                    lines_after_coord -= 1
-                    if lines_after_coord == 0:
-                        section = SEC_ATOMS
-                    continue
-
-            elif section == SEC_ATOMS:
-                if GAU_SEP_PAT.match(line):
-                    section = SEC_TAIL
-                    continue
-
-                split_line = line.split()
-
-                try:
-                    element_type = ATOM_NUM_DICT[int(split_line[1])]
-                except KeyError:
-                    raise InvalidDataError("Currently, this code only expects atom numbers up to 36 (Kr), and the "
-                                           "atomic number read was {}. Update the code to use this with your current "
-                                           "output.".format(split_line[1]))
-                # if working from a template, check atom type
-                if cfg[PDB_TPL_FILE]:
-                    try:
-                        pdb_element_type = pdb_data_section[atom_id][8].split(' ')[-1]
-                    except IndexError:
-                        raise InvalidDataError('Gausslog file: {}\n   has more atoms than the expected {} atoms in '
-                                               'the template file: {}'.
-                                               format(gausslog_file, pdb_tpl_content[NUM_ATOMS], cfg[PDB_TPL_FILE]))
-                    if element_type != pdb_element_type:
-                        warning("Atom element types do not match for atom number {}; pdb atom type is {} while "
-                                "gausscom type is {}".format(atom_id, pdb_element_type, element_type))
-                else:
-                    pdb_data_section.append(atom_id)
-                    atom_type = element_type
-                    if cfg[ADD_NUM_TO_TYPE]:
-                        # catch too long atom_type after adding number...
-                        max_atom_num_length = 4 - len(atom_type)
-                        atom_type += str(atom_id + 1)[:max_atom_num_length]
-                    pdb_data_section[atom_id] = ['HETATM', '{:5d}'.format(atom_id + 1), ' {:4} '.format(atom_type),
-                                                 'UNL  ', 1, 0.0, 0.0, 0.0,
-                                                 '  1.00  0.00          {:>2}'.format(element_type)]
-                pdb_data_section[atom_id][5:8] = map(float, split_line[3:6])
-                atom_id += 1
-            elif section == SEC_TAIL:
-                if GAU_E_PAT.match(line):
-                    if first_pass:
-                        first_pass = False
-                    else:
-                        del pdb_tpl_content[SEC_HEAD][-1]
-                    pdb_tpl_content[SEC_HEAD].append("REMARK    {}".format(line))
-                    if not cfg[ONLY_FINAL]:
-                        check_and_print(cfg, atom_id, pdb_tpl_content, gausslog_file, pdb_data_section,
-                                        f_name, mode, message)
-                        if cfg[ONLY_FIRST]:
-                            return
-                        message = False
-                        mode = 'a'
-                    section = SEC_HEAD
-                    coord_match = False
-                    atom_id = 0
-                    lines_after_coord = 2
-
-    if len(pdb_tpl_content) == 0:
+            del pdb_tpl_content[SEC_HEAD][-1]
+        pdb_tpl_content[SEC_HEAD].append("REMARK    {}".format(step.scf_line))
+        if not cfg[ONLY_FINAL]:
+            check_and_print(cfg, atom_id, pdb_tpl_content, gausslog_file, pdb_data_section,
+                            f_name, mode, message)
+            if cfg[ONLY_FIRST]:
+                return
+            message = False
+            mode = 'a'
+
+    if pdb_data_section is None:
         raise InvalidDataError("Did not find Gaussian output coordinates in file {}".format(gausslog_file))
 
     if cfg[ONLY_FINAL]:
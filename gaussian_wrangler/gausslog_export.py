@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+"""
+Parses many Gaussian output files and writes the results to one columnar file, to be loaded with a single read
+(e.g. numpy.load or pandas.read_parquet) rather than by reading many per-file csv files.
+"""
+
+import os
+import sys
+import struct
+import zipfile
+import argparse
+import tempfile
+import functools
+import numpy as np
+from common_wrangler.common import (InvalidDataError, warning, check_for_files, silent_remove,
+                                    GOOD_RET, INPUT_ERROR, IO_ERROR, INVALID_DATA)
+from gaussian_wrangler.gw_common import (STOICH, CHARGE, MULT, ENERGY, ENTHALPY, GIBBS, TS, CONVERG, CONVERG_ERR,
+                                         CONVERG_STEP_DICT, MAX_FORCE, RMS_FORCE, MAX_DISPL, RMS_DISPL, STEP_NUM,
+                                         converg_step_array, map_in_order, call_capturing_output,
+                                         print_captured_output)
+from gaussian_wrangler.log_cache import get_gausslog_content, NO_CACHE_HELP
+from gaussian_wrangler import __version__
+
+
+__author__ = 'hmayes'
+
+# Constants #
+DEF_EXT = '.log'
+DEF_OUT_FNAME = 'gausslog_export.npz'
+DEF_JOBS = 1
+# number of files read before their rows are written, which bounds the memory used
+BATCH_SIZE = 256
+# number of rows of a column copied from its temporary file at a time when writing npz files
+CHUNK_SIZE = 65536
+PARQUET_EXT = '.parquet'
+# dtype of flags that may be undetermined (None): written to npz files as 1.0, 0.0, or nan (like the charge and
+#     multiplicity of files where they were not found), and to Parquet files as booleans that may be null
+OPTIONAL_BOOL = 'optional_bool'
+
+# Tables and their columns; in npz files, each column is stored as "<table>_<column>"
+FILE_TABLE = 'file'
+STEP_TABLE = 'step'
+FILE_COLUMNS = [('name', str), ('stoich', str), ('charge', np.float64), ('mult', np.float64),
+                ('energy', np.float64), ('enthalpy', np.float64), ('gibbs', np.float64), ('ts', OPTIONAL_BOOL),
+                ('converg', np.float64), ('converg_error', np.bool_), ('num_steps', np.int64)]
+STEP_COLUMNS = [('file_index', np.int64), ('step', np.int64), ('energy', np.float64), ('max_force', np.float64),
+                ('rms_force', np.float64), ('max_displ', np.float64), ('rms_displ', np.float64),
+                ('converg', np.float64), ('converg_error', np.bool_)]
+STEP_KEYS = [STEP_NUM, ENERGY, MAX_FORCE, RMS_FORCE, MAX_DISPL, RMS_DISPL, CONVERG, CONVERG_ERR]
+
+
+def parse_cmdline(argv):
+    """
+    Returns the parsed argument list and return code.
+    `argv` is a list of arguments, or `None` for ``sys.argv[1:]``.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # initialize the parser object:
+    parser = argparse.ArgumentParser(description="Reads Gaussian output files and writes, in one columnar file, a "
+                                                 "row for each file (stoichiometry, charge, multiplicity, "
+                                                 "energies, enthalpy, Gibbs free energy, transition state flag, "
+                                                 "and final convergence) and a row for each optimization step "
+                                                 "(energy and convergence values). The file is written as rows "
+                                                 "are read, so that any number of files can be exported.")
+    parser.add_argument("-d", "--directory", help="The directory where to look for Gaussian output files to export, "
+                                                  "without checking in subdirectories.", metavar="path", default=None)
+    parser.add_argument("-ds", "--dir_subdirs", help="The directory where to look for Gaussian output files to "
+                                                     "export, including checking in subdirectories.",
+                        metavar="path", default=None)
+    parser.add_argument("-e", "--extension", help="The extension of the Gaussian output file(s) to look for when "
+                                                  "searching a directory for output files. The default is '{}'."
+                                                  "".format(DEF_EXT), metavar="ext", default=DEF_EXT)
+    parser.add_argument("-f", "--file_name", help="A Gaussian output file name (with path, if not the current "
+                                                  "directory) to export. If used, this option overrides the '-d' "
+                                                  "option, and no searching for files is performed.",
+                        metavar="path", default=None)
+    parser.add_argument("-j", "--jobs", help="The number of processes to use to read Gaussian output files in "
+                                             "parallel (the default is {}).".format(DEF_JOBS), metavar="int",
+                        type=int, default=DEF_JOBS)
+    parser.add_argument("-l", "--file_list", help="A file name (with path, if not the current directory) with a "
+                                                  "list of Gaussian output files to export. If used, this option "
+                                                  "overrides the '-d' option, and no searching for files is "
+                                                  "performed.", metavar="path", default=None)
+    parser.add_argument("--no_cache", help=NO_CACHE_HELP, action="store_true", default=False)
+    parser.add_argument("-o", "--out_fname", help="The name of the file to create. A name ending in '.npz' (the "
+                                                  "default, '{}') is written for numpy.load, with each column "
+                                                  "saved as an array named '<table>_<column>' (e.g. 'file_energy', "
+                                                  "'step_converg'). A name ending in '{}' (which requires the "
+                                                  "'pyarrow' package) creates one Parquet file for each table, with "
+                                                  "'_{}' and '_{}' added to the name."
+                                                  "".format(DEF_OUT_FNAME, PARQUET_EXT, FILE_TABLE, STEP_TABLE),
+                        metavar="path", default=DEF_OUT_FNAME)
+    args = None
+    try:
+        args = parser.parse_args(argv)
+        if args.jobs < 1:
+            raise InvalidDataError("The number of jobs ('-j' option) must be a positive integer.")
+        out_ext = os.path.splitext(args.out_fname)[1].lower()
+        if out_ext not in ['.npz', PARQUET_EXT]:
+            raise InvalidDataError(f"The output file name must end in '.npz' or '{PARQUET_EXT}'.")
+    except (InvalidDataError, SystemExit) as e:
+        if hasattr(e, 'code') and e.code == 0:
+            return args, GOOD_RET
+        warning(e)
+        parser.print_help()
+        return args, INPUT_ERROR
+
+    return args, GOOD_RET
+
+
+def read_log_rows(fname, use_cache=True):
+    """
+    Parses a Gaussian output file into a row for the file table and the columns of its rows of the step table
+    :param fname: str, Gaussian output file name
+    :param use_cache: boolean, False to always parse the file, rather than reusing cached results
+    :return: dict of file column values and dict of step column arrays (without the file_index column)
+    """
+    # one parse gives the steps as read by check_gauss with the '-s' option, and the final convergence as with '-z'
+    log_content = get_gausslog_content(fname, use_cache=use_cache, find_step_converg=True, keep_final_converg=True)
+    step_array = converg_step_array(log_content[CONVERG_STEP_DICT])
+    step_columns = {column: step_array[key] for (column, _), key in zip(STEP_COLUMNS[1:], STEP_KEYS)}
+    file_row = {'name': os.path.relpath(fname), 'stoich': log_content[STOICH] or '',
+                'charge': np.nan if log_content.get(CHARGE) is None else log_content[CHARGE],
+                'mult': np.nan if log_content.get(MULT) is None else log_content[MULT],
+                'energy': log_content[ENERGY], 'enthalpy': log_content[ENTHALPY], 'gibbs': log_content[GIBBS],
+                'ts': log_content[TS], 'converg': log_content[CONVERG],
+                'converg_error': log_content[CONVERG_ERR] is True, 'num_steps': len(step_array)}
+    return file_row, step_columns
+
+
+class NpzColumnWriter:
+    """
+    Writes tables to an npz file one batch of rows at a time. Each column is appended to its own temporary file as
+        rows arrive, and the npz file is assembled from these when closed, so that no more than a batch of rows (and
+        a chunk of a string column) is held in memory. String columns are saved as fixed-width unicode arrays as wide
+        as the longest string.
+    """
+    def __init__(self, out_fname, tables):
+        """
+        :param out_fname: str, name of the npz file to write
+        :param tables: dict of table name to a list of (column name, dtype) tuples, with str as dtype for strings
+            and OPTIONAL_BOOL for flags that may be None
+        """
+        self.out_fname = out_fname
+        self.tables = tables
+        out_dir = os.path.dirname(os.path.abspath(out_fname))
+        self.spools = {}
+        for table, columns in tables.items():
+            for column, dtype in columns:
+                # the spooled file, the number of rows, and for strings, the most characters in a row
+                self.spools[(table, column)] = [tempfile.TemporaryFile(dir=out_dir), 0, 1]
+
+    def append(self, table, columns):
+        """
+        :param table: str, table name
+        :param columns: dict of column name to a 1-D array-like of values; all the table's columns must be given
+        """
+        for column, dtype in self.tables[table]:
+            spool = self.spools[(table, column)]
+            if dtype is str:
+                for value in columns[column]:
+                    encoded = value.encode()
+                    spool[0].write(struct.pack('<q', len(encoded)) + encoded)
+                    spool[2] = max(spool[2], len(value))
+                    spool[1] += 1
+            else:
+                if dtype is OPTIONAL_BOOL:
+                    values = np.array([np.nan if value is None else value for value in columns[column]],
+                                      dtype=np.float64)
+                else:
+                    values = np.asarray(columns[column], dtype=dtype)
+                spool[0].write(values.tobytes())
+                spool[1] += len(values)
+
+    def close(self):
+        try:
+            with zipfile.ZipFile(self.out_fname, 'w', zipfile.ZIP_STORED, allowZip64=True) as zip_file:
+                for table, columns in self.tables.items():
+                    for column, dtype in columns:
+                        spool_file, num_rows, max_len = self.spools[(table, column)]
+                        if dtype is str:
+                            out_dtype = np.dtype(f'<U{max_len}')
+                        else:
+                            out_dtype = np.dtype(np.float64 if dtype is OPTIONAL_BOOL else dtype)
+                        spool_file.seek(0)
+                        with zip_file.open(f'{table}_{column}.npy', 'w', force_zip64=True) as f:
+                            np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(out_dtype),
+                                                                     'fortran_order': False, 'shape': (num_rows,)})
+                            if dtype is str:
+                                write_str_chunks(spool_file, num_rows, out_dtype, f)
+                            else:
+                                while True:
+                                    data = spool_file.read(out_dtype.itemsize * CHUNK_SIZE)
+                                    if not data:
+                                        break
+                                    f.write(data)
+        except BaseException:
+            # do not leave a partly written npz file
+            silent_remove(self.out_fname)
+            raise
+        finally:
+            self.abort()
+        print(f"Wrote file: {os.path.relpath(self.out_fname)}")
+
+    def abort(self):
+        """
+        Discards the rows appended so far (the npz file is only created when closing)
+        """
+        for spool_file, _, _ in self.spools.values():
+            spool_file.close()
+
+
+def write_str_chunks(spool_file, num_rows, out_dtype, f):
+    """
+    Converts spooled length-prefixed strings to fixed-width unicode array data, a chunk of rows at a time
+    """
+    rows_left = num_rows
+    while rows_left > 0:
+        chunk = []
+        for _ in range(min(rows_left, CHUNK_SIZE)):
+            str_len = struct.unpack('<q', spool_file.read(8))[0]
+            chunk.append(spool_file.read(str_len).decode())
+        f.write(np.array(chunk, dtype=out_dtype).tobytes())
+        rows_left -= len(chunk)
+
+
+class ParquetColumnWriter:
+    """
+    Writes each table to its own Parquet file, one row group for each batch of rows
+    """
+    def __init__(self, out_fname, tables):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise InvalidDataError(f"Writing '{PARQUET_EXT}' files requires the 'pyarrow' package, which can be "
+                                   f"installed with: pip install pyarrow")
+        self.pa = pyarrow
+        self.tables = tables
+        root = os.path.splitext(out_fname)[0]
+        self.out_fnames = {table: f'{root}_{table}{PARQUET_EXT}' for table in tables}
+        self.writers = {}
+        try:
+            for table, columns in tables.items():
+                schema = pyarrow.schema([(column, parquet_type(pyarrow, dtype)) for column, dtype in columns])
+                self.writers[table] = pyarrow.parquet.ParquetWriter(self.out_fnames[table], schema)
+        except BaseException:
+            self.abort()
+            raise
+
+    def append(self, table, columns):
+        writer = self.writers[table]
+        writer.write_table(self.pa.table({column: columns[column] for column, _ in self.tables[table]},
+                                         schema=writer.schema))
+
+    def close(self):
+        for table, writer in self.writers.items():
+            writer.close()
+            print(f"Wrote file: {os.path.relpath(self.out_fnames[table])}")
+
+    def abort(self):
+        """
+        Closes and removes the Parquet files, which have only some of the rows
+        """
+        for table, writer in self.writers.items():
+            try:
+                writer.close()
+            finally:
+                silent_remove(self.out_fnames[table])
+
+
+def parquet_type(pyarrow, dtype):
+    if dtype is str:
+        return pyarrow.string()
+    if dtype is OPTIONAL_BOOL:
+        return pyarrow.bool_()
+    return pyarrow.from_numpy_dtype(dtype)
+
+
+def export_logs(check_file_list, out_fname, use_cache=True, jobs=DEF_JOBS):
+    """
+    Writes the file and step tables for the given Gaussian output files, writing the rows of BATCH_SIZE files at a
+        time. Files that cannot be read are skipped with a warning; if an error stops the export, no output file is
+        left.
+    :param check_file_list: list of Gaussian output file names
+    :param out_fname: str, the name of the npz or Parquet file to write
+    :param use_cache: boolean, False to always parse the files, rather than reusing cached results
+    :param jobs: int, number of processes to use to read files
+    :return: int, the number of files exported
+    """
+    tables = {FILE_TABLE: FILE_COLUMNS, STEP_TABLE: STEP_COLUMNS}
+    if os.path.splitext(out_fname)[1].lower() == PARQUET_EXT:
+        writer = ParquetColumnWriter(out_fname, tables)
+    else:
+        writer = NpzColumnWriter(out_fname, tables)
+    read_one_file = functools.partial(call_capturing_output, read_log_rows, use_cache=use_cache)
+    num_files = 0
+    file_rows = []
+    step_batch = []
+
+    def write_batch():
+        writer.append(FILE_TABLE, {column: [row[column] for row in file_rows] for column, _ in FILE_COLUMNS})
+        writer.append(STEP_TABLE, {column: np.concatenate([steps[column] for steps in step_batch])
+                                   for column, dtype in STEP_COLUMNS})
+        file_rows.clear()
+        step_batch.clear()
+
+    try:
+        # one pool reads all the files, and rows are written as they arrive, BATCH_SIZE files at a time
+        for fname, captured in zip(check_file_list, map_in_order(read_one_file, check_file_list, jobs=jobs)):
+            try:
+                file_row, step_columns = print_captured_output(captured)
+            except (InvalidDataError, ValueError, OSError) as e:
+                warning(f"Skipping file '{os.path.relpath(fname)}':", e)
+                continue
+            step_columns['file_index'] = np.full(len(step_columns['step']), num_files, dtype=np.int64)
+            file_rows.append(file_row)
+            step_batch.append(step_columns)
+            num_files += 1
+            if len(file_rows) == BATCH_SIZE:
+                write_batch()
+        if file_rows:
+            write_batch()
+        if num_files == 0:
+            raise InvalidDataError("None of the Gaussian output files could be read.")
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    return num_files
+
+
+def main(argv=None):
+    print(f"Running GaussianWrangler script gausslog_export version {__version__}")
+
+    args, ret = parse_cmdline(argv)
+    if ret != GOOD_RET or args is None:
+        return ret
+
+    try:
+        check_sub_dirs = False
+        search_dir = None
+        if args.dir_subdirs:
+            search_dir = args.dir_subdirs
+            check_sub_dirs = True
+        elif args.directory:
+            search_dir = args.directory
+        check_file_list = check_for_files(args.file_name, args.file_list, search_pattern=args.extension,
+                                          search_dir=search_dir, search_sub_dir=check_sub_dirs)
+        export_logs(check_file_list, args.out_fname, use_cache=not args.no_cache, jobs=args.jobs)
+
+    except IOError as e:
+        warning("Problems reading file:", e)
+        return IO_ERROR
+    except InvalidDataError as e:
+        warning("", e)
+        return INVALID_DATA
+
+    return GOOD_RET  # success
+
+
+if __name__ == '__main__':
+    status = main()
+    sys.exit(status)
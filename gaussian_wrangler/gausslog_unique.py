@@ -5,13 +5,19 @@ if atoms are in the same order, checks for duplicate conformers
 
 import os
 import sys
+import hashlib
 import argparse
+import itertools
+import numpy as np
 from numpy import isnan
 from configparser import MissingSectionHeaderError
 from common_wrangler.common import (InvalidDataError, warning,
                                     GOOD_RET, INPUT_ERROR, IO_ERROR, INVALID_DATA, DIHES, EHPART_TO_KCAL_MOL, quote,
-                                    list_to_file)
-from gaussian_wrangler.gw_common import (STOICH, CONVERG, ENERGY, ENTHALPY, GIBBS, CONVERG_ERR, process_gausslog_file)
+                                    list_to_file, SEC_ATOMS)
+from gaussian_wrangler.gw_common import (STOICH, CONVERG, ENERGY, ENTHALPY, GIBBS, CONVERG_ERR)
+from gaussian_wrangler.log_cache import get_gausslog_content, NO_CACHE_HELP
+from gaussian_wrangler.conformer_library import (ConfGroup, open_conformer_library, read_library_members,
+                                                 read_library_groups, save_library_groups)
 from gaussian_wrangler import __version__
 
 __author__ = 'hmayes'
@@ -40,6 +46,18 @@ MAX_H_BOND_DIST = 1.5  # same length units as in input and output file, here Ang
 MAX_M_BOND_DIST = 2.3  # same length units as in input and output file, here Angstroms
 METALS = ['Ti', 'Sb', 'Ge']
 
+# For the vectorized engine (cluster_conformers): files are compared to existing groups a block at a time, and the
+#     number of pairs of files and groups compared at once is limited to keep memory use low
+FILE_BLOCK_SIZE = 64
+MAX_BLOCK_PAIRS = 2 ** 20
+# the most dihedral differences to find at once, rather than one dihedral at a time for the pairs that still match
+MAX_DENSE_DIFFS = 2 ** 16
+# For the grid index (with the '--index' option): the number of dihedrals used to place each group on the grid, the
+#     most grid cells per dihedral, and the width of the cells, relative to the tolerance
+INDEX_DIMS = 3
+MAX_INDEX_CELLS = 360
+INDEX_CELL_TOL_RATIO = 1.2
+
 
 def parse_cmdline(argv):
     """
@@ -60,12 +78,29 @@ def parse_cmdline(argv):
     parser.add_argument("-g", "--gibbs", help="Sort output by lowest Gibbs free energy. If not found, the script will "
                                               "sort output by the lowest electronic energy. The default is False.",
                         action='store_true')
+    parser.add_argument("--canonical", help="Compare files whose atoms may be in different orders (e.g. conformers "
+                                            "from different programs): bonds are found from the final "
+                                            "coordinates, atoms are labeled by their place in the bond graph, and "
+                                            "files are compared by the dihedral angles about each bond, found from "
+                                            "the coordinates and keyed by the labels of their atoms. Files are only "
+                                            "compared if their bond graphs are the same.", action='store_true')
+    parser.add_argument("--index", help="Find the groups that a conformation may belong to with a grid of the values "
+                                        "of a few of its dihedral angles, instead of comparing it to every group. "
+                                        "The groups found are the same; this is faster for many conformations "
+                                        "with many different conformations.", action='store_true')
     parser.add_argument("-l", "--list", help="The file location of the list of Gaussian output files. There should "
                                              "be one output file listed per line. The default file name is '{}', "
                                              "located in the base directory where the program as "
                                              "run. This program assumes that all the given files have the same atom "
                                              "order.".format(DEF_LIST_FILE),
                         default=DEF_LIST_FILE)
+    parser.add_argument("--library", help="A conformer library file (created if it does not exist) that keeps the "
+                                          "unique conformations found in earlier runs with this option. Files "
+                                          "listed that are already in the library are not read again; the new "
+                                          "files are compared to the conformations in the library, which is then "
+                                          "updated, and the output lists the unique conformations of all files "
+                                          "in the library. The same '-t' and '-r' options must be used each time.",
+                        metavar="path", default=None)
     parser.add_argument("-m", "--max_diff", help="If a numerical value is provided with this option, the output list "
                                                  "will be split between files within or not within this maximum "
                                                  "difference, in kcal/mol), from the lowest energy or enthalpy. "
@@ -75,15 +110,22 @@ def parse_cmdline(argv):
     parser.add_argument("-n", "--enthalpy", help="Sort output by lowest enthalpy. If no enthalpy is found, it will "
                                                  "sort by the lowest electronic energy. The default is False.",
                         action='store_true')
+    parser.add_argument("--no_cache", help=NO_CACHE_HELP, action="store_true", default=False)
     parser.add_argument("-o", "--out_fname", help=f"When using the '-m'/'--max_diff' option, a file will be created "
                                                   f"with only the names of the files within the specified cutoff, one "
                                                   f"per line. This option allows the user to specify the output "
                                                   f"file name. By default, the name will be '{DEF_OUT_NAME}'.",
                         default=DEF_OUT_NAME)
 
+    parser.add_argument("-r", "--rmsd_tol", help="Also group files for which no dihedral angles were found (e.g. "
+                                                 "from optimizations in Cartesian coordinates), if the root-mean-"
+                                                 "square deviation (RMSD) of their final coordinates, after the best "
+                                                 "superposition, is within this tolerance, in Angstroms. Without this "
+                                                 "option, each such file is considered a unique conformation.",
+                        type=float, default=None)
     parser.add_argument("-t", "--tol", help="The tolerance, in degrees, for concluding that dihedral angles are "
                                             "equivalent. The default value is {}.".format(DEF_DIH_TOL),
-                        default=DEF_DIH_TOL)
+                        default=DEF_DIH_TOL, type=float)
 
     args = None
     try:
@@ -135,10 +177,433 @@ def compare_gausslog_info(log_info, dih_tol):
     return conf_groups
 
 
+def dihedral_array(dih_dicts):
+    """
+    Puts the dihedral angles of many files into one array
+    :param dih_dicts: list of dicts of dihedral names to values (in degrees)
+    :return: list of the dihedral names found in any of the dicts, and an (n_dicts, n_names) float array of the
+        values, with nan for dihedrals not in a dict
+    """
+    dih_names = {}
+    for dih_dict in dih_dicts:
+        for dih_name in dih_dict:
+            dih_names.setdefault(dih_name, len(dih_names))
+    dihes = np.full((len(dih_dicts), len(dih_names)), np.nan)
+    for row, dih_dict in zip(dihes, dih_dicts):
+        row[[dih_names[dih_name] for dih_name in dih_dict]] = list(dih_dict.values())
+    return list(dih_names), dihes
+
+
+def within_tol(dihes, rep_dihes, dih_tol):
+    """
+    Vectorized form of the check in compare_gausslog_info of whether a file has the same conformation as the first
+        member of a group: each of the file's dihedrals must also be found for the group, and differ by no more than
+        dih_tol, allowing for differences near 360 degrees. As most pairs differ in the first dihedrals compared, the
+        pairs are compared one dihedral at a time, and only the pairs that still match are compared further (unless
+        there are few enough to compare at once).
+    :param dihes: (n_files, n_dih) float array of the dihedrals of each file, with nan for dihedrals not found
+    :param rep_dihes: (n_reps, n_dih) float array of the dihedrals of the first member of each group, as above
+    :param dih_tol: float, the tolerance in degrees
+    :return: (n_files, n_reps) boolean array, true where a file has the same conformation as a group
+    """
+    max_diff = 360.0 - dih_tol * 1.1
+    if len(dihes) * len(rep_dihes) * dihes.shape[1] <= MAX_DENSE_DIFFS:
+        # few enough to compare all dihedrals of all pairs at once
+        diffs = np.abs(dihes[:, None, :] - rep_dihes[None, :, :])
+        outside_tol = (diffs > dih_tol) & (diffs <= max_diff)
+        outside_tol |= np.isnan(rep_dihes)[None, :, :] & ~np.isnan(dihes)[:, None, :]
+        return ~outside_tol.any(axis=2)
+    matches = np.zeros((len(dihes), len(rep_dihes)), dtype=bool)
+    # compare all pairs on the first dihedral, then only the remaining pairs on each next one
+    file_vals = dihes[:, :1]
+    rep_vals = rep_dihes[:, 0]
+    file_rows, rep_rows = None, None
+    for dih_index in range(dihes.shape[1]):
+        if dih_index > 0:
+            file_vals = dihes[file_rows, dih_index]
+            rep_vals = rep_dihes[rep_rows, dih_index]
+        diffs = np.abs(file_vals - rep_vals)
+        same = ~((diffs > dih_tol) & (diffs <= max_diff))
+        same &= ~np.isnan(rep_vals) | np.isnan(file_vals)
+        if dih_index == 0:
+            file_rows, rep_rows = np.nonzero(same)
+        else:
+            file_rows, rep_rows = file_rows[same], rep_rows[same]
+        if len(file_rows) == 0:
+            return matches
+    matches[file_rows, rep_rows] = True
+    return matches
+
+
+def assign_groups(dihes, dih_tol):
+    """
+    Groups conformations as compare_gausslog_info does: in order, each one joins the first group whose first member
+        has the same conformation (see within_tol), or starts a new group
+    :param dihes: (n_files, n_dih) float array of the dihedrals of each file, with nan for dihedrals not found
+    :param dih_tol: float, the tolerance in degrees
+    :return: (n_files,) int array of the row of the first member of the group of each row
+    """
+    n_files = len(dihes)
+    first_members = np.empty(n_files, dtype=np.intp)
+    # the first member of each group, and its dihedrals, in the order the groups were started
+    rep_rows = np.empty(n_files, dtype=np.intp)
+    rep_dihes = np.empty_like(dihes)
+    num_reps = 0
+    rep_chunk_size = max(1, MAX_BLOCK_PAIRS // FILE_BLOCK_SIZE)
+    for block_start in range(0, n_files, FILE_BLOCK_SIZE):
+        block_rows = np.arange(block_start, min(block_start + FILE_BLOCK_SIZE, n_files))
+        block_firsts = np.full(len(block_rows), -1)
+        for rep_start in range(0, num_reps, rep_chunk_size):
+            unmatched = np.flatnonzero(block_firsts < 0)
+            if len(unmatched) == 0:
+                break
+            rep_end = min(rep_start + rep_chunk_size, num_reps)
+            matches = within_tol(dihes[block_rows[unmatched]], rep_dihes[rep_start:rep_end], dih_tol)
+            has_match = matches.any(axis=1)
+            block_firsts[unmatched[has_match]] = rep_rows[rep_start + matches[has_match].argmax(axis=1)]
+        # the rest may match a group started by an earlier file of this block, or start a group
+        new_rows = block_rows[block_firsts < 0]
+        new_matches = within_tol(dihes[new_rows], dihes[new_rows], dih_tol)
+        block_reps = []
+        for new_index, row in enumerate(new_rows):
+            rep_matches = np.flatnonzero(new_matches[new_index, block_reps])
+            if len(rep_matches) > 0:
+                block_firsts[row - block_start] = new_rows[block_reps[rep_matches[0]]]
+            else:
+                block_reps.append(new_index)
+                block_firsts[row - block_start] = row
+                rep_rows[num_reps] = row
+                rep_dihes[num_reps] = dihes[row]
+                num_reps += 1
+        first_members[block_rows] = block_firsts
+    return first_members
+
+
+def grid_index_dims(dihes, dih_tol, max_dims=INDEX_DIMS):
+    """
+    Chooses the dihedrals to use for a grid index of conformations (see assign_groups_indexed): ones found for every
+        file, with the largest spread of values
+    :param dihes: (n_files, n_dih) float array of the dihedrals of each file, with nan for dihedrals not found
+    :param dih_tol: float, the tolerance in degrees
+    :param max_dims: int, the most dihedrals to use
+    :return: list of the column indices of the dihedrals to use (empty if a grid would not narrow the search), and the
+        number of grid cells per dihedral
+    """
+    if dih_tol > 0:
+        num_cells = min(MAX_INDEX_CELLS, int(360.0 // (dih_tol * INDEX_CELL_TOL_RATIO)))
+    else:
+        num_cells = MAX_INDEX_CELLS
+    found_cols = np.flatnonzero(~np.isnan(dihes).any(axis=0))
+    # with fewer than 3 cells, every cell neighbors every other; values outside (-180, 180] (not printed by
+    #     Gaussian) would not compare on the grid as in within_tol
+    if num_cells < 3 or len(found_cols) == 0 or np.abs(dihes[:, found_cols]).max() > 180.0:
+        return [], num_cells
+    angles = np.radians(dihes[:, found_cols])
+    circ_spread = 1.0 - np.hypot(np.cos(angles).mean(axis=0), np.sin(angles).mean(axis=0))
+    return found_cols[np.argsort(-circ_spread, kind='stable')[:max_dims]].tolist(), num_cells
+
+
+def assign_groups_indexed(dihes, dih_tol):
+    """
+    Returns the same groups as assign_groups, but instead of comparing each file to all earlier groups, only compares
+        it to those in neighboring cells of a periodic grid of the values of a few dihedrals (see grid_index_dims):
+        as the cells are wider than any difference within the tolerance, no group with the same conformation is
+        missed. Falls back to assign_groups if no dihedrals can be used for the grid.
+    :param dihes: (n_files, n_dih) float array of the dihedrals of each file, with nan for dihedrals not found
+    :param dih_tol: float, the tolerance in degrees
+    :return: (n_files,) int array of the row of the first member of the group of each row
+    """
+    index_cols, num_cells = grid_index_dims(dihes, dih_tol)
+    if not index_cols:
+        return assign_groups(dihes, dih_tol)
+    cells = np.floor((dihes[:, index_cols] + 180.0) * (num_cells / 360.0)).astype(np.intp) % num_cells
+    neighbor_offsets = np.array(list(itertools.product((-1, 0, 1), repeat=len(index_cols))))
+    # the rows of the first members of the groups in each cell, in the order the groups were started
+    grid = {}
+    first_members = np.empty(len(dihes), dtype=np.intp)
+    for row, row_cell in enumerate(cells):
+        candidates = []
+        for cell in ((row_cell + neighbor_offsets) % num_cells).tolist():
+            candidates.extend(grid.get(tuple(cell), ()))
+        if candidates:
+            candidates.sort()
+            matches = within_tol(dihes[row:row + 1], dihes[candidates], dih_tol)[0]
+            if matches.any():
+                first_members[row] = candidates[matches.argmax()]
+                continue
+        first_members[row] = row
+        grid.setdefault(tuple(row_cell.tolist()), []).append(row)
+    return first_members
+
+
+def kabsch_rmsd(coords, ref_coords):
+    """
+    Finds the RMSD of one structure from each of a stack of structures with the same atoms (in the same order), after
+        the best superposition (translation and proper rotation) of each pair, with the Kabsch algorithm; only the
+        singular values of the covariance matrices are needed, so the rotations are not made
+    :param coords: (N, 3) float array of the coordinates of one structure, centered at the origin
+    :param ref_coords: (n_ref, N, 3) float array of the coordinates of the other structures, each centered
+    :return: (n_ref,) float array of the RMSD from each structure
+    """
+    covariances = np.einsum('mni,nj->mij', ref_coords, coords)
+    sing_vals = np.linalg.svd(covariances, compute_uv=False)
+    # a reflection is not allowed, so when the best orthogonal transformation is one, the smallest term changes sign
+    sing_vals[:, -1] *= np.sign(np.linalg.det(covariances))
+    sq_devs = np.sum(coords ** 2) + np.sum(ref_coords ** 2, axis=(1, 2)) - 2.0 * sing_vals.sum(axis=1)
+    return np.sqrt(np.maximum(sq_devs, 0.0) / len(coords))
+
+
+def assign_groups_rmsd(coords, rmsd_tol):
+    """
+    Groups structures as assign_groups does, but with the same conformation defined by an RMSD (see kabsch_rmsd)
+        within the tolerance. Before superposing, groups are screened out with a lower bound of the RMSD: as atoms
+        keep their distances from the center in any superposition, the RMSD is at least the root-mean-square
+        difference in these distances, so only groups within the tolerance by this bound are superposed.
+    :param coords: (n_files, N, 3) float array of the coordinates of each file, with atoms in the same order
+    :param rmsd_tol: float, the tolerance in Angstroms
+    :return: (n_files,) int array of the row of the first member of the group of each row
+    """
+    centered = coords - coords.mean(axis=1, keepdims=True)
+    center_dists = np.linalg.norm(centered, axis=2)
+    num_atoms = coords.shape[1]
+    first_members = np.empty(len(coords), dtype=np.intp)
+    rep_rows = []
+    for row in range(len(coords)):
+        if rep_rows:
+            dist_diffs = center_dists[rep_rows] - center_dists[row]
+            candidates = np.flatnonzero(np.einsum('mn,mn->m', dist_diffs, dist_diffs) <= rmsd_tol ** 2 * num_atoms)
+            if len(candidates) > 0:
+                candidate_rows = np.asarray(rep_rows)[candidates]
+                matches = np.flatnonzero(kabsch_rmsd(centered[row], centered[candidate_rows]) <= rmsd_tol)
+                if len(matches) > 0:
+                    first_members[row] = candidate_rows[matches[0]]
+                    continue
+        first_members[row] = row
+        rep_rows.append(row)
+    return first_members
+
+
+def cluster_conformers(log_info, dih_tol, use_index=False, rmsd_tol=None):
+    """
+    Alternate engine for compare_gausslog_info, taking the same arguments and returning the same groups. Instead of
+        comparing the dihedrals of each file to those of each group one at a time, the dihedrals of all files with the
+        same stoichiometry are put in one array, and blocks of files are compared to the groups at once.
+    :param log_info: dict of file names to gausslog_content dicts (with the DIHES found, or None)
+    :param dih_tol: float, the tolerance in degrees
+    :param use_index: Boolean; if true, find the groups a file may belong to with a grid index (see
+        assign_groups_indexed), rather than comparing it to every group
+    :param rmsd_tol: None, or float: the RMSD tolerance, in Angstroms, to group files without dihedrals that have the
+        same atoms in the same order (see assign_groups_rmsd)
+    :return: list of lists of file names with the same conformation
+    """
+    group_assigner = assign_groups_indexed if use_index else assign_groups
+    stoich_files = {}
+    atoms_files = {}
+    for fname, gausslog_content in log_info.items():
+        if gausslog_content.get(DIHES) is not None:
+            stoich_files.setdefault(gausslog_content[STOICH], []).append(fname)
+        elif rmsd_tol is not None and gausslog_content[SEC_ATOMS].num_atoms > 0:
+            atomic_nums = gausslog_content[SEC_ATOMS].atomic_nums
+            atoms_files.setdefault((gausslog_content[STOICH], atomic_nums.tobytes()), []).append(fname)
+    first_members = {}
+    for fnames in stoich_files.values():
+        dihes = dihedral_array([log_info[fname][DIHES] for fname in fnames])[1]
+        for fname, first_row in zip(fnames, group_assigner(dihes, float(dih_tol)).tolist()):
+            first_members[fname] = fnames[first_row]
+    for fnames in atoms_files.values():
+        coords = np.stack([log_info[fname][SEC_ATOMS].coords for fname in fnames])
+        for fname, first_row in zip(fnames, assign_groups_rmsd(coords, rmsd_tol).tolist()):
+            first_members[fname] = fnames[first_row]
+
+    # any other file without dihedrals is in a group of its own
+    conf_groups = []
+    groups_by_first = {}
+    for fname in log_info:
+        first_member = first_members.get(fname, fname)
+        if first_member == fname:
+            groups_by_first[fname] = [fname]
+            conf_groups.append(groups_by_first[fname])
+        else:
+            groups_by_first[first_member].append(fname)
+    return conf_groups
+
+
+def better_converged(converg, best_converg):
+    """
+    As in print_results, the file with the lowest convergence is the best of a group, but a file with a convergence is
+        also better than one without
+    """
+    return converg < best_converg or (isnan(best_converg) and not isnan(converg))
+
+
+def update_conformer_library(conn, log_info, dih_tol, use_index=False, rmsd_tol=None):
+    """
+    Adds files to a conformer library: they are grouped with the groups in the library, as if the files already in the
+        library came first in the list of files (see cluster_conformers), and the best converged file of each group is
+        updated
+    :param conn: sqlite3 connection returned by open_conformer_library
+    :param log_info: dict of the names of files not in the library to gausslog_content dicts
+    :param dih_tol: float, the tolerance in degrees
+    :param use_index: Boolean; if true, use a grid index to find groups (see assign_groups_indexed)
+    :param rmsd_tol: None, or float: the RMSD tolerance, in Angstroms, for files without dihedrals
+    :return: a dict of the results of the best converged file of each group in the library, and a list of lists with
+        the name of that file, as used by print_results
+    """
+    lib_groups = read_library_groups(conn)
+    groups_by_first = {conf_group.first_member: conf_group for conf_group in lib_groups}
+    # only the first member of each group is compared to other files
+    compare_info = {conf_group.first_member: conf_group.first_content for conf_group in lib_groups}
+    compare_info.update(log_info)
+    for conf_list in cluster_conformers(compare_info, dih_tol, use_index=use_index, rmsd_tol=rmsd_tol):
+        first_member = conf_list[0]
+        if first_member in groups_by_first:
+            conf_group = groups_by_first[first_member]
+            new_members = conf_list[1:]
+        else:
+            gausslog_content = log_info[first_member]
+            first_content = {STOICH: gausslog_content[STOICH], DIHES: gausslog_content.get(DIHES)}
+            if first_content[DIHES] is None:
+                first_content[SEC_ATOMS] = gausslog_content[SEC_ATOMS]
+            conf_group = ConfGroup(first_member, first_content, None, {CONVERG: np.nan})
+            lib_groups.append(conf_group)
+            new_members = conf_list
+        for fname in new_members:
+            if conf_group.winner is None or better_converged(log_info[fname][CONVERG],
+                                                             conf_group.winner_content[CONVERG]):
+                conf_group.winner = fname
+                conf_group.winner_content = {key: log_info[fname][key] for key in
+                                             [CONVERG, ENERGY, ENTHALPY, GIBBS, CONVERG_ERR]}
+        conf_group.new_members = new_members
+    save_library_groups(conn, lib_groups, STOICH)
+    winner_info = {conf_group.winner: conf_group.winner_content for conf_group in lib_groups}
+    return winner_info, [[conf_group.winner] for conf_group in lib_groups]
+
+
+def bond_graph(geometry):
+    """
+    Finds bonds from interatomic distances, using the hydrogen cutoff (MAX_H_BOND_DIST) if either atom is a hydrogen,
+        otherwise the metal cutoff (MAX_M_BOND_DIST) if either is a metal, and otherwise MAX_BOND_DIST
+    :param geometry: Geometry
+    :return: (N, N) boolean adjacency array
+    """
+    atomic_nums = geometry.atomic_nums
+    dists = np.linalg.norm(geometry.coords[:, None, :] - geometry.coords[None, :, :], axis=2)
+    is_h = atomic_nums == 1
+    is_metal = np.isin(geometry.atom_types, METALS)
+    cutoffs = np.where(is_h[:, None] | is_h[None, :], MAX_H_BOND_DIST,
+                       np.where(is_metal[:, None] | is_metal[None, :], MAX_M_BOND_DIST, MAX_BOND_DIST))
+    bonds = dists <= cutoffs
+    np.fill_diagonal(bonds, False)
+    return bonds
+
+
+def graph_label(*parts):
+    """
+    :return: int, a hash of the parts (ints, or tuples of ints) that is the same in any process
+    """
+    return int.from_bytes(hashlib.blake2b(repr(parts).encode(), digest_size=8).digest(), 'little')
+
+
+def canonical_labels(atomic_nums, bonds):
+    """
+    Labels atoms by their place in a bond graph, independent of atom order (Weisfeiler-Lehman refinement, as for Morgan
+        fingerprints): starting from the element and number of bonds, each atom's label is repeatedly replaced with a
+        hash of its label and the sorted labels of its bonded atoms, until no more atoms are told apart
+    :param atomic_nums: (N,) int array
+    :param bonds: (N, N) boolean adjacency array
+    :return: list of int labels, in atom order; atoms with the same label are equivalent in the graph
+    """
+    neighbors = [np.flatnonzero(atom_bonds).tolist() for atom_bonds in bonds]
+    labels = [graph_label(atomic_num, len(atom_neighbors))
+              for atomic_num, atom_neighbors in zip(atomic_nums.tolist(), neighbors)]
+    num_classes = len(set(labels))
+    for _ in range(len(labels)):
+        labels = [graph_label(label, tuple(sorted(labels[neighbor] for neighbor in atom_neighbors)))
+                  for label, atom_neighbors in zip(labels, neighbors)]
+        new_num_classes = len(set(labels))
+        if new_num_classes == num_classes:
+            break
+        num_classes = new_num_classes
+    return labels
+
+
+def dihedral_angles(coords, quads):
+    """
+    :param coords: (N, 3) float array
+    :param quads: (n, 4) int array of the atom indices of each dihedral
+    :return: (n,) float array of the dihedral angles, in degrees, from -180 to 180
+    """
+    pos = coords[quads]
+    b0 = pos[:, 0] - pos[:, 1]
+    b1 = pos[:, 2] - pos[:, 1]
+    b2 = pos[:, 3] - pos[:, 2]
+    b1 /= np.linalg.norm(b1, axis=1, keepdims=True)
+    v = b0 - np.einsum('ij,ij->i', b0, b1)[:, None] * b1
+    w = b2 - np.einsum('ij,ij->i', b2, b1)[:, None] * b1
+    x = np.einsum('ij,ij->i', v, w)
+    y = np.einsum('ij,ij->i', np.cross(b1, v), w)
+    return np.degrees(np.arctan2(y, x))
+
+
+def canonical_content(gausslog_content):
+    """
+    Replaces the stoichiometry and dihedrals of a file with ones that do not depend on atom order: the stoichiometry
+        with a key for the bond graph, and the dihedrals with one for each bond between atoms that each have other
+        bonds, about the heaviest of the other atoms bonded to each that is not equivalent to another of them (see
+        canonical_labels). A dihedral is left out if there is no such atom (e.g. for a methyl group); dihedrals with
+        the same key (in symmetric molecules) are sorted by value.
+    :param gausslog_content: dict with the SEC_ATOMS Geometry
+    :return: a copy of gausslog_content with the STOICH key of the graph and the DIHES dict of dihedral keys to angles
+        (None if there are fewer than four atoms)
+    """
+    canon_content = dict(gausslog_content)
+    geometry = gausslog_content[SEC_ATOMS]
+    if geometry.num_atoms < 4:
+        canon_content[DIHES] = None
+        return canon_content
+    bonds = bond_graph(geometry)
+    atomic_nums = geometry.atomic_nums.tolist()
+    labels = canonical_labels(geometry.atomic_nums, bonds)
+    bond_pairs = np.argwhere(np.triu(bonds))
+    bond_labels = tuple(sorted(tuple(sorted((labels[atom1], labels[atom2]))) for atom1, atom2 in bond_pairs.tolist()))
+    graph_key = graph_label(tuple(sorted(labels)), bond_labels)
+    canon_content[STOICH] = f"{gausslog_content[STOICH]}:{graph_key:016x}"
+
+    quads = []
+    quad_keys = []
+    for atom1, atom2 in bond_pairs.tolist():
+        end_atoms = []
+        for center, other in [(atom1, atom2), (atom2, atom1)]:
+            end_candidates = [neighbor for neighbor in np.flatnonzero(bonds[center]).tolist() if neighbor != other]
+            candidate_labels = [labels[neighbor] for neighbor in end_candidates]
+            end_candidates = [neighbor for neighbor, label in zip(end_candidates, candidate_labels)
+                              if candidate_labels.count(label) == 1]
+            if len(end_candidates) == 0:
+                break
+            end_atoms.append(max(end_candidates, key=lambda neighbor: (atomic_nums[neighbor], labels[neighbor])))
+        if len(end_atoms) < 2:
+            continue
+        quad = [end_atoms[0], atom1, atom2, end_atoms[1]]
+        quad_key = tuple(labels[atom] for atom in quad)
+        # a dihedral has the same value read in either direction
+        if quad_key[::-1] < quad_key:
+            quad, quad_key = quad[::-1], quad_key[::-1]
+        quads.append(quad)
+        quad_keys.append(quad_key)
+    key_vals = {}
+    if quads:
+        for quad_key, dih_val in zip(quad_keys, dihedral_angles(geometry.coords, np.array(quads)).tolist()):
+            key_vals.setdefault(quad_key, []).append(dih_val)
+    canon_content[DIHES] = {}
+    for quad_key in sorted(key_vals):
+        for val_index, dih_val in enumerate(sorted(key_vals[quad_key])):
+            canon_content[DIHES]["-".join(f"{label:x}" for label in quad_key) + f"_{val_index}"] = dih_val
+    return canon_content
+
+
 def print_results(log_info, list_of_conf_lists, sort_by_enthalpy, sort_by_energy, max_diff=None, print_winners=True,
                   out_fname=DEF_OUT_NAME):
     winners = []
-    warn_files_str = ''
     for conf_list in list_of_conf_lists:
         if len(conf_list) == 1:
             low_conv_log = conf_list[0]
@@ -168,12 +633,13 @@ def print_results(log_info, list_of_conf_lists, sort_by_enthalpy, sort_by_energy
     else:
         sort_key = 4
     winners.sort(key=lambda tup: tup[sort_key])
-    winner_str = quote('","'.join(['File', CONVERG, ENERGY, ENTHALPY, GIBBS]))
+    winner_lines = [quote('","'.join(['File', CONVERG, ENERGY, ENTHALPY, GIBBS]))]
+    warn_files = []
 
     # now gather results
     cutoff_list = []
     if max_diff:
-        winner_str += ',"Diff(kcal/mol)"\n'
+        winner_lines[0] += ',"Diff(kcal/mol)"'
         lowest_val = winners[0][sort_key]
         if sort_by_enthalpy:
             sort_type = "enthalpy"
@@ -181,10 +647,9 @@ def print_results(log_info, list_of_conf_lists, sort_by_enthalpy, sort_by_energy
             sort_type = "SCF energy"
         else:
             sort_type = "Gibbs free energy"
-        winner_str += f'"Files within {sort_type} cutoff of {max_diff:.2f} kcal/mol"\n'
+        winner_lines.append(f'"Files within {sort_type} cutoff of {max_diff:.2f} kcal/mol"')
         within_cutoff = True
     else:
-        winner_str += '\n'
         lowest_val = None  # to make IDE happy
         within_cutoff = False
     val_diff_str = ""
@@ -202,16 +667,18 @@ def print_results(log_info, list_of_conf_lists, sort_by_enthalpy, sort_by_energy
 
             if within_cutoff:
                 if val_diff > max_diff:
-                    winner_str += f'"Files outside of cutoff:"\n'
+                    winner_lines.append('"Files outside of cutoff:"')
                     within_cutoff = False
                 else:
                     cutoff_list.append(winner)
 
-            winner_str += f'"{winner}",{converg:.4f},{energy:.6f},{enthalpy:.6f},{gibbs:.6f}{val_diff_str}\n'
+            winner_lines.append(f'"{winner}",{converg:.4f},{energy:.6f},{enthalpy:.6f},{gibbs:.6f}{val_diff_str}')
         if log_info[winner][CONVERG_ERR]:
-            warn_files_str += '\n    {:}:  {:.2f}'.format(winner, converg)
+            warn_files.append('\n    {:}:  {:.2f}'.format(winner, converg))
         elif log_info[winner][CONVERG_ERR] is None:
-            warn_files_str += '\n    {:}:  Not found'.format(winner)
+            warn_files.append('\n    {:}:  Not found'.format(winner))
+    winner_str = '\n'.join(winner_lines) + '\n'
+    warn_files_str = ''.join(warn_files)
     if print_winners:
         print(winner_str)
 
@@ -253,17 +720,38 @@ def main(argv=None):
             if len(missing_files) > 0:
                 raise IOError("Could not find the following file(s) listed in '{}':\n    "
                               "{}".format(args.list, '\n    '.join(sorted(set(missing_files)))))
-            if len(gausslog_files) < 2:
+            if len(gausslog_files) < 2 and args.library is None:
                 raise InvalidDataError("This program expects at least two files to compare to determine if they "
                                        "have the same conformation. Check input.")
 
+        library_conn = None
+        library_members = set()
+        if args.library:
+            library_options = {DIH_TOL: args.tol, 'rmsd_tolerance': args.rmsd_tol, 'canonical': args.canonical}
+            library_conn = open_conformer_library(args.library, library_options)
+            library_members = read_library_members(library_conn)
+
         # get the data from the files
         for gausslog_file in gausslog_files:
-            gausslog_content = process_gausslog_file(gausslog_file, find_dih=True, find_converg=True)
-            log_info[os.path.basename(gausslog_file)] = gausslog_content
+            base_name = os.path.basename(gausslog_file)
+            if base_name in library_members:
+                continue
+            gausslog_content = get_gausslog_content(gausslog_file, use_cache=not args.no_cache, find_dih=True,
+                                                    find_converg=True)
+            log_info[base_name] = gausslog_content
+
+        if args.canonical:
+            log_info = {fname: canonical_content(gausslog_content) for fname, gausslog_content in log_info.items()}
 
         # process data from files
-        list_of_conf_lists = compare_gausslog_info(log_info, args.tol)
+        if library_conn is None:
+            list_of_conf_lists = cluster_conformers(log_info, args.tol, use_index=args.index, rmsd_tol=args.rmsd_tol)
+        else:
+            log_info, list_of_conf_lists = update_conformer_library(library_conn, log_info, args.tol,
+                                                                    use_index=args.index, rmsd_tol=args.rmsd_tol)
+            library_conn.close()
+            if len(list_of_conf_lists) == 0:
+                raise InvalidDataError(f"No files have been added to conformer library '{args.library}'.")
         winner_str, warn_files_str = print_results(log_info, list_of_conf_lists, args.enthalpy, args.energy,
                                                    args.max_diff, args.out_fname)
         if len(warn_files_str) > 0:
@@ -1228,16 +1228,25 @@ def output_pes_temp_interval(options, delim_row, interval, interval_bbe_data, in
         j += 1
 
 
-def output_cosmos_rs_interval(files, options, s_m, l_o_t):
-    gsolv_dicts = None  # make IDE happy
+def find_scaling_data(level_of_theory):
+    """
+    :param level_of_theory: str, the level of theory (method/basis set) as returned by goodvibes_hm.read_initial
+    :return: ScalingData namedtuple for this level of theory (its 'zpe_fac' is the vibrational scaling factor used),
+        or None if it is not in SCALING_DATA
+    """
     scaling_data_tuple = namedtuple("ScalingData",
                                     ['level_basis', 'zpe_fac', 'zpe_ref', 'zpe_meth', 'harm_fac', 'harm_ref',
                                      'harm_meth', 'fund_fac', 'fund_ref', 'fund_meth'])
-    scaling_data_dict, scaling_data_dict_mod = {}, {}
+    scaling_data_dict_mod = {}
     for row in SCALING_DATA:
-        level_basis, zpe_fac, zpe_ref, zpe_meth, harm_fac, harm_ref, harm_meth, fund_fac, fund_ref, fund_meth = row
-        data = scaling_data_tuple(*row)
-        scaling_data_dict[level_basis.upper()] = scaling_data_dict_mod[level_basis.replace("-", "").upper()] = data
+        # as python types, since float32 factors lose precision in products with numpy >= 2 (e.g. h**2 underflows)
+        data = scaling_data_tuple(*row.tolist())
+        scaling_data_dict_mod[data.level_basis.replace("-", "").upper()] = data
+    return scaling_data_dict_mod.get(level_of_theory.upper())
+
+
+def output_cosmos_rs_interval(files, options, s_m, l_o_t):
+    gsolv_dicts = None  # make IDE happy
 
     # Attempt to automatically obtain frequency scale factor,
     # Application of freq scale factors requires all outputs to be same level of theory
@@ -1251,14 +1260,12 @@ def output_cosmos_rs_interval(files, options, s_m, l_o_t):
     else:
         # Look for vibrational scaling factor automatically
         if all_same(l_o_t):
-            level = l_o_t[0].upper()
-            for data in (scaling_data_dict_mod, scaling_data_dict_mod):
-                if level in data:
-                    options.freq_scale_factor = data[level].zpe_fac
-                    ref = SCALING_REFS[data[level].zpe_ref]
-                    print("\nFound vibrational scaling factor of {:.3f} for {} level of theory\n"
-                          "    REF: {}".format(options.freq_scale_factor, l_o_t[0], ref))
-                    break
+            data = find_scaling_data(l_o_t[0])
+            if data is not None:
+                options.freq_scale_factor = data.zpe_fac
+                ref = SCALING_REFS[data.zpe_ref]
+                print("\nFound vibrational scaling factor of {:.3f} for {} level of theory\n"
+                      "    REF: {}".format(options.freq_scale_factor, l_o_t[0], ref))
         else:  # Print files and different levels of theory found
             files_l_o_t, levels_l_o_t, filtered_calcs_l_o_t = [], [], []
             for file in files:
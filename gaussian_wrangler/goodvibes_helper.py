@@ -11,14 +11,19 @@ import re
 import sys
 import numpy as np
 import gaussian_wrangler.goodvibes_hm
+from gaussian_wrangler.goodvibes_hm import (calc_temp_range_thermochem, TEMPS, ENTHALPY, QH_ENTHALPY, GIBBS,
+                                            QH_GIBBS)
 import jpype
 import jpype.imports
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import defaultdict
 from common_wrangler.common import (InvalidDataError, warning, RG, KB, H, EHPART_TO_KCAL_MOL,
                                     GOOD_RET, INPUT_ERROR, IO_ERROR, INVALID_DATA,
                                     write_csv, create_out_fname, make_fig, parse_stoich, capture_stdout, list_to_file,
                                     round_sig_figs)
+from gaussian_wrangler.gw_common import (STOICH, CHARGE, MULT, FUNCTIONAL, BASIS_SET, SOLV, FREQS, GAUSS_VER,
+                                         read_job_info)
 from gaussian_wrangler import __version__
 
 __author__ = 'hmayes'
@@ -29,21 +34,19 @@ __author__ = 'hmayes'
 # Config keys
 DEF_OUT_FILE_NAME = 'aea_out.csv'
 
-# For data processing; standard hartree fieldnames below
+# For data processing; the job information (see gw_common.read_job_info) is named as the standard hartree fieldnames:
 # '"File Name","Solvent type","Stoichiometry","Charge","Mult","Functional","Basis Set","Energy (A.U.)","dipole",
 # "ZPE (Hartrees)","H298 (Hartrees)","G298 (Hartrees)","Freq 1","Freq 2","BSSE (Hartrees)"'
-FUNCTIONAL = 'Functional'
-BASIS_SET = 'Basis Set'
-SOLV = 'Solvent type'
-STOICH = 'Stoichiometry'
-FREQS = 'Frequencies 1 and 2'
 GAUSS_VER_PAT = re.compile(r"Gaussian.*:.*Rev.*")
 GOODVIBES_ERROR_PAT = re.compile(r"x .*")
-GOODVIBES_DATA_PAT = re.compile(r"Structure .*")
 REACT_PROD_SEP = 'TS'
+# ways to read the job information from output files
+NATIVE_BACKEND = 'native'
+HARTREE_BACKEND = 'hartree'
+BACKENDS = [NATIVE_BACKEND, HARTREE_BACKEND]
 
-HARTREE_OUT = 'hartree_output'
 GOODVIBES_OUT = 'goodvibes_output'
+THERMO = 'thermochemistry'
 
 # for printing
 FILE1 = 'file1'
@@ -68,11 +71,24 @@ OUTPUT_HEADERS = [FILE1, FILE2, FILE3, FILE4, FILE5, A, EA, DELTA_G_TEMP, RATE_C
 
 
 class HartreeWrapper:
+    """
+    Reads Gaussian output files with hartree's SnapshotLoader. The JVM is started when the first file is read, so that
+        importing this module (or printing help) does not require it.
+    """
     def __init__(self):
+        self.loader = None
+
+    def start(self):
+        """
+        Starts the JVM with the hartree jars on the class path, if not already done
+        :return: the SnapshotLoader
+        """
+        if self.loader is not None:
+            return self.loader
         jar_path = Path(__file__).parent / "hartree"
         found_jars = sorted(jar_path.glob('*.jar'))
         if len(found_jars) == 0:
-            raise Exception("Could not find any JARs in dir {}".format(jar_path))
+            raise InvalidDataError("Could not find any JARs in dir {}".format(jar_path))
 
         for found_jar in found_jars:
             jpype.addClassPath(found_jar)
@@ -86,27 +102,51 @@ class HartreeWrapper:
         from org.cmayes.hartree.loader.gaussian import SnapshotLoader
 
         self.loader = SnapshotLoader()
+        return self.loader
 
     def read_all_gaussian(self, files):
-        # noinspection PyUnresolvedReferences
-        from java.io import FileReader
-        mapped_results = {}
-        for cur_file in files:
-            mapped_results[cur_file] = self.loader.load(cur_file, FileReader(cur_file))
-
-        return mapped_results
+        return dict(self.load_gaussian_files(files))
 
     def read_gaussian(self, tgt_file):
+        loader = self.start()
         # noinspection PyUnresolvedReferences
         from java.io import FileReader
-        return self.loader.load(tgt_file, FileReader(tgt_file))
+        return loader.load(tgt_file, FileReader(tgt_file))
+
+    def load_gaussian_files(self, files, threads=None):
+        """
+        Reads many files in a pool of threads. Each thread calls into the JVM, which releases the GIL while the
+            file is parsed, so files are read in parallel on as many cores.
+        :param files: iterable of file names
+        :param threads: None or int, the number of threads to use (the default is the number of CPUs)
+        :return: generator of (file name, hartree result) tuples, in the order the files finish loading
+        """
+        files = list(files)
+        if len(files) == 0:
+            return
+        self.start()
+        if threads is None:
+            threads = os.cpu_count() or 1
+        threads = min(threads, len(files))
+        if threads == 1:
+            for fname in files:
+                yield fname, self.read_gaussian(fname)
+            return
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            futures = {executor.submit(self.read_gaussian, fname): fname for fname in files}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
 
     def __del__(self):
-        if jpype.isJVMStarted():
+        if self.loader is not None and jpype.isJVMStarted():
             jpype.shutdownJVM()
 
 
-# Jpype can't restart the JVM, so we make this global.
+# Jpype can't restart the JVM, so we make this global; the JVM is only started when a file is first read.
 hartree = HartreeWrapper()
 
 
@@ -127,7 +167,16 @@ def parse_cmdline(argv):
     parser.add_argument("-d", "--out_dir", help="A directory where output files should be saved. The default location "
                                                 "is the current working directory.", default=None)
     parser.add_argument("-f", dest="freq_cutoff", help="Cut-off frequency for both entropy and enthalpy (wavenumbers) "
-                                                       "(default = 0)", default="0")
+                                                       "(default = 0)", default=0.0, type=float)
+    parser.add_argument("-b", "--backend", help="How to read the job information (charge, multiplicity, solvent, "
+                                                "level of theory, stoichiometry, and frequencies) from Gaussian "
+                                                "output files: '{}' reads them directly, while '{}' uses the hartree "
+                                                "Java library (and so requires Java). The default is '{}'."
+                                                "".format(NATIVE_BACKEND, HARTREE_BACKEND, NATIVE_BACKEND),
+                        choices=BACKENDS, default=NATIVE_BACKEND)
+    parser.add_argument("-j", "--jobs", help="With the '{}' backend, the number of threads to use to read Gaussian "
+                                             "output files (the default is the number of CPUs)."
+                                             "".format(HARTREE_BACKEND), metavar="int", type=int, default=None)
     parser.add_argument("-l", "--list", help="The location of the list of Gaussian output files. "
                                              "The default file name.", default=None)
     parser.add_argument("-q", "--quasiharmonic", help="Use the '-q' option in GoodVibes, which turns on turns on "
@@ -190,7 +239,10 @@ def parse_cmdline(argv):
         if options.vib_scale:
             options.vib_scale = float(options.vib_scale)
 
-    except (SystemExit, ValueError) as e:
+        if options.jobs is not None and options.jobs < 1:
+            raise InvalidDataError("The number of jobs ('-j' option) must be a positive integer.")
+
+    except (SystemExit, ValueError, InvalidDataError) as e:
         if hasattr(e, 'code') and e.code == 0:
             return args, GOOD_RET
         warning(e)
@@ -200,26 +252,62 @@ def parse_cmdline(argv):
     return args, GOOD_RET
 
 
+def read_gauss_version(fname):
+    """
+    :param fname: str, Gaussian output file name
+    :return: the first three words of the Gaussian version line in the file header, or None if not found
+    """
+    with open(fname) as f:
+        for i, line in enumerate(f):
+            s_line = line.strip()
+            if GAUSS_VER_PAT.match(s_line):
+                return s_line.split()[:3]
+            # just in case not caught... don't read the whole file
+            if i >= 160:
+                break
+    return None
+
+
+def hartree_job_info(fname, gauss_result):
+    """
+    :param fname: str, Gaussian output file name
+    :param gauss_result: the result of reading the file with hartree's SnapshotLoader
+    :return: dict of job information, as returned by gw_common.read_job_info
+    """
+    solvent = gauss_result.getSolvent()
+    # later, a regex will be performed on STOICH, and it will expect a standard string, not a java.lang.String
+    return {GAUSS_VER: read_gauss_version(fname), CHARGE: int(gauss_result.getCharge()),
+            MULT: int(gauss_result.getMult()), SOLV: str(solvent) if solvent else None,
+            STOICH: str(gauss_result.getStoichiometry()), FUNCTIONAL: str(gauss_result.getFunctional()),
+            BASIS_SET: str(gauss_result.getBasisSet()), FREQS: list(gauss_result.getFrequencyValues())}
+
+
 def get_gauss_results(options, unique_fnames):
     """
-    Run hartree and goodvibes only once per file name
-    :param options: user-specified options, used here to determine goodvibes input
+    Read job information and run goodvibes only once per file name
+    :param options: user-specified options, used here to determine the backend and goodvibes input
     :param unique_fnames: a set of unique file names (really, file locations)
-    :return: results_dict: dictionary of results from running hartree and goodvibes
+    :return: results_dict: dictionary of results from reading each file and running goodvibes
     """
     results_dict = defaultdict(dict)
-    for fname in unique_fnames:
-        if fname != REACT_PROD_SEP:
-            base_name = os.path.basename(fname)
-            gauss_results = hartree.read_gaussian(fname)
-            solvent = gauss_results.getSolvent()
-
-            results_dict[base_name][HARTREE_OUT] = gauss_results
-            results_dict[base_name][SOLV] = solvent
-            results_dict[base_name][FREQS] = gauss_results.getFrequencyValues()
-            # later, a regex will be performed on STOICH, and it will expect a standard string, not a java.lang.String
-            results_dict[base_name][STOICH] = str(gauss_results.getStoichiometry())
-            vibes_input = [fname, "--ti", options.temp_range, "-f", options.freq_cutoff]
+    gauss_fnames = [fname for fname in unique_fnames if fname != REACT_PROD_SEP]
+    if options.backend == HARTREE_BACKEND:
+        job_infos = ((fname, hartree_job_info(fname, gauss_result)) for fname, gauss_result in
+                     hartree.load_gaussian_files(gauss_fnames, threads=options.jobs))
+    else:
+        job_infos = ((fname, read_job_info(fname)) for fname in gauss_fnames)
+    for fname, job_info in job_infos:
+        results_dict[os.path.basename(fname)].update(job_info)
+    for fname in gauss_fnames:
+        base_name = os.path.basename(fname)
+        solvent = results_dict[base_name][SOLV]
+        results_dict[base_name][THERMO] = calc_temp_range_thermochem(
+            fname, options.temp_range, conc=1.0 if solvent else False, qh=options.quasiharmonic,
+            s_freq_cutoff=options.freq_cutoff, h_freq_cutoff=options.freq_cutoff,
+            freq_scale_factor=options.vib_scale or False)
+        # the GoodVibes output is only made if it is to be saved
+        if options.save_vibes or options.tog_vibes:
+            vibes_input = [fname, "--ti", options.temp_range, "-f", str(options.freq_cutoff)]
             if solvent:
                 vibes_input += ["-c", "1"]
             if options.quasiharmonic:
@@ -243,7 +331,7 @@ def check_gausslog_fileset(file_set, good_vibes_check, results_dict):
         made GoodVibes checks optional to save run time
     :param file_set: list of reactant file(s) and TS file
     :param good_vibes_check: boolean to run goodvibes checking; will slow down calculations
-    :param results_dict: dictionary of results from running hartree and goodvibes
+    :param results_dict: dictionary of results from reading each file and running goodvibes
     :return: reaction_type: integer for molecularity of reaction
     """
     total_react_charge = 0
@@ -275,10 +363,10 @@ def check_gausslog_fileset(file_set, good_vibes_check, results_dict):
                 multiplicities[index] = multiplicities[index - 1]
             continue
 
-        # now start checks by getting info from hartree
-        gauss_result = results_dict[base_name][HARTREE_OUT]
-        freq_vals = results_dict[base_name][FREQS]
-        stoich = results_dict[base_name][STOICH]
+        # now start checks with the job information
+        job_info = results_dict[base_name]
+        freq_vals = job_info[FREQS]
+        stoich = job_info[STOICH]
 
         # exit effort if there files with more than one imaginary frequency
         if freq_vals[0] < 0 and freq_vals[1] < 0:
@@ -292,58 +380,47 @@ def check_gausslog_fileset(file_set, good_vibes_check, results_dict):
                                        "{}".format(fname, file_set[ts_index]))
             reading_reactants = False
             ts_index = index
-            ts_charge = gauss_result.getCharge()
+            ts_charge = job_info[CHARGE]
             ts_stoich_dict = parse_stoich(stoich)
         elif reading_reactants:
-            total_react_charge += gauss_result.getCharge()
+            total_react_charge += job_info[CHARGE]
             if len(react_stoich_dict) == 0:
                 react_stoich_dict = parse_stoich(stoich)
             else:
                 react_stoich_dict = parse_stoich(stoich, add_to_dict=react_stoich_dict)
         else:
-            total_product_charge += gauss_result.getCharge()
+            total_product_charge += job_info[CHARGE]
             if len(prod_stoich_dict) == 0:
                 prod_stoich_dict = parse_stoich(stoich)
             else:
                 prod_stoich_dict = parse_stoich(stoich, add_to_dict=prod_stoich_dict)
 
         # additional checks on all files as we go...
-        multiplicities[index] = int(gauss_result.getMult())
-        file_gauss_ver = None
-        i = 0
-        with open(fname) as f:
-            for line in f:
-                s_line = line.strip()
-                if GAUSS_VER_PAT.match(s_line):
-                    file_gauss_ver = s_line.split()[:3]
-                    break
-                i += 1
-                # just in case not caught... don't read the whole file
-                if i > 160:
-                    break
+        multiplicities[index] = job_info[MULT]
+        file_gauss_ver = job_info[GAUSS_VER]
         if index == 0:
             # make all lower case to remove chance of flagging this insignificant difference
-            solvent = str(results_dict[base_name][SOLV]).lower()
-            func = str(gauss_result.getFunctional()).lower()
+            solvent = str(job_info[SOLV]).lower()
+            func = str(job_info[FUNCTIONAL]).lower()
             # ignore differences between restricted and unrestricted versions of the functional
             if func.startswith("r") or func.startswith("u"):
                 func = func[1:]
-            basis = str(gauss_result.getBasisSet()).lower()
+            basis = str(job_info[BASIS_SET]).lower()
             gauss_ver = file_gauss_ver
         else:
-            if str(gauss_result.getSolvent()).lower() != solvent:
+            if str(job_info[SOLV]).lower() != solvent:
                 raise InvalidDataError("Different solvents ({}, {}) found for file set: "
-                                       "{}".format(solvent, gauss_result.getSolvent(), file_set))
+                                       "{}".format(solvent, job_info[SOLV], file_set))
             # ignore differences between restricted and unrestricted versions of the functional
-            current_func = str(gauss_result.getFunctional()).lower()
+            current_func = str(job_info[FUNCTIONAL]).lower()
             if current_func.startswith("u") or current_func.startswith("r"):
                 current_func = current_func[1:]
             if current_func != func:
                 raise InvalidDataError("Different functionals ({}, {}) found for file set: "
-                                       "{}".format(func, gauss_result.getFunctional(), file_set))
-            if str(gauss_result.getBasisSet()).lower() != basis:
+                                       "{}".format(func, job_info[FUNCTIONAL], file_set))
+            if str(job_info[BASIS_SET]).lower() != basis:
                 raise InvalidDataError("Different basis sets ({}, {}) found for file set: "
-                                       "{}".format(basis, gauss_result.getBasisSet(), file_set))
+                                       "{}".format(basis, job_info[BASIS_SET], file_set))
             if gauss_ver != file_gauss_ver:
                 warning("Different Gaussian versions ({}, {}) found for file set: {}".
                         format(gauss_ver, file_gauss_ver, file_set))
@@ -390,22 +467,22 @@ def check_gausslog_fileset(file_set, good_vibes_check, results_dict):
 
 def get_thermochem(file_set, results_dict, save_vibes, out_dir, tog_output_fname, qh_h_opt, write_mode):
     """
-    Calls GoodVibes to get thermochem at a range of temps
+    Collects the thermochem at a range of temps calculated with GoodVibes, and saves the GoodVibes output if requested
     :param file_set: list of reactant file(s), TS file (or separator), and optionally products
-    :param results_dict: dictionary of results from running hartree and goodvibes
+    :param results_dict: dictionary of results from reading each file and running goodvibes
     :param save_vibes: boolean to determine whether to save each GoodVibes output separately
     :param out_dir: directory to save GoodVibes output files (if requested)
     :param tog_output_fname: None or string (file name) if saving each GoodVibes output together
     :param qh_h_opt: boolean to use the '-q' option in GoodVibes (corrections to both entropy and enthalpy)
     :param write_mode: boolean to start a new to add to an all-together goodvibes output file
-    :return: nothing
+    :return: temps (np array), and lists of np arrays (kcal/mol) of h, qh_h, gt, qh_gt for each file
     """
     h = []
     qh_h = []
     gt = []
     qh_gt = []
     temps = []
-    for index, file in enumerate(file_set):
+    for file in file_set:
         base_name = os.path.basename(file)
         if file == REACT_PROD_SEP:
             h.append(np.full([len(temps)], np.nan))
@@ -413,53 +490,30 @@ def get_thermochem(file_set, results_dict, save_vibes, out_dir, tog_output_fname
             gt.append(np.full([len(temps)], np.nan))
             qh_gt.append(np.full([len(temps)], np.nan))
             continue
-        vibes_out = results_dict[base_name][GOODVIBES_OUT]
-        found_structure = False
-        skip_line = True
-        h.append([])
-        qh_h.append([])
-        gt.append([])
-        qh_gt.append([])
-        # we know the last line should be dropped, and at least the first 10
-        for line in vibes_out[10:-2]:
-            if GOODVIBES_ERROR_PAT.match(line):
-                raise InvalidDataError("See GoodVibes output: {}".format(vibes_out))
-            if not found_structure:
-                if GOODVIBES_DATA_PAT.match(line):
-                    found_structure = True
-                    continue
-            elif skip_line:
-                skip_line = False
-                continue
-            else:
-                vals = line.split()
-                if index == 0:
-                    temps.append(float(vals[1]))
-                h[index].append(float(vals[2]))
-                if qh_h_opt:
-                    qh_h[index].append(float(vals[3]))
-                gt[index].append(float(vals[-2]))
-                qh_gt[index].append(float(vals[-1]))
+        thermo_vals = results_dict[base_name][THERMO]
+        if len(temps) == 0:
+            temps = thermo_vals[TEMPS]
+        # for each molecule, multiply the array to convert to kcal/mol
+        h.append(thermo_vals[ENTHALPY] * EHPART_TO_KCAL_MOL)
+        if qh_h_opt:
+            qh_h.append(thermo_vals[QH_ENTHALPY] * EHPART_TO_KCAL_MOL)
+        else:
+            qh_h.append(np.asarray([]))
+        gt.append(thermo_vals[GIBBS] * EHPART_TO_KCAL_MOL)
+        qh_gt.append(thermo_vals[QH_GIBBS] * EHPART_TO_KCAL_MOL)
         if save_vibes:
+            vibes_out = results_dict[base_name][GOODVIBES_OUT]
             vibes_out_fname = os.path.relpath(create_out_fname(file, suffix='_vibes', base_dir=out_dir, ext='.dat'))
             list_to_file(vibes_out, vibes_out_fname, print_message=False)
             print('Saved GoodVibes output as: {}'.format(vibes_out_fname))
         if tog_output_fname:
+            vibes_out = results_dict[base_name][GOODVIBES_OUT]
             list_to_file(vibes_out, tog_output_fname, mode=write_mode, print_message=False)
             if write_mode == 'w':
                 print("Adding all GoodVibes output to: {}".format(tog_output_fname))
                 write_mode = "a"
 
-    temps = np.asarray(temps)
-    # for each molecule, multiply the array to convert to kcal/mol
-    for index in range(len(gt)):
-        h[index] = np.asarray(h[index]) * EHPART_TO_KCAL_MOL
-        if qh_h_opt:
-            qh_h[index] = np.asarray(qh_h[index]) * EHPART_TO_KCAL_MOL
-        gt[index] = np.asarray(gt[index]) * EHPART_TO_KCAL_MOL
-        qh_gt[index] = np.asarray(qh_gt[index]) * EHPART_TO_KCAL_MOL
-
-    return temps, h, qh_h, gt, qh_gt
+    return np.asarray(temps), h, qh_h, gt, qh_gt
 
 
 def get_deltas(temps, vals, ts_index):
@@ -37,10 +37,11 @@ import argparse
 import time
 import numpy as np
 from datetime import datetime, timedelta
-from gaussian_wrangler.vib_scale_factors import (GetOutData, CalcBBE)
+from gaussian_wrangler.vib_scale_factors import (GetOutData, CalcBBE, get_log_index)
+from gaussian_wrangler.gw_common import split_log_name, strip_compression_ext
 from gaussian_wrangler.goodvibes_functions import (ALPHABET, output_pes_temp_interval, create_plot, output_rel_e_data,
                                                    calc_enantio_excess, get_boltz, output_cosmos_rs_interval, all_same,
-                                                   print_check_fails)
+                                                   print_check_fails, find_scaling_data)
 from common_wrangler.common import (InvalidDataError, warning,
                                     GAS_CONSTANT, ATM_TO_KPA, AU_TO_J,
                                     GOOD_RET, INPUT_ERROR, INVALID_DATA, file_rows_to_list)
@@ -67,6 +68,16 @@ __version__ = "3.0.1.hmayes"
 
 SUPPORTED_EXTENSIONS = {'.out', '.log'}
 
+# keys of the arrays returned by calc_temp_range_thermochem (in Hartree, except TEMPS), named as the printed columns
+TEMPS = 'Temp/K'
+ENTHALPY = 'H'
+QH_ENTHALPY = 'qh-H'
+TS = 'T.S'
+QH_TS = 'T.qh-S'
+GIBBS = 'G(T)'
+QH_GIBBS = 'qh-G(T)'
+THERMO_KEYS = [ENTHALPY, QH_ENTHALPY, TS, QH_TS, GIBBS, QH_GIBBS]
+
 
 GOODVIBES_REF = ("Luchini, G.; Alegre-Requena J. V.; Guan, Y.; Funes-Ardoiz, I.; Paton, R. S. (2019)."
                  "\n         http://doi.org/10.5281/zenodo.595246")
@@ -116,101 +127,21 @@ SOLVENTS = {"water": (18.02, 0.998), "oxidane": (18.02, 0.998), "methanol": (32.
 
 def find_level_of_theory(file):
     # Read output for the level of theory and basis set used
-    repeated_theory = 0
-    with open(file) as f:
-        data = f.readlines()
-    level, bs = 'none', 'none'
-
-    for line in data:
-        if line.strip().find('External calculation') > -1:
-            level, bs = 'ext', 'ext'
-            break
-        bs, level = find_freq_sp_dlpno_cbs(bs, level, line, repeated_theory)
-    level_of_theory = '/'.join([level, bs])
-    return level_of_theory
-
-
-def find_freq_sp_dlpno_cbs(bs, level, line, repeated_theory):
-    if '\\Freq\\' in line.strip() and repeated_theory == 0:
-        try:
-            level, bs = (line.strip().split("\\")[4:6])
-            repeated_theory = 1
-        except IndexError:
-            pass
-    elif '|Freq|' in line.strip() and repeated_theory == 0:
-        try:
-            level, bs = (line.strip().split("|")[4:6])
-            repeated_theory = 1
-        except IndexError:
-            pass
-    if '\\SP\\' in line.strip() and repeated_theory == 0:
-        try:
-            level, bs = (line.strip().split("\\")[4:6])
-        except IndexError:
-            pass
-    elif '|SP|' in line.strip() and repeated_theory == 0:
-        try:
-            level, bs = (line.strip().split("|")[4:6])
-        except IndexError:
-            pass
-    if 'DLPNO BASED TRIPLES CORRECTION' in line.strip():
-        level = 'DLPNO-CCSD(T)'
-    if 'Estimated CBS total energy' in line.strip():
-        try:
-            bs = ("Extrapol." + line.strip().split()[4])
-        except IndexError:
-            pass
-    # Remove the restricted R or unrestricted U label
-    if level[0] in ('R', 'U'):
-        level = level[1:]
-    return bs, level
+    log_index = get_log_index(file)
+    log_index.check_error('find_level_of_theory')
+    return log_index.level_of_theory
 
 
 # At beginning of procedure, read level of theory, solvation model, and check for normal termination
 def read_initial(file):
-    with open(file) as f:
-        data = f.readlines()
-    level, bs, program, keyword_line = 'none', 'none', 'none', 'none'
-    progress, orientation = 'Incomplete', 'Input'
-    a, repeated_theory = 0, 0
-    no_grid = True
-    dft, dft_used, level, bs, scf_iradan, cphf_iradan = False, 'F', 'none', 'none', False, False
-
-    for line in data:
-        # Determine program to find solvation model used
-        if "Gaussian" in line:
-            program = "Gaussian"
-        if "* O   R   C   A *" in line:
-            program = "Orca"
-        # Grab pertinent information from file
-        if line.strip().find('External calculation') > -1:
-            level, bs = 'ext', 'ext'
-        if line.strip().find('Standard orientation:') > -1:
-            orientation = 'Standard'
-        if line.strip().find('IExCor=') > -1 and no_grid:
-            dft_used = line.split('=')[2].split()[0]
-            no_grid = False
-        bs, level = find_freq_sp_dlpno_cbs(bs, level, line, repeated_theory)
+    log_index = get_log_index(file)
+    log_index.check_error('read_initial')
+    program, keyword_line, dft_used = log_index.last_program, log_index.initial_keyword_line, log_index.dft_used
 
     # print(file,level)
     # Grab solvation models - Gaussian files
     solvation_model = None
     if program == 'Gaussian':
-        for i, line in enumerate(data):
-            if '#' in line.strip() and a == 0:
-                for j, d_line in enumerate(data[i:i + 10]):
-                    if '--' in d_line.strip():
-                        a = a + 1
-                        break
-                    if a != 0:
-                        break
-                    else:
-                        for k in range(len(d_line.strip().split("\n"))):
-                            keyword_line += d_line.strip().split("\n")[k]
-            if 'Normal termination' in line:
-                progress = 'Normal'
-            elif 'Error termination' in line:
-                progress = 'Error'
         keyword_line = keyword_line.lower()
         if 'scrf' not in keyword_line.strip():
             solvation_model = "gas phase"
@@ -239,22 +170,10 @@ def read_initial(file):
                     solvation_model = "scrf=" + keyword_line[start_scrf:end_scrf]
     # ORCA parsing for solvation model
     elif program == 'Orca':
-        keyword_line_1 = "gas phase"
-        keyword_line_2 = ''
-        keyword_line_3 = ''
-        for i, line in enumerate(data):
-            if 'CPCM SOLVATION MODEL' in line.strip():
-                keyword_line_1 = "CPCM,"
-            if 'SMD CDS free energy correction energy' in line.strip():
-                keyword_line_2 = "SMD,"
-            if "Solvent:              " in line.strip():
-                keyword_line_3 = line.strip().split()[-1]
-            if 'ORCA TERMINATED NORMALLY' in line:
-                progress = 'Normal'
-            elif 'error termination' in line:
-                progress = 'Error'
-        solvation_model = keyword_line_1 + keyword_line_2 + keyword_line_3
-    level_of_theory = '/'.join([level, bs])
+        solvation_model = log_index.orca_solvation
+    level_of_theory = log_index.initial_level_of_theory
+    progress = log_index.terminations.get(program, 'Incomplete')
+    orientation = log_index.orientation
 
     return level_of_theory, solvation_model, progress, orientation, dft_used
 
@@ -474,11 +393,13 @@ def check_files(files, thermo_data, options, delimiter_row, l_o_t):
         print(delimiter_row)
         names_spc, version_check_spc = [], []
         for file in files:
-            name, ext = os.path.splitext(file)
+            name, ext = split_log_name(file)
             if os.path.exists(name + '_' + options.spc + '.log'):
                 names_spc.append(name + '_' + options.spc + '.log')
             elif os.path.exists(name + '_' + options.spc + '.out'):
                 names_spc.append(name + '_' + options.spc + '.out')
+            elif os.path.exists(name + '_' + options.spc + ext):
+                names_spc.append(name + '_' + options.spc + ext)
 
         # Check SPC program versions
         version_check_spc = [thermo_data[key].sp_version_program for key in thermo_data]
@@ -695,6 +616,21 @@ def output_pes_data(options, thermo_data, delimiter_row, interval, interval_bbe_
         output_rel_e_data(options, delimiter_row, thermo_data)
 
 
+def parse_temp_interval(temperature_interval):
+    """
+    :param temperature_interval: str, initial temp, final temp, and (optionally) step size (K), separated by commas
+    :return: list of the initial temp, final temp, and step size, and np array of the temperatures in the range
+    """
+    temperature_interval = [float(temp) for temp in temperature_interval.split(',')]
+    # If no temperature step was defined, divide the region into 10
+    if len(temperature_interval) == 2:
+        temperature_interval.append((temperature_interval[1] - temperature_interval[0]) / 10.0)
+    # below assumes that the interval is great than 1; no big deal if it isn't
+    interval = np.arange(float(temperature_interval[0]), float(temperature_interval[1] + 1),
+                         float(temperature_interval[2]))
+    return temperature_interval, interval
+
+
 def variable_temp_analysis(options, delimiter_row, files, t_interval, interval_bbe_data, gas_phase):
     print("Variable-Temperature analysis of the enthalpy, entropy and the entropy at a constant "
           "pressure between")
@@ -702,13 +638,7 @@ def variable_temp_analysis(options, delimiter_row, files, t_interval, interval_b
         interval = t_interval
         print("    T init:  {:.2f},   T final: {:.2f}\n".format(interval[0], interval[-1]))
     else:
-        temperature_interval = [float(temp) for temp in options.temperature_interval.split(',')]
-        # If no temperature step was defined, divide the region into 10
-        if len(temperature_interval) == 2:
-            temperature_interval.append((temperature_interval[1] - temperature_interval[0]) / 10.0)
-        # below assumes that the interval is great than 1; no big deal if it isn't
-        interval = np.arange(float(temperature_interval[0]), float(temperature_interval[1] + 1),
-                             float(temperature_interval[2]))
+        temperature_interval, interval = parse_temp_interval(options.temperature_interval)
         print("    T init:  {:.2f},  T final:  {:.2f},  T interval: {:.2f}\n".
               format(temperature_interval[0], temperature_interval[1], temperature_interval[2]))
 
@@ -800,7 +730,7 @@ def variable_temp_analysis(options, delimiter_row, files, t_interval, interval_b
                                                  bbe.qh_gibbs_free_energy))
                     else:
                         if options.media.lower() in SOLVENTS and options.media.lower() == \
-                                os.path.splitext(os.path.basename(file))[0].lower():
+                                split_log_name(os.path.basename(file))[0].lower():
                             mw_solvent = SOLVENTS[options.media.lower()][0]
                             density_solvent = SOLVENTS[options.media.lower()][1]
                             concentration_solvent = (density_solvent * 1000) / mw_solvent
@@ -896,13 +826,15 @@ def main(argv=None):
                     clusters.append([])
             try:
                 # Look for file names
-                if os.path.splitext(elem)[1].lower() in SUPPORTED_EXTENSIONS:
+                # compressed files (e.g. 'name.log.gz') are read as the file type before the compression extension
+                if os.path.splitext(strip_compression_ext(elem))[1].lower() in SUPPORTED_EXTENSIONS:
                     if os.path.isfile(elem):
                         # skip repeats
                         if elem not in files:
                             if options.spc:
-                                name, ext = os.path.splitext(os.path.relpath(elem))
-                                if os.path.exists(name + '_spc.log') or os.path.exists(name + '_spc.out'):
+                                name, ext = split_log_name(os.path.relpath(elem))
+                                if os.path.exists(name + '_spc.log') or os.path.exists(name + '_spc.out') or \
+                                        os.path.exists(name + '_spc' + ext):
                                     files.append(elem)
                                 else:
                                     raise InvalidDataError("SPC calculation file '{}.{}' not found!\n    Make sure "
@@ -1130,7 +1062,7 @@ def main(argv=None):
                             else:
                                 # Media correction based on standard concentration of solvent
                                 if options.media.lower() in SOLVENTS and options.media.lower() == \
-                                        os.path.splitext(os.path.basename(file))[0].lower():
+                                        split_log_name(os.path.basename(file))[0].lower():
                                     mw_solvent = SOLVENTS[options.media.lower()][0]
                                     density_solvent = SOLVENTS[options.media.lower()][1]
                                     concentration_solvent = (density_solvent * 1000) / mw_solvent
@@ -1277,6 +1209,65 @@ def compute_thermochem(files, options, cosmo_solv=None, ssymm_option=False, vmm_
     return thermo_data
 
 
+def calc_temp_range_thermochem(file, temperature_interval, conc=False, qh=False, qs='grimme', s_freq_cutoff=100.0,
+                               h_freq_cutoff=100.0, freq_scale_factor=False, zpe_scale_factor=False, freespace='none',
+                               invert=False):
+    """
+    Calculates the thermochemistry of one output file at each temperature of a range, as main prints with the '--ti'
+        option, but returning the values (without rounding) instead of printing them
+    :param file: str, Gaussian output file name
+    :param temperature_interval: str, initial temp, final temp, and (optionally) step size (K) ('--ti' option)
+    :param conc: False for a pressure of 1 atm (gas phase), or float, the concentration (mol/l) ('-c' option)
+    :param qh: Boolean, to apply the quasi-harmonic enthalpy correction ('-q' option)
+    :param qs: str, the type of quasi-harmonic entropy correction ('--qs' option)
+    :param s_freq_cutoff: float, cut-off frequency for entropy (wavenumbers) ('--fs' option)
+    :param h_freq_cutoff: float, cut-off frequency for enthalpy (wavenumbers) ('--fh' option)
+    :param freq_scale_factor: False or float, the frequency scaling factor ('-v' option); if False, the factor found
+        for the file's level of theory is used, if any, or else 1.0
+    :param zpe_scale_factor: False or float, the zero-point energy scaling factor ('-z' option); if False, the same
+        as the frequency scaling factor
+    :param freespace: str, the solvent for the free space correction ('--freespace' option)
+    :param invert: False, or float, the (negative) cut-off below which imaginary frequencies are not made positive
+    :return: dict with TEMPS, an np array of the temperatures, and, for each of THERMO_KEYS, an np array of the values
+        (Hartree) at each temperature; QH_ENTHALPY is nan unless qh is True
+    """
+    level_of_theory, _, progress, _, _ = read_initial(file)
+    if progress != 'Normal':
+        raise InvalidDataError("{} termination found in file: {}".format(progress, os.path.relpath(file)))
+    # as main does, look for the scaling factor for the level of theory, or else use 1.0
+    if not freq_scale_factor:
+        scaling_data = find_scaling_data(level_of_theory)
+        if scaling_data is not None:
+            freq_scale_factor = scaling_data.zpe_fac
+    if not zpe_scale_factor:
+        zpe_scale_factor = freq_scale_factor
+    if not freq_scale_factor:
+        freq_scale_factor = 1.0
+    interval = parse_temp_interval(temperature_interval)[1]
+    thermo_vals = {key: np.full(len(interval), np.nan) for key in THERMO_KEYS}
+    thermo_vals[TEMPS] = interval
+    for i, temp in enumerate(interval):
+        if conc:
+            temp_conc = conc
+        else:
+            temp_conc = ATM_TO_KPA / GAS_CONSTANT / temp
+        bbe = CalcBBE(file, qs, qh, s_freq_cutoff, h_freq_cutoff, temp, temp_conc, freq_scale_factor,
+                      zpe_scale_factor, freespace, False, invert, 0.0, cosmo=False)
+        if bbe.linear_warning:
+            raise InvalidDataError("Potential invalid calculation of linear molecule from Gaussian in file: "
+                                   "{}".format(os.path.relpath(file)))
+        if not hasattr(bbe, "gibbs_free_energy"):
+            raise InvalidDataError("Could not find frequency information for: {}".format(os.path.relpath(file)))
+        thermo_vals[ENTHALPY][i] = bbe.enthalpy
+        if qh:
+            thermo_vals[QH_ENTHALPY][i] = bbe.qh_enthalpy
+        thermo_vals[TS][i] = temp * bbe.entropy
+        thermo_vals[QH_TS][i] = temp * bbe.qh_entropy
+        thermo_vals[GIBBS][i] = bbe.gibbs_free_energy
+        thermo_vals[QH_GIBBS][i] = bbe.qh_gibbs_free_energy
+    return thermo_vals
+
+
 if __name__ == '__main__':
     status = main()
     sys.exit(status)
@@ -5,7 +5,18 @@ Common methods for this project.
 """
 import re
 import os
+import io
+import sys
+import mmap
+import fnmatch
+import itertools
+import bz2
+import gzip
+import lzma
 import collections
+from contextlib import redirect_stdout, redirect_stderr, contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Mapping, Sequence
 import numpy as np
 from common_wrangler.common import (InvalidDataError, SEC_HEAD, SEC_ATOMS, SEC_TAIL, BASE_NAME,
                                     ATOM_TYPE, ATOM_COORDS, DIHES, ATOM_NUM_DICT, warning, get_fname_root,
@@ -33,6 +44,7 @@ MULTIPLICITY = 'Multiplicity'
 ENERGY = 'Energy'
 CONVERG_STEP_DICT = 'converg_dict'
 SCAN_DICT = 'scan_dict'
+SCAN_PARAMS = 'scan_params'
 MAX_FORCE = 'Max Force'
 RMS_FORCE = 'RMS Force'
 MAX_DISPL = 'Max Displacement'
@@ -42,7 +54,184 @@ CONVERG_ERR = 'Convergence_Error'
 ENTHALPY = 'Enthalpy'
 GIBBS = 'Gibbs_Free_E'
 TS = 'Transition_State'
+STEP_NUM = 'step_number'
+NEGLIGIBLE_FORCES = 'Negligible_Forces'
+NEGLIGIBLE_FORCES_ERR = "False (negligible forces)"
+# job information (named as by hartree, where applicable)
+FUNCTIONAL = 'Functional'
+BASIS_SET = 'Basis Set'
+SOLV = 'Solvent type'
+FREQS = 'Frequencies 1 and 2'
+GAUSS_VER = 'Gaussian version'
+# the convergence of each step as returned by converg_step_array
+CONVERG_STEP_DTYPE = np.dtype([(STEP_NUM, np.int64), (ENERGY, np.float64), (MAX_FORCE, np.float64),
+                               (RMS_FORCE, np.float64), (MAX_DISPL, np.float64), (RMS_DISPL, np.float64),
+                               (CONVERG, np.float64), (CONVERG_ERR, np.bool_), (NEGLIGIBLE_FORCES, np.bool_)])
 SCAN_STR = "  Scan  "
+TAIL_BLOCK_SIZE = 4096
+TAIL_TEXT_SIZE = 8192
+
+# For the mmap engine (scan_gausslog_file): the literal start of each stripped line matched by the patterns above
+GAU_COORD_KEY = b"Center     Atomic      Atomic             Coordinates"
+GAU_SEP_KEY = b"-" * 69
+GAU_E_KEY = b"SCF Done:"
+GAU_CHARGE_KEY = b"Charge ="
+GAU_STOICH_KEY = b"Stoichiometry"
+GAU_CONVERG_KEY = b"Item               Value     Threshold  Converge"
+GAU_DIH_KEY = b"! D"
+GAU_DERIV_KEY = b"! Name  Definition              Value          Derivative Info"
+GAU_H_KEY = b"Sum of electronic and thermal Enthalpies"
+GAU_STEP_KEY = b"Step number"
+HARM_FREQ_KEY = b"Harmonic frequencies"
+FREQ_KEY = b"Frequencies"
+GAU_VER_KEY = b"Gaussian"
+GAU_ROUTE_KEY = b"#"
+GAU_SOLV_KEY = b"Solvent"
+GAU_ARCHIVE_KEY = b"1\\1\\GINC"
+GAU_ARCHIVE_END = b"\\@"
+
+ELEMENT_NUM_DICT = {element: atomic_num for atomic_num, element in ATOM_NUM_DICT.items()}
+ELEMENT_PAT = re.compile(r"[A-Z][a-z]?")
+
+# largest number of items sent to a worker process at once by map_in_order
+MAX_CHUNK_SIZE = 64
+
+# compressed file extensions read by open_log, with the module that decompresses them (zstandard is optional)
+COMPRESSED_EXTS = {'.gz': gzip, '.xz': lzma, '.bz2': bz2, '.zst': None}
+
+
+class Geometry(Mapping):
+    """
+    The atoms of one structure, as an (N, 3) float64 array of Cartesian coordinates (coords) and an (N,) int8 array of
+        atomic numbers (atomic_nums). Gaussian input files can label atoms with more than their element (e.g.
+        "C(Fragment=1)"); such labels are kept, in atom order, in atom_labels.
+    Can also be used as the read-only dict the parsers used to return, with atom_id (starting from 1) as key to a dict
+        with ATOM_TYPE: atom_type (str), ATOM_COORDS: (np array, a view into coords).
+    """
+    def __init__(self, coords, atomic_nums, atom_labels=None):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        self.atomic_nums = np.asarray(atomic_nums, dtype=np.int8)
+        self.atom_labels = atom_labels
+        if len(self.atomic_nums) != len(self.coords) or (atom_labels is not None and
+                                                         len(atom_labels) != len(self.coords)):
+            raise InvalidDataError(f"Expected the same number of coordinates ({len(self.coords)}) and atom types "
+                                   f"({len(self.atomic_nums)})")
+
+    @classmethod
+    def from_atom_labels(cls, atom_labels, coords):
+        """
+        Makes a Geometry from the atom labels of a Gaussian input file; an unrecognized element has atomic number 0
+        """
+        atomic_nums = []
+        keep_labels = False
+        for label in atom_labels:
+            element_match = ELEMENT_PAT.match(label)
+            atomic_num = ELEMENT_NUM_DICT.get(element_match.group(0), 0) if element_match else 0
+            atomic_nums.append(atomic_num)
+            if label != ATOM_NUM_DICT.get(atomic_num):
+                keep_labels = True
+        return cls(coords, atomic_nums, atom_labels=list(atom_labels) if keep_labels else None)
+
+    @property
+    def num_atoms(self):
+        return len(self.atomic_nums)
+
+    @property
+    def atom_types(self):
+        """
+        :return: list of str, the atom labels if available, otherwise element symbols
+        """
+        if self.atom_labels is not None:
+            return list(self.atom_labels)
+        return [ATOM_NUM_DICT[atomic_num] for atomic_num in self.atomic_nums.tolist()]
+
+    def distances_from(self, atom_id):
+        """
+        :param atom_id: int, starting from 1
+        :return: (N,) array of the distances from atom_id to each atom
+        """
+        return np.linalg.norm(self.coords - self.coords[atom_id - 1], axis=1)
+
+    def __getitem__(self, atom_id):
+        if not isinstance(atom_id, (int, np.integer)) or not 0 < atom_id <= self.num_atoms:
+            raise KeyError(atom_id)
+        index = atom_id - 1
+        if self.atom_labels is not None:
+            atom_type = self.atom_labels[index]
+        else:
+            atom_type = ATOM_NUM_DICT[int(self.atomic_nums[index])]
+        return {ATOM_TYPE: atom_type, ATOM_COORDS: self.coords[index]}
+
+    def __iter__(self):
+        return iter(range(1, self.num_atoms + 1))
+
+    def __len__(self):
+        return self.num_atoms
+
+    def __eq__(self, other):
+        return (isinstance(other, Geometry) and np.array_equal(self.atomic_nums, other.atomic_nums) and
+                np.array_equal(self.coords, other.coords) and self.atom_labels == other.atom_labels)
+
+    def __repr__(self):
+        return f"Geometry(num_atoms={self.num_atoms})"
+
+
+class Trajectory(Sequence):
+    """
+    The coordinates of the same atoms at several steps of a job, as an (n_steps, N, 3) float64 array (coords), with the
+        (N,) int8 array of atomic numbers shared by all steps. Indexing by step returns a Geometry whose coordinates
+        are a view into coords.
+    """
+    def __init__(self, coords, atomic_nums, atom_labels=None):
+        self.atomic_nums = np.asarray(atomic_nums, dtype=np.int8)
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, len(self.atomic_nums), 3)
+        self.atom_labels = atom_labels
+
+    @classmethod
+    def from_geometries(cls, geometries):
+        """
+        :param geometries: non-empty sequence of Geometry objects, all with the same atoms in the same order
+        :return: Trajectory
+        """
+        first = geometries[0]
+        for step, geometry in enumerate(geometries):
+            if not np.array_equal(geometry.atomic_nums, first.atomic_nums):
+                raise InvalidDataError(f"Expected the same atoms in each step, but the atoms in step {step + 1} do "
+                                       f"not match those in the first step")
+        return cls(np.stack([geometry.coords for geometry in geometries]), first.atomic_nums,
+                   atom_labels=first.atom_labels)
+
+    @property
+    def num_atoms(self):
+        return len(self.atomic_nums)
+
+    def __getitem__(self, step):
+        if isinstance(step, slice):
+            return Trajectory(self.coords[step], self.atomic_nums, atom_labels=self.atom_labels)
+        return Geometry(self.coords[step], self.atomic_nums, atom_labels=self.atom_labels)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __repr__(self):
+        return f"Trajectory(n_steps={len(self)}, num_atoms={self.num_atoms})"
+
+
+def empty_geometry():
+    return Geometry(np.empty((0, 3)), [])
+
+
+def geometry_from_coord_table(coord_table):
+    """
+    Reads the rows of a Gaussian output coordinate table (center number, atomic number, atomic type, x, y, z)
+    :param coord_table: str, the rows of the table (without its header or final separator line)
+    :return: Geometry
+    """
+    values = coord_table.split()
+    # if the file ended while the table was being written, the last row can be incomplete; skip it
+    num_atoms = len(values) // 6
+    table = np.array(values[:num_atoms * 6], dtype=np.float64).reshape(num_atoms, 6)
+    return Geometry(table[:, 3:], table[:, 1])
 
 
 def process_gausscom_file(gausscom_file):
@@ -50,14 +239,15 @@ def process_gausscom_file(gausscom_file):
     #    SEC_HEAD: header (route section, blank lines, comments, and full charge and multiplicity line)
     #    CHARGE: overall charge (only) as int
     #    MULT: overall multiplicity (only) as int
-    #    SEC_ATOMS: atoms as a dict of dicts, with atom_id as key to dict with
-    #        ATOM_TYPE: atom_type (str), ATOM_COORDS: (np array)
+    #    SEC_ATOMS: atoms as a Geometry (which can also be used as a dict of dicts, with atom_id as key to dict with
+    #        ATOM_TYPE: atom_type (str), ATOM_COORDS: (np array))
     #    SEC_TAIL: everything including and after the blank line following SEC_ATOMS
     with open(gausscom_file) as d:
-        gausscom_content = {SEC_HEAD: [], SEC_ATOMS: {}, SEC_TAIL: [],
+        gausscom_content = {SEC_HEAD: [], SEC_ATOMS: empty_geometry(), SEC_TAIL: [],
                             BASE_NAME: get_fname_root(gausscom_file)}
         section = SEC_HEAD
-        atom_id = 1
+        atom_labels = []
+        atom_coords = []
         blank_header_lines = 0
 
         for line in d:
@@ -88,35 +278,129 @@ def process_gausscom_file(gausscom_file):
                     gausscom_content[SEC_TAIL].append(line)
                     continue
                 split_line = line.split()
-                atom_type = split_line[0]
-                atom_xyz = np.array(list(map(float, split_line[1:4])))
-                gausscom_content[SEC_ATOMS][atom_id] = {ATOM_TYPE: atom_type, ATOM_COORDS: atom_xyz}
-                atom_id += 1
+                atom_labels.append(split_line[0])
+                # templates (e.g. for pdbs2gausscoms) may have a placeholder (e.g. '${atoms}') rather than atoms with
+                #     coordinates; only lines with coordinates must be read as such
+                if len(split_line) > 1:
+                    try:
+                        atom_coords.append([float(coord) for coord in split_line[1:4]])
+                    except ValueError:
+                        raise InvalidDataError("Error in reading file {}\n  as a Gaussian input file. On a line "
+                                               "where an atom type and coordinates are expected, "
+                                               "found: '{}'".format(gausscom_file, line))
+                    if len(atom_coords[-1]) != 3:
+                        raise InvalidDataError("Error in reading file {}\n  as a Gaussian input file. Expected "
+                                               "three coordinates after the atom type, but found: "
+                                               "'{}'".format(gausscom_file, line))
 
             elif section == SEC_TAIL:
                 gausscom_content[SEC_TAIL].append(line)
 
+    if atom_labels and len(atom_coords) == len(atom_labels):
+        gausscom_content[SEC_ATOMS] = Geometry.from_atom_labels(atom_labels, np.array(atom_coords, dtype=np.float64))
     return gausscom_content
 
 
+def get_compression_ext(file_name):
+    """
+    Returns the compression extension (e.g. '.gz') of a file name, or an empty string if open_log reads it as is
+    :param file_name: str, file name
+    :return: str, the lower-case compression extension, or ''
+    """
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext in COMPRESSED_EXTS:
+        return ext
+    return ''
+
+
+def strip_compression_ext(file_name):
+    """
+    Removes any compression extension, so that names of files made from "name.log.gz" are based on "name.log"
+    :param file_name: str, file name
+    :return: str, the file name without its compression extension
+    """
+    return file_name[:len(file_name) - len(get_compression_ext(file_name))]
+
+
+def split_log_name(file_name):
+    """
+    As os.path.splitext, but keeping any compression extension with the extension it follows, so that
+        "name.log.gz" is split into "name" and ".log.gz"
+    :param file_name: str, file name
+    :return: tuple of strs: the file name without extensions, and the extension(s)
+    """
+    root, ext = os.path.splitext(strip_compression_ext(file_name))
+    return root, file_name[len(root):]
+
+
+def open_log(file_name, mode='r'):
+    """
+    Opens a file for reading, decompressing it as it is read if its name ends with '.gz', '.xz', '.bz2', or '.zst'
+    :param file_name: str, name of the file to open
+    :param mode: str, 'r' (text) or 'rb' (bytes)
+    :return: a file object
+    """
+    compression_ext = get_compression_ext(file_name)
+    if not compression_ext:
+        return open(file_name, mode)
+    text_mode = 'b' not in mode
+    if compression_ext == '.zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise InvalidDataError(f"Reading '{os.path.basename(file_name)}' requires the 'zstandard' package, "
+                                   f"which can be installed with: pip install zstandard")
+        if text_mode:
+            return zstandard.open(file_name, 'rt')
+        # buffered, so that it can also be read by line
+        return io.BufferedReader(zstandard.open(file_name, 'rb'))
+    return COMPRESSED_EXTS[compression_ext].open(file_name, 'rt' if text_mode else 'rb')
+
+
+@contextmanager
+def log_bytes(file_name):
+    """
+    Provides the contents of a Gaussian output file for the mmap engine: a plain file is memory-mapped, while a
+        compressed file is decompressed whole into memory, as the engine looks ahead and back within the file. Thus,
+        scan_gausslog_file and iter_gausslog_steps instead read compressed files one line at a time.
+    :param file_name: str, name of the file to read
+    :return: context manager giving a bytes-like object, or None for an empty file
+    """
+    if get_compression_ext(file_name):
+        with open_log(file_name, 'rb') as f:
+            data = f.read()
+        yield data if data else None
+        return
+    with open(file_name, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # an empty file cannot be mapped, and has nothing to read
+            yield None
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield buffer
+
+
 def process_gausslog_file(gausslog_file, find_dih=False, find_converg=False, find_step_converg=False,
-                          last_step_to_read=None, collect_scan_steps=False):
+                          last_step_to_read=None, collect_scan_steps=False, keep_final_converg=False):
     # Grabs and stores in gausslog_content as a dictionary with the keys:
     #    (fyi: unlike process_gausscom_file, no SEC_HEAD is collected)
     #    CHARGE: overall charge (only) as int
     #    MULT: overall multiplicity (only) as int
-    #    SEC_ATOMS: atoms as a dict of dicts, with atom_id as key to dict with
-    #        ATOM_TYPE: atom_type (str), ATOM_COORDS: (np array)
+    #    SEC_ATOMS: atoms as a Geometry (which can also be used as a dict of dicts, with atom_id as key to dict with
+    #        ATOM_TYPE: atom_type (str), ATOM_COORDS: (np array)), from the last step read
     #    SEC_TAIL: everything including and after the blank line following SEC_ATOMS
+    # With find_step_converg, the convergence of each step is stored in CONVERG_STEP_DICT, and CONVERG and
+    #    CONVERG_ERR are only stored if keep_final_converg is True, with the values of the last step read: the same
+    #    final convergence report as found with find_converg alone, without parsing the file again
 
     # The mode argument is optional; 'r' will be assumed if it’s omitted. (so read-only below)
     base_name = os.path.basename(gausslog_file)
-    with open(gausslog_file) as d:
-        gausslog_content = {SEC_ATOMS: {}, BASE_NAME: base_name, STOICH: None, TS: None,
+    with open_log(gausslog_file) as d:
+        gausslog_content = {SEC_ATOMS: empty_geometry(), BASE_NAME: base_name, STOICH: None, TS: None,
                             ENERGY: np.nan, ENTHALPY: np.nan, GIBBS: np.nan,
                             CONVERG_STEP_DICT: collections.OrderedDict(), SCAN_DICT: {}}
         section = SEC_HEAD
-        atom_id = 1
+        coord_lines = None
         scan_parameter = None
         # using step convergence for collecting scan step energies, so set flag to true
         if collect_scan_steps:
@@ -152,28 +436,15 @@ def process_gausslog_file(gausslog_file, find_dih=False, find_converg=False, fin
                                 line = next(d).strip()
                             gausslog_content[DIHES] = dih_dict
                         else:
-                            # the initial parameters indicate which parameter will be scanned, otherwise search for
-                            #     parameter pattern
-                            if scan_parameter:
-                                search_term = scan_parameter
-                            else:
-                                search_term = SCAN_STR
                             # move past first separator
                             next(d)
                             line = next(d).strip()
-                            while search_term not in line and not GAU_SEP_PAT.match(line):
+                            table_lines = []
+                            while not GAU_SEP_PAT.match(line):
+                                table_lines.append(line)
                                 line = next(d).strip()
-                            if search_term in line:
-                                line_split = line.split()
-
-                                # Only if scan parameter already found will there be an energy collected to store
-                                if search_term == SCAN_STR:
-                                    scan_parameter = line_split[2]
-                                else:
-                                    gausslog_content[SCAN_DICT][line_split[3]] = gausslog_content[ENERGY]
-                            else:
-                                raise InvalidDataError(f"Did not find expected parameter scan info in file: "
-                                                       f"{os.path.relpath(gausslog_file)}")
+                            scan_parameter = store_scan_step(gausslog_content, gausslog_file, table_lines,
+                                                             scan_parameter)
                     # may gave stopped by matching dih pat, so may need to continue
                     #   for some jobs, stoich before coordinates
                     while not GAU_COORD_PAT.match(line) and not GAU_STOICH_PAT.match(line):
@@ -186,17 +457,15 @@ def process_gausslog_file(gausslog_file, find_dih=False, find_converg=False, fin
                     next(d)
                     next(d)
                     section = SEC_ATOMS
+                    coord_lines = []
 
                 elif section == SEC_ATOMS:
                     # will keep overwriting coordinates until it gets to the end
                     while not GAU_SEP_PAT.match(line):
-                        split_line = line.split()
-                        atom_type = ATOM_NUM_DICT[int(split_line[1])]
-                        atom_xyz = np.array(list(map(float, split_line[3:6])))
-                        # noinspection PyTypeChecker
-                        gausslog_content[SEC_ATOMS][atom_id] = {ATOM_TYPE: atom_type, ATOM_COORDS: atom_xyz}
-                        atom_id += 1
+                        coord_lines.append(line)
                         line = next(d).strip()
+                    gausslog_content[SEC_ATOMS] = geometry_from_coord_table("\n".join(coord_lines))
+                    coord_lines = None
                     if not gausslog_content[STOICH]:
                         while not GAU_STOICH_PAT.match(line):
                             line = next(d).strip()
@@ -227,21 +496,7 @@ def process_gausslog_file(gausslog_file, find_dih=False, find_converg=False, fin
                         while not FREQ_PAT.match(line) and not GAU_H_PAT.match(line):
                             line = next(d).strip()
                         if FREQ_PAT.match(line):
-                            split_line = line.split()
-                            first_freq = float(split_line[2])
-                            if len(split_line) > 3:
-                                second_freq = float(split_line[3])
-                            else:
-                                second_freq = 0.
-                            if first_freq < -10.:
-                                gausslog_content[TS] = True
-                                if first_freq > -40:
-                                    warning("Low imaginary frequency for {}: {}".format(base_name, first_freq))
-                                if second_freq < -10.:
-                                    warning("At least two imaginary frequencies for {}: {:.2f}, {:.2f}"
-                                            "".format(base_name, first_freq, second_freq))
-                            else:
-                                gausslog_content[TS] = False
+                            gausslog_content[TS] = is_ts_from_freq_line(line, base_name)
                             while not GAU_H_PAT.match(line):
                                 line = next(d).strip()
 
@@ -261,51 +516,23 @@ def process_gausslog_file(gausslog_file, find_dih=False, find_converg=False, fin
 
                     # convergence after step number
                     if find_converg or find_step_converg:
-                        converge_error = False
-                        converg = 0.0
-                        ind_converg = []
                         while not GAU_CONVERG_PAT.match(line):
                             line = next(d).strip()
-                        # in all cases, use the loop below to advance lines, but do not get values if not needed
+                        converg_lines = []
                         for i in range(4):
-                            line = next(d).strip()
-                            if find_converg or find_step_converg:
-                                line_split = line.split()
-                                try:
-                                    # Catching case when convergence is so poor that Gaussian prints '********' instead
-                                    # of a number (that won't fit) and assign an arbitrarily large convergence penalty
-                                    ind_converg.append(float(line_split[2]))
-                                    current_converge = ind_converg[i] / float(line_split[3])
-                                    if current_converge > 1.0:
-                                        converge_error = True
-                                    converg += current_converge
-                                except ValueError as e:
-                                    if '********' in e.args[0]:
-                                        ind_converg.append(9.999999)
-                                        converg += 2000.00
-                                        converge_error = True
-                                    else:
-                                        raise InvalidDataError(e)
+                            converg_lines.append(next(d).strip())
+                        ind_converg, converg, converge_error = parse_converg_lines(converg_lines)
                         # sometimes, Gaussian ignores the convergence error with the line below. Look for it.
                         next(d)
                         line = next(d).strip()
                         if "Optimization completed on the basis of negligible forces." in line:
-                            converge_error = "False (negligible forces)"
+                            converge_error = NEGLIGIBLE_FORCES_ERR
                         if find_step_converg:
-                            # the transformations with step_num_list may not be strictly necessary, but makes IDE happy
-                            #    and (likely due to casting the list) removed an error that appeared on a unix cluster
-                            #    but not on a local mac
-                            step_num_list = list(gausslog_content[CONVERG_STEP_DICT].keys())
-                            if step_num in step_num_list:
-                                step_num = int(step_num_list[-1]) + 1
-                            # noinspection PyTypeChecker
-                            gausslog_content[CONVERG_STEP_DICT][step_num] = {ENERGY: gausslog_content[ENERGY],
-                                                                             MAX_FORCE: ind_converg[0],
-                                                                             RMS_FORCE: ind_converg[1],
-                                                                             MAX_DISPL: ind_converg[2],
-                                                                             RMS_DISPL: ind_converg[3],
-                                                                             CONVERG: converg,
-                                                                             CONVERG_ERR: converge_error}
+                            step_num = store_converg_step(gausslog_content, step_num, ind_converg, converg,
+                                                          converge_error)
+                            if keep_final_converg:
+                                gausslog_content[CONVERG] = converg
+                                gausslog_content[CONVERG_ERR] = converge_error
                             # if want to stop after a particular step in a job (so we only care when we are keeping
                             #    track of steps), this is the place to do it,
                             #    as the last thing kept from a middle step is convergence
@@ -316,24 +543,883 @@ def process_gausslog_file(gausslog_file, find_dih=False, find_converg=False, fin
                             gausslog_content[CONVERG_ERR] = converge_error
 
                     section = SEC_TAIL
-                    atom_id = 1
         except StopIteration:
-            # continue to error checking
-            pass
+            # continue to error checking; if the file ended within a coordinate table, keep the atoms written
+            if coord_lines:
+                gausslog_content[SEC_ATOMS] = geometry_from_coord_table("\n".join(coord_lines))
+
+    add_missing_placeholders(gausslog_content, find_dih, find_converg, find_step_converg, collect_scan_steps)
+    return gausslog_content
+
+
+def is_ts_from_freq_line(line, base_name):
+    """
+    Checks the first "Frequencies" line of a Gaussian output for imaginary frequencies
+    :param line: str, the stripped line starting with "Frequencies"
+    :param base_name: str, file name used in warnings
+    :return: boolean, True if the first frequency indicates a transition state
+    """
+    split_line = line.split()
+    first_freq = float(split_line[2])
+    if len(split_line) > 3:
+        second_freq = float(split_line[3])
+    else:
+        second_freq = 0.
+    if first_freq < -10.:
+        if first_freq > -40:
+            warning("Low imaginary frequency for {}: {}".format(base_name, first_freq))
+        if second_freq < -10.:
+            warning("At least two imaginary frequencies for {}: {:.2f}, {:.2f}"
+                    "".format(base_name, first_freq, second_freq))
+        return True
+    return False
+
+
+def parse_converg_lines(converg_lines):
+    """
+    Reads the four lines (Max Force, RMS Force, Max Displacement, RMS Displacement) following a convergence header
+    :param converg_lines: list of four stripped strs
+    :return: list of the four values, the summed convergence (each value divided by its threshold), and
+        a boolean that is True if any value is above its threshold
+    """
+    converge_error = False
+    converg = 0.0
+    ind_converg = []
+    for i, line in enumerate(converg_lines):
+        line_split = line.split()
+        try:
+            # Catching case when convergence is so poor that Gaussian prints '********' instead
+            # of a number (that won't fit) and assign an arbitrarily large convergence penalty
+            ind_converg.append(float(line_split[2]))
+            current_converge = ind_converg[i] / float(line_split[3])
+            if current_converge > 1.0:
+                converge_error = True
+            converg += current_converge
+        except ValueError as e:
+            if '********' in e.args[0]:
+                ind_converg.append(9.999999)
+                converg += 2000.00
+                converge_error = True
+            else:
+                raise InvalidDataError(e)
+    return ind_converg, converg, converge_error
 
+
+def store_converg_step(gausslog_content, step_num, ind_converg, converg, converge_error):
+    """
+    Adds one step to the CONVERG_STEP_DICT; Gaussian restarts step numbers within some jobs (e.g. scans), so
+        repeated numbers are renumbered to continue from the last stored step
+    :return: int, the step number used as the key
+    """
+    step_dict = gausslog_content[CONVERG_STEP_DICT]
+    if step_num in step_dict:
+        step_num = int(next(reversed(step_dict))) + 1
+    step_dict[step_num] = {ENERGY: gausslog_content[ENERGY], MAX_FORCE: ind_converg[0], RMS_FORCE: ind_converg[1],
+                           MAX_DISPL: ind_converg[2], RMS_DISPL: ind_converg[3], CONVERG: converg,
+                           CONVERG_ERR: converge_error}
+    return step_num
+
+
+def converg_step_array(step_dict):
+    """
+    Converts the convergence of each step, as parsed into gausslog_content[CONVERG_STEP_DICT], into one array
+    :param step_dict: OrderedDict of step number to a dict of the energy and convergence of that step
+    :return: np structured array with CONVERG_STEP_DTYPE, one row per step in the order read; CONVERG_ERR is True only
+        when the convergence criteria were not met, and NEGLIGIBLE_FORCES is True when Gaussian accepted the step
+        based on negligible forces
+    """
+    num_steps = len(step_dict)
+    step_array = np.empty(num_steps, dtype=CONVERG_STEP_DTYPE)
+    step_array[STEP_NUM] = np.fromiter(step_dict.keys(), dtype=np.int64, count=num_steps)
+    for field in [ENERGY, MAX_FORCE, RMS_FORCE, MAX_DISPL, RMS_DISPL, CONVERG]:
+        step_array[field] = np.fromiter((step[field] for step in step_dict.values()), dtype=np.float64,
+                                        count=num_steps)
+    step_array[CONVERG_ERR] = np.fromiter((step[CONVERG_ERR] is True for step in step_dict.values()), dtype=np.bool_,
+                                          count=num_steps)
+    step_array[NEGLIGIBLE_FORCES] = np.fromiter((step[CONVERG_ERR] == NEGLIGIBLE_FORCES_ERR
+                                                 for step in step_dict.values()), dtype=np.bool_, count=num_steps)
+    return step_array
+
+
+def store_scan_step(gausslog_content, gausslog_file, table_lines, scan_parameter):
+    """
+    Reads a table of parameters (the lines between the separators below the "! Name  Definition ..." header). The
+        first table read marks which parameters are scanned; later tables give the values of these parameters at each
+        scan point, which are stored in gausslog_content[SCAN_DICT] as the key to the last SCF energy read. The key is
+        the value (as a str) for a scan of one parameter, or a tuple of values for a scan of more than one parameter.
+    :param gausslog_content: dict being filled by process_gausslog_file or scan_gausslog_file
+    :param gausslog_file: str, Gaussian output file name, for error messages
+    :param table_lines: list of stripped strs, the rows of the table
+    :param scan_parameter: None if no table has yet been read, otherwise the tuple of the definitions (e.g.
+        "D(41,30,35,16)") of the scanned parameters
+    :return: the tuple of the definitions of the scanned parameters
+    """
+    scan_values = {}
+    for line in table_lines:
+        if scan_parameter is None:
+            if SCAN_STR in line:
+                scan_values[line.split()[2]] = None
+        else:
+            line_split = line.split()
+            if len(line_split) > 3 and line_split[2] in scan_parameter:
+                scan_values[line_split[2]] = line_split[3]
+    if len(scan_values) == 0 or (scan_parameter is not None and len(scan_values) < len(scan_parameter)):
+        raise InvalidDataError(f"Did not find expected parameter scan info in file: "
+                               f"{os.path.relpath(gausslog_file)}")
+    # Only if scan parameter already found will there be an energy collected to store
+    if scan_parameter is None:
+        scan_parameter = tuple(scan_values)
+        gausslog_content[SCAN_PARAMS] = scan_parameter
+    elif len(scan_parameter) == 1:
+        gausslog_content[SCAN_DICT][scan_values[scan_parameter[0]]] = gausslog_content[ENERGY]
+    else:
+        gausslog_content[SCAN_DICT][tuple(scan_values[param] for param in scan_parameter)] = gausslog_content[ENERGY]
+    return scan_parameter
+
+
+def add_missing_placeholders(gausslog_content, find_dih, find_converg, find_step_converg, collect_scan_steps):
     # Sometimes we want data that is not in the output file. Put placeholders.
+    base_name = gausslog_content[BASE_NAME]
     if find_dih and DIHES not in gausslog_content and len(gausslog_content[SEC_ATOMS]) > 3:
-        warning("Requested dihedral data not found for file:", os.path.basename(gausslog_file))
+        warning("Requested dihedral data not found for file:", base_name)
         gausslog_content[DIHES] = None
     if not collect_scan_steps:
         if (find_converg or find_step_converg) and CONVERG_ERR not in gausslog_content:
-            warning("Did not find final convergence report for file:", os.path.basename(gausslog_file))
+            warning("Did not find final convergence report for file:", base_name)
             gausslog_content[CONVERG] = np.nan
             gausslog_content[CONVERG_ERR] = None
 
+
+class EndOfLog(Exception):
+    """ Raised by LogBuffer when the end of the file is reached while looking for a line """
+    pass
+
+
+class LogBuffer:
+    """
+    Line-oriented access to the bytes of a Gaussian output file (typically a read-only mmap). Lines are located with
+    bytes-level searches and only decoded when their content is needed. Positions are always the offset of the start
+    of a line.
+    """
+    def __init__(self, buffer, size=None):
+        """
+        :param buffer: bytes-like object with find and rfind methods
+        :param size: None, or int, to only read the buffer up to this offset
+        """
+        self.buffer = buffer
+        if size is None:
+            size = len(buffer)
+        self.size = size
+        # anchor: (offset the search started from, start of first matching line at or after it, or -1 if none)
+        self._found = {}
+
+    def next_line(self, pos):
+        """
+        :param pos: int, start of the current line
+        :return: int, start of the following line; raises EndOfLog if there is no following line
+        """
+        end = self.buffer.find(b"\n", pos, self.size)
+        if end < 0 or end + 1 >= self.size:
+            raise EndOfLog
+        return end + 1
+
+    def line_end(self, pos):
+        end = self.buffer.find(b"\n", pos, self.size)
+        if end < 0:
+            return self.size
+        return end
+
+    def read_line(self, pos):
+        """
+        :param pos: int, start of the line
+        :return: str, the decoded and stripped line
+        """
+        if pos >= self.size:
+            raise EndOfLog
+        return self.buffer[pos:self.line_end(pos)].decode().strip()
+
+    def find_line(self, pos, *anchors):
+        """
+        Finds the first line, starting with the line at pos, whose stripped content starts with any of the anchors
+        :param pos: int, start of the line at which to start searching
+        :param anchors: bytes, one or more line beginnings to look for
+        :return: the start of the matching line and the anchor it matched; raises EndOfLog if no line matches
+        """
+        match_pos = -1
+        match_anchor = None
+        for anchor in anchors:
+            anchor_pos = self._find_anchor(pos, anchor)
+            if anchor_pos >= 0 and (match_pos < 0 or anchor_pos < match_pos):
+                match_pos = anchor_pos
+                match_anchor = anchor
+        if match_pos < 0:
+            raise EndOfLog
+        return match_pos, match_anchor
+
+    def _find_anchor(self, pos, anchor):
+        # Searches are cached so that looking for a rare (or absent) anchor at every step does not rescan the file
+        if anchor in self._found:
+            searched_from, found_pos = self._found[anchor]
+            if searched_from <= pos and (found_pos < 0 or found_pos >= pos):
+                return found_pos
+        loc = self.buffer.find(anchor, pos, self.size)
+        while loc >= 0:
+            line_start = self.buffer.rfind(b"\n", pos, loc) + 1
+            if line_start == 0:
+                line_start = pos
+            if len(self.buffer[line_start:loc].strip()) == 0:
+                break
+            loc = self.buffer.find(anchor, loc + 1, self.size)
+        else:
+            line_start = -1
+        self._found[anchor] = (pos, line_start)
+        return line_start
+
+
+def scan_gausslog_file(gausslog_file, find_dih=False, find_converg=False, find_step_converg=False,
+                       last_step_to_read=None, collect_scan_steps=False, keep_final_converg=False, resume=None,
+                       on_step_start=None):
+    """
+    Alternate engine for process_gausslog_file, taking the same arguments and returning the same gausslog_content
+        dict. Instead of matching regular expressions on every line, the file is memory-mapped, the next needed
+        section is found with bytes-level searches, and only the lines (or blocks, for coordinates) that hold
+        wanted values are decoded.
+    The last two arguments allow continuing to read a file that is still being written (see scan_log_buffer):
+    :param resume: None, or a tuple of the file position and scan parameter passed to on_step_start by an earlier read
+        of the file, plus the gausslog_content as it was then, to continue reading from that step
+    :param on_step_start: None, or a function called with the file position, scan parameter, and gausslog_content
+        at the start of each step, before gausslog_content is changed for that step
+    If either is given, only complete lines (ending with a line break) are read.
+    A compressed file cannot be memory-mapped, so it is read one line at a time by process_gausslog_file, in constant
+        memory; such files are not written as a job runs, so resume and on_step_start are not used with them.
+    """
+    if get_compression_ext(gausslog_file):
+        if resume is not None or on_step_start is not None:
+            raise InvalidDataError(f"Only uncompressed files can be read as they are written, not: "
+                                   f"{os.path.relpath(gausslog_file)}")
+        return process_gausslog_file(gausslog_file, find_dih=find_dih, find_converg=find_converg,
+                                     find_step_converg=find_step_converg, last_step_to_read=last_step_to_read,
+                                     collect_scan_steps=collect_scan_steps, keep_final_converg=keep_final_converg)
+    if resume is None:
+        gausslog_content = {SEC_ATOMS: empty_geometry(), BASE_NAME: os.path.basename(gausslog_file), STOICH: None,
+                            TS: None, ENERGY: np.nan, ENTHALPY: np.nan, GIBBS: np.nan,
+                            CONVERG_STEP_DICT: collections.OrderedDict(), SCAN_DICT: {}}
+        resume_from = None
+    else:
+        resume_pos, scan_parameter, gausslog_content = resume
+        resume_from = resume_pos, scan_parameter
+    # using step convergence for collecting scan step energies, so set flag to true
+    if collect_scan_steps:
+        find_step_converg = True
+
+    with log_bytes(gausslog_file) as buffer:
+        if buffer is None:
+            read_all = True
+        else:
+            if resume is None and on_step_start is None:
+                log_buffer = LogBuffer(buffer)
+            else:
+                # a file being written may end with part of a line, which is left to be read once complete
+                log_buffer = LogBuffer(buffer, size=buffer.rfind(b"\n") + 1)
+            read_all = scan_log_buffer(log_buffer, gausslog_content, gausslog_file, find_dih,
+                                       find_converg, find_step_converg, last_step_to_read, collect_scan_steps,
+                                       keep_final_converg=keep_final_converg, resume_from=resume_from,
+                                       on_step_start=on_step_start)
+    if read_all:
+        add_missing_placeholders(gausslog_content, find_dih, find_converg, find_step_converg, collect_scan_steps)
     return gausslog_content
 
 
+def scan_log_buffer(log_buffer, gausslog_content, gausslog_file, find_dih, find_converg, find_step_converg,
+                    last_step_to_read, collect_scan_steps, keep_final_converg=False, resume_from=None,
+                    on_step_start=None):
+    """
+    Fills gausslog_content following the same sequence of sections as process_gausslog_file.
+    Each pass of the main loop reads one step and starts at the beginning of a line, after which the rest of the
+        file, gausslog_content, and the scan parameter determine all that is read. Thus, reading can stop at the end of
+        a file that is still being written, and later continue from the start of its last (incomplete) step, given
+        the gausslog_content saved at that point, with the same result as reading the finished file.
+    :param resume_from: None, or the file position and scan parameter passed to on_step_start when gausslog_content
+        was as given, to continue reading from there
+    :param on_step_start: None, or a function called with the file position, scan parameter, and gausslog_content
+        at the start of each step
+    :return: boolean, False if reading stopped at last_step_to_read, True otherwise
+    """
+    base_name = gausslog_content[BASE_NAME]
+    try:
+        if resume_from is None:
+            scan_parameter = None
+            # first find charge & multiplicity; first thing encountered to keep
+            pos, _ = log_buffer.find_line(0, GAU_CHARGE_KEY)
+            split_line = log_buffer.read_line(pos).split('=')
+            gausslog_content[CHARGE] = int(split_line[1].split()[0])
+            gausslog_content[MULT] = int(split_line[2].split()[0])
+            pos = log_buffer.next_line(pos)
+        else:
+            pos, scan_parameter = resume_from
+
+        while True:
+            if on_step_start is not None:
+                on_step_start(pos, scan_parameter, gausslog_content)
+            # there is not always a dih section in every step
+            pos, anchor = log_buffer.find_line(pos, GAU_DERIV_KEY, GAU_COORD_KEY, GAU_STOICH_KEY)
+            if (find_dih or collect_scan_steps) and anchor == GAU_DERIV_KEY:
+                if find_dih:
+                    pos, _ = log_buffer.find_line(pos, GAU_DIH_KEY)
+                    line = log_buffer.read_line(pos)
+                    dih_dict = {}
+                    while GAU_DIH_PAT.match(line):
+                        line_split = line.split()
+                        dih_dict[line_split[2]] = float(line_split[3])
+                        pos = log_buffer.next_line(pos)
+                        line = log_buffer.read_line(pos)
+                    gausslog_content[DIHES] = dih_dict
+                else:
+                    # move past first separator
+                    pos = log_buffer.next_line(log_buffer.next_line(pos))
+                    line = log_buffer.read_line(pos)
+                    table_lines = []
+                    while not GAU_SEP_PAT.match(line):
+                        table_lines.append(line)
+                        pos = log_buffer.next_line(pos)
+                        line = log_buffer.read_line(pos)
+                    scan_parameter = store_scan_step(gausslog_content, gausslog_file, table_lines, scan_parameter)
+            pos, anchor = log_buffer.find_line(pos, GAU_COORD_KEY, GAU_STOICH_KEY)
+            if anchor == GAU_STOICH_KEY:
+                gausslog_content[STOICH] = log_buffer.read_line(pos).split()[1]
+                pos, _ = log_buffer.find_line(pos, GAU_COORD_KEY)
+            # skip the two header lines below "Coordinates" to get to the first atom
+            pos = log_buffer.next_line(log_buffer.next_line(log_buffer.next_line(pos)))
+
+            # decode the whole coordinate block at once; if the file ends within it, keep the atoms that were written
+            try:
+                sep_pos, _ = log_buffer.find_line(pos, GAU_SEP_KEY)
+                end_of_log = False
+            except EndOfLog:
+                sep_pos = log_buffer.size
+                end_of_log = True
+            coord_table = log_buffer.buffer[pos:sep_pos].decode()
+            if coord_table.strip() or not end_of_log:
+                gausslog_content[SEC_ATOMS] = geometry_from_coord_table(coord_table)
+            if end_of_log:
+                raise EndOfLog
+            pos = sep_pos
+
+            if not gausslog_content[STOICH]:
+                pos, _ = log_buffer.find_line(pos, GAU_STOICH_KEY)
+                gausslog_content[STOICH] = log_buffer.read_line(pos).split()[1]
+                pos = log_buffer.next_line(pos)
+
+            # Sometimes there is energy & step number before hitting enthalpy, but not in CalcAll jobs; see
+            #    process_gausslog_file for the orders in which these sections are found
+            pos, anchor = log_buffer.find_line(pos, GAU_E_KEY, GAU_H_KEY, HARM_FREQ_KEY)
+            if anchor == GAU_E_KEY:
+                gausslog_content[ENERGY] = float(log_buffer.read_line(pos).split('=')[1].split()[0])
+                pos = log_buffer.next_line(pos)
+
+            pos, anchor = log_buffer.find_line(pos, HARM_FREQ_KEY, GAU_H_KEY, GAU_STEP_KEY)
+            if anchor == HARM_FREQ_KEY:
+                # checking to hit GAU_H_PAT because one atom jobs won't have a FREQ_PAT
+                pos, anchor = log_buffer.find_line(pos, FREQ_KEY, GAU_H_KEY)
+                if anchor == FREQ_KEY:
+                    gausslog_content[TS] = is_ts_from_freq_line(log_buffer.read_line(pos), base_name)
+                    pos, anchor = log_buffer.find_line(pos, GAU_H_KEY)
+
+            if anchor == GAU_H_KEY:
+                gausslog_content[ENTHALPY] = float(log_buffer.read_line(pos).split('=')[1].strip())
+                pos = log_buffer.next_line(pos)
+                gausslog_content[GIBBS] = float(log_buffer.read_line(pos).split('=')[1].strip())
+                pos = log_buffer.next_line(pos)
+
+            # Step num after SCF Done
+            step_num = None
+            if find_step_converg:
+                pos, _ = log_buffer.find_line(pos, GAU_STEP_KEY)
+                step_num = int(log_buffer.read_line(pos).split()[2])
+                pos = log_buffer.next_line(pos)
+
+            # convergence after step number
+            if find_converg or find_step_converg:
+                pos, _ = log_buffer.find_line(pos, GAU_CONVERG_KEY)
+                pos, ind_converg, converg, converge_error = read_converg_block(log_buffer, pos)
+                if find_step_converg:
+                    step_num = store_converg_step(gausslog_content, step_num, ind_converg, converg, converge_error)
+                    if keep_final_converg:
+                        gausslog_content[CONVERG] = converg
+                        gausslog_content[CONVERG_ERR] = converge_error
+                    if last_step_to_read and last_step_to_read == step_num:
+                        return False
+                else:
+                    gausslog_content[CONVERG] = converg
+                    gausslog_content[CONVERG_ERR] = converge_error
+            pos = log_buffer.next_line(pos)
+    except EndOfLog:
+        pass
+    return True
+
+
+def read_converg_block(log_buffer, pos):
+    """
+    Reads the convergence table of an optimization step
+    :param log_buffer: LogBuffer
+    :param pos: int, start of the convergence table header line
+    :return: the start of the last line read, then the values returned by parse_converg_lines
+    """
+    converg_lines = []
+    for i in range(4):
+        pos = log_buffer.next_line(pos)
+        converg_lines.append(log_buffer.read_line(pos))
+    ind_converg, converg, converge_error = parse_converg_lines(converg_lines)
+    # sometimes, Gaussian ignores the convergence error with the line below. Look for it.
+    pos = log_buffer.next_line(log_buffer.next_line(pos))
+    if "Optimization completed on the basis of negligible forces." in log_buffer.read_line(pos):
+        converge_error = NEGLIGIBLE_FORCES_ERR
+    return pos, ind_converg, converg, converge_error
+
+
+class LogStep(collections.namedtuple('LogStep', 'coord_table scf_line energy step_num ind_converg converg '
+                                                'converge_error')):
+    """
+    One step of a Gaussian output file, as yielded by iter_gausslog_steps:
+        coord_table: str, the rows of the step's coordinate table, as printed (see geometry_from_coord_table)
+        scf_line: str, the step's stripped "SCF Done:" line, or None if the file ended before it
+        energy: float, the SCF energy, or np.nan if not found or not printed as a number
+        step_num: int, from the "Step number" line following the SCF energy, or None if there is none
+        ind_converg, converg, converge_error: the values returned by parse_converg_lines for the step's convergence
+            table (or None, np.nan, None if there is none)
+    """
+    __slots__ = ()
+
+    @property
+    def geometry(self):
+        return geometry_from_coord_table(self.coord_table)
+
+
+def iter_gausslog_steps(gausslog_file):
+    """
+    Reads a Gaussian output file one step at a time, holding only the current step in memory. A step starts with
+        the first coordinate table after the previous step's SCF energy, and includes the next SCF energy and any step
+        number and convergence table found before the next coordinate table.
+    :param gausslog_file: str, Gaussian output file name
+    :return: generator of LogStep tuples
+    """
+    if get_compression_ext(gausslog_file):
+        with open_log(gausslog_file, 'rb') as f:
+            yield from iter_log_line_steps(f)
+        return
+    with log_bytes(gausslog_file) as buffer:
+        if buffer is not None:
+            yield from iter_log_buffer_steps(LogBuffer(buffer))
+
+
+def iter_log_buffer_steps(log_buffer):
+    try:
+        pos, _ = log_buffer.find_line(0, GAU_COORD_KEY)
+    except EndOfLog:
+        return
+    while True:
+        step = {'scf_line': None, 'energy': np.nan, 'step_num': None, 'ind_converg': None, 'converg': np.nan,
+                'converge_error': None}
+        try:
+            # skip the two header lines below "Coordinates" to get to the first atom
+            pos = log_buffer.next_line(log_buffer.next_line(log_buffer.next_line(pos)))
+        except EndOfLog:
+            return
+        try:
+            sep_pos, _ = log_buffer.find_line(pos, GAU_SEP_KEY)
+        except EndOfLog:
+            yield LogStep(log_buffer.buffer[pos:log_buffer.size].decode(), **step)
+            return
+        step_coord_table = log_buffer.buffer[pos:sep_pos].decode()
+        try:
+            pos, _ = log_buffer.find_line(sep_pos, GAU_E_KEY)
+        except EndOfLog:
+            yield LogStep(step_coord_table, **step)
+            return
+        step['scf_line'] = log_buffer.read_line(pos)
+        try:
+            step['energy'] = float(step['scf_line'].split('=')[1].split()[0])
+        except ValueError:
+            # Gaussian prints "XXXXX.XXXXXXXX" for an energy that does not fit its format
+            pass
+        try:
+            next_coord_pos, _ = log_buffer.find_line(pos, GAU_COORD_KEY)
+        except EndOfLog:
+            next_coord_pos = None
+        try:
+            step_pos, anchor = log_buffer.find_line(pos, GAU_STEP_KEY, GAU_CONVERG_KEY)
+            if next_coord_pos is None or step_pos < next_coord_pos:
+                if anchor == GAU_STEP_KEY:
+                    step['step_num'] = int(log_buffer.read_line(step_pos).split()[2])
+                    step_pos, anchor = log_buffer.find_line(step_pos, GAU_CONVERG_KEY)
+                if anchor == GAU_CONVERG_KEY and (next_coord_pos is None or step_pos < next_coord_pos):
+                    _, step['ind_converg'], step['converg'], step['converge_error'] = \
+                        read_converg_block(log_buffer, step_pos)
+        except EndOfLog:
+            # no (complete) convergence table in the rest of the file
+            pass
+        yield LogStep(step_coord_table, **step)
+        if next_coord_pos is None:
+            return
+        pos = next_coord_pos
+
+
+def line_anchor(line, anchors):
+    """
+    :param line: bytes, a line of a Gaussian output file
+    :param anchors: tuple of bytes, line beginnings to look for
+    :return: the first of the anchors that the stripped line starts with, or None
+    """
+    stripped = line.lstrip()
+    for anchor in anchors:
+        if stripped.startswith(anchor):
+            return anchor
+    return None
+
+
+def iter_log_line_steps(lines):
+    """
+    Yields the same steps as iter_log_buffer_steps, reading the file one line at a time (for compressed files, which
+        cannot be memory-mapped), so that only the current step is held in memory
+    :param lines: iterable of the lines of a Gaussian output file, as bytes (e.g. a file opened in binary mode)
+    :return: generator of LogStep tuples
+    """
+    lines = iter(lines)
+    if not any(line_anchor(line, (GAU_COORD_KEY,)) for line in lines):
+        return
+    while True:
+        step = {'scf_line': None, 'energy': np.nan, 'step_num': None, 'ind_converg': None, 'converg': np.nan,
+                'converge_error': None}
+        # skip the two header lines below "Coordinates" to get to the first atom
+        if len(list(itertools.islice(lines, 2))) < 2:
+            return
+        coord_lines = []
+        for line in lines:
+            if line_anchor(line, (GAU_SEP_KEY,)):
+                break
+            coord_lines.append(line)
+        else:
+            if coord_lines:
+                yield LogStep(b"".join(coord_lines).decode(), **step)
+            return
+        step_coord_table = b"".join(coord_lines).decode()
+        for line in lines:
+            if line_anchor(line, (GAU_E_KEY,)):
+                break
+        else:
+            yield LogStep(step_coord_table, **step)
+            return
+        step['scf_line'] = line.decode().strip()
+        try:
+            step['energy'] = float(step['scf_line'].split('=')[1].split()[0])
+        except ValueError:
+            # Gaussian prints "XXXXX.XXXXXXXX" for an energy that does not fit its format
+            pass
+        # as in iter_log_buffer_steps, only the first step number and convergence table before the next coordinates
+        #     belong to this step
+        found_next_coords = False
+        found_converg = False
+        for line in lines:
+            anchor = line_anchor(line, (GAU_COORD_KEY, GAU_STEP_KEY, GAU_CONVERG_KEY))
+            if anchor == GAU_COORD_KEY:
+                found_next_coords = True
+                break
+            if found_converg:
+                continue
+            if anchor == GAU_STEP_KEY and step['step_num'] is None:
+                step['step_num'] = int(line.decode().split()[2])
+            elif anchor == GAU_CONVERG_KEY:
+                found_converg = True
+                # four lines of convergence values, then a line that may report negligible forces
+                block_lines = [block_line.decode().strip() for block_line in itertools.islice(lines, 6)]
+                if len(block_lines) < 6:
+                    break
+                step['ind_converg'], step['converg'], step['converge_error'] = parse_converg_lines(block_lines[:4])
+                if "Optimization completed on the basis of negligible forces." in block_lines[5]:
+                    step['converge_error'] = NEGLIGIBLE_FORCES_ERR
+        yield LogStep(step_coord_table, **step)
+        if not found_next_coords:
+            return
+
+
+def read_job_info(gausslog_file):
+    """
+    Reads the information about a Gaussian job that hartree's SnapshotLoader provides for goodvibes_helper, in one
+        read of the file (memory-mapped, or for a compressed file, decompressed into memory): the Gaussian version,
+        charge and multiplicity, solvent, stoichiometry, functional and basis set, and the first two frequencies
+    :param gausslog_file: str, Gaussian output file name
+    :return: dict with the keys GAUSS_VER (list of the first three words of the version line, or None), CHARGE and
+        MULT (ints), SOLV (str, or None if no implicit solvent), STOICH (str), FUNCTIONAL and BASIS_SET (strs, from the
+        last archive entry, or else the route), and FREQS (list of up to two floats, from the last frequency job)
+    """
+    job_info = {GAUSS_VER: None, CHARGE: None, MULT: None, SOLV: None, STOICH: None, FUNCTIONAL: None,
+                BASIS_SET: None, FREQS: []}
+    with log_bytes(gausslog_file) as buffer:
+        if buffer is None:
+            raise InvalidDataError(f"No job information found in file: {os.path.relpath(gausslog_file)}")
+        read_log_buffer_job_info(LogBuffer(buffer), job_info)
+    if job_info[CHARGE] is None or job_info[FUNCTIONAL] is None:
+        raise InvalidDataError(f"No job information found in file: {os.path.relpath(gausslog_file)}")
+    return job_info
+
+
+def read_log_buffer_job_info(log_buffer, job_info):
+    buffer = log_buffer.buffer
+    route = ""
+    job_start = 0
+    try:
+        # the version line is in the header, before the route; the citation also has lines starting with "Gaussian"
+        pos, anchor = log_buffer.find_line(0, GAU_VER_KEY, GAU_ROUTE_KEY)
+        while anchor == GAU_VER_KEY:
+            line = log_buffer.read_line(pos)
+            if ':' in line and 'Rev' in line:
+                job_info[GAUSS_VER] = line.split()[:3]
+                break
+            pos, anchor = log_buffer.find_line(log_buffer.next_line(pos), GAU_VER_KEY, GAU_ROUTE_KEY)
+
+        pos, _ = log_buffer.find_line(pos, GAU_ROUTE_KEY)
+        # the route may be continued on following lines, up to a line of dashes
+        route_lines = []
+        line = log_buffer.read_line(pos)
+        while line.strip('-'):
+            route_lines.append(line)
+            pos = log_buffer.next_line(pos)
+            line = log_buffer.read_line(pos)
+        route = "".join(route_lines)
+
+        pos, _ = log_buffer.find_line(pos, GAU_CHARGE_KEY)
+        split_line = log_buffer.read_line(pos).split('=')
+        job_info[CHARGE] = int(split_line[1].split()[0])
+        job_info[MULT] = int(split_line[2].split()[0])
+        job_start = pos
+        pos, _ = log_buffer.find_line(pos, GAU_STOICH_KEY)
+        job_info[STOICH] = log_buffer.read_line(pos).split()[1]
+    except EndOfLog:
+        pass
+
+    # the implicit solvent is described at the first SCF (e.g. "Solvent : Water, Eps= 78.355300 ...")
+    try:
+        pos, _ = log_buffer.find_line(job_start, GAU_SOLV_KEY)
+        while True:
+            line = log_buffer.read_line(pos)
+            if line.split(':')[0].strip() == "Solvent":
+                job_info[SOLV] = line.split(':', 1)[1].split(', Eps=')[0].strip()
+                break
+            pos, _ = log_buffer.find_line(log_buffer.next_line(pos), GAU_SOLV_KEY)
+    except EndOfLog:
+        pass
+
+    # the last frequency job
+    loc = buffer.rfind(HARM_FREQ_KEY, 0, log_buffer.size)
+    if loc >= 0:
+        try:
+            pos, anchor = log_buffer.find_line(buffer.rfind(b"\n", 0, loc) + 1, FREQ_KEY, GAU_H_KEY)
+            if anchor == FREQ_KEY:
+                job_info[FREQS] = [float(val) for val in log_buffer.read_line(pos).split('--')[1].split()[:2]]
+        except EndOfLog:
+            pass
+
+    # The archive entry of the last job, with lines wrapped at 70 characters after a leading space, has
+    #    1\1\GINC-host\job type\method\basis set\stoichiometry\...
+    loc = buffer.rfind(GAU_ARCHIVE_KEY, job_start, log_buffer.size)
+    if loc >= 0:
+        end = buffer.find(GAU_ARCHIVE_END, loc, log_buffer.size)
+        if end < 0:
+            end = log_buffer.size
+        archive = "".join(line[1:] if line.startswith(" ") else line
+                          for line in buffer[loc - 1:end].decode(errors='replace').splitlines())
+        archive_fields = archive.split("\\")
+        if len(archive_fields) > 5:
+            job_info[FUNCTIONAL] = archive_fields[4]
+            job_info[BASIS_SET] = archive_fields[5]
+            return
+    # without an archive entry (e.g. an unfinished job), use the method/basis set given in the route
+    for word in route.lstrip('#').split():
+        if '/' in word and '=' not in word:
+            job_info[FUNCTIONAL], job_info[BASIS_SET] = word.split('/', 1)
+            break
+
+
+def read_tail_lines(file_name, num_lines=1, block_size=TAIL_BLOCK_SIZE):
+    """
+    Returns the last lines of a file, reading backwards from its end in blocks, so that the time taken does not
+        depend on the size of the file
+    :param file_name: str, name of the file to read
+    :param num_lines: int, the number of lines to return
+    :param block_size: int, number of bytes read at a time
+    :return: list of up to num_lines strs (without line endings); lines are split as by readlines (on "\n" only)
+    """
+    if get_compression_ext(file_name):
+        # a compressed file cannot be read from its end, so it is streamed through, keeping only the last lines
+        with open_log(file_name, 'rb') as f:
+            lines = collections.deque(f, maxlen=num_lines)
+        return [line.rstrip(b"\n").decode(errors='replace') for line in lines]
+    with open(file_name, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b''
+        while pos > 0:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            data = f.read(read_size) + data
+            # with more line breaks than lines wanted, the earliest wanted line is complete (even if the file ends
+            #     with a line break)
+            if data.count(b"\n") > num_lines:
+                break
+    if len(data) == 0:
+        return []
+    lines = data.split(b"\n")
+    if data.endswith(b"\n"):
+        lines.pop()
+    if pos > 0:
+        # the first line is likely only the end of a line
+        lines = lines[1:]
+    return [line.decode(errors='replace') for line in lines[-num_lines:]]
+
+
+def read_tail_text(file_name, num_bytes=TAIL_TEXT_SIZE):
+    """
+    Returns the lines in the last num_bytes of a file; only that much of an uncompressed file is read, so that the time
+        taken does not depend on the size of the file
+    :param file_name: str, name of the file to read
+    :param num_bytes: int, number of bytes to read from the end of the file
+    :return: list of strs (without line endings), split as by read_tail_lines; when the file is longer than num_bytes,
+        the first (likely partial) line is not included
+    """
+    if get_compression_ext(file_name):
+        # a compressed file cannot be read from its end, so it is streamed through, keeping only the last blocks
+        with open_log(file_name, 'rb') as f:
+            num_read = 0
+            blocks = collections.deque(maxlen=2)
+            for block in iter(lambda: f.read(num_bytes), b''):
+                num_read += len(block)
+                blocks.append(block)
+        data = b''.join(blocks)[-num_bytes:]
+        is_partial = num_read > num_bytes
+    else:
+        with open(file_name, 'rb') as f:
+            start = max(0, f.seek(0, os.SEEK_END) - num_bytes)
+            f.seek(start)
+            data = f.read()
+        is_partial = start > 0
+    if len(data) == 0:
+        return []
+    lines = data.split(b"\n")
+    if data.endswith(b"\n"):
+        lines.pop()
+    if is_partial:
+        lines = lines[1:]
+    return [line.decode(errors='replace') for line in lines]
+
+
+def scan_dir_files(search_dir, search_pattern, search_sub_dir=False):
+    """
+    Finds the files matching a pattern in a directory (and optionally its subdirectories), as
+        common_wrangler.common.check_for_files does, but with os.scandir, so that the size and modification time of
+        each file found are returned without looking up each file again
+    :param search_dir: str, the directory to search
+    :param search_pattern: str, fnmatch pattern of the file names to find; a pattern without a "*" matches names that
+        include it anywhere (e.g. '.log' matches 'name.log.gz')
+    :param search_sub_dir: Boolean, if True, also search all subdirectories (without following links to directories)
+    :return: dict of absolute directory names (of directories with matching files) to lists of (file name,
+        os.stat_result) tuples, sorted by file name
+    """
+    if not os.path.isdir(search_dir):
+        raise InvalidDataError(f"Could not find the specified directory '{search_dir}'")
+    if "*" not in search_pattern:
+        search_pattern = f"*{search_pattern}*"
+    found_files = {}
+    dirs_to_search = [os.path.abspath(search_dir)]
+    while dirs_to_search:
+        dir_name = dirs_to_search.pop()
+        matches = []
+        with os.scandir(dir_name) as entries:
+            for entry in entries:
+                # the file type is usually known from the directory listing, and the DirEntry keeps its stat result
+                if entry.is_dir(follow_symlinks=False):
+                    if search_sub_dir:
+                        dirs_to_search.append(entry.path)
+                elif fnmatch.fnmatch(entry.name, search_pattern) and entry.is_file():
+                    matches.append((entry.name, entry.stat()))
+        if matches:
+            found_files[dir_name] = sorted(matches)
+    return found_files
+
+
+def call_capturing_output(func, *args, **kwargs):
+    """
+    Calls func, capturing what it writes to stdout and stderr instead of printing it, so that output from work done in
+        other processes can be printed in the same order as when done serially (see print_captured_output)
+    :param func: the function to call (module-level, or a functools.partial of one, if to be run in a process pool)
+    :return: tuple of the value returned by func (None if it raised an exception), the exception raised (or None),
+        and strs of what was written to stdout and to stderr
+    """
+    out_buffer = io.StringIO()
+    err_buffer = io.StringIO()
+    result = None
+    error = None
+    with redirect_stdout(out_buffer), redirect_stderr(err_buffer):
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            error = e
+    return result, error, out_buffer.getvalue(), err_buffer.getvalue()
+
+
+def print_captured_output(captured):
+    """
+    Writes the output captured by call_capturing_output, then raises the captured exception, if any
+    :param captured: tuple returned by call_capturing_output
+    :return: the value returned by the captured call
+    """
+    result, error, out_str, err_str = captured
+    # warnings are printed while parsing, before any results are printed
+    sys.stderr.write(err_str)
+    sys.stdout.write(out_str)
+    if error is not None:
+        raise error
+    return result
+
+
+def map_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+
+def map_in_order(func, items, jobs=1):
+    """
+    Yields func(item) for each item, in the order of the items. If jobs > 1, the calls are spread over a pool of
+        that many processes, so func and the items must be picklable; each result is yielded once it and all earlier
+        results are ready, while later items are still being processed. Only a few chunks of items per process are
+        sent ahead of the results yielded, so that results waiting to be used do not fill memory however many items
+        there are.
+    :param func: function to apply to each item
+    :param items: list of items
+    :param jobs: int, the number of processes to use
+    :return: generator of results
+    """
+    if jobs < 2 or len(items) < 2:
+        yield from map(func, items)
+        return
+    # several items per task keeps inter-process overhead low for many small files, while still leaving enough tasks
+    #     to balance the load between workers
+    chunk_size = max(1, min(MAX_CHUNK_SIZE, len(items) // (4 * jobs)))
+    max_pending = 4 * jobs
+    pending = collections.deque()
+    executor = ProcessPoolExecutor(max_workers=min(jobs, len(items)))
+    try:
+        for start in range(0, len(items), chunk_size):
+            pending.append(executor.submit(map_chunk, func, items[start:start + chunk_size]))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # if stopped early (e.g. by an error in an earlier item), do not wait for the items not yet started
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
+
+
 def get_pdb_coord_list(pdb_str):
     coord_list = []
     pdb_str_list = pdb_str.split("\n")
@@ -0,0 +1,200 @@
+# coding=utf-8
+
+"""
+Plots for the scripts of this package, drawn without a display (on matplotlib's Agg canvas, without pyplot).
+Each kind of figure is made once per process and reused: for each plot, only the data of its lines is updated.
+"""
+import os
+import functools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from gaussian_wrangler.gw_common import ENERGY, MAX_FORCE, RMS_FORCE, MAX_DISPL, RMS_DISPL, CONVERG
+
+__author__ = 'hmayes'
+
+
+# Kinds of plots
+CONVERG_PLOT = 'converg'
+SCAN_PLOT = 'scan'
+FIT_PLOT = 'fit'
+CONTOUR_PLOT = 'contour'
+
+CONVERG_PLOT_TITLES = [CONVERG, ENERGY, MAX_FORCE, RMS_FORCE, MAX_DISPL, RMS_DISPL]
+AXIS_FONT_SIZE = 14
+SAVE_KWARGS = {'transparent': True, 'bbox_inches': 'tight'}
+# line styles, as matplotlib Line2D properties
+POINTS_STYLE = {'marker': '.', 'linestyle': 'none', 'color': 'C0'}
+CURVE_STYLE = {'marker': 'none', 'linestyle': '-', 'color': 'C0'}
+
+
+def curve_style(color):
+    """
+    :param color: a matplotlib color
+    :return: dict of Line2D properties for a solid line of that color
+    """
+    return dict(CURVE_STYLE, color=color)
+
+
+class LineFigure:
+    """
+    A figure with a fixed set of axes, whose lines are made as needed and then reused: rendering a plot sets the data
+        and style of as many lines as the plot has, and hides any others.
+    """
+    def __init__(self, num_axes=1, figsize=None, titles=None, x_label=None, y_label=None, font_size=None,
+                 hspace=None):
+        """
+        :param num_axes: int, the number of axes, stacked vertically
+        :param figsize: None or tuple of floats, the figure size in inches
+        :param titles: None or list of strs, a title for each axes
+        :param x_label: None or str, label of the x-axis of the last axes
+        :param y_label: None or str, label of the y-axis of each axes
+        :param font_size: None or int, the font size of the axis labels
+        :param hspace: None or float, the space between axes, as a fraction of the average axes height
+        """
+        self.fig = Figure(figsize=figsize)
+        FigureCanvasAgg(self.fig)
+        self.axes = list(np.atleast_1d(self.fig.subplots(num_axes)))
+        if titles:
+            for ax, title in zip(self.axes, titles):
+                ax.set_title(title)
+        if hspace is not None:
+            self.fig.subplots_adjust(hspace=hspace)
+        if x_label:
+            self.axes[-1].set_xlabel(x_label, fontsize=font_size)
+        if y_label:
+            for ax in self.axes:
+                ax.set_ylabel(y_label, fontsize=font_size)
+        self.lines = [[] for _ in self.axes]
+
+    def render(self, png_fname, axes_lines):
+        """
+        :param png_fname: str, the file to save
+        :param axes_lines: for each axes, a list of (x values, y values, dict of Line2D properties) for each line
+        :return: n/a, saves file
+        """
+        for ax, lines, plot_lines in zip(self.axes, self.lines, axes_lines):
+            while len(lines) < len(plot_lines):
+                lines.append(ax.plot([], [])[0])
+            for line, (x_vals, y_vals, style) in zip(lines, plot_lines):
+                line.set_data(x_vals, y_vals)
+                line.set(visible=True, **style)
+            for line in lines[len(plot_lines):]:
+                line.set_visible(False)
+            ax.relim(visible_only=True)
+            ax.autoscale_view()
+        self.fig.savefig(png_fname, **SAVE_KWARGS)
+
+
+class ContourFigure:
+    """
+    A figure with one axes, cleared for each plot of filled energy contours
+    """
+    def __init__(self):
+        self.fig = Figure()
+        FigureCanvasAgg(self.fig)
+
+    def render(self, png_fname, x_grid, y_grid, z_grid):
+        """
+        :param png_fname: str, the file to save
+        :param x_grid: 2D np array, the x value of each grid point
+        :param y_grid: 2D np array, the y value of each grid point
+        :param z_grid: 2D np array, the energy (kcal/mol) at each grid point, with nan where not found
+        :return: n/a, saves file
+        """
+        self.fig.clear()
+        ax = self.fig.subplots()
+        contours = ax.contourf(x_grid, y_grid, z_grid, levels=20)
+        self.fig.colorbar(contours, ax=ax, label="Change in Energy (kcal/mol)")
+        ax.set_xlabel("First Scan Parameter", fontsize=AXIS_FONT_SIZE)
+        ax.set_ylabel("Second Scan Parameter", fontsize=AXIS_FONT_SIZE)
+        self.fig.savefig(png_fname, **SAVE_KWARGS)
+
+
+FIGURE_MAKERS = {CONVERG_PLOT: functools.partial(LineFigure, num_axes=len(CONVERG_PLOT_TITLES), figsize=(7, 11.5),
+                                                 titles=CONVERG_PLOT_TITLES, hspace=0.4, x_label="Step number"),
+                 SCAN_PLOT: functools.partial(LineFigure, x_label="Dihedral Scan (degrees)",
+                                              y_label="Change in Energy (kcal/mol)", font_size=AXIS_FONT_SIZE),
+                 FIT_PLOT: LineFigure,
+                 CONTOUR_PLOT: ContourFigure,
+                 }
+# the figures made in this process, by kind of plot
+FIGURES = {}
+
+
+def get_figure(kind):
+    """
+    :param kind: str, one of the keys of FIGURE_MAKERS
+    :return: the figure for this kind of plot, made on first use in this process
+    """
+    if kind not in FIGURES:
+        FIGURES[kind] = FIGURE_MAKERS[kind]()
+    return FIGURES[kind]
+
+
+def render_plot(kind, png_fname, *plot_data):
+    """
+    Draws and saves one plot
+    :param kind: str, one of the keys of FIGURE_MAKERS
+    :param png_fname: str, the file to save
+    :param plot_data: the arguments for the render method of that kind of figure, after png_fname
+    :return: n/a, saves file
+    """
+    get_figure(kind).render(png_fname, *plot_data)
+
+
+class PlotRenderer:
+    """
+    Renders plots as they are submitted, or, with more than one job, in a pool of that many background processes, so
+        that rendering continues while the next results are found. Use it as a context manager: on exit, it waits for
+        all plots to be saved, and raises the first error from rendering, if any.
+    """
+    def __init__(self, jobs=1, skip=False):
+        """
+        :param jobs: int, the number of processes to use to render plots
+        :param skip: Boolean; if true, plots are not made
+        """
+        self.skip = skip
+        self.executor = None
+        self.futures = []
+        if jobs > 1 and not skip:
+            self.executor = ProcessPoolExecutor(max_workers=jobs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(cancel=exc_type is not None)
+        return False
+
+    def submit(self, kind, png_fname, *plot_data):
+        """
+        Renders a plot (see render_plot), or queues it to be rendered in the background
+        :return: n/a, saves file (or will before close returns)
+        """
+        if self.skip:
+            return
+        if self.executor is None:
+            render_plot(kind, png_fname, *plot_data)
+        else:
+            self.futures.append(self.executor.submit(render_plot, kind, png_fname, *plot_data))
+        print(f"Wrote file: {os.path.relpath(png_fname)}")
+
+    def close(self, cancel=False):
+        """
+        Waits for queued plots to be saved
+        :param cancel: Boolean; if true, plots not yet started are not rendered
+        """
+        if self.executor is None:
+            return
+        try:
+            if not cancel:
+                for future in self.futures:
+                    future.result()
+        finally:
+            if cancel:
+                for future in self.futures:
+                    future.cancel()
+            self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,420 @@
+# coding=utf-8
+
+"""
+On-disk cache of parsed Gaussian output files, so that re-running scripts over unchanged logs does no text parsing.
+One SQLite database is kept for each directory with parsed logs, in the user's cache directory (see get_cache_dir),
+not next to the logs. Entries are keyed by file name and parse options, are dropped when the file's size or
+modification time changes or the parser changes, and the least recently used entries are evicted once the database
+grows past its size cap. Parsed content is stored as compressed JSON (see encode_content), so reading a cache
+database can never run code, even if someone else could write to it.
+The same database holds the state used to follow logs that are still being written: where the parser was at the start
+of the last step it read, so that the next read only parses what was written since. It also holds the termination
+status last found for each log in the directory, so that a re-run only reads the logs that changed since.
+"""
+import io
+import os
+import sys
+import json
+import time
+import zlib
+import base64
+import hashlib
+import sqlite3
+import itertools
+import collections
+from contextlib import redirect_stderr
+import numpy as np
+from common_wrangler.common import warning
+from gaussian_wrangler import gw_common
+from gaussian_wrangler.gw_common import (scan_gausslog_file, get_compression_ext, Geometry, CONVERG_STEP_DICT,
+                                         SCAN_DICT)
+
+
+# environment variable to set the directory with cache databases
+CACHE_DIR_ENV = 'GW_CACHE_DIR'
+CACHE_SUBDIR = 'gaussian_wrangler'
+DEF_CACHE_MAX_MB = 512
+# Increase when the content returned by the parser changes in a way not seen in gw_common.py (entries are also
+#     dropped whenever that file changes; see PARSER_VERSION)
+CACHE_VERSION = 4
+
+CREATE_TABLE = "CREATE TABLE IF NOT EXISTS parsed_logs (fname TEXT, options TEXT, size INTEGER, mtime_ns INTEGER, " \
+               "last_used REAL, num_bytes INTEGER, content BLOB, PRIMARY KEY (fname, options))"
+CREATE_FOLLOW_TABLE = "CREATE TABLE IF NOT EXISTS followed_logs (fname TEXT, options TEXT, state BLOB, " \
+                      "PRIMARY KEY (fname, options))"
+CREATE_STATE_TABLE = "CREATE TABLE IF NOT EXISTS termination_states (fname TEXT PRIMARY KEY, size INTEGER, " \
+                     "mtime_ns INTEGER, version TEXT, termination TEXT)"
+# help for the '--no_cache' option of scripts that use the cache
+NO_CACHE_HELP = "Parse each Gaussian output file, rather than reusing results saved from an earlier run when the " \
+                "file has not changed since. Without this option, parsed results are saved in a cache database in " \
+                f"the user's cache directory (set with the environment variable {CACHE_DIR_ENV}; by default " \
+                f"'~/.cache/{CACHE_SUBDIR}')."
+# the bytes before the saved position that must be unchanged for a followed log to be read from there
+FOLLOW_CHECK_BYTES = 1024
+# errors from content read from a database that was not written by encode_content
+DECODE_ERRORS = (ValueError, KeyError, TypeError, zlib.error)
+
+# connections are reused for all files in a directory; keyed with the process id so that forked worker processes
+#     do not share a parent's connection
+_CONNECTIONS = {}
+
+
+def get_parser_version():
+    """
+    :return: str, CACHE_VERSION and a hash of the parser source, so that entries saved by another version of the
+        parser are not used
+    """
+    with open(gw_common.__file__, 'rb') as f:
+        return f"{CACHE_VERSION}-{hashlib.sha1(f.read()).hexdigest()[:16]}"
+
+
+PARSER_VERSION = get_parser_version()
+
+
+def get_cache_dir():
+    """
+    :return: str, the directory with cache databases: the value of the GW_CACHE_DIR environment variable if set,
+        otherwise 'gaussian_wrangler' in the XDG cache directory (by default, '~/.cache')
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                                 CACHE_SUBDIR)
+    return cache_dir
+
+
+def get_cache_fname(log_dir):
+    """
+    :param log_dir: str, absolute path of the directory holding the logs
+    :return: str, the name of the cache database for the directory
+    """
+    dir_hash = hashlib.sha1(log_dir.encode('utf-8', 'surrogateescape')).hexdigest()[:20]
+    return os.path.join(get_cache_dir(), f"{os.path.basename(log_dir)}_{dir_hash}.sqlite")
+
+
+def get_cache_connection(log_dir):
+    """
+    Opens (creating if needed) the cache database for a directory
+    :param log_dir: str, absolute path of the directory holding the logs
+    :return: sqlite3 connection, or None if the cache cannot be used (e.g. a read-only cache directory)
+    """
+    cache_fname = get_cache_fname(log_dir)
+    conn_key = (os.getpid(), cache_fname)
+    # also reconnect if the database was deleted while this process was running
+    if conn_key not in _CONNECTIONS or (_CONNECTIONS[conn_key] is not None and not os.path.isfile(cache_fname)):
+        try:
+            os.makedirs(os.path.dirname(cache_fname), mode=0o700, exist_ok=True)
+            conn = sqlite3.connect(cache_fname, timeout=30)
+            # the cache can always be rebuilt, so favor speed over durability
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute(CREATE_TABLE)
+            conn.execute(CREATE_FOLLOW_TABLE)
+            conn.execute(CREATE_STATE_TABLE)
+            conn.commit()
+        except (sqlite3.Error, OSError) as e:
+            warning(f"Could not use parsed-log cache for directory '{os.path.relpath(log_dir)}': {e}")
+            conn = None
+        _CONNECTIONS[conn_key] = conn
+    return _CONNECTIONS[conn_key]
+
+
+def encode_value(value):
+    """
+    Converts parsed content into values that can be written as JSON. Containers and types that JSON does not keep
+        (dicts with non-str keys, tuples, arrays, ...) are written as single-key dicts naming the type.
+    :param value: parsed content: None, bool, int, float, str, bytes, list, tuple, dict, np array (not of objects),
+        np scalar, or Geometry
+    :return: a value that can be written with json.dumps
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, list):
+        return [encode_value(item) for item in value]
+    if isinstance(value, tuple):
+        return {'tuple': [encode_value(item) for item in value]}
+    if isinstance(value, dict):
+        dict_type = 'ordered_dict' if isinstance(value, collections.OrderedDict) else 'dict'
+        return {dict_type: [[encode_value(key), encode_value(item)] for key, item in value.items()]}
+    if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+        return {'array': [value.dtype.str, list(value.shape),
+                          base64.b64encode(np.ascontiguousarray(value).tobytes()).decode('ascii')]}
+    if isinstance(value, bytes):
+        return {'bytes': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, Geometry):
+        return {'geometry': [encode_value(value.coords), encode_value(value.atomic_nums),
+                             encode_value(value.atom_labels)]}
+    raise TypeError(f"Cannot save values of type '{type(value).__name__}' in the parsed-log cache")
+
+
+def decode_value(value):
+    """
+    The inverse of encode_value
+    :raises ValueError, KeyError, or TypeError: if the value was not written by encode_value
+    """
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    (value_type, data), = value.items()
+    if value_type == 'tuple':
+        return tuple(decode_value(item) for item in data)
+    if value_type in ('dict', 'ordered_dict'):
+        dict_type = collections.OrderedDict if value_type == 'ordered_dict' else dict
+        return dict_type((decode_value(key), decode_value(item)) for key, item in data)
+    if value_type == 'array':
+        dtype_str, shape, array_bytes = data
+        dtype = np.dtype(dtype_str)
+        if dtype.hasobject:
+            raise ValueError("Arrays of objects are not read from the parsed-log cache")
+        return np.frombuffer(base64.b64decode(array_bytes), dtype=dtype).reshape(shape).copy()
+    if value_type == 'bytes':
+        return base64.b64decode(data)
+    if value_type == 'geometry':
+        coords, atomic_nums, atom_labels = data
+        return Geometry(decode_value(coords), decode_value(atomic_nums), atom_labels=decode_value(atom_labels))
+    raise ValueError(f"Unexpected type '{value_type}' in the parsed-log cache")
+
+
+def encode_content(value):
+    """
+    :return: bytes, the value (see encode_value) as compressed JSON
+    """
+    return zlib.compress(json.dumps(encode_value(value), separators=(',', ':')).encode('utf-8'))
+
+
+def decode_content(content):
+    """
+    The inverse of encode_content
+    :raises ValueError, KeyError, TypeError, or zlib.error: if the content was not written by encode_content
+    """
+    return decode_value(json.loads(zlib.decompress(content).decode('utf-8')))
+
+
+def options_key(parse_options):
+    return json.dumps({'parser_version': PARSER_VERSION, **parse_options}, sort_keys=True)
+
+
+def read_cache_entry(conn, base_name, options, file_stat):
+    """
+    :return: the stored (gausslog_content, parse_warnings) tuple, or None if missing or out of date
+    """
+    row = conn.execute("SELECT size, mtime_ns, content FROM parsed_logs WHERE fname = ? AND options = ?",
+                       (base_name, options)).fetchone()
+    if row is None:
+        return None
+    size, mtime_ns, content = row
+    if size != file_stat.st_size or mtime_ns != file_stat.st_mtime_ns:
+        # the file has changed, so no entry for it (with any options) is valid
+        conn.execute("DELETE FROM parsed_logs WHERE fname = ?", (base_name,))
+        conn.commit()
+        return None
+    conn.execute("UPDATE parsed_logs SET last_used = ? WHERE fname = ? AND options = ?",
+                 (time.time(), base_name, options))
+    conn.commit()
+    return decode_content(content)
+
+
+def write_cache_entry(conn, base_name, options, file_stat, entry, max_mb):
+    content = encode_content(entry)
+    conn.execute("INSERT OR REPLACE INTO parsed_logs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (base_name, options, file_stat.st_size, file_stat.st_mtime_ns, time.time(), len(content), content))
+    evict_lru_entries(conn, max_mb * 1024 * 1024)
+    conn.commit()
+
+
+def evict_lru_entries(conn, max_bytes):
+    """
+    Removes the least recently used entries until the total size of stored content is no more than max_bytes
+    """
+    total_bytes = conn.execute("SELECT COALESCE(SUM(num_bytes), 0) FROM parsed_logs").fetchone()[0]
+    if total_bytes <= max_bytes:
+        return
+    to_remove = []
+    for fname, options, num_bytes in conn.execute("SELECT fname, options, num_bytes FROM parsed_logs "
+                                                  "ORDER BY last_used"):
+        to_remove.append((fname, options))
+        total_bytes -= num_bytes
+        if total_bytes <= max_bytes:
+            break
+    conn.executemany("DELETE FROM parsed_logs WHERE fname = ? AND options = ?", to_remove)
+
+
+def get_gausslog_content(gausslog_file, use_cache=True, max_mb=DEF_CACHE_MAX_MB, follow=False, **parse_options):
+    """
+    Returns the same gausslog_content dict as scan_gausslog_file (which takes the parse_options), reading it from
+        the directory's cache when the file has not changed since it was stored. Warnings printed while parsing are
+        stored with the content and printed again when it is read from the cache.
+    :param gausslog_file: str, Gaussian output file name
+    :param use_cache: boolean, False to always parse the file (and not read or write the cache)
+    :param max_mb: number, maximum size of cached content in the directory's database, in MB
+    :param follow: boolean, True to instead only parse what was written since the last call with this option (see
+        follow_gausslog_content), for files that are still being written; compressed files, which are not written
+        as a job runs, are cached as usual
+    :param parse_options: keyword arguments for scan_gausslog_file
+    :return: dict, gausslog_content
+    """
+    if follow and not get_compression_ext(gausslog_file):
+        return follow_gausslog_content(gausslog_file, **parse_options)
+    conn = None
+    if use_cache:
+        conn = get_cache_connection(os.path.dirname(os.path.abspath(gausslog_file)))
+    if conn is None:
+        return scan_gausslog_file(gausslog_file, **parse_options)
+
+    base_name = os.path.basename(gausslog_file)
+    options = options_key(parse_options)
+    file_stat = os.stat(gausslog_file)
+    try:
+        entry = read_cache_entry(conn, base_name, options, file_stat)
+    except (sqlite3.Error,) + DECODE_ERRORS:
+        entry = None
+    if entry is not None:
+        gausslog_content, parse_warnings = entry
+        sys.stderr.write(parse_warnings)
+        return gausslog_content
+
+    parse_stderr = io.StringIO()
+    try:
+        with redirect_stderr(parse_stderr):
+            gausslog_content = scan_gausslog_file(gausslog_file, **parse_options)
+    finally:
+        sys.stderr.write(parse_stderr.getvalue())
+    try:
+        write_cache_entry(conn, base_name, options, file_stat, (gausslog_content, parse_stderr.getvalue()), max_mb)
+    except (sqlite3.Error, TypeError) as e:
+        warning(f"Could not update parsed-log cache for file '{os.path.relpath(gausslog_file)}': {e}")
+    return gausslog_content
+
+
+def read_file_bytes(fname, start, end):
+    with open(fname, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def read_follow_state(conn, gausslog_file, base_name, options):
+    """
+    :return: the saved follow state for the file, or None if there is none or the file changed before its position
+    """
+    row = conn.execute("SELECT state FROM followed_logs WHERE fname = ? AND options = ?",
+                       (base_name, options)).fetchone()
+    if row is None:
+        return None
+    state = decode_content(row[0])
+    check_start = max(0, state['pos'] - FOLLOW_CHECK_BYTES)
+    if read_file_bytes(gausslog_file, check_start, state['pos']) != state['check_bytes']:
+        # e.g. a job was restarted, overwriting its log; reading from the saved position would mix the two
+        return None
+    return state
+
+
+def follow_gausslog_content(gausslog_file, **parse_options):
+    """
+    Returns the same gausslog_content dict as scan_gausslog_file (which takes the parse_options) for a file that may
+        still be being written, without parsing again what was parsed by an earlier call: the file position, scan
+        parameter, and gausslog_content at the start of the last step read are saved in the directory's cache
+        database, and the next call continues reading from there. The file is read from the beginning if the bytes
+        before the saved position have changed. Warnings printed while parsing are saved and printed again, as for
+        get_gausslog_content.
+    :param gausslog_file: str, Gaussian output file name
+    :param parse_options: keyword arguments for scan_gausslog_file
+    :return: dict, gausslog_content
+    """
+    conn = get_cache_connection(os.path.dirname(os.path.abspath(gausslog_file)))
+    if conn is None:
+        return scan_gausslog_file(gausslog_file, **parse_options)
+
+    base_name = os.path.basename(gausslog_file)
+    options = options_key(parse_options)
+    try:
+        state = read_follow_state(conn, gausslog_file, base_name, options)
+    except (sqlite3.Error,) + DECODE_ERRORS:
+        state = None
+
+    parse_stderr = io.StringIO()
+    resume = None
+    if state is not None:
+        parse_stderr.write(state['warnings'])
+        resume = state['pos'], state['scan_parameter'], state['content']
+    # the state at the start of the step being read; only steps read completely are kept in the saved content
+    step_start = {}
+
+    def save_step_start(pos, scan_parameter, gausslog_content):
+        step_start.update(pos=pos, scan_parameter=scan_parameter, num_warning_chars=parse_stderr.tell(),
+                          num_steps=len(gausslog_content[CONVERG_STEP_DICT]),
+                          num_scan_points=len(gausslog_content[SCAN_DICT]), content=dict(gausslog_content))
+
+    try:
+        with redirect_stderr(parse_stderr):
+            gausslog_content = scan_gausslog_file(gausslog_file, resume=resume, on_step_start=save_step_start,
+                                                  **parse_options)
+    finally:
+        sys.stderr.write(parse_stderr.getvalue())
+
+    if not step_start:
+        # nothing to resume from yet (the file ends before its first step)
+        try:
+            conn.execute("DELETE FROM followed_logs WHERE fname = ? AND options = ?", (base_name, options))
+            conn.commit()
+        except sqlite3.Error:
+            pass
+        return gausslog_content
+
+    # the step and scan dicts were only added to since the step started, so drop what was added
+    content = step_start['content']
+    content[CONVERG_STEP_DICT] = collections.OrderedDict(
+        itertools.islice(content[CONVERG_STEP_DICT].items(), step_start['num_steps']))
+    content[SCAN_DICT] = dict(itertools.islice(content[SCAN_DICT].items(), step_start['num_scan_points']))
+    pos = step_start['pos']
+    state = {'pos': pos, 'scan_parameter': step_start['scan_parameter'], 'content': content,
+             'warnings': parse_stderr.getvalue()[:step_start['num_warning_chars']],
+             'check_bytes': read_file_bytes(gausslog_file, max(0, pos - FOLLOW_CHECK_BYTES), pos)}
+    try:
+        conn.execute("INSERT OR REPLACE INTO followed_logs VALUES (?, ?, ?)",
+                     (base_name, options, encode_content(state)))
+        conn.commit()
+    except (sqlite3.Error, TypeError) as e:
+        warning(f"Could not save the position read in file '{os.path.relpath(gausslog_file)}': {e}")
+    return gausslog_content
+
+
+def read_termination_states(log_dir):
+    """
+    Reads the termination status saved for each file in a directory by write_termination_states
+    :param log_dir: str, absolute path of the directory holding the logs
+    :return: dict of file base names to tuples of (size, mtime_ns, termination dict); empty if there is no state, or
+        it cannot be read
+    """
+    conn = get_cache_connection(log_dir)
+    if conn is None:
+        return {}
+    try:
+        rows = conn.execute("SELECT fname, size, mtime_ns, termination FROM termination_states WHERE version = ?",
+                            (PARSER_VERSION,)).fetchall()
+        return {fname: (size, mtime_ns, json.loads(termination)) for fname, size, mtime_ns, termination in rows}
+    except (sqlite3.Error, ValueError):
+        return {}
+
+
+def write_termination_states(log_dir, file_states):
+    """
+    Replaces the termination status saved for the files in a directory, so that files no longer there (e.g. moved
+        after they completed) are dropped
+    :param log_dir: str, absolute path of the directory holding the logs
+    :param file_states: dict of file base names to tuples of (size, mtime_ns, termination dict), where the
+        termination dict can be written as json
+    :return: n/a, updates the directory's cache database
+    """
+    conn = get_cache_connection(log_dir)
+    if conn is None:
+        return
+    try:
+        with conn:
+            conn.execute("DELETE FROM termination_states")
+            conn.executemany("INSERT INTO termination_states VALUES (?, ?, ?, ?, ?)",
+                             [(fname, size, mtime_ns, PARSER_VERSION, json.dumps(termination))
+                              for fname, (size, mtime_ns, termination) in file_states.items()])
+    except sqlite3.Error as e:
+        warning(f"Could not save termination status in directory '{os.path.relpath(log_dir)}': {e}")
@@ -13,7 +13,7 @@ from common_wrangler.common import (GOOD_RET, INPUT_ERROR, IO_ERROR, INVALID_DAT
                                     InvalidInputError, InvalidDataError, warning,
                                     create_out_fname, get_fname_root, list_to_file, process_cfg, read_tpl, str_to_file)
 from common_wrangler.fill_tpl import fill_save_tpl
-from gaussian_wrangler.gw_common import GAU_HEADER_PAT
+from gaussian_wrangler.gw_common import GAU_HEADER_PAT, read_tail_lines
 from gaussian_wrangler import __version__
 
 __author__ = 'hmayes'
@@ -448,8 +448,8 @@ def run_job(job, job_name_perhaps_with_dir, tpl_dict, cfg, testing_mode):
         p1 = subprocess.Popen(job_runner_fname)
         p1.wait()
         out_file = tpl_dict[JOB_NAME] + ".log"
-        last_line = subprocess.check_output(["tail", "-1",  out_file]).strip().decode("utf-8")
-        if GAU_GOOD_PAT.match(last_line):
+        tail_lines = read_tail_lines(out_file)
+        if tail_lines and GAU_GOOD_PAT.match(tail_lines[-1].strip()):
             print("Successfully completed {}\n".format(out_file))
             os.remove(job_runner_fname)
         else:
@@ -32,10 +32,12 @@ R: The scale factor was obtained via the Reduced Scale Factor Optimization Model
 
 import os
 import sys
+import collections
 import numpy as np
 from common_wrangler.common import (InvalidDataError,
                                     SPEED_OF_LIGHT, GAS_CONSTANT, KB, H, AVOGADRO_CONST, AMU_TO_KG, AU_TO_J,
                                     )
+from gaussian_wrangler.gw_common import open_log, split_log_name, get_compression_ext
 
 # # To make the output exactly match Gaussian's, use the values below instead importing them from common_wrangler.common
 # SPEED_OF_LIGHT = 2.99792458e10  # cm / s (same as in common)
@@ -302,6 +304,485 @@ BONDI = {'H': 1.09, 'He': 1.40, 'Li': 1.82, 'Be': 2.00, 'B': 2.00, 'C': 1.70, 'N
          'Ne': 1.54}
 
 
+# Number of files for which the values read are kept (see get_log_index)
+MAX_LOG_INDEXES = 32
+_LOG_INDEXES = collections.OrderedDict()
+
+
+def find_freq_sp_dlpno_cbs(bs, level, line, repeated_theory):
+    if '\\Freq\\' in line.strip() and repeated_theory == 0:
+        try:
+            level, bs = (line.strip().split("\\")[4:6])
+            repeated_theory = 1
+        except IndexError:
+            pass
+    elif '|Freq|' in line.strip() and repeated_theory == 0:
+        try:
+            level, bs = (line.strip().split("|")[4:6])
+            repeated_theory = 1
+        except IndexError:
+            pass
+    if '\\SP\\' in line.strip() and repeated_theory == 0:
+        try:
+            level, bs = (line.strip().split("\\")[4:6])
+        except IndexError:
+            pass
+    elif '|SP|' in line.strip() and repeated_theory == 0:
+        try:
+            level, bs = (line.strip().split("|")[4:6])
+        except IndexError:
+            pass
+    if 'DLPNO BASED TRIPLES CORRECTION' in line.strip():
+        level = 'DLPNO-CCSD(T)'
+    if 'Estimated CBS total energy' in line.strip():
+        try:
+            bs = ("Extrapol." + line.strip().split()[4])
+        except IndexError:
+            pass
+    # Remove the restricted R or unrestricted U label
+    if level[0] in ('R', 'U'):
+        level = level[1:]
+    return bs, level
+
+
+class LinkData:
+    """
+    What CalcBBE reads from one link of a Gaussian output file, that is, from the start of the file or a
+        "Normal termination" line up to the next one:
+        scf_energy, zero_point_corr, mult, molecular_mass, sym_no, roconst, rot_temp: the last value found, or None
+        linear_mol, linear_warning: True if found
+        freqs: for each "Frequencies --" line, the list of its frequencies and the list of their MM fractions (for the
+            '--vmm' option), with None for a frequency that is skipped when using MM fractions
+        cpu: the sum of the "Job cpu time" values, or None
+        error, mm_error: (position, exception) for the first error found in reading the link (mm_error, in reading MM
+            fractions), which CalcBBE raises if it uses the link; the link is not read further after an error
+    """
+    def __init__(self):
+        self.scf_energy = None
+        self.zero_point_corr = None
+        self.mult = None
+        self.molecular_mass = None
+        self.sym_no = None
+        self.linear_mol = False
+        self.roconst = None
+        self.rot_temp = None
+        self.linear_warning = False
+        self.freqs = []
+        self.cpu = None
+        self.error = None
+        self.mm_error = None
+
+    def read_freqs(self, g_line, lines, i):
+        mm_line = None
+        if self.mm_error is None:
+            try:
+                mm_line = lines[i + 3].strip().split()
+            except IndexError as e:
+                self.mm_error = ((i, 0, 0), e)
+        freqs, mm_fracs = [], []
+        for j in range(2, 5):
+            try:
+                freq = float(g_line.split()[j])
+            except IndexError:
+                continue
+            except ValueError as e:
+                self.error = ((i, j, 0), e)
+                return
+            mm_frac = None
+            if mm_line is not None:
+                try:
+                    mm_frac = float('{:.6f}'.format(float(mm_line[j]) / 100.0))
+                except IndexError:
+                    pass
+                except ValueError as e:
+                    self.mm_error = ((i, j, 1), e)
+                    mm_line = None
+            freqs.append(freq)
+            mm_fracs.append(mm_frac)
+        self.freqs.append((freqs, mm_fracs))
+
+    def read_line(self, g_line, lines, i):
+        """
+        :param g_line: str, the stripped line i of lines
+        :param lines: list of strs, the lines of the output file
+        :param i: int, the index of the line
+        """
+        # Iterate over output: look out for low frequencies
+        if g_line.startswith('Frequencies -- '):
+            self.read_freqs(g_line, lines, i)
+        # For QM calculations look for SCF energies, last one will be the optimized energy
+        elif g_line.startswith('SCF Done:'):
+            self.scf_energy = float(g_line.split()[4])
+        # For Counterpoise calculations the corrected energy value will be taken
+        elif g_line.startswith('Counterpoise corrected energy'):
+            self.scf_energy = float(g_line.split()[4])
+        # For MP2 calculations replace with EUMP2
+        elif 'EUMP2 =' in g_line:
+            self.scf_energy = float((g_line.split()[5]).replace('D', 'E'))
+        # For ONIOM calculations use the extrapolated value rather than SCF value
+        elif "ONIOM: extrapolated energy" in g_line:
+            self.scf_energy = float(g_line.split()[4])
+        # For Semi-empirical or Molecular Mechanics calculations
+        elif "Energy= " in g_line and "Predicted" not in g_line and "Thermal" not in g_line:
+            self.scf_energy = float(g_line.split()[1])
+        # Look for thermal corrections, paying attention to point group symmetry
+        elif g_line.startswith('Zero-point correction='):
+            self.zero_point_corr = float(g_line.split()[2])
+        # Grab Multiplicity
+        elif 'Multiplicity' in g_line:
+            try:
+                self.mult = int(g_line.split('=')[-1].strip().split()[0])
+            except IndexError:  # not really sure what error might happen, or why the below would fix it
+                self.mult = int(g_line.split()[-1])
+        # Grab molecular mass
+        elif g_line.startswith('Molecular mass:'):
+            self.molecular_mass = float(g_line.split()[2])
+        # Grab rational symmetry number
+        elif g_line.startswith('Rotational symmetry number'):
+            self.sym_no = int(g_line.split()[3].split(".")[0])
+        # Grab point group
+        elif g_line.startswith('Full point group'):
+            if g_line.split()[3] == 'D*H' or g_line.split()[3] == 'C*V':
+                self.linear_mol = True
+        # Grab rotational constants
+        elif g_line.startswith('Rotational constants (GHZ):'):
+            split_line = g_line.replace(':', ' ').split()
+            try:
+                self.roconst = [float(split_line[3]), float(split_line[4]), float(split_line[5])]
+            except ValueError:
+                self.linear_warning = True
+                self.roconst = [float(split_line[4]), float(split_line[5])]
+        # Grab rotational temperatures
+        elif g_line.startswith('Rotational temperature '):
+            self.rot_temp = [float(g_line.split()[3])]
+        elif g_line.startswith('Rotational temperatures'):
+            split_line = g_line.split()
+            try:
+                self.rot_temp = [float(split_line[3]), float(split_line[4]), float(split_line[5])]
+            except ValueError:
+                self.linear_warning = True
+                self.rot_temp = [float(split_line[4]), float(split_line[5])]
+        if "Job cpu time" in g_line:
+            split_line = g_line.split()
+            cpu = [int(split_line[3]), int(split_line[5]), int(split_line[7]), 0, int(float(split_line[9]) * 1000.0)]
+            if self.cpu is None:
+                self.cpu = cpu
+            else:
+                self.cpu = [total + time for total, time in zip(self.cpu, cpu)]
+
+
+class LogIndex:
+    """
+    What the GoodVibes functions read from a compchem output file, found in a single pass through its lines so that
+        each file is read once. The lines themselves are not kept.
+        program: 'Gaussian', 'Orca', or 'none', from the first line naming one of these programs (last_program, from
+            the last such line)
+        job_type: str, as returned by job_type
+        terminations: dict of 'Normal', 'Error', or 'Incomplete' for each program, from the last termination message
+            in the format of that program
+        orientation: 'Standard' if the file has a standard orientation section, otherwise 'Input'
+        links, freq_link: the LinkData of each link, and the number of the link with the last frequencies, for CalcBBE
+        atom_nums, atom_types, atomic_types, cartesians: from the last orientation (or Orca xyz) section, or None, and
+            freqs, reduced_mass, force_const, normal_mode: np arrays from the frequency sections, for GetOutData
+        spe, version_program, charge, multiplicity, pd_keyword_line, orca_solvation: for parse_data
+        initial_level_of_theory, dft_used, initial_keyword_line: for read_initial (and level_of_theory, for
+            find_level_of_theory)
+        cpu: the last cpu time reported, for sp_cpu
+    An error found in reading a value is kept in errors and raised by the function that uses the value (see
+        check_error), as it would have been had that function read the lines.
+    """
+    def __init__(self, file):
+        self.file = file
+        with open_log(file) as f:
+            lines = f.readlines()
+        self.program = 'none'
+        self.last_program = 'none'
+        self.orientation = 'Input'
+        job = ''
+        self.terminations = {'Gaussian': 'Incomplete', 'Orca': 'Incomplete'}
+        self.errors = {}
+        self.links = [LinkData()]
+        self.freq_link = 0
+        # the values that depend on the program are read in the format of each program, and chosen at the end
+        atoms = {'Gaussian': (None, None, None, None), 'Orca': (None, None, None, None)}
+        freq_line_nums = []
+        spe = {'Gaussian': 'none', 'Orca': 'none'}
+        version_program = {'Gaussian': '', 'Orca': ''}
+        charge = {'Gaussian': None, 'Orca': None}
+        multiplicity = {'Gaussian': None, 'Orca': None}
+        cpu = {'Gaussian': None, 'Orca': None}
+        repeated_link1 = 0
+        self.pd_keyword_line = ''
+        orca_solvation = ["gas phase", '', '']
+        level, bs, initial_level, initial_bs = 'none', 'none', 'none', 'none'
+        found_external, found_dft, found_route_end = False, False, False
+        self.dft_used = 'F'
+        self.initial_keyword_line = 'none'
+
+        for i, line in enumerate(lines):
+            s_line = line.strip()
+            if "Gaussian" in line:
+                self.last_program = "Gaussian"
+            if "* O   R   C   A *" in line:
+                self.last_program = "Orca"
+            if self.program == 'none':
+                self.program = self.last_program
+            if '\\' in line:
+                if '\\SP\\' in line:
+                    job += 'SP'
+                if '\\FOpt\\' in line:
+                    job += 'GS'
+                if '\\FTS\\' in line:
+                    job += 'TS'
+                if '\\Freq\\' in line:
+                    job += 'Freq'
+            if 'termination' in line or 'TERMINATED' in line:
+                if 'Normal termination' in line:
+                    self.terminations['Gaussian'] = 'Normal'
+                elif 'Error termination' in line:
+                    self.terminations['Gaussian'] = 'Error'
+                if 'ORCA TERMINATED NORMALLY' in line:
+                    self.terminations['Orca'] = 'Normal'
+                elif 'error termination' in line:
+                    self.terminations['Orca'] = 'Error'
+            if 'Standard orientation:' in line:
+                self.orientation = 'Standard'
+
+            # Links, for CalcBBE
+            if "Normal termination" in line:
+                self.links.append(LinkData())
+            if 'Frequencies --' in line:
+                self.freq_link = len(self.links) - 1
+            link_data = self.links[-1]
+            if link_data.error is None:
+                try:
+                    link_data.read_line(s_line, lines, i)
+                except (IndexError, ValueError) as e:
+                    link_data.error = ((i, 0, 0), e)
+
+            # Atoms and frequencies, for GetOutData
+            if "Input orientation" in line or "Standard orientation" in line:
+                try:
+                    atoms['Gaussian'] = read_orientation(lines[i + 5:])
+                except (IndexError, ValueError) as e:
+                    self.errors.setdefault('GetOutData_Gaussian', e)
+            if "*" in line and ">" in line and "xyz" in line:
+                try:
+                    atoms['Orca'] = read_orca_xyz(lines[i:])
+                except (IndexError, ValueError) as e:
+                    self.errors.setdefault('GetOutData_Orca', e)
+            if line.find(" Frequencies -- ") > -1:
+                freq_line_nums.append(i)
+
+            # Energy, version, charge, multiplicity, and solvation, for parse_data
+            try:
+                if s_line.startswith('SCF Done:'):
+                    spe['Gaussian'] = float(s_line.split()[4])
+                if s_line.startswith('Counterpoise corrected energy'):
+                    spe['Gaussian'] = float(s_line.split()[4])
+                # For MP2 calculations replace with EUMP2
+                if 'EUMP2 =' in s_line:
+                    spe['Gaussian'] = float((s_line.split()[5]).replace('D', 'E'))
+                # For ONIOM calculations use the extrapolated value rather than SCF value
+                if "ONIOM: extrapolated energy" in s_line:
+                    spe['Gaussian'] = (float(s_line.split()[4]))
+                # For Semi-empirical or Molecular Mechanics calculations
+                if "Energy= " in s_line and "Predicted" not in s_line and "Thermal" not in s_line:
+                    spe['Gaussian'] = (float(s_line.split()[1]))
+                if "Gaussian" in line and "Revision" in line and repeated_link1 == 0:
+                    for j in range(len(line.strip(",").split(",")) - 1):
+                        version_program['Gaussian'] += line.strip(",").split(",")[j]
+                        repeated_link1 = 1
+                    version_program['Gaussian'] = version_program['Gaussian'][1:]
+                if "Charge" in s_line and "Multiplicity" in s_line:
+                    charge['Gaussian'] = line.strip("=").split()[2]
+                    multiplicity['Gaussian'] = line.strip('=').split()[5]
+            except (IndexError, ValueError) as e:
+                self.errors.setdefault('parse_data_Gaussian', e)
+            try:
+                if s_line.startswith('FINAL SINGLE POINT ENERGY'):
+                    spe['Orca'] = float(s_line.split()[4])
+                if 'Program Version' in s_line:
+                    version_program['Orca'] = "ORCA version " + line.split()[2]
+                if "Total Charge" in s_line and "...." in s_line:
+                    charge['Orca'] = int(line.strip("=").split()[-1])
+                if "Multiplicity" in s_line and "...." in s_line:
+                    multiplicity['Orca'] = int(line.strip("=").split()[-1])
+            except (IndexError, ValueError) as e:
+                self.errors.setdefault('parse_data_Orca', e)
+            if '#' in s_line:
+                if '--' not in s_line:
+                    self.pd_keyword_line += ''.join([d_line.strip() for d_line in lines[i:i + 10]])
+                # read_initial uses the route section up to the first '--' line
+                if not found_route_end:
+                    for d_line in lines[i:i + 10]:
+                        if '--' in d_line.strip():
+                            found_route_end = True
+                            break
+                        self.initial_keyword_line += d_line.strip()
+            if 'CPCM SOLVATION MODEL' in s_line:
+                orca_solvation[0] = "CPCM,"
+            if 'SMD CDS free energy correction energy' in s_line:
+                orca_solvation[1] = "SMD,"
+            if "Solvent:              " in s_line:
+                orca_solvation[2] = s_line.split()[-1]
+
+            # Level of theory and DFT grid, for read_initial and find_level_of_theory
+            if 'read_initial' not in self.errors:
+                try:
+                    if s_line.find('External calculation') > -1:
+                        initial_level, initial_bs = 'ext', 'ext'
+                    if s_line.find('IExCor=') > -1 and not found_dft:
+                        self.dft_used = line.split('=')[2].split()[0]
+                        found_dft = True
+                    initial_bs, initial_level = find_freq_sp_dlpno_cbs(initial_bs, initial_level, line, 0)
+                except (IndexError, ValueError) as e:
+                    self.errors['read_initial'] = e
+            if not found_external and 'find_level_of_theory' not in self.errors:
+                if s_line.find('External calculation') > -1:
+                    level, bs = 'ext', 'ext'
+                    found_external = True
+                else:
+                    try:
+                        bs, level = find_freq_sp_dlpno_cbs(bs, level, line, 0)
+                    except (IndexError, ValueError) as e:
+                        self.errors['find_level_of_theory'] = e
+
+            # CPU time, for sp_cpu
+            try:
+                if s_line.find("Job cpu time") > -1:
+                    split_line = line.split()
+                    cpu['Gaussian'] = [int(split_line[3]), int(split_line[5]), int(split_line[7]), 0,
+                                       int(float(split_line[9]) * 1000.0)]
+            except (IndexError, ValueError) as e:
+                self.errors.setdefault('sp_cpu_Gaussian', e)
+            try:
+                if s_line.find("TOTAL RUN TIME") > -1:
+                    split_line = line.split()
+                    cpu['Orca'] = [int(split_line[3]), int(split_line[5]), int(split_line[7]), int(split_line[9]),
+                                   float(split_line[11])]
+            except (IndexError, ValueError) as e:
+                self.errors.setdefault('sp_cpu_Orca', e)
+
+        self.job_type = job
+        atoms['none'] = (None, None, None, None)
+        self.atom_nums, self.atom_types, self.atomic_types, self.cartesians = atoms[self.program]
+        freq_data = [], [], [], []
+        if self.program == 'Gaussian' and self.atom_types is not None and 'GetOutData_Gaussian' not in self.errors:
+            try:
+                freq_data = read_freq_sections(lines, freq_line_nums, len(self.atom_types))
+            except (IndexError, ValueError) as e:
+                self.errors['GetOutData_Gaussian'] = e
+        self.freqs, self.reduced_mass, self.force_const, self.normal_mode = [np.array(data) for data in freq_data]
+        self.spe = spe.get(self.program, 'none')
+        self.version_program = version_program.get(self.program, '')
+        self.charge = charge.get(self.program)
+        self.multiplicity = multiplicity.get(self.program)
+        self.cpu = cpu.get(self.program)
+        self.orca_solvation = ''.join(orca_solvation)
+        self.level_of_theory = '/'.join([level, bs])
+        self.initial_level_of_theory = '/'.join([initial_level, initial_bs])
+
+    def check_error(self, reader):
+        """
+        Raises the first error found in reading the values used by a function
+        :param reader: str, the name of the function
+        """
+        for key in [reader, reader + '_' + self.program]:
+            if key in self.errors:
+                raise self.errors[key]
+
+
+def read_freq_sections(lines, freq_line_nums, n_atoms):
+    """
+    Reads the Gaussian frequency sections
+    :param lines: list of strs, the lines of the output file
+    :param freq_line_nums: list of ints, the indices of the " Frequencies -- " lines
+    :param n_atoms: int, the number of atoms
+    :return: lists of the frequencies, reduced masses, force constants, and normal modes
+    """
+    freqs, reduced_mass, force_const, normal_mode = [], [], [], []
+    for i in freq_line_nums:
+        n_freqs = len(lines[i].split())
+        freqs_so_far = len(freqs)
+        for j in range(2, n_freqs):
+            freqs.append(float(lines[i].split()[j]))
+            normal_mode.append([])
+        for j in range(3, n_freqs + 1):
+            reduced_mass.append(float(lines[i + 1].split()[j]))
+        for j in range(3, n_freqs + 1):
+            force_const.append(float(lines[i + 2].split()[j]))
+        for j in range(0, n_atoms):
+            for k in range(0, n_freqs - 2):
+                split_line = lines[i + 5 + j].split()
+                normal_mode[(freqs_so_far + k)].append([float(split_line[3 * k + 2]), float(split_line[3 * k + 3]),
+                                                        float(split_line[3 * k + 4])])
+    return freqs, reduced_mass, force_const, normal_mode
+
+
+def read_orientation(carts):
+    """
+    Reads a Gaussian orientation table
+    :param carts: list of strs, the lines of the table, ending with a line of dashes
+    :return: lists of the atomic numbers, element types, atomic types, and cartesian coordinates of the atoms
+    """
+    atom_nums, atom_types, atomic_types, cartesians = [], [], [], []
+    for c_line in carts:
+        if "-------" in c_line:
+            break
+        split_line = c_line.split()
+        atom_nums.append(int(split_line[1]))
+        atom_types.append(element_id(int(split_line[1])))
+        atomic_types.append(int(split_line[2]))
+        if len(split_line) > 5:
+            cartesians.append([float(split_line[3]), float(split_line[4]), float(split_line[5])])
+        else:
+            cartesians.append([float(split_line[2]), float(split_line[3]), float(split_line[4])])
+    return atom_nums, atom_types, atomic_types, cartesians
+
+
+def read_orca_xyz(xyz_lines):
+    """
+    Reads the atoms of an Orca "* xyz" section. As in GoodVibes, each atom is read from the "* xyz" line itself.
+    :param xyz_lines: list of strs, the lines starting with the "* xyz" line
+    :return: lists of the atomic numbers, element types, atomic types (None), and cartesian coordinates of the atoms
+    """
+    atom_nums, atom_types, cartesians = [], [], []
+    split_line = xyz_lines[0].split()
+    for c_line in xyz_lines[1:]:
+        if ">" in c_line and "*" in c_line:
+            break
+        if len(split_line) > 5:
+            cartesians.append([float(split_line[3]), float(split_line[4]), float(split_line[5])])
+            atom_types.append(split_line[2])
+            atom_nums.append(element_id(split_line[2], num=True))
+        else:
+            cartesians.append([float(split_line[2]), float(split_line[3]), float(split_line[4])])
+            atom_types.append(split_line[1])
+            atom_nums.append(element_id(split_line[1], num=True))
+    return atom_nums, atom_types, None, cartesians
+
+
+def get_log_index(file):
+    """
+    Returns the LogIndex for a file, reading the file only if it was not recently read or has changed since
+    :param file: str, the file name
+    :return: LogIndex
+    """
+    key = os.path.abspath(file)
+    stat = os.stat(file)
+    file_id = (stat.st_size, stat.st_mtime_ns)
+    if key in _LOG_INDEXES and _LOG_INDEXES[key][0] == file_id:
+        _LOG_INDEXES.move_to_end(key)
+        return _LOG_INDEXES[key][1]
+    log_index = LogIndex(file)
+    _LOG_INDEXES[key] = (file_id, log_index)
+    _LOG_INDEXES.move_to_end(key)
+    while len(_LOG_INDEXES) > MAX_LOG_INDEXES:
+        _LOG_INDEXES.popitem(last=False)
+    return log_index
+
+
 def element_id(mass_num, num=False):
     try:
         if num:
@@ -321,8 +802,8 @@ class CalcBBE:
         h_damp, u_vib_qrrho, qh_u_vib = None, None, None   # make IDE happy
 
         # List of frequencies and default values
-        im_freq_cutoff, frequency_wn, im_frequency_wn, rot_temp, roconst, linear_mol, link, freq_loc, linkmax, sym_no, \
-            self.cpu, inverted_freqs = 0.0, [], [], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0], 0, 0, 0, 0, 1, [0, 0, 0, 0, 0], []
+        im_freq_cutoff, frequency_wn, im_frequency_wn, rot_temp, linear_mol, sym_no, self.cpu, inverted_freqs = \
+            0.0, [], [], [0.0, 0.0, 0.0], 0, 1, [0, 0, 0, 0, 0], []
         s_vib_rrqho = []  # make IDE happy
         linear_warning = False
         if mm_freq_scale_factor:
@@ -335,12 +816,11 @@ class CalcBBE:
         # Parse some useful information from the file
         self.sp_energy, self.program, self.version_program, self.solvation_model, self.file, self.charge, \
             self.empirical_dispersion, self.multiplicity = parse_data(file)
-        with open(file) as f:
-            g_output = f.readlines()
+        log_index = get_log_index(file)
         self.cosmo_qhg = 0.0
         # Read any single point energies if requested
         if spc and spc != 'link':
-            name, ext = os.path.splitext(file)
+            name, ext = split_log_name(file)
             try:
                 self.sp_energy, self.sp_program, self.sp_version_program, self.sp_solvation_model, self.sp_file, \
                     self.sp_charge, self.sp_empirical_dispersion, self.sp_multiplicity = parse_data(name + '_' +
@@ -352,130 +832,65 @@ class CalcBBE:
         elif spc == 'link':
             self.sp_energy, self.sp_program, self.sp_version_program, self.sp_solvation_model, self.sp_file, \
                 self.sp_charge, self.sp_empirical_dispersion, self.sp_multiplicity = parse_data(file)
-        # Count number of links
-        for g_line in g_output:
-            # Only read first link + freq not other link jobs
-            if "Normal termination" in g_line:
-                linkmax += 1
-            else:
-                frequency_wn = []
-            if 'Frequencies --' in g_line:
-                freq_loc = linkmax
-
-        # Iterate over output
+        # Only read first link + freq not other link jobs
+        freq_loc = log_index.freq_link
+        links = log_index.links[:freq_loc + 1] if freq_loc else log_index.links
         molecular_mass = None  # make IDE happy
-        if freq_loc == 0:
-            freq_loc = len(g_output)
-        for i, g_line in enumerate(g_output):
-            # Link counter
-            g_line = g_line.strip()
-            if "Normal termination" in g_line:
-                link += 1
-                # Reset frequencies if in final freq link
-                if link == freq_loc:
-                    frequency_wn = []
-                    im_frequency_wn = []
-                    if mm_freq_scale_factor:
-                        fract_model_sys = []
-            # If spc specified will take last Energy from file, otherwise will break after freq calc
-            if link > freq_loc:
-                break
-            # Iterate over output: look out for low frequencies
-            if g_line.startswith('Frequencies -- '):
-                new_line = None  # make IDE happy
+        for link, link_data in enumerate(links):
+            errors = [link_data.error]
+            if mm_freq_scale_factor:
+                errors.append(link_data.mm_error)
+            errors = [error for error in errors if error is not None]
+            if errors:
+                raise min(errors, key=lambda error: error[0])[1]
+            # Reset frequencies if in final freq link
+            if link == freq_loc and freq_loc > 0:
+                frequency_wn = []
+                im_frequency_wn = []
                 if mm_freq_scale_factor:
-                    new_line = g_output[i + 3]
-                for j in range(2, 5):
-                    try:
-                        x = float(g_line.split()[j])
-                        # If given MM freq scale factor fill the fract_model_sys array:
+                    fract_model_sys = []
+            for freqs, mm_fracs in link_data.freqs:
+                for x, y in zip(freqs, mm_fracs):
+                    # If given MM freq scale factor fill the fract_model_sys array (skipping freqs without one)
+                    if mm_freq_scale_factor and y is None:
+                        continue
+                    # Only deal with real frequencies
+                    if x > 0.00:
+                        frequency_wn.append(x)
                         if mm_freq_scale_factor:
-                            y = float(new_line.strip().split()[j]) / 100.0
-                            y = float('{:.6f}'.format(y))
-                        else:
-                            y = 1.0
-                        # Only deal with real frequencies
-                        if x > 0.00:
-                            frequency_wn.append(x)
-                            if mm_freq_scale_factor:
-                                fract_model_sys.append(y)
-                        # Check if we want to make any low lying imaginary frequencies positive
-                        elif x < -1 * im_freq_cutoff:
-                            if invert:
-                                if x > float(invert):
-                                    frequency_wn.append(x * -1.)
-                                    inverted_freqs.append(x)
-                                else:
-                                    im_frequency_wn.append(x)
+                            fract_model_sys.append(y)
+                    # Check if we want to make any low lying imaginary frequencies positive
+                    elif x < -1 * im_freq_cutoff:
+                        if invert:
+                            if x > float(invert):
+                                frequency_wn.append(x * -1.)
+                                inverted_freqs.append(x)
                             else:
                                 im_frequency_wn.append(x)
-                    except IndexError:
-                        pass
-            # For QM calculations look for SCF energies, last one will be the optimized energy
-            elif g_line.startswith('SCF Done:'):
-                self.scf_energy = float(g_line.split()[4])
-            # For Counterpoise calculations the corrected energy value will be taken
-            elif g_line.startswith('Counterpoise corrected energy'):
-                self.scf_energy = float(g_line.split()[4])
-            # For MP2 calculations replace with EUMP2
-            elif 'EUMP2 =' in g_line:
-                self.scf_energy = float((g_line.split()[5]).replace('D', 'E'))
-            # For ONIOM calculations use the extrapolated value rather than SCF value
-            elif "ONIOM: extrapolated energy" in g_line:
-                self.scf_energy = float(g_line.split()[4])
-            # For Semi-empirical or Molecular Mechanics calculations
-            elif "Energy= " in g_line and "Predicted" not in g_line and "Thermal" not in g_line:
-                self.scf_energy = float(g_line.split()[1])
-            # Look for thermal corrections, paying attention to point group symmetry
-            elif g_line.startswith('Zero-point correction='):
-                self.zero_point_corr = float(g_line.split()[2])
-            # Grab Multiplicity
-            elif 'Multiplicity' in g_line:
-                try:
-                    self.mult = int(g_line.split('=')[-1].strip().split()[0])
-                except IndexError:  # not really sure what error might happen, or why the below would fix it
-                    self.mult = int(g_line.split()[-1])
-            # Grab molecular mass
-            elif g_line.startswith('Molecular mass:'):
-                molecular_mass = float(g_line.split()[2])
-            # Grab rational symmetry number
-            elif g_line.startswith('Rotational symmetry number'):
-                sym_no = int(g_line.split()[3].split(".")[0])
-            # Grab point group
-            elif g_line.startswith('Full point group'):
-                if g_line.split()[3] == 'D*H' or g_line.split()[3] == 'C*V':
-                    linear_mol = 1
-            # Grab rotational constants
-            elif g_line.startswith('Rotational constants (GHZ):'):
-                try:
-                    split_line = g_line.replace(':', ' ').split()
-                    self.roconst = [float(split_line[3]), float(split_line[4]), float(split_line[5])]
-                except ValueError:
-                    if g_line.find('********'):
-                        linear_warning = True
-                        split_line = g_line.replace(':', ' ').split()
-                        self.roconst = [float(split_line[4]), float(split_line[5])]
-            # Grab rotational temperatures
-            elif g_line.startswith('Rotational temperature '):
-                rot_temp = [float(g_line.split()[3])]
-            elif g_line.startswith('Rotational temperatures'):
-                try:
-                    split_line = g_line.split()
-                    rot_temp = [float(split_line[3]), float(split_line[4]), float(split_line[5])]
-                except ValueError:
-                    rot_temp = None
-                    if g_line.find('********'):
-                        linear_warning = True
-                        rot_temp = [float(g_line.split()[4]), float(g_line.split()[5])]
-            if "Job cpu time" in g_line:
-                split_line = g_line.split()
+                        else:
+                            im_frequency_wn.append(x)
+            # The last value found is used
+            if link_data.scf_energy is not None:
+                self.scf_energy = link_data.scf_energy
+            if link_data.zero_point_corr is not None:
+                self.zero_point_corr = link_data.zero_point_corr
+            if link_data.mult is not None:
+                self.mult = link_data.mult
+            if link_data.molecular_mass is not None:
+                molecular_mass = link_data.molecular_mass
+            if link_data.sym_no is not None:
+                sym_no = link_data.sym_no
+            if link_data.linear_mol:
+                linear_mol = 1
+            if link_data.roconst is not None:
+                self.roconst = link_data.roconst
+            if link_data.rot_temp is not None:
+                rot_temp = link_data.rot_temp
+            if link_data.linear_warning:
+                linear_warning = True
+            if link_data.cpu is not None:
                 # noinspection PyUnresolvedReferences
-                days = int(split_line[3]) + self.cpu[0]
-                hours = int(split_line[5]) + self.cpu[1]
-                mins = int(split_line[7]) + self.cpu[2]
-                secs = 0 + self.cpu[3]
-                msecs = int(float(split_line[9]) * 1000.0) + self.cpu[4]
-                self.cpu = [days, hours, mins, secs, msecs]
+                self.cpu = [total + time for total, time in zip(self.cpu, link_data.cpu)]
         self.inverted_freqs = inverted_freqs
         # Skip the calculation if unable to parse the frequencies or zpe from the output file
         if hasattr(self, "zero_point_corr") and rot_temp:
@@ -617,91 +1032,18 @@ class CalcBBE:
 #
 class GetOutData:
     def __init__(self, file):
-        self.atom_types = None
-        with open(file) as f:
-            out_data = f.readlines()
-        program = 'none'
-
-        for o_line in out_data:
-            if "Gaussian" in o_line:
-                program = "Gaussian"
-                break
-            if "* O   R   C   A *" in o_line:
-                program = "Orca"
-                break
-
-        # noinspection PyShadowingNames
-        def get_freqs(self, outlines, n_atoms, f_format):
-            self.FREQS = []
-            self.REDUCED_MASS = []
-            self.FORCE_CONST = []
-            self.NORMAL_MODE = []
-            freqs_so_far = 0
-            if f_format == "Gaussian":
-                for i in range(0, len(outlines)):
-                    if outlines[i].find(" Frequencies -- ") > -1:
-                        n_freqs = len(outlines[i].split())
-                        for j in range(2, n_freqs):
-                            self.FREQS.append(float(outlines[i].split()[j]))
-                            self.NORMAL_MODE.append([])
-                        for j in range(3, n_freqs + 1):
-                            self.REDUCED_MASS.append(float(outlines[i + 1].split()[j]))
-                        for j in range(3, n_freqs + 1):
-                            self.FORCE_CONST.append(float(outlines[i + 2].split()[j]))
-
-                        for j in range(0, n_atoms):
-                            for k in range(0, n_freqs - 2):
-                                self.NORMAL_MODE[(freqs_so_far + k)].append(
-                                    [float(outlines[i + 5 + j].split()[3 * k + 2]),
-                                     float(outlines[i + 5 + j].split()[3 * k + 3]),
-                                     float(outlines[i + 5 + j].split()[3 * k + 4])])
-                        freqs_so_far = freqs_so_far + n_freqs - 2
-
-        # noinspection PyShadowingNames
-        def getatom_types(self, outlines, program_name):
-            if program_name == "Gaussian":
-                for i, p_line in enumerate(outlines):
-                    if "Input orientation" in p_line or "Standard orientation" in p_line:
-                        self.atom_nums, self.atom_types, self.cartesians, self.atomic_types, carts = [], [], [], [], \
-                                                                                                    outlines[i + 5:]
-                        for j, c_line in enumerate(carts):
-                            if "-------" in c_line:
-                                break
-                            split_line = c_line.split()
-                            self.atom_nums.append(int(split_line[1]))
-                            self.atom_types.append(element_id(int(split_line[1])))
-                            self.atomic_types.append(int(split_line[2]))
-                            if len(split_line) > 5:
-                                self.cartesians.append([float(split_line[3]), float(split_line[4]),
-                                                        float(split_line[5])])
-                            else:
-                                self.cartesians.append([float(split_line[2]), float(split_line[3]),
-                                                        float(split_line[4])])
-            if program_name == "Orca":
-                for i, r_line in enumerate(outlines):
-                    if "*" in r_line and ">" in r_line and "xyz" in r_line:
-                        self.atom_nums, self.atom_types, self.cartesians, carts = [], [], [], outlines[i + 1:]
-                        for j, c_line in enumerate(carts):
-                            if ">" in c_line and "*" in c_line:
-                                break
-                            split_line = r_line.split()
-                            if len(split_line) > 5:
-                                self.cartesians.append([float(split_line[3]), float(split_line[4]),
-                                                        float(split_line[5])])
-                                self.atom_types.append(split_line[2])
-                                self.atom_nums.append(element_id(split_line[2], num=True))
-                            else:
-                                self.cartesians.append([float(split_line[2]), float(split_line[3]),
-                                                        float(split_line[4])])
-                                self.atom_types.append(split_line[1])
-                                self.atom_nums.append(element_id(split_line[1], num=True))
-
-        getatom_types(self, out_data, program)
-        # noinspection PyTypeChecker
-        n_atoms = len(self.atom_types)
-
+        log_index = get_log_index(file)
+        log_index.check_error('GetOutData')
+        # copies, since the index is kept for other callers; as before, a TypeError if no atoms were found
         # noinspection PyTypeChecker
-        get_freqs(self, out_data, n_atoms, program)
+        self.atom_nums, self.atom_types = list(log_index.atom_nums), list(log_index.atom_types)
+        self.cartesians = [list(xyz) for xyz in log_index.cartesians]
+        if log_index.atomic_types is not None:
+            self.atomic_types = list(log_index.atomic_types)
+        self.FREQS = log_index.freqs.tolist()
+        self.REDUCED_MASS = log_index.reduced_mass.tolist()
+        self.FORCE_CONST = log_index.force_const.tolist()
+        self.NORMAL_MODE = log_index.normal_mode.tolist()
 
     # Obtain molecule connectivity to be used for internal symmetry determination
     def get_connectivity(self):
@@ -749,101 +1091,41 @@ def get_factors(fract_model_sys, freq_scale_factor, frequency_wn, temperature=1.
 
 def job_type(file):
     # Read output for the level of theory and basis set used
-    job = ''
-    with open(file) as f:
-        job_data = f.readlines()
-    for line in job_data:
-        if line.strip().find('\\SP\\') > -1:
-            job += 'SP'
-        if line.strip().find('\\FOpt\\') > -1:
-            job += 'GS'
-        if line.strip().find('\\FTS\\') > -1:
-            job += 'TS'
-        if line.strip().find('\\Freq\\') > -1:
-            job += 'Freq'
-    return job
-
-
-def read_file_contents(f_name):
+    return get_log_index(file).job_type
+
+
+def read_log_index(f_name):
     """
-    Checks that the file is either '.out' or '.log', and reads the contents if so
+    Checks that the file is either '.out' or '.log' (which may be compressed), and returns its LogIndex if so
     :param f_name: str, the file name
-    :return: f_contents, str, contents of the file
+    :return: LogIndex
     """
-    if os.path.exists(os.path.splitext(f_name)[0] + '.log') or os.path.exists(os.path.splitext(f_name)[0] + '.out'):
-        with open(f_name) as f:
-            f_contents = f.readlines()
+    name = split_log_name(f_name)[0]
+    compression_ext = get_compression_ext(f_name)
+    if os.path.exists(name + '.log' + compression_ext) or os.path.exists(name + '.out' + compression_ext):
+        return get_log_index(f_name)
     elif os.path.exists(f_name):
         raise ValueError(f"Expected file name to end in '.out' or '.out' for file: {f_name}")
     else:
         raise ValueError("File {} does not exist".format(f_name))
-    return f_contents
 
 
 # noinspection DuplicatedCode
 def parse_data(file):
     # Read Gaussian output and obtain single point energy, program type,
     # program version, solvation_model, charge, empirical_dispersion, multiplicity
-    spe, program = 'none', 'none'
-    version_program, solvation_model, keyword_line = '', '', ''
-    charge, multiplicity = None, None
-    file_contents = read_file_contents(file)
-
-    for line in file_contents:
-        if "Gaussian" in line:
-            program = "Gaussian"
-            break
-        if "* O   R   C   A *" in line:
-            program = "Orca"
-            break
-    repeated_link1 = 0
-    for line in file_contents:
-        if program == "Gaussian":
-            if line.strip().startswith('SCF Done:'):
-                spe = float(line.strip().split()[4])
-            if line.strip().startswith('Counterpoise corrected energy'):
-                spe = float(line.strip().split()[4])
-            # For MP2 calculations replace with EUMP2
-            if 'EUMP2 =' in line.strip():
-                spe = float((line.strip().split()[5]).replace('D', 'E'))
-            # For ONIOM calculations use the extrapolated value rather than SCF value
-            if "ONIOM: extrapolated energy" in line.strip():
-                spe = (float(line.strip().split()[4]))
-            # For Semi-empirical or Molecular Mechanics calculations
-            if "Energy= " in line.strip() and "Predicted" not in line.strip() and "Thermal" not in line.strip():
-                spe = (float(line.strip().split()[1]))
-            if "Gaussian" in line and "Revision" in line and repeated_link1 == 0:
-                for i in range(len(line.strip(",").split(",")) - 1):
-                    version_program += line.strip(",").split(",")[i]
-                    repeated_link1 = 1
-                version_program = version_program[1:]
-            if "Charge" in line.strip() and "Multiplicity" in line.strip():
-                charge = line.strip("=").split()[2]
-                multiplicity = line.strip('=').split()[5]
-        if program == "Orca":
-            if line.strip().startswith('FINAL SINGLE POINT ENERGY'):
-                spe = float(line.strip().split()[4])
-            if 'Program Version' in line.strip():
-                version_program = "ORCA version " + line.split()[2]
-            if "Total Charge" in line.strip() and "...." in line.strip():
-                charge = int(line.strip("=").split()[-1])
-            if "Multiplicity" in line.strip() and "...." in line.strip():
-                multiplicity = int(line.strip("=").split()[-1])
+    log_index = read_log_index(file)
+    log_index.check_error('parse_data')
+    spe, program, version_program = log_index.spe, log_index.program, log_index.version_program
+    charge, multiplicity = log_index.charge, log_index.multiplicity
+    solvation_model, keyword_line = '', ''
 
     # Solvation model and empirical dispersion detection
     empirical_dispersion = None
     sorted_solvation_model = None
     display_solvation_model = None
     if 'Gaussian' in version_program.strip():
-        for i, line in enumerate(file_contents):
-            if '#' in line.strip():
-                for j, d_line in enumerate(file_contents[i:i + 10]):
-                    if '--' in line.strip():
-                        break
-                    else:
-                        for k in range(len(d_line.strip().split("\n"))):
-                            keyword_line += d_line.strip().split("\n")[k]
-        keyword_line = keyword_line.lower()
+        keyword_line = log_index.pd_keyword_line.lower()
         if 'scrf' not in keyword_line.strip():
             solvation_model = "gas phase"
         else:
@@ -918,17 +1200,7 @@ def parse_data(file):
                 empirical_dispersion = 'empiricaldispersion=(' + ','.join(
                     sorted(keyword_line[start_emp_disp:end_emp_disp].lower().split(','))) + ')'
     if 'ORCA' in version_program.strip():
-        keyword_line_1 = "gas phase"
-        keyword_line_2 = ''
-        keyword_line_3 = ''
-        for i, line in enumerate(file_contents):
-            if 'CPCM SOLVATION MODEL' in line.strip():
-                keyword_line_1 = "CPCM,"
-            if 'SMD CDS free energy correction energy' in line.strip():
-                keyword_line_2 = "SMD,"
-            if "Solvent:              " in line.strip():
-                keyword_line_3 = line.strip().split()[-1]
-        solvation_model = keyword_line_1 + keyword_line_2 + keyword_line_3
+        solvation_model = log_index.orca_solvation
         empirical_dispersion1 = 'No empirical dispersion detected'
         empirical_dispersion2 = ''
         empirical_dispersion3 = ''
@@ -968,34 +1240,9 @@ def get_emp_dispersion(keyword_line, start_emp_disp):
 
 def sp_cpu(f_name):
     # Read single-point output for cpu time
-    spe, program, cpu = None, None, None
-    file_contents = read_file_contents(f_name)
-
-    for line in file_contents:
-        if line.find("Gaussian") > -1:
-            program = "Gaussian"
-            break
-        if line.find("* O   R   C   A *") > -1:
-            program = "Orca"
-            break
-
-    for line in file_contents:
-        if program == "Gaussian":
-            if line.strip().find("Job cpu time") > -1:
-                days = int(line.split()[3])
-                hours = int(line.split()[5])
-                mins = int(line.split()[7])
-                secs = 0
-                msecs = int(float(line.split()[9]) * 1000.0)
-                cpu = [days, hours, mins, secs, msecs]
-        if program == "Orca":
-            if line.strip().find("TOTAL RUN TIME") > -1:
-                days = int(line.split()[3])
-                hours = int(line.split()[5])
-                mins = int(line.split()[7])
-                secs = int(line.split()[9])
-                msecs = float(line.split()[11])
-                cpu = [days, hours, mins, secs, msecs]
+    log_index = read_log_index(f_name)
+    log_index.check_error('sp_cpu')
+    cpu = log_index.cpu
     return cpu
 
 
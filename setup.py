@@ -35,6 +35,7 @@ setup(
                                       'pdbs2gausscoms = gaussian_wrangler.pdbs2gausscoms:main',
                                       'gausslog2com = gaussian_wrangler.gausslog2com:main',
                                       'gausslog2pdb = gaussian_wrangler.gausslog2pdb:main',
+                                      'gausslog_export = gaussian_wrangler.gausslog_export:main',
                                       'gausslog_unique = gaussian_wrangler.gausslog_unique:main',
                                       'gauss_fragment = gaussian_wrangler.gauss_fragment:main',
                                       'run_gauss = gaussian_wrangler.run_gauss:main',
@@ -50,7 +51,9 @@ setup(
     # to install jpype1, use conda: install -c conda-forge jpype1
     # install_requires=requirements,
     # install_requires=[],   # Required packages, pulls from pip if needed; do not use for Conda deployment
-    install_requires=['numpy', 'matplotlib', 'scipy', 'common-wrangler>=0.3.6', 'jpype1', 'pubchempy'],
+    install_requires=['numpy>=1.21', 'matplotlib', 'scipy', 'common-wrangler>=0.3.6', 'jpype1', 'pubchempy'],
+    # optional: reading '.zst' compressed output files, and writing Parquet files with gausslog_export
+    extras_require={'zst': ['zstandard'], 'parquet': ['pyarrow']},
     tests_require=['pytest'],
     # Additional entries you may want simply uncomment the lines you want and fill in the data
     # url='http://www.my_package.com',  # Website
@@ -58,7 +61,7 @@ setup(
                'Mac OS-X',
                'Unix',
                'Windows'],            # Valid platforms your code works on, adjust to your flavor
-    python_requires=">=3.0",  # Python version restrictions
+    python_requires=">=3.7",  # Python version restrictions
     # Manual control if final package is compressible or not, set False to prevent the .egg from being made
     # zip_safe=False,
 
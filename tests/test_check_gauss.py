@@ -1,12 +1,17 @@
+import json
 import logging
 import os
 import unittest
+from unittest import mock
 import numpy as np
 from shutil import copyfile
 from common_wrangler.common import (capture_stdout, capture_stderr, diff_lines, silent_remove, list_to_file, make_dir)
 from gaussian_wrangler.gw_common import process_gausslog_file, SCAN_DICT
 from gaussian_wrangler.check_gauss import main, plot_scan, process_scan_array, charmm_dihedral, find_good_fit, \
-    find_stable_points, collect_output_scan_steps
+    find_stable_points, collect_output_scan_steps, fit_charmm_dihedral, CHARMM_N_MULTIPLIERS, combine_scan_segments, \
+    grid_scan_points, lowest_converg_steps, classify_termination
+# run with an empty parsed-log cache in a temporary directory, removed after the module's tests
+from tests.test_log_cache import setUpModule, tearDownModule  # noqa: F401
 
 
 # logging.basicConfig(level=logging.DEBUG)
@@ -147,6 +152,11 @@ class TestCheckGaussNoOut(unittest.TestCase):
             self.assertTrue("Choose either" in output)
         silent_remove(FOR_HARTREE_DIR, disable=DISABLE_REMOVE)
 
+    def testScanPlotsWithoutScanList(self):
+        test_input = ["--scan", "test.png", "--scan_plots"]
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("only used with the '--scan_list' option" in output)
+
     def testNoLastStepNum(self):
         test_input = ["-t"]
         # main(test_input)
@@ -163,6 +173,16 @@ class TestCheckGaussNoOut(unittest.TestCase):
         with capture_stderr(main, test_input) as output:
             self.assertTrue("integer must be provided" in output)
 
+    def testNonPositiveJobs(self):
+        test_input = ["-f", SINGLE_FILE, "-z", "-j", "0"]
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("must be a positive integer" in output)
+
+    def testFollowNoCache(self):
+        test_input = ["-f", SINGLE_FILE, "-z", "--follow", "--no_cache"]
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("Choose either the '--follow'" in output)
+
     def testDirInsteadOfFile(self):
         test_input = ["-f", SUB_DATA_DIR, "-z"]
         with capture_stderr(main, test_input) as output:
@@ -175,6 +195,16 @@ class TestCheckGaussNoOut(unittest.TestCase):
         with capture_stderr(main, test_input) as output:
             self.assertTrue("Did not find expected parameter scan info" in output)
 
+    def testPlotsOnlyFailedWithoutSteps(self):
+        test_input = ["-f", SINGLE_FILE, "--plots_only_failed"]
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("only used with the '-s' option" in output)
+
+    def testWrongSummaryExt(self):
+        test_input = ["-f", SINGLE_FILE, "--summary", "summary.txt"]
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("must end in '.json' or '.csv'" in output)
+
     def testMismatchScanFiles(self):
         # no_scan_log = os.path.join(SUB_DATA_DIR, 'me2propprpnt_7.log')
         # test_input = ["-f", no_scan_log, "--scan", "test.png"]
@@ -233,6 +263,68 @@ class TestCheckGauss(unittest.TestCase):
             silent_remove(SUB_SUB_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
             pass
 
+    def testTerminationSummary(self):
+        silent_remove(SUB_SUB_DIR, dir_with_files=True)
+        make_dir(SUB_SUB_DIR)
+        copyfile(os.path.join(SUB_DATA_DIR, 'pet_mono_637_tzvp.tpl'),
+                 os.path.join(SUB_SUB_DIR, 'pet_mono_637_tzvp.log'))
+        for fname in ['me2propprpnt_7.log', 'pet_mono_671_tzvp.log', 'pet_mono_674_tzvp.log']:
+            copyfile(os.path.join(SUB_DATA_DIR, fname), os.path.join(SUB_SUB_DIR, fname))
+        json_fname = os.path.join(SUB_SUB_DIR, 'summary.json')
+        csv_fname = os.path.join(SUB_SUB_DIR, 'summary.csv')
+        try:
+            with capture_stdout(main, ["-d", SUB_SUB_DIR, "--summary", json_fname]) as output:
+                self.assertTrue("summary.json" in output)
+            with open(json_fname) as f:
+                summary = {os.path.basename(row['File']): row for row in json.load(f)}
+            self.assertEqual(summary['pet_mono_637_tzvp.log']['Status'], 'completed')
+            self.assertEqual(summary['pet_mono_671_tzvp.log']['Status'], 'perhaps_running')
+            self.assertEqual(summary['me2propprpnt_7.log'],
+                             {'File': os.path.relpath(os.path.join(SUB_SUB_DIR, 'me2propprpnt_7.log')),
+                              'Status': 'likely_failed', 'Link': 'l9999', 'Error': 'optimization_not_converged',
+                              'Message': None})
+            self.assertEqual(summary['pet_mono_674_tzvp.log']['Message'], 'Route card not found.')
+            main(["-d", SUB_SUB_DIR, "--summary", csv_fname])
+            with open(csv_fname) as f:
+                csv_lines = f.readlines()
+            self.assertEqual(csv_lines[0].strip(), '"File","Status","Link","Error","Message"')
+            self.assertEqual(len(csv_lines), 4)
+        finally:
+            silent_remove(SUB_SUB_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
+            pass
+
+    def testRecheckOnlyChanged(self):
+        silent_remove(SUB_SUB_DIR, dir_with_files=True)
+        make_dir(SUB_SUB_DIR)
+        base_names = ['me2propprpnt_7.log', 'pet_mono_671_tzvp.log', 'pet_mono_674_tzvp.log']
+        for fname in base_names:
+            copyfile(os.path.join(SUB_DATA_DIR, fname), os.path.join(SUB_SUB_DIR, fname))
+        running_fname = os.path.join(SUB_SUB_DIR, 'pet_mono_671_tzvp.log')
+        test_input = ["-d", SUB_SUB_DIR]
+        try:
+            with capture_stdout(main, test_input) as first_output:
+                self.assertTrue("No normally completed files found." in first_output)
+            # the same is reported when no file has changed, without reading any file
+            with mock.patch('gaussian_wrangler.check_gauss.classify_termination', side_effect=classify_termination) \
+                    as classify_mock:
+                with capture_stdout(main, test_input) as output:
+                    self.assertEqual(output, first_output)
+                self.assertEqual(classify_mock.call_count, 0)
+                # only the file that changed is read again
+                with open(running_fname, 'a') as f:
+                    f.write(" Normal termination of Gaussian 16 at Fri Jun  5 12:00:00 2020.\n")
+                with capture_stdout(main, test_input) as output:
+                    self.assertTrue("The following files completed normally:\n"
+                                    "    tests/test_data/check_gauss/temp_dir/pet_mono_671_tzvp.log\n" in output)
+                self.assertEqual(classify_mock.call_args_list, [mock.call(os.path.relpath(running_fname))])
+                # all files are read with the '--no_cache' option
+                classify_mock.reset_mock()
+                main(test_input + ["--no_cache"])
+                self.assertEqual(classify_mock.call_count, 2)
+        finally:
+            silent_remove(SUB_SUB_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
+            pass
+
     def testSingleFinalConvergence(self):
         test_input = ["-f", SINGLE_FILE, "-z"]
         good_out = 'File Name                            Convergence Convergence_Error\n'\
@@ -265,6 +357,38 @@ class TestCheckGauss(unittest.TestCase):
                 silent_remove(f_name, disable=DISABLE_REMOVE)
             pass
 
+    def testNoPlots(self):
+        test_input = ["-l", LIST_FILE, "-s", "--no_plots"]
+        expected_f_names = [CONV_239_OUT, CONV_239_PNG, CONV_419_OUT, CONV_419_PNG]
+        try:
+            for f_name in expected_f_names:
+                silent_remove(f_name)
+            with capture_stdout(main, test_input) as output:
+                self.assertFalse(".png" in output)
+            self.assertFalse(diff_lines(CONV_239_OUT, GOOD_CONV_239_OUT))
+            self.assertFalse(os.path.isfile(CONV_239_PNG))
+            self.assertFalse(os.path.isfile(CONV_419_PNG))
+        finally:
+            for f_name in expected_f_names:
+                silent_remove(f_name, disable=DISABLE_REMOVE)
+            pass
+
+    def testPlotsOnlyFailed(self):
+        # the last step of me2propprpnt_7.log did not converge; that of prop_acetate_8.log did
+        silent_remove(SUB_SUB_DIR, dir_with_files=True)
+        os.makedirs(SUB_SUB_DIR)
+        for fname in ["me2propprpnt_7.log", "prop_acetate_8.log"]:
+            copyfile(os.path.join(SUB_DATA_DIR, fname), os.path.join(SUB_SUB_DIR, fname))
+        test_input = ["-d", SUB_SUB_DIR, "-s", "--plots_only_failed", "--no_cache"]
+        try:
+            main(test_input)
+            self.assertTrue(os.path.isfile(os.path.join(SUB_SUB_DIR, "me2propprpnt_7_conv_steps.png")))
+            self.assertTrue(os.path.isfile(os.path.join(SUB_SUB_DIR, "prop_acetate_8_conv_steps.csv")))
+            self.assertFalse(os.path.isfile(os.path.join(SUB_SUB_DIR, "prop_acetate_8_conv_steps.png")))
+        finally:
+            silent_remove(SUB_SUB_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
+            pass
+
     def testOneEachStepOut(self):
         # tests searching directory with checking convergence, plus using an alternate extension
         test_input = ["-s", "-d", SUB_DATA_DIR, "-e", "ts.out"]
@@ -415,6 +539,88 @@ class TestCheckGauss(unittest.TestCase):
             silent_remove(SUB_SUB_DIR, disable=DISABLE_REMOVE, dir_with_files=True)
             pass
 
+    def testParallelSameAsSerial(self):
+        temp_files_list = make_fill_sub_dir()
+        serial_input = ["-ds", SUB_SUB_DIR, "-b"]
+        parallel_input = serial_input + ["-j", "2"]
+        try:
+            with capture_stdout(main, serial_input) as output:
+                serial_output = output
+            with capture_stdout(main, parallel_input) as output:
+                self.assertEqual(serial_output, output)
+            self.assertTrue("No convergence data found for file: ipvc_11_10_cp.log" in serial_output)
+        finally:
+            for temp_name in temp_files_list:
+                silent_remove(temp_name, disable=DISABLE_REMOVE)
+            silent_remove(SUB_SUB_DIR, disable=DISABLE_REMOVE, dir_with_files=True)
+            pass
+
+    def testParallelListEachStepConvergence(self):
+        test_input = ["-l", LIST_FILE, "-s", "-j", "2"]
+        expected_f_names = [CONV_239_OUT, CONV_239_PNG, CONV_419_OUT, CONV_419_PNG]
+        try:
+            for f_name in expected_f_names:
+                silent_remove(f_name)
+            with capture_stdout(main, test_input) as output:
+                # printed in the order of the list, after the header
+                self.assertTrue(output.index("hexyl_acrylate_239_conv_steps.csv") <
+                                output.index("hexyl_acrylate_419_conv_steps.csv"))
+            self.assertFalse(diff_lines(CONV_239_OUT, GOOD_CONV_239_OUT))
+            self.assertFalse(diff_lines(CONV_419_OUT, GOOD_CONV_419_OUT))
+            self.assertTrue(os.path.isfile(CONV_239_PNG))
+            self.assertTrue(os.path.isfile(CONV_419_PNG))
+        finally:
+            for f_name in expected_f_names:
+                silent_remove(f_name, disable=DISABLE_REMOVE)
+            pass
+
+    def testParallelTermination(self):
+        silent_remove(SUB_SUB_DIR, dir_with_files=True)
+        make_dir(SUB_SUB_DIR)
+        fname_after_run = os.path.join(SUB_SUB_DIR, 'for_hartree', 'pet_mono_637_tzvp.log')
+        copyfile(os.path.join(SUB_DATA_DIR, 'pet_mono_637_tzvp.tpl'),
+                 os.path.join(SUB_SUB_DIR, 'pet_mono_637_tzvp.log'))
+        for base_name in ['me2propprpnt_7.log', 'pet_mono_671_tzvp.log']:
+            copyfile(os.path.join(SUB_DATA_DIR, base_name), os.path.join(SUB_SUB_DIR, base_name))
+        good_output = "The following files completed normally:\n" \
+                      "    tests/test_data/check_gauss/temp_dir/pet_mono_637_tzvp.log\n" \
+                      "The following files may have failed:\n" \
+                      "    tests/test_data/check_gauss/temp_dir/me2propprpnt_7.log\n" \
+                      "The following files may still be running:\n" \
+                      "    tests/test_data/check_gauss/temp_dir/pet_mono_671_tzvp.log\n"
+        try:
+            test_input = ["-d", SUB_SUB_DIR, "-j", "3"]
+            # main(test_input)
+            with capture_stdout(main, test_input) as output:
+                self.assertTrue(good_output in output)
+            self.assertTrue(os.path.isfile(fname_after_run))
+        finally:
+            silent_remove(SUB_SUB_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
+            pass
+
+    def testFollowEachStepConvergence(self):
+        silent_remove(SUB_SUB_DIR, dir_with_files=True)
+        make_dir(SUB_SUB_DIR)
+        temp_log = os.path.join(SUB_SUB_DIR, 'hexyl_acrylate_239.log')
+        temp_csv = os.path.join(SUB_SUB_DIR, 'hexyl_acrylate_239_conv_steps.csv')
+        with open(os.path.join(ALT_DATA_DIR, 'hexyl_acrylate_239.log')) as f:
+            log_str = f.read()
+        test_input = ["-f", temp_log, "-s", "--follow"]
+        try:
+            # check a job as it runs: first only part of the log is written, ending within a line
+            with open(temp_log, 'w') as f:
+                f.write(log_str[:len(log_str) // 2])
+            main(test_input)
+            with open(temp_csv) as f:
+                self.assertTrue(0 < len(f.readlines()) < 12)
+            with open(temp_log, 'a') as f:
+                f.write(log_str[len(log_str) // 2:])
+            main(test_input)
+            self.assertFalse(diff_lines(temp_csv, GOOD_CONV_239_OUT))
+        finally:
+            silent_remove(SUB_SUB_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
+            pass
+
     def testCheckFinalConverg(self):
         input_fname = os.path.join(SUB_DATA_DIR, "prop_acetate_8.log")
         test_input = ["-f", input_fname, "-z"]
@@ -422,6 +628,35 @@ class TestCheckGauss(unittest.TestCase):
         with capture_stdout(main, test_input) as output:
             self.assertTrue("False (negligible forces)" in output)
 
+    def testScanList(self):
+        scan_list_fname = os.path.join(SUB_DATA_DIR, "scans.txt")
+        scan_lines = ["# scan name, then its files",
+                      "pet_dimer " + " ".join([os.path.join(SUB_DATA_DIR, "pet_dimer_scan_neg_tzvp.log"),
+                                               os.path.join(SUB_DATA_DIR, "pet_dimer_scan_pos_tzvp.log")]),
+                      "pet_dimer_neg " + os.path.join(SUB_DATA_DIR, "pet_dimer_scan_neg.log"),
+                      "no_scan " + SINGLE_FILE,
+                      "missing_file " + os.path.join(SUB_DATA_DIR, "nosuch.log")]
+        list_to_file(scan_lines, scan_list_fname)
+        fits_fname = os.path.join(SUB_DATA_DIR, "scans_fits.csv")
+        png_fnames = [os.path.join(SUB_DATA_DIR, "pet_dimer.png"), os.path.join(SUB_DATA_DIR, "pet_dimer_neg.png")]
+        test_input = ["--scan_list", scan_list_fname, "-j", "2", "--scan_plots"]
+        try:
+            # main(test_input)
+            with capture_stderr(main, test_input) as output:
+                self.assertTrue("Skipping scan 'no_scan'" in output)
+                self.assertTrue("Skipping scan 'missing_file'" in output)
+            with open(fits_fname) as f:
+                fit_lines = f.readlines()
+            self.assertEqual(len(fit_lines), 3)
+            self.assertTrue(fit_lines[1].startswith('"pet_dimer",37,"1,2,3,4,6",0.050265,'))
+            self.assertTrue(fit_lines[1].strip().endswith('7.291863,"7.29;3.56;2.52;2.52;3.56;7.29"'))
+            self.assertTrue(fit_lines[2].startswith('"pet_dimer_neg",19,'))
+            for fname in png_fnames:
+                self.assertTrue(os.path.isfile(fname))
+        finally:
+            for fname in [scan_list_fname, fits_fname] + png_fnames:
+                silent_remove(fname, disable=DISABLE_REMOVE)
+
     def testMakeScanPlot(self):
         list_fname = os.path.join(SUB_DATA_DIR, "scan_list.txt")
         fnames = [os.path.join(SUB_DATA_DIR, "pet_dimer_scan_neg_tzvp.log"),
@@ -434,6 +669,7 @@ class TestCheckGauss(unittest.TestCase):
             # main(test_input)
             with capture_stdout(main, test_input) as output:
                 self.assertTrue("Barriers" in output)
+                self.assertTrue("CHARMM dihedral parameters for the best fit (RMSE 0.05" in output)
             self.assertTrue(os.path.isfile(out_png_fname))
         finally:
             silent_remove(list_fname, disable=DISABLE_REMOVE)
@@ -441,6 +677,49 @@ class TestCheckGauss(unittest.TestCase):
             pass
 
 
+class TestClassifyTermination(unittest.TestCase):
+    def testErrorTerminations(self):
+        expected = {os.path.join(LOG_2_COM_DIR, 'acyl-ts_mp.log'): ('l103', 'constraint_error'),
+                    os.path.join(LOG_2_COM_DIR, 's12but_17_84_f2.log'): ('l1002', 'out_of_memory'),
+                    os.path.join(DATA_DIR, 'goodvibes_helper', 'co_fail_gas.log'): ('l301', 'charge_multiplicity'),
+                    os.path.join(SUB_DATA_DIR, 'pet_mono_819_tzvp.log'): (None, 'file_error'),
+                    os.path.join(SUB_DATA_DIR, 'pet_mono_671_tzvp.log'): (None, None),
+                    os.path.join(SUB_DATA_DIR, 'empty.log'): (None, None),
+                    }
+        for fname, (link, error) in expected.items():
+            termination = classify_termination(fname)
+            self.assertEqual((termination['Link'], termination['Error']), (link, error), msg=fname)
+
+    def testKilledJobs(self):
+        # a job cut off mid-run, with the message from the queueing system added to the log
+        with open(os.path.join(SUB_DATA_DIR, 'pet_mono_671_tzvp.log')) as f:
+            log_str = f.read()
+        temp_log = os.path.join(SUB_DATA_DIR, 'killed.log')
+        try:
+            for kill_line, error in [("slurmstepd: error: *** JOB 123 ON r1i1n1 CANCELLED AT 2020-01-01T01:01:01 "
+                                      "DUE TO TIME LIMIT ***", 'walltime'),
+                                     ("slurmstepd: error: *** JOB 123 ON r1i1n1 CANCELLED AT 2020-01-01T01:01:01 ***",
+                                      'killed'),
+                                     ("Erroneous write. Write 8192 instead of 12288.", 'file_error')]:
+                with open(temp_log, 'w') as f:
+                    f.write(log_str + kill_line + "\n")
+                termination = classify_termination(temp_log)
+                self.assertEqual(termination['Status'], 'likely_failed')
+                self.assertEqual(termination['Error'], error)
+                self.assertEqual(termination['Message'], kill_line)
+        finally:
+            silent_remove(temp_log, disable=DISABLE_REMOVE)
+
+
+class TestCheckConvergParts(unittest.TestCase):
+    def testLowestConvergSteps(self):
+        # same order as sorting all steps, including for ties
+        converg = np.asarray([5., 1., 3., 1., 2., 3., 3., 0.5, 7.])
+        for num_steps in range(1, 12):
+            expected = sorted(range(len(converg)), key=lambda idx: converg[idx])[:num_steps]
+            self.assertEqual(lowest_converg_steps(converg, num_steps).tolist(), expected)
+
+
 class TestCheckScanPlotParts(unittest.TestCase):
     def testCharmmDihedralFunction(self):
         params = np.asarray([0.8119, 0.2299, -1.7798, -0.8174, 1.53312,
@@ -478,7 +757,7 @@ class TestCheckScanPlotParts(unittest.TestCase):
                 silent_remove(fname)
             # find_good_fit(*test_input)
             with capture_stdout(find_good_fit, *test_input) as output:
-                self.assertTrue("0.44" in output)
+                self.assertTrue("n = 1,2,3,4,6:  0.05" in output)
                 self.assertTrue("0.07" in output)
             for fname in out_names:
                 self.assertTrue(os.path.isfile(fname))
@@ -487,6 +766,24 @@ class TestCheckScanPlotParts(unittest.TestCase):
                 silent_remove(fname, disable=DISABLE_REMOVE)
             pass
 
+    def testFitCharmmDihedral(self):
+        # energies from the CHARMM formula (with any offset) are fit exactly when the same n values are used
+        params = np.asarray([0.8119, 0.2299, -1.7798, -0.8174, 1.53312,
+                             88.429, 42.743, 52.9498, 34.9852, 36.352])
+        x_vals = SCAN_ARRAY[:, 0]
+        y_vals = charmm_dihedral(x_vals, *params, 1, 1, 1, 1, 1) + 2.5
+        k_vals, d_vals, offsets, resids = fit_charmm_dihedral(x_vals, y_vals)
+        self.assertEqual(k_vals.shape, (len(CHARMM_N_MULTIPLIERS), 5))
+        self.assertAlmostEqual(resids[0], 0.)
+        self.assertTrue(np.all(resids[1:] > 0.01))
+        self.assertTrue(np.allclose(k_vals[0], np.abs(params[:5])))
+        x_fit = np.linspace(0., 360., 50)
+        self.assertTrue(np.allclose(charmm_dihedral(x_fit, *k_vals[0], *d_vals[0], 1, 1, 1, 1, 1) + offsets[0],
+                                    charmm_dihedral(x_fit, *params, 1, 1, 1, 1, 1) + 2.5))
+        # unused n values have no k or d
+        self.assertTrue(np.all(k_vals[5, 1:] == 0.))
+        self.assertTrue(np.all(d_vals[5, 1:] == 0.))
+
     def testMakePlot(self):
         png_out_fname = os.path.join(SUB_DATA_DIR, "scan.png")
         try:
@@ -596,3 +893,40 @@ class TestCheckScanPlotParts(unittest.TestCase):
                                       [329.9998, 3.79202718], [339.9998, 5.41971772], [349.9998, 6.66774621],
                                       [359.9998, 7.26502227]])
         self.assertTrue(np.allclose(scan_array, good_scan_array))
+
+    def testCombineScanSegments(self):
+        # the same scan as above, split into overlapping pieces given in any order and direction
+        fnames = [os.path.join(SUB_DATA_DIR, "pet_dimer_scan_neg_tzvp.log"),
+                  os.path.join(SUB_DATA_DIR, "pet_dimer_scan_pos_tzvp.log")]
+        expected = collect_output_scan_steps(fnames)
+        neg_scan, pos_scan = [np.array(list(process_gausslog_file(fname, collect_scan_steps=True)[SCAN_DICT].items()),
+                                       dtype=float) for fname in fnames]
+        self.assertTrue(np.allclose(combine_scan_segments([pos_scan, neg_scan])[:, 0], expected[:, 0]))
+        pieces = [neg_scan[:16], pos_scan[8:], neg_scan[::-1][:6], pos_scan[:10], neg_scan[::-1][5:12]]
+        scan_array = combine_scan_segments(pieces)
+        scan_array[:, 1] = (scan_array[:, 1] - np.min(scan_array[:, 1])) * 627.5094740631
+        # the pieces are combined in the period of the first piece: here, -180 to 180
+        self.assertEqual(scan_array.shape, expected.shape)
+        self.assertAlmostEqual(scan_array[0, 0], -180.0001)
+        self.assertAlmostEqual(scan_array[-1, 0], 179.9999)
+        for scan_val, energy in scan_array:
+            same_point = np.abs(np.mod(expected[:, 0] - scan_val + 180.001, 360.) - 180.001) < 0.002
+            self.assertTrue(np.any(np.abs(expected[same_point, 1] - energy) < 0.0001))
+        # where values overlap, the lowest energy is kept
+        pieces.append(np.array([[-170., -1610.]]))
+        scan_array = combine_scan_segments(pieces)
+        self.assertEqual(len(scan_array), len(expected))
+        self.assertAlmostEqual(scan_array[np.argmin(scan_array[:, 1]), 0], -170.)
+
+    def testGridScanPoints(self):
+        x1, x2 = np.meshgrid([-120., 0., 120.], [170., -180., -170.], indexing='ij')
+        energies = np.arange(9.)
+        scan_points = np.column_stack((x1.ravel(), x2.ravel(), energies))
+        # one point missing, one repeated with a lower energy
+        scan_points = np.vstack((scan_points[1:], [[0.0001, -179.9999, -1.]]))
+        scan_grid = grid_scan_points(scan_points)
+        self.assertEqual(scan_grid.shape, (3, 3, 3))
+        self.assertTrue(np.allclose(scan_grid[0][:, 0], [0., 120., 240.], atol=0.001))
+        self.assertTrue(np.allclose(scan_grid[1][0], [170., 180., 190.], atol=0.001))
+        good_energies = np.asarray([[3., -1., 5.], [6., 7., 8.], [np.nan, 1., 2.]])
+        self.assertTrue(np.array_equal(scan_grid[2], good_energies, equal_nan=True))
@@ -1,6 +1,8 @@
 import unittest
 import os
-from gaussian_wrangler.gauss_fragment import main
+import numpy as np
+from gaussian_wrangler.gauss_fragment import main, fragment_molecule
+from gaussian_wrangler.gw_common import Geometry
 from common_wrangler.common import diff_lines, silent_remove, capture_stdout, capture_stderr
 import logging
 
@@ -320,3 +322,17 @@ class TestGausscomFrag(unittest.TestCase):
             silent_remove(CP_FOOTER_F1_OUT, disable=DISABLE_REMOVE)
             silent_remove(CP_FOOTER_F2_OUT, disable=DISABLE_REMOVE)
             pass
+
+
+class TestFragmentMoleculeParts(unittest.TestCase):
+    def testDiatomic(self):
+        # with no other atoms, breaking the bond leaves the O alone, as from a broken double bond
+        carbon_monoxide = Geometry([[0.0, 0.0, 0.0], [0.0, 0.0, 1.13]], [6, 8])
+        found = fragment_molecule((1, 2), carbon_monoxide, False)
+        self.assertEqual(found[:4], ([2], [1], True, False))
+        self.assertTrue(np.array_equal(found[4], [2, 1]))
+
+    def testNitrogenDiatomic(self):
+        nitric_oxide = Geometry([[0.0, 0.0, 0.0], [0.0, 0.0, 1.15]], [7, 8])
+        found = fragment_molecule((1, 2), nitric_oxide, False)
+        self.assertEqual(found[:4], ([1], [2], False, True))
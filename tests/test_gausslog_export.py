@@ -0,0 +1,143 @@
+import logging
+import os
+import unittest
+from unittest import mock
+import numpy as np
+from common_wrangler.common import capture_stdout, capture_stderr, silent_remove, make_dir
+from gaussian_wrangler.gw_common import scan_gausslog_file, CONVERG_STEP_DICT, ENERGY, CONVERG
+from gaussian_wrangler.gausslog_export import main
+# run with an empty parsed-log cache in a temporary directory, removed after the module's tests
+from tests.test_log_cache import setUpModule, tearDownModule  # noqa: F401
+
+
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+DISABLE_REMOVE = logger.isEnabledFor(logging.DEBUG)
+
+__author__ = 'hmayes'
+
+TEST_DIR = os.path.dirname(__file__)
+MAIN_DIR = os.path.dirname(TEST_DIR)
+DATA_DIR = os.path.join(TEST_DIR, 'test_data')
+SUB_DATA_DIR = os.path.join(DATA_DIR, 'check_gauss')
+ALT_DATA_DIR = os.path.join(DATA_DIR, 'gausslog_unique')
+OUT_DIR = os.path.join(DATA_DIR, 'export_temp')
+OUT_NPZ = os.path.join(OUT_DIR, 'export.npz')
+
+SINGLE_FILE = os.path.join(SUB_DATA_DIR, 'me2propprpnt_7.log')
+OTHER_FILE = os.path.join(SUB_DATA_DIR, 'prop_acetate_8.log')
+SCAN_FILE = os.path.join(SUB_DATA_DIR, 'pet_dimer_scan_pos_tzvp.log')
+# has a coordinate that cannot be read
+BAD_FILE = os.path.join(DATA_DIR, 'gausslog2pdb', 'pet_trimer_confab_1_tzvp_opt.log')
+FILE_COLUMN_NAMES = ['name', 'stoich', 'charge', 'mult', 'energy', 'enthalpy', 'gibbs', 'ts', 'converg',
+                     'converg_error', 'num_steps']
+STEP_COLUMN_NAMES = ['file_index', 'step', 'energy', 'max_force', 'rms_force', 'max_displ', 'rms_displ', 'converg',
+                     'converg_error']
+
+
+class TestGausslogExportNoOut(unittest.TestCase):
+    # These test failure cases that do not produce output files
+    def testHelp(self):
+        test_input = ['-h']
+        if logger.isEnabledFor(logging.DEBUG):
+            main(test_input)
+        with capture_stderr(main, test_input) as output:
+            self.assertFalse(output)
+        with capture_stdout(main, test_input) as output:
+            self.assertTrue("optional arguments" in output or "options" in output)
+
+    def testWrongExt(self):
+        test_input = ["-f", SINGLE_FILE, "-o", "export.csv"]
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("must end in '.npz' or '.parquet'" in output)
+
+    def testNonPositiveJobs(self):
+        test_input = ["-f", SINGLE_FILE, "-j", "0"]
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("must be a positive integer" in output)
+
+    def testNoPyarrow(self):
+        test_input = ["-f", SINGLE_FILE, "-o", os.path.join(OUT_DIR, "export.parquet")]
+        with mock.patch.dict('sys.modules', {'pyarrow': None, 'pyarrow.parquet': None}):
+            with capture_stderr(main, test_input) as output:
+                self.assertTrue("pip install pyarrow" in output)
+
+
+class TestGausslogExport(unittest.TestCase):
+    def setUp(self):
+        make_dir(OUT_DIR)
+
+    def tearDown(self):
+        silent_remove(OUT_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
+
+    def testDirectory(self):
+        test_input = ["-d", SUB_DATA_DIR, "-o", OUT_NPZ, "--no_cache"]
+        if logger.isEnabledFor(logging.DEBUG):
+            main(test_input)
+        with capture_stdout(main, test_input) as output:
+            self.assertTrue("Wrote file" in output)
+        with np.load(OUT_NPZ) as data:
+            self.assertEqual(sorted(data.files), sorted(['file_' + name for name in FILE_COLUMN_NAMES] +
+                                                        ['step_' + name for name in STEP_COLUMN_NAMES]))
+            names = list(data['file_name'])
+            self.assertEqual(len(names), 12)
+            self.assertEqual(len(data['step_file_index']), np.sum(data['file_num_steps']))
+            file_index = names.index(os.path.relpath(SINGLE_FILE))
+            self.assertEqual(data['file_stoich'][file_index], 'C7H12O4')
+            self.assertAlmostEqual(data['file_converg'][file_index], 111.4981, places=4)
+            self.assertTrue(data['file_converg_error'][file_index])
+            # no frequencies, so whether it is a transition state was not determined
+            self.assertTrue(np.isnan(data['file_ts'][file_index]))
+            self.assertEqual(data['file_ts'][names.index(os.path.relpath(OTHER_FILE))], 0.)
+            # the final convergence is the same as found by check_gauss with the '-z' option, also for scans
+            scan_index = names.index(os.path.relpath(SCAN_FILE))
+            self.assertAlmostEqual(data['file_converg'][scan_index],
+                                   scan_gausslog_file(SCAN_FILE, find_converg=True)[CONVERG])
+            expected_steps = scan_gausslog_file(SINGLE_FILE, find_step_converg=True)[CONVERG_STEP_DICT]
+            step_mask = data['step_file_index'] == file_index
+            self.assertEqual(list(data['step_step'][step_mask]), list(expected_steps.keys()))
+            self.assertTrue(np.array_equal(data['step_energy'][step_mask],
+                                           [step[ENERGY] for step in expected_steps.values()]))
+            self.assertTrue(np.array_equal(data['step_converg'][step_mask],
+                                           [step[CONVERG] for step in expected_steps.values()]))
+
+    def testSmallBatches(self):
+        # the same data is written when files are read, and columns copied, a few at a time
+        test_input = ["-ds", ALT_DATA_DIR, "-o", OUT_NPZ, "--no_cache"]
+        with capture_stderr(main, test_input):
+            with np.load(OUT_NPZ) as data:
+                expected = {key: data[key] for key in data.files}
+        with mock.patch('gaussian_wrangler.gausslog_export.BATCH_SIZE', 2), \
+                mock.patch('gaussian_wrangler.gausslog_export.CHUNK_SIZE', 3):
+            with capture_stderr(main, test_input + ["-j", "2"]):
+                with np.load(OUT_NPZ) as data:
+                    for key in data.files:
+                        equal_nan = data[key].dtype.kind == 'f'
+                        self.assertTrue(np.array_equal(data[key], expected[key], equal_nan=equal_nan), msg=key)
+        self.assertTrue(len(expected['file_name']) > 4)
+
+    def testSkipUnreadable(self):
+        # a file that cannot be parsed is skipped, and the others are exported
+        file_list = os.path.join(OUT_DIR, 'export_list.txt')
+        with open(file_list, 'w') as f:
+            f.write(f"{BAD_FILE}\n{SINGLE_FILE}\n")
+        test_input = ["-l", file_list, "-o", OUT_NPZ, "--no_cache"]
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("Skipping file '{}'".format(os.path.relpath(BAD_FILE)) in output)
+        with np.load(OUT_NPZ) as data:
+            self.assertEqual(list(data['file_name']), [os.path.relpath(SINGLE_FILE)])
+            self.assertTrue(np.all(data['step_file_index'] == 0))
+
+    def testNoReadableFiles(self):
+        test_input = ["-f", BAD_FILE, "-o", OUT_NPZ, "--no_cache"]
+        with capture_stderr(main, test_input) as output:
+            self.assertTrue("None of the Gaussian output files could be read" in output)
+        self.assertFalse(os.path.exists(OUT_NPZ))
+
+    def testNoPartialOutput(self):
+        # if writing fails, a partly written file is not left behind
+        test_input = ["-f", SINGLE_FILE, "-o", OUT_NPZ, "--no_cache"]
+        with mock.patch('gaussian_wrangler.gausslog_export.write_str_chunks', side_effect=OSError("No space left")):
+            with capture_stderr(main, test_input) as output:
+                self.assertTrue("No space left" in output)
+        self.assertFalse(os.path.exists(OUT_NPZ))
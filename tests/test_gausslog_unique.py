@@ -1,10 +1,18 @@
 import unittest
 import os
+import sqlite3
 import numpy as np
-from common_wrangler.common import capture_stdout, capture_stderr, DIHES, silent_remove
-from gaussian_wrangler.gausslog_unique import main, compare_gausslog_info, print_results, DEF_OUT_NAME
-from gaussian_wrangler.gw_common import process_gausslog_file, CONVERG_ERR, TS, CONVERG
+from common_wrangler.common import (capture_stdout, capture_stderr, DIHES, SEC_ATOMS, silent_remove, make_dir,
+                                    list_to_file, file_rows_to_list)
+from unittest import mock
+from gaussian_wrangler.gausslog_unique import (main, compare_gausslog_info, print_results, DEF_OUT_NAME,
+                                               cluster_conformers, dihedral_array, grid_index_dims, kabsch_rmsd,
+                                               canonical_content, dihedral_angles)
+from gaussian_wrangler.gw_common import process_gausslog_file, CONVERG_ERR, TS, CONVERG, STOICH, Geometry
+from gaussian_wrangler.log_cache import get_gausslog_content
 import logging
+# run with an empty parsed-log cache in a temporary directory, removed after the module's tests
+from tests.test_log_cache import setUpModule, tearDownModule  # noqa: F401
 
 # logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -33,6 +41,8 @@ TWO_MOL_LIST = os.path.join(SUB_DATA_DIR, 'list_two_molecules.txt')
 TWO_MORE_MOL_LIST = os.path.join(SUB_DATA_DIR, 'list_two_more_molecules.txt')
 SIMILAR_LIST = os.path.join(SUB_DATA_DIR, 'list_similar_molecules.txt')
 CALCALL_LIST = os.path.join(SUB_DATA_DIR, 'list_calcall.txt')
+LIBRARY_DIR = os.path.join(SUB_DATA_DIR, 'library_temp')
+LIBRARY_FILE = os.path.join(LIBRARY_DIR, 'conformers.sqlite')
 
 
 class TestGausslogUniqueNoOut(unittest.TestCase):
@@ -206,6 +216,55 @@ class TestGausslogUnique(unittest.TestCase):
             self.assertTrue('' == output)
 
 
+class TestConformerLibrary(unittest.TestCase):
+    def setUp(self):
+        make_dir(LIBRARY_DIR)
+        self.all_files = []
+        for list_fname in [TWO_MOL_LIST, LIGNIN_LIST, SIMILAR_LIST, LIST_NO_FREQ]:
+            self.all_files.extend(fname for fname in file_rows_to_list(list_fname) if fname not in self.all_files)
+        self.first_list = os.path.join(LIBRARY_DIR, 'first_list.txt')
+        self.all_list = os.path.join(LIBRARY_DIR, 'all_list.txt')
+        list_to_file(self.all_files[:5], self.first_list)
+        list_to_file(self.all_files, self.all_list)
+
+    def tearDown(self):
+        silent_remove(LIBRARY_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
+        silent_remove(DEF_OUT_NAME)
+
+    def testSameAsAllFiles(self):
+        with capture_stdout(main, ["-l", self.all_list, "-m", "5.0"]) as expected_output:
+            with open(DEF_OUT_NAME) as f:
+                expected_cutoff = f.read()
+        library_input = ["--library", LIBRARY_FILE, "-m", "5.0"]
+        with capture_stdout(main, ["-l", self.first_list] + library_input):
+            pass
+        # only the files not in the library are read
+        with mock.patch('gaussian_wrangler.gausslog_unique.get_gausslog_content',
+                        side_effect=get_gausslog_content) as read_mock:
+            with capture_stdout(main, ["-l", self.all_list] + library_input) as output:
+                self.assertEqual(output, expected_output)
+            self.assertEqual(read_mock.call_count, len(self.all_files) - 5)
+            with open(DEF_OUT_NAME) as f:
+                self.assertEqual(f.read(), expected_cutoff)
+            # the output can be made from the library alone
+            with capture_stdout(main, ["-l", EMPTY_LIST] + library_input) as output:
+                self.assertEqual(output, expected_output)
+            self.assertEqual(read_mock.call_count, len(self.all_files) - 5)
+
+    def testUnreadableLibrary(self):
+        # saved content that was not written as JSON (here, a pickle, which could run code when loaded) is not used
+        main(["-l", self.first_list, "--library", LIBRARY_FILE])
+        with sqlite3.connect(LIBRARY_FILE) as conn:
+            conn.execute("UPDATE conf_groups SET first_content = ?", (b'\x80\x04\x95cos\nsystem\n.',))
+        with capture_stderr(main, ["-l", self.all_list, "--library", LIBRARY_FILE]) as output:
+            self.assertTrue("start a new library" in output)
+
+    def testChangedTolerance(self):
+        main(["-l", self.first_list, "--library", LIBRARY_FILE])
+        with capture_stderr(main, ["-l", self.all_list, "--library", LIBRARY_FILE, "-t", "10"]) as output:
+            self.assertTrue("was made with dihedral_tolerance 5.0 (not 10.0)" in output)
+
+
 class TestGausslogUniqueFunctions(unittest.TestCase):
     def testOneFileMissingDihedralInfo(self):
         # testing for some specific problem encountered: when there is a freq only job (no opt) there is no
@@ -239,6 +298,144 @@ class TestGausslogUniqueFunctions(unittest.TestCase):
         warn_files_list = warn_files_str.split('\n')
         self.assertEqual(len(warn_files_list), 4)
 
+    def testClusterSameAsCompare(self):
+        log_info = {}
+        for fname in sorted(os.listdir(SUB_DATA_DIR)):
+            if fname.endswith('.log'):
+                log_info[fname] = process_gausslog_file(os.path.join(SUB_DATA_DIR, fname), find_dih=True)
+        for dih_tol in [1., 5., 30.]:
+            expected = compare_gausslog_info(log_info, dih_tol)
+            self.assertEqual(cluster_conformers(log_info, dih_tol), expected)
+            self.assertEqual(cluster_conformers(log_info, dih_tol, use_index=True), expected)
+            self.assertTrue(len(expected) < len(log_info))
+
+    def testClusterBlocks(self):
+        # groups found in different blocks (and chunks of groups) are the same as when comparing one file at a time
+        rng = np.random.default_rng(12)
+        base_dihes = rng.uniform(-180., 180., (8, 6))
+        log_info = {}
+        for index in range(60):
+            dihes = (base_dihes[index % 8] + rng.normal(0., 2., 6) + 180.) % 360. - 180.
+            dih_dict = {f"D{dih_num}": dih_val for dih_num, dih_val in enumerate(dihes.tolist())}
+            if index % 7 == 0:
+                del dih_dict["D2"]
+            log_info[f"conf_{index}.log"] = {STOICH: "C5H10" if index % 5 else "C6H12",
+                                             DIHES: None if index % 11 == 3 else dih_dict}
+        expected = compare_gausslog_info(log_info, 5.)
+        with mock.patch('gaussian_wrangler.gausslog_unique.FILE_BLOCK_SIZE', 4), \
+                mock.patch('gaussian_wrangler.gausslog_unique.MAX_BLOCK_PAIRS', 12):
+            self.assertEqual(cluster_conformers(log_info, 5.), expected)
+        self.assertEqual(cluster_conformers(log_info, 5.), expected)
+
+    def testClusterIndexed(self):
+        # includes values on either side of +/-180 degrees, which are in neighboring cells of the periodic grid
+        rng = np.random.default_rng(7)
+        base_dihes = rng.uniform(-180., 180., (20, 5))
+        base_dihes[:4, :3] = 179.
+        for dih_tol in [0., 2., 5., 45.]:
+            log_info = {}
+            for index in range(200):
+                dihes = (base_dihes[index % 20] + rng.normal(0., dih_tol / 2. + 0.1, 5) + 180.) % 360. - 180.
+                dih_dict = {f"D{dih_num}": dih_val for dih_num, dih_val in enumerate(dihes.tolist())}
+                if index % 13 == 0:
+                    del dih_dict["D4"]
+                log_info[f"conf_{index}.log"] = {STOICH: "C5H10", DIHES: dih_dict}
+            self.assertEqual(cluster_conformers(log_info, dih_tol, use_index=True),
+                             compare_gausslog_info(log_info, dih_tol))
+
+    def testGridIndexDims(self):
+        dihes = np.array([[10., 20., -100., 5.], [12., np.nan, 100., 5.], [14., 25., 170., 5.]])
+        self.assertEqual(grid_index_dims(dihes, 5., max_dims=2), ([2, 0], 60))
+        # cells would be too wide to narrow the search
+        self.assertEqual(grid_index_dims(dihes, 150.)[0], [])
+
+    def testCanonicalOption(self):
+        # the first member of each file's group is the same conformation (with nearly the same energy), but their
+        #     dihedrals from Gaussian have different labels
+        test_input = ["-l", LOG_LIST, "--canonical"]
+        good_output = ''.join([HEADER, LME2_25_T]) + '\n'
+        with capture_stdout(main, test_input) as output:
+            self.assertTrue(good_output in output)
+
+    def testIndexOption(self):
+        test_input = ["-l", LOG_LIST, "--index"]
+        good_output = ''.join([HEADER, LME2_TS3, LME2_25_T]) + '\n'
+        with capture_stdout(main, test_input) as output:
+            self.assertTrue(good_output in output)
+
+    def testKabschRmsd(self):
+        rng = np.random.default_rng(5)
+        coords = rng.normal(size=(10, 3))
+        coords -= coords.mean(axis=0)
+        angle = np.radians(40.)
+        rotation = np.array([[np.cos(angle), -np.sin(angle), 0.], [np.sin(angle), np.cos(angle), 0.], [0., 0., 1.]])
+        displacements = rng.normal(scale=0.1, size=(10, 3))
+        displacements -= displacements.mean(axis=0)
+        ref_coords = np.stack([coords @ rotation.T, (coords + displacements) @ rotation.T, -coords])
+        rmsds = kabsch_rmsd(coords, ref_coords)
+        self.assertAlmostEqual(rmsds[0], 0.)
+        # the displacements are at most the RMSD from the best superposition
+        self.assertTrue(0. < rmsds[1] <= np.sqrt(np.mean(np.sum(displacements ** 2, axis=1))) + 1e-12)
+        # an inverted structure (with a different chirality) cannot be superposed by rotation
+        self.assertTrue(rmsds[2] > 0.5)
+
+    def testClusterRmsd(self):
+        rng = np.random.default_rng(9)
+        base_coords = rng.normal(scale=2., size=(3, 8, 3))
+        atomic_nums = [6, 6, 6, 8, 1, 1, 1, 1]
+        log_info = {}
+        for index in range(12):
+            coords = base_coords[index % 3] + rng.normal(scale=0.01, size=(8, 3))
+            angle = rng.uniform(0., 2. * np.pi)
+            rotation = np.array([[1., 0., 0.], [0., np.cos(angle), -np.sin(angle)],
+                                 [0., np.sin(angle), np.cos(angle)]])
+            log_info[f"conf_{index}.log"] = {STOICH: "C3H4O", DIHES: None,
+                                             SEC_ATOMS: Geometry(coords @ rotation.T + index, atomic_nums)}
+        # with a different atom order, not compared
+        log_info["conf_12.log"] = {STOICH: "C3H4O", DIHES: None,
+                                   SEC_ATOMS: Geometry(base_coords[0], atomic_nums[::-1])}
+        self.assertEqual(len(cluster_conformers(log_info, 5.)), 13)
+        conf_groups = cluster_conformers(log_info, 5., rmsd_tol=0.1)
+        self.assertEqual(conf_groups, [[f"conf_{index}.log" for index in range(first, 12, 3)] for first in range(3)] +
+                         [["conf_12.log"]])
+
+    def testCanonicalContent(self):
+        gausslog_content = get_gausslog_content(os.path.join(SUB_DATA_DIR, 'hexyl_acrylate_239.log'),
+                                                find_dih=True, find_converg=True)
+        geometry = gausslog_content[SEC_ATOMS]
+        rng = np.random.default_rng(4)
+        atom_order = rng.permutation(geometry.num_atoms)
+        rotation = np.linalg.qr(rng.normal(size=(3, 3)))[0]
+        if np.linalg.det(rotation) < 0:
+            rotation = -rotation
+        moved_content = dict(gausslog_content)
+        moved_content[SEC_ATOMS] = Geometry(geometry.coords[atom_order] @ rotation.T + 3.,
+                                            geometry.atomic_nums[atom_order])
+        canon_content = canonical_content(gausslog_content)
+        moved_canon_content = canonical_content(moved_content)
+        self.assertTrue(canon_content[STOICH].startswith('C9H16O2:'))
+        self.assertEqual(canon_content[STOICH], moved_canon_content[STOICH])
+        # one dihedral about each bond of the chain, except the one to the methyl group
+        self.assertEqual(len(canon_content[DIHES]), 7)
+        self.assertEqual(list(canon_content[DIHES]), list(moved_canon_content[DIHES]))
+        self.assertTrue(np.allclose(list(canon_content[DIHES].values()), list(moved_canon_content[DIHES].values())))
+        other_content = canonical_content(get_gausslog_content(os.path.join(SUB_DATA_DIR, 'hexyl_acrylate_419.log'),
+                                                               find_dih=True, find_converg=True))
+        self.assertEqual(other_content[STOICH], canon_content[STOICH])
+        log_info = {'239.log': canon_content, '419.log': other_content, 'moved_239.log': moved_canon_content}
+        self.assertEqual(cluster_conformers(log_info, 5.), [['239.log', 'moved_239.log'], ['419.log']])
+
+    def testDihedralAngles(self):
+        coords = np.array([[1., 0., 0.], [0., 0., 0.], [0., 0., 1.], [0., 1., 1.], [1., 0., 1.], [-1., 0., 1.]])
+        dihedral_atoms = np.array([[0, 1, 2, 3], [0, 1, 2, 4], [0, 1, 2, 5], [3, 2, 1, 0]])
+        self.assertTrue(np.allclose(dihedral_angles(coords, dihedral_atoms), [90., 0., 180., 90.]))
+
+    def testDihedralArray(self):
+        dih_names, dihes = dihedral_array([{"D1": 10., "D2": -170.}, {"D2": 175., "D3": 1.}, {}])
+        self.assertEqual(dih_names, ["D1", "D2", "D3"])
+        self.assertTrue(np.array_equal(dihes, [[10., -170., np.nan], [np.nan, 175., 1.], [np.nan] * 3],
+                                       equal_nan=True))
+
     def testRemoveConvErr(self):
         # sometimes Gaussian ignore convergence error stating:
         #     "Optimization completed on the basis of negligible forces."
@@ -1,5 +1,7 @@
 import unittest
 import os
+import sys
+import subprocess
 from gaussian_wrangler.goodvibes_helper import main
 from common_wrangler.common import silent_remove, capture_stdout, capture_stderr, diff_lines
 import logging
@@ -89,6 +91,17 @@ class TestGoodVibesHelperNoOut(unittest.TestCase):
         with capture_stdout(main, test_input) as output:
             self.assertTrue("optional arguments" in output)
 
+    def testNoJVM(self):
+        # the JVM is only started to read files with the hartree backend, not on import, to report input errors, or
+        #     with the native backend; checked in a new process, as other tests may have started it in this one
+        check_script = "import jpype; from gaussian_wrangler.goodvibes_helper import main; " \
+                       "main(['{0}', '{1}', '-b', 'hartree', '-j', '0']); main(['{0}', '{1}']); " \
+                       "print(jpype.isJVMStarted())".format(UNI_REACT, UNI_TS)
+        result = subprocess.run([sys.executable, "-c", check_script], cwd=MAIN_DIR, capture_output=True, text=True)
+        self.assertTrue("must be a positive integer" in result.stderr)
+        self.assertTrue("Different basis sets" in result.stderr)
+        self.assertEqual(result.stdout.split()[-1], "False")
+
     def testNoneFloatVib(self):
         test_input = ["-l", TPA_LIST, "-d", SUB_DATA_DIR, "-t", "-v", "ghost"]
         # main(test_input)
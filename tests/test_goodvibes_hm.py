@@ -1,10 +1,13 @@
 import unittest
 import os
 
-from gaussian_wrangler.vib_scale_factors import CalcBBE
+from gaussian_wrangler.vib_scale_factors import CalcBBE, LogIndex, get_log_index, job_type
 
-from gaussian_wrangler.goodvibes_hm import main
-from common_wrangler.common import (capture_stdout, capture_stderr)
+import numpy as np
+from gaussian_wrangler.goodvibes_hm import (main, calc_temp_range_thermochem, TEMPS, ENTHALPY, QH_ENTHALPY, TS, QH_TS,
+                                            GIBBS, QH_GIBBS)
+from shutil import copyfile
+from common_wrangler.common import (capture_stdout, capture_stderr, silent_remove, InvalidDataError)
 import logging
 
 # logging.basicConfig(level=logging.DEBUG)
@@ -426,3 +429,64 @@ class TestBBE(unittest.TestCase):
         bbe = CalcBBE(fname, qs, qh, s_freq_cutoff, h_freq_cutoff,
                       temperature, conc, freq_scale_factor, zpe_scale_factor)
         self.assertAlmostEqual(bbe.gibbs_free_energy, -993.7747010616555)
+
+
+class TestLogIndex(unittest.TestCase):
+    def testIndexContents(self):
+        log_index = LogIndex(TEST_LOG2)
+        self.assertEqual(log_index.program, "Gaussian")
+        self.assertEqual(log_index.job_type, "TSFreq")
+        self.assertEqual(log_index.terminations["Gaussian"], "Normal")
+        self.assertEqual(log_index.orientation, "Input")
+        # the values read by the functions that use the index
+        self.assertAlmostEqual(log_index.spe, -840.031002948)
+        self.assertEqual(log_index.level_of_theory, "M062X/def2TZVP")
+        self.assertEqual(log_index.charge, "1")
+        self.assertEqual(len(log_index.atom_types), 29)
+        self.assertEqual(log_index.normal_mode.shape, (81, 29, 3))
+        self.assertAlmostEqual(log_index.freqs[0], -1608.4118)
+        self.assertAlmostEqual(log_index.links[log_index.freq_link].zero_point_corr, 0.227825)
+        self.assertFalse(hasattr(log_index, "lines"))
+        self.assertEqual(LogIndex(FAILED_LOG).terminations["Gaussian"], "Error")
+        self.assertEqual(LogIndex(INCOMPLETE_LOG).terminations["Gaussian"], "Incomplete")
+
+    def testReadOnce(self):
+        temp_log = os.path.join(SUB_DATA_DIR, "temp_index.log")
+        try:
+            copyfile(TEST_LOG1, temp_log)
+            log_index = get_log_index(temp_log)
+            self.assertIs(log_index, get_log_index(temp_log))
+            self.assertEqual(job_type(temp_log), "GSFreq")
+            # a changed file is read again
+            with open(temp_log, 'a') as f:
+                f.write(" Normal termination of Gaussian 16\n")
+            self.assertIsNot(log_index, get_log_index(temp_log))
+            self.assertEqual(len(get_log_index(temp_log).links), len(log_index.links) + 1)
+        finally:
+            silent_remove(temp_log, disable=DISABLE_REMOVE)
+
+
+class TestTempRangeThermochem(unittest.TestCase):
+    def testSameAsPrinted(self):
+        # the same values as printed with the '--ti' option, where they are rounded to 6 decimal places
+        for fname, input_options, thermo_options in [
+                (TEST_LOG4, ["-f", "0", "-v", "1.0"],
+                 dict(s_freq_cutoff=0.0, h_freq_cutoff=0.0, freq_scale_factor=1.0)),
+                (TEST_LOG1, ["-q", "-c", "1"], dict(qh=True, conc=1.0))]:
+            with capture_stdout(main, [fname, "--ti", "688.15,888.15,25"] + input_options) as output:
+                rows = [line.split()[1:] for line in output.split("\n")
+                        if line.startswith(os.path.basename(fname))]
+            thermo_vals = calc_temp_range_thermochem(fname, "688.15,888.15,25", **thermo_options)
+            keys = [TEMPS, ENTHALPY] + ([QH_ENTHALPY] if thermo_options.get('qh') else []) + \
+                [TS, QH_TS, GIBBS, QH_GIBBS]
+            expected = np.asarray(rows, dtype=float)
+            self.assertEqual(expected.shape, (9, len(keys)))
+            self.assertTrue(np.allclose(np.column_stack([thermo_vals[key] for key in keys]), expected, rtol=0,
+                                        atol=5.1e-7, equal_nan=True))
+            if not thermo_options.get('qh'):
+                self.assertTrue(np.all(np.isnan(thermo_vals[QH_ENTHALPY])))
+
+    def testIncomplete(self):
+        with self.assertRaises(InvalidDataError) as context:
+            calc_temp_range_thermochem(INCOMPLETE_LOG, "300,600,30")
+        self.assertTrue("Incomplete termination" in str(context.exception))
@@ -0,0 +1,405 @@
+import bz2
+import gzip
+import lzma
+import logging
+import os
+import shutil
+import unittest
+import numpy as np
+from common_wrangler.common import (capture_stderr, silent_remove, InvalidDataError, ATOM_TYPE, ATOM_COORDS,
+                                    SEC_ATOMS, BASE_NAME, check_for_files)
+from gaussian_wrangler.gw_common import (process_gausslog_file, scan_gausslog_file, process_gausscom_file, Geometry,
+                                         Trajectory, iter_gausslog_steps, read_tail_lines, STOICH, CONVERG_STEP_DICT,
+                                         ENERGY, CONVERG, CONVERG_ERR, open_log, split_log_name, strip_compression_ext,
+                                         SCAN_DICT, SCAN_PARAMS, STEP_NUM, NEGLIGIBLE_FORCES, NEGLIGIBLE_FORCES_ERR,
+                                         converg_step_array, scan_dir_files, read_job_info, CHARGE, MULT, SOLV,
+                                         FUNCTIONAL, BASIS_SET, FREQS, GAUSS_VER, map_in_order)
+
+
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+DISABLE_REMOVE = logger.isEnabledFor(logging.DEBUG)
+
+__author__ = 'hmayes'
+
+TEST_DIR = os.path.dirname(__file__)
+MAIN_DIR = os.path.dirname(TEST_DIR)
+DATA_DIR = os.path.join(TEST_DIR, 'test_data')
+SUB_DATA_DIR = os.path.join(DATA_DIR, 'check_gauss')
+FRAG_DATA_DIR = os.path.join(DATA_DIR, 'gauss_fragment')
+PET_MONO_COM = os.path.join(FRAG_DATA_DIR, 'pet_mono_1_tzvp.com')
+PET_MONO_CP_COM = os.path.join(FRAG_DATA_DIR, 'pet_mono_1_tzvp_14_15_cp_good.com')
+PET_MONO_BAD_COM = os.path.join(FRAG_DATA_DIR, 'pet_mono_bad_coords.com')
+GAU_TPL = os.path.join(DATA_DIR, 'pdbs2gausscoms', 'gau.tpl')
+WATER_LOG = os.path.join(DATA_DIR, 'goodvibes_helper', 'water.log')
+TEMP_TAIL_FILE = os.path.join(DATA_DIR, 'temp_tail.txt')
+SCAN_LOG = os.path.join(SUB_DATA_DIR, 'pet_dimer_scan_pos_tzvp.log')
+TWO_PARAM_SCAN_LOG = os.path.join(DATA_DIR, 'two_param_scan.log')
+COMPRESSED_DIR = os.path.join(DATA_DIR, 'compressed_temp')
+GOODVIBES_DIR = os.path.join(DATA_DIR, 'goodvibes_helper')
+
+# the combinations of options used by the scripts in this package
+PARSE_OPTION_SETS = [{},
+                     {'find_dih': True, 'find_converg': True},
+                     {'find_converg': True},
+                     {'find_step_converg': True},
+                     {'find_converg': True, 'find_step_converg': True, 'last_step_to_read': 3},
+                     {'find_step_converg': True, 'keep_final_converg': True},
+                     {'collect_scan_steps': True},
+                     ]
+
+
+def find_test_logs():
+    log_files = []
+    for root, dirs, files in os.walk(DATA_DIR):
+        for fname in sorted(files):
+            if os.path.splitext(fname)[1] in ['.log', '.out']:
+                log_files.append(os.path.join(root, fname))
+    return log_files
+
+
+def parse_and_report(parse_function, log_file, options):
+    """
+    Runs a parser, returning its results or the type and message of the error raised, plus any warnings
+    """
+    result = None
+
+    def run_parser():
+        nonlocal result
+        try:
+            result = parse_function(log_file, **options)
+        except Exception as e:
+            result = (type(e), str(e))
+
+    with capture_stderr(run_parser) as output:
+        warnings = output
+    return result, warnings
+
+
+def same_content(content1, content2):
+    if isinstance(content1, dict):
+        return (isinstance(content2, dict) and list(content1.keys()) == list(content2.keys()) and
+                all(same_content(content1[key], content2[key]) for key in content1))
+    if isinstance(content1, np.ndarray):
+        return np.array_equal(content1, content2)
+    if isinstance(content1, float) and np.isnan(content1):
+        return isinstance(content2, float) and np.isnan(content2)
+    return type(content1) is type(content2) and content1 == content2
+
+
+class TestScanGausslogFile(unittest.TestCase):
+    def testSameAsProcessGausslogFile(self):
+        log_files = find_test_logs()
+        self.assertTrue(len(log_files) > 50)
+        for log_file in log_files:
+            for options in PARSE_OPTION_SETS:
+                expected, expected_warnings = parse_and_report(process_gausslog_file, log_file, options)
+                found, found_warnings = parse_and_report(scan_gausslog_file, log_file, options)
+                self.assertTrue(same_content(expected, found), msg=f"{log_file} with options {options}")
+                self.assertEqual(expected_warnings, found_warnings)
+
+    def testKeepFinalConverg(self):
+        # the convergence of the last step read is the final report found when not reading steps, also in scans,
+        #     where repeated step numbers are renumbered
+        for log_file in [SCAN_LOG, WATER_LOG, os.path.join(SUB_DATA_DIR, 'me2propprpnt_7.log')]:
+            expected = scan_gausslog_file(log_file, find_converg=True)
+            found = scan_gausslog_file(log_file, find_step_converg=True, keep_final_converg=True)
+            self.assertEqual(found[CONVERG], expected[CONVERG], msg=log_file)
+            self.assertEqual(found[CONVERG_ERR], expected[CONVERG_ERR], msg=log_file)
+            self.assertTrue(same_content(found[CONVERG_STEP_DICT],
+                                         scan_gausslog_file(log_file, find_step_converg=True)[CONVERG_STEP_DICT]))
+
+    def testEmptyFile(self):
+        empty_log = os.path.join(SUB_DATA_DIR, 'empty.log')
+        gausslog_content = scan_gausslog_file(empty_log)
+        self.assertIsNone(gausslog_content[STOICH])
+        self.assertEqual(len(gausslog_content[CONVERG_STEP_DICT]), 0)
+
+
+class TestGeometry(unittest.TestCase):
+    def testComAtoms(self):
+        atoms = process_gausscom_file(PET_MONO_COM)[SEC_ATOMS]
+        self.assertIsInstance(atoms, Geometry)
+        self.assertEqual(atoms.coords.shape, (len(atoms), 3))
+        self.assertEqual(atoms.atomic_nums.dtype, np.int8)
+        self.assertIsNone(atoms.atom_labels)
+        # dict view, as used before the atoms were stored in arrays
+        self.assertEqual(list(atoms.keys())[:2], [1, 2])
+        self.assertEqual(atoms[1][ATOM_TYPE], 'O')
+        self.assertTrue(np.allclose(atoms[2][ATOM_COORDS], [3.115034, 6.739670, 1.820294]))
+        self.assertNotIn(0, atoms)
+        self.assertNotIn(len(atoms) + 1, atoms)
+
+    def testComAtomLabels(self):
+        atoms = process_gausscom_file(PET_MONO_CP_COM)[SEC_ATOMS]
+        self.assertEqual(atoms.atomic_nums[:3].tolist(), [8, 1, 6])
+        self.assertEqual(atoms[1][ATOM_TYPE], 'O(Fragment=2)')
+        self.assertEqual(atoms.atom_types[2], 'C(Fragment=1)')
+
+    def testComBadCoords(self):
+        with self.assertRaises(InvalidDataError) as context:
+            process_gausscom_file(PET_MONO_BAD_COM)
+        self.assertTrue("6.7396.70" in str(context.exception))
+
+    def testTemplatePlaceholder(self):
+        # templates have a placeholder rather than atoms with coordinates
+        gausscom_content = process_gausscom_file(GAU_TPL)
+        self.assertEqual(len(gausscom_content[SEC_ATOMS]), 0)
+        self.assertEqual(gausscom_content[MULT], 1)
+
+    def testLogAtoms(self):
+        atoms = scan_gausslog_file(os.path.join(SUB_DATA_DIR, 'me2propprpnt_7.log'))[SEC_ATOMS]
+        self.assertEqual(atoms.atom_types[:3], [atoms[i][ATOM_TYPE] for i in range(1, 4)])
+        self.assertTrue(np.allclose(atoms.distances_from(2)[0], np.linalg.norm(atoms[1][ATOM_COORDS] -
+                                                                               atoms[2][ATOM_COORDS])))
+
+    def testMismatchedLengths(self):
+        with self.assertRaises(InvalidDataError):
+            Geometry(np.zeros((3, 3)), [1, 1])
+
+
+class TestTrajectory(unittest.TestCase):
+    def testFromGeometries(self):
+        first = Geometry(np.zeros((2, 3)), [8, 1])
+        second = Geometry(np.ones((2, 3)), [8, 1])
+        traj = Trajectory.from_geometries([first, second])
+        self.assertEqual(traj.coords.shape, (2, 2, 3))
+        self.assertEqual(len(traj), 2)
+        self.assertEqual(traj[1], second)
+        self.assertEqual(len(traj[1:]), 1)
+        # steps are views into the trajectory array
+        traj[0].coords[0, 0] = 5.
+        self.assertEqual(traj.coords[0, 0, 0], 5.)
+
+    def testDifferentAtoms(self):
+        with self.assertRaises(InvalidDataError):
+            Trajectory.from_geometries([Geometry(np.zeros((2, 3)), [8, 1]), Geometry(np.zeros((2, 3)), [1, 8])])
+
+
+class TestIterGausslogSteps(unittest.TestCase):
+    def testSameAsStepConverg(self):
+        steps = list(iter_gausslog_steps(WATER_LOG))
+        # the frequency job that follows the optimization starts its step numbers again
+        self.assertEqual([step.step_num for step in steps], [1, 2, 1])
+        step_dict = scan_gausslog_file(WATER_LOG, find_step_converg=True)[CONVERG_STEP_DICT]
+        for step, step_content in zip(steps, step_dict.values()):
+            self.assertEqual(step.energy, step_content[ENERGY])
+            self.assertEqual(step.converg, step_content[CONVERG])
+            self.assertEqual(step.converge_error, step_content[CONVERG_ERR])
+        self.assertTrue(steps[0].scf_line.startswith("SCF Done:"))
+        self.assertEqual(len(steps[0].ind_converg), 4)
+
+    def testLastGeometry(self):
+        last_step = None
+        for last_step in iter_gausslog_steps(WATER_LOG):
+            pass
+        self.assertEqual(last_step.geometry, scan_gausslog_file(WATER_LOG)[SEC_ATOMS])
+
+    def testStopEarly(self):
+        first_step = next(iter_gausslog_steps(WATER_LOG))
+        self.assertEqual(first_step.geometry.atomic_nums.tolist(), [8, 1, 1])
+
+    def testEmptyFile(self):
+        self.assertEqual(list(iter_gausslog_steps(os.path.join(SUB_DATA_DIR, 'empty.log'))), [])
+
+
+class TestReadTailLines(unittest.TestCase):
+    def testSameAsReadlines(self):
+        for log_file in find_test_logs():
+            with open(log_file, 'rb') as f:
+                expected = [line.rstrip(b"\n").decode(errors='replace') for line in f.readlines()[-3:]]
+            # a small block size so that several blocks are read
+            self.assertEqual(read_tail_lines(log_file, num_lines=3, block_size=64), expected, msg=log_file)
+
+    def testLineEndings(self):
+        try:
+            for file_str, expected in [("", []), ("\n", [""]), ("one line", ["one line"]),
+                                       ("first\nsecond\n", ["second"]), ("first\nsecond\n\n", [""])]:
+                with open(TEMP_TAIL_FILE, 'w') as f:
+                    f.write(file_str)
+                self.assertEqual(read_tail_lines(TEMP_TAIL_FILE, block_size=4), expected)
+        finally:
+            silent_remove(TEMP_TAIL_FILE, disable=DISABLE_REMOVE)
+
+
+class TestScanDirFiles(unittest.TestCase):
+    def testSameAsCheckForFiles(self):
+        for search_sub_dir in [False, True]:
+            expected = check_for_files(None, None, search_pattern='.log', search_dir=DATA_DIR,
+                                       search_sub_dir=search_sub_dir, warn_if_no_matches=False)
+            found_files = scan_dir_files(DATA_DIR, '.log', search_sub_dir=search_sub_dir)
+            found = sorted(os.path.relpath(os.path.join(dir_name, fname))
+                           for dir_name, dir_files in found_files.items() for fname, _ in dir_files)
+            self.assertEqual(found, expected)
+            for dir_name, dir_files in found_files.items():
+                for fname, file_stat in dir_files:
+                    self.assertEqual(file_stat.st_size, os.path.getsize(os.path.join(dir_name, fname)))
+
+    def testMissingDir(self):
+        with self.assertRaises(InvalidDataError):
+            scan_dir_files(os.path.join(DATA_DIR, 'ghost'), '.log')
+
+
+class TestMapInOrder(unittest.TestCase):
+    def testSameAsMap(self):
+        items = list(range(-1000, 0))
+        self.assertEqual(list(map_in_order(abs, items, jobs=3)), list(map(abs, items)))
+
+    def testStopEarly(self):
+        results = map_in_order(abs, list(range(-1000, 0)), jobs=2)
+        self.assertEqual(next(results), 1000)
+        # the items not yet read are dropped
+        results.close()
+
+
+class TestReadJobInfo(unittest.TestCase):
+    def testTSInSolvent(self):
+        job_info = read_job_info(os.path.join(GOODVIBES_DIR, 'ts3b.log'))
+        self.assertEqual(job_info, {GAUSS_VER: ['Gaussian', '16:', 'ES64L-G16RevB.01'], CHARGE: 1, MULT: 1,
+                                    SOLV: '1,2-EthaneDiol', STOICH: 'C4H13O4(1+)', FUNCTIONAL: 'RM062X',
+                                    BASIS_SET: 'def2TZVP', FREQS: [-119.2069, 78.3112]})
+
+    def testGasOneFreq(self):
+        job_info = read_job_info(os.path.join(GOODVIBES_DIR, 'co_gas.log'))
+        self.assertIsNone(job_info[SOLV])
+        self.assertEqual(job_info[FREQS], [2279.0095])
+
+    def testNoArchive(self):
+        # the level of theory is taken from the route when the job did not finish
+        job_info = read_job_info(os.path.join(GOODVIBES_DIR, 'co_fail_gas.log'))
+        self.assertEqual((job_info[FUNCTIONAL], job_info[BASIS_SET], job_info[MULT]), ('m062x', 'Def2TZVP', 2))
+        self.assertEqual(job_info[FREQS], [])
+
+    def testEmptyFile(self):
+        with self.assertRaises(InvalidDataError) as context:
+            read_job_info(os.path.join(SUB_DATA_DIR, 'empty.log'))
+        self.assertTrue("No job information" in str(context.exception))
+
+
+class TestConvergStepArray(unittest.TestCase):
+    def testSameAsDict(self):
+        for log_file in [os.path.join(SUB_DATA_DIR, 'prop_acetate_8.log'), WATER_LOG, SCAN_LOG]:
+            step_dict = scan_gausslog_file(log_file, find_step_converg=True)[CONVERG_STEP_DICT]
+            step_array = converg_step_array(step_dict)
+            self.assertEqual(step_array[STEP_NUM].tolist(), list(step_dict.keys()))
+            for row, step in zip(step_array, step_dict.values()):
+                self.assertTrue(np.array_equal([row[ENERGY], row[CONVERG]], [step[ENERGY], step[CONVERG]],
+                                               equal_nan=True))
+                self.assertEqual(row[CONVERG_ERR], step[CONVERG_ERR] is True)
+                self.assertEqual(row[NEGLIGIBLE_FORCES], step[CONVERG_ERR] == NEGLIGIBLE_FORCES_ERR)
+        # the last step of this file was accepted because of negligible forces
+        self.assertTrue(converg_step_array(scan_gausslog_file(os.path.join(SUB_DATA_DIR, 'prop_acetate_8.log'),
+                                                              find_step_converg=True)[CONVERG_STEP_DICT])
+                        [NEGLIGIBLE_FORCES][-1])
+
+    def testNoSteps(self):
+        self.assertEqual(len(converg_step_array({})), 0)
+
+
+def write_two_param_scan():
+    # mark a second dihedral as scanned in the initial parameter table of a scan of one dihedral
+    with open(SCAN_LOG) as f:
+        log_str = f.read()
+    with open(TWO_PARAM_SCAN_LOG, 'w') as f:
+        f.write(log_str.replace(" ! D72   D(32,30,35,37)         59.024          D2E/DX2 =    0.0184             !",
+                                " ! D72   D(32,30,35,37)         59.024          Scan                            !",
+                                1))
+
+
+class TestScanParams(unittest.TestCase):
+    def testOneParam(self):
+        for parse_function in [process_gausslog_file, scan_gausslog_file]:
+            content = parse_function(SCAN_LOG, collect_scan_steps=True)
+            self.assertEqual(content[SCAN_PARAMS], ('D(41,30,35,16)',))
+            self.assertEqual(content[SCAN_DICT]['-170.0002'], -1603.87783501)
+
+    def testTwoParams(self):
+        try:
+            write_two_param_scan()
+            expected = scan_gausslog_file(SCAN_LOG, collect_scan_steps=True)[SCAN_DICT]
+            for parse_function in [process_gausslog_file, scan_gausslog_file]:
+                content = parse_function(TWO_PARAM_SCAN_LOG, collect_scan_steps=True)
+                self.assertEqual(content[SCAN_PARAMS], ('D(32,30,35,37)', 'D(41,30,35,16)'))
+                self.assertEqual(len(content[SCAN_DICT]), len(expected))
+                for (_, second_val), energy in content[SCAN_DICT].items():
+                    self.assertEqual(expected[second_val], energy)
+        finally:
+            silent_remove(TWO_PARAM_SCAN_LOG, disable=DISABLE_REMOVE)
+
+
+def write_compressed_copies(log_file):
+    """
+    Returns the names of gzip, xz, and bz2 compressed copies of log_file written to COMPRESSED_DIR
+    """
+    os.makedirs(COMPRESSED_DIR, exist_ok=True)
+    compressed_files = []
+    for ext, module in [('.gz', gzip), ('.xz', lzma), ('.bz2', bz2)]:
+        compressed_file = os.path.join(COMPRESSED_DIR, os.path.basename(log_file) + ext)
+        with open(log_file, 'rb') as f_in, module.open(compressed_file, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        compressed_files.append(compressed_file)
+    return compressed_files
+
+
+def same_steps(steps1, steps2):
+    steps1 = [step._asdict() for step in steps1]
+    steps2 = [step._asdict() for step in steps2]
+    return len(steps1) == len(steps2) and all(same_content(step1, step2) for step1, step2 in zip(steps1, steps2))
+
+
+class TestCompressedLogs(unittest.TestCase):
+    def tearDown(self):
+        silent_remove(COMPRESSED_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
+
+    def testSameAsPlainFile(self):
+        # collecting scan steps is only for scan jobs
+        for log_file, option_sets in [(WATER_LOG, PARSE_OPTION_SETS[:-1]), (SCAN_LOG, PARSE_OPTION_SETS)]:
+            for compressed_file in write_compressed_copies(log_file):
+                for options in option_sets:
+                    expected = scan_gausslog_file(log_file, **options)
+                    expected[BASE_NAME] = os.path.basename(compressed_file)
+                    self.assertTrue(same_content(expected, scan_gausslog_file(compressed_file, **options)))
+                    self.assertTrue(same_content(expected, process_gausslog_file(compressed_file, **options)))
+                self.assertTrue(same_steps(iter_gausslog_steps(log_file), iter_gausslog_steps(compressed_file)))
+                self.assertEqual(read_tail_lines(compressed_file, num_lines=3), read_tail_lines(log_file, num_lines=3))
+
+    def testPartialFileSteps(self):
+        # files that end at any point give the same steps when read line by line as when memory-mapped
+        with open(SCAN_LOG, 'rb') as f:
+            data = f.read()
+        os.makedirs(COMPRESSED_DIR, exist_ok=True)
+        partial_log = os.path.join(COMPRESSED_DIR, 'partial.log')
+        for cut in range(1000, len(data), len(data) // 11):
+            with open(partial_log, 'wb') as f:
+                f.write(data[:cut])
+            with gzip.open(partial_log + '.gz', 'wb') as f:
+                f.write(data[:cut])
+            self.assertTrue(same_steps(iter_gausslog_steps(partial_log), iter_gausslog_steps(partial_log + '.gz')),
+                            msg=f"file cut at {cut}")
+
+    def testEmptyFile(self):
+        compressed_file = write_compressed_copies(os.path.join(SUB_DATA_DIR, 'empty.log'))[0]
+        self.assertIsNone(scan_gausslog_file(compressed_file)[STOICH])
+        self.assertEqual(list(iter_gausslog_steps(compressed_file)), [])
+        self.assertEqual(read_tail_lines(compressed_file), [])
+
+    def testLogNames(self):
+        self.assertEqual(split_log_name("dir/name.log.GZ"), ("dir/name", ".log.GZ"))
+        self.assertEqual(split_log_name("dir/name.log"), ("dir/name", ".log"))
+        self.assertEqual(strip_compression_ext("name.out.zst"), "name.out")
+        self.assertEqual(strip_compression_ext("name.out"), "name.out")
+
+    def testZstandard(self):
+        try:
+            import zstandard
+        except ImportError:
+            with self.assertRaises(InvalidDataError) as context:
+                open_log(os.path.join(COMPRESSED_DIR, 'missing.log.zst'))
+            self.assertTrue("pip install zstandard" in str(context.exception))
+            return
+        os.makedirs(COMPRESSED_DIR, exist_ok=True)
+        compressed_file = os.path.join(COMPRESSED_DIR, 'water.log.zst')
+        with open(WATER_LOG, 'rb') as f, zstandard.open(compressed_file, 'wb') as f_out:
+            shutil.copyfileobj(f, f_out)
+        self.assertEqual(scan_gausslog_file(WATER_LOG)[ENERGY], scan_gausslog_file(compressed_file)[ENERGY])
+        self.assertEqual(read_tail_lines(WATER_LOG, num_lines=3), read_tail_lines(compressed_file, num_lines=3))
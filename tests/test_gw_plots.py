@@ -0,0 +1,67 @@
+import logging
+import os
+import unittest
+import numpy as np
+from common_wrangler.common import capture_stdout, silent_remove, make_dir
+from gaussian_wrangler.gw_plots import (FIT_PLOT, CONVERG_PLOT, POINTS_STYLE, CURVE_STYLE, curve_style, get_figure,
+                                        render_plot, PlotRenderer)
+
+
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+DISABLE_REMOVE = logger.isEnabledFor(logging.DEBUG)
+
+__author__ = 'hmayes'
+
+TEST_DIR = os.path.dirname(__file__)
+DATA_DIR = os.path.join(TEST_DIR, 'test_data')
+PLOT_DIR = os.path.join(DATA_DIR, 'plots_temp')
+
+X_VALS = np.linspace(0., 10., 11)
+
+
+def converg_lines(scale):
+    return [[(X_VALS, X_VALS * scale * (idx + 1), CURVE_STYLE)] for idx in range(6)]
+
+
+class TestGwPlots(unittest.TestCase):
+    def setUp(self):
+        make_dir(PLOT_DIR)
+
+    def tearDown(self):
+        silent_remove(PLOT_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
+
+    def testReuseFigure(self):
+        first_png = os.path.join(PLOT_DIR, "first.png")
+        second_png = os.path.join(PLOT_DIR, "second.png")
+        render_plot(FIT_PLOT, first_png, [[(X_VALS, X_VALS, POINTS_STYLE), (X_VALS, -X_VALS, curve_style('red')),
+                                           (X_VALS, 2 * X_VALS, curve_style('blue'))]])
+        figure = get_figure(FIT_PLOT)
+        render_plot(FIT_PLOT, second_png, [[(X_VALS, X_VALS + 100., POINTS_STYLE)]])
+        # the same figure and lines are used; lines not needed are hidden and not used to set the axis limits
+        self.assertIs(get_figure(FIT_PLOT), figure)
+        lines = figure.lines[0]
+        self.assertTrue(len(lines) >= 3)
+        self.assertEqual([line.get_visible() for line in lines], [True] + [False] * (len(lines) - 1))
+        self.assertTrue(figure.axes[0].get_ylim()[0] > 90.)
+        for png in [first_png, second_png]:
+            self.assertTrue(os.path.isfile(png))
+
+    def testBackgroundRenderer(self):
+        png_fnames = [os.path.join(PLOT_DIR, f"converg_{idx}.png") for idx in range(3)]
+        with capture_stdout(self.render_all, png_fnames, jobs=2) as output:
+            self.assertEqual(output.count("Wrote file:"), 3)
+        for png in png_fnames:
+            self.assertTrue(os.path.isfile(png))
+
+    def testSkip(self):
+        png_fnames = [os.path.join(PLOT_DIR, "converg.png")]
+        with capture_stdout(self.render_all, png_fnames, jobs=2, skip=True) as output:
+            self.assertFalse(output)
+        self.assertFalse(os.path.isfile(png_fnames[0]))
+
+    @staticmethod
+    def render_all(png_fnames, jobs=1, skip=False):
+        with PlotRenderer(jobs=jobs, skip=skip) as renderer:
+            for idx, png in enumerate(png_fnames):
+                renderer.submit(CONVERG_PLOT, png, converg_lines(idx + 1))
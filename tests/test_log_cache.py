@@ -0,0 +1,225 @@
+import collections
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import zlib
+import numpy as np
+from common_wrangler.common import capture_stderr, silent_remove, make_dir
+from common_wrangler.common import BASE_NAME
+from gaussian_wrangler.gw_common import scan_gausslog_file, Geometry, ENERGY, CONVERG_STEP_DICT, SCAN_DICT
+from gaussian_wrangler.log_cache import (get_gausslog_content, follow_gausslog_content, read_termination_states,
+                                         write_termination_states, get_cache_fname, encode_content, decode_content,
+                                         CACHE_DIR_ENV)
+from tests.test_gw_common import same_content
+
+
+# logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+DISABLE_REMOVE = logger.isEnabledFor(logging.DEBUG)
+
+__author__ = 'hmayes'
+
+TEST_DIR = os.path.dirname(__file__)
+MAIN_DIR = os.path.dirname(TEST_DIR)
+DATA_DIR = os.path.join(TEST_DIR, 'test_data')
+SUB_DATA_DIR = os.path.join(DATA_DIR, 'check_gauss')
+CACHE_TEST_DIR = os.path.join(DATA_DIR, 'log_cache_temp')
+
+SOURCE_LOG = os.path.join(SUB_DATA_DIR, 'me2propprpnt_7.log')
+OTHER_SOURCE_LOG = os.path.join(SUB_DATA_DIR, 'prop_acetate_8.log')
+TEMP_LOG = os.path.join(CACHE_TEST_DIR, 'me2propprpnt_7.log')
+OTHER_TEMP_LOG = os.path.join(CACHE_TEST_DIR, 'prop_acetate_8.log')
+NO_CONV_SOURCE_LOG = os.path.join(SUB_DATA_DIR, 'pet_mono_671_tzvp.log')
+STEPS_SOURCE_LOG = os.path.join(DATA_DIR, 'gausslog_unique', 'hexyl_acrylate_239.log')
+OTHER_STEPS_SOURCE_LOG = os.path.join(DATA_DIR, 'gausslog_unique', 'hexyl_acrylate_419.log')
+SCAN_SOURCE_LOG = os.path.join(SUB_DATA_DIR, 'pet_dimer_scan_pos_tzvp.log')
+GROWING_LOG = os.path.join(CACHE_TEST_DIR, 'growing.log')
+NO_CONV_TEMP_LOG = os.path.join(CACHE_TEST_DIR, 'pet_mono_671_tzvp.log')
+
+
+def write_in_parts(source_log, num_parts):
+    """
+    Yields after writing each of num_parts pieces of source_log to GROWING_LOG, as if written by a running job
+    """
+    with open(source_log, 'rb') as f:
+        data = f.read()
+    # make most parts end within a line
+    cuts = [len(data) * part // num_parts + 7 for part in range(1, num_parts)] + [len(data)]
+    start = 0
+    with open(GROWING_LOG, 'wb') as f:
+        for cut in cuts:
+            f.write(data[start:cut])
+            f.flush()
+            start = cut
+            yield
+
+
+def read_as_growing_log(source_log, **parse_options):
+    gausslog_content = scan_gausslog_file(source_log, **parse_options)
+    gausslog_content[BASE_NAME] = os.path.basename(GROWING_LOG)
+    return gausslog_content
+
+
+def temp_cache_fname():
+    return get_cache_fname(os.path.abspath(CACHE_TEST_DIR))
+
+
+def count_cache_entries():
+    with sqlite3.connect(temp_cache_fname()) as conn:
+        return conn.execute("SELECT COUNT(*) FROM parsed_logs").fetchone()[0]
+
+
+def setUpModule():
+    # keep the cache databases written by the tests out of the user's cache directory
+    os.environ[CACHE_DIR_ENV] = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(os.environ.pop(CACHE_DIR_ENV), ignore_errors=True)
+
+
+class TestLogCache(unittest.TestCase):
+    def setUp(self):
+        make_dir(CACHE_TEST_DIR)
+        shutil.copy2(SOURCE_LOG, TEMP_LOG)
+        shutil.copy2(OTHER_SOURCE_LOG, OTHER_TEMP_LOG)
+
+    def tearDown(self):
+        silent_remove(CACHE_TEST_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
+        silent_remove(temp_cache_fname(), disable=DISABLE_REMOVE)
+
+    def testCacheHit(self):
+        expected = scan_gausslog_file(TEMP_LOG, find_converg=True)
+        first = get_gausslog_content(TEMP_LOG, find_converg=True)
+        self.assertTrue(os.path.isfile(temp_cache_fname()))
+        # nothing is written next to the logs
+        self.assertEqual(sorted(os.listdir(CACHE_TEST_DIR)), ['me2propprpnt_7.log', 'prop_acetate_8.log'])
+        self.assertEqual(count_cache_entries(), 1)
+        # a different set of options gets its own entry
+        get_gausslog_content(TEMP_LOG, find_step_converg=True)
+        self.assertEqual(count_cache_entries(), 2)
+        # replace the log with different contents but keep the size and time stamp: the stale result is returned,
+        #     showing that the file was not parsed again
+        stat = os.stat(TEMP_LOG)
+        with open(TEMP_LOG, 'r+') as f:
+            f.write(' ' * 20)
+        os.utime(TEMP_LOG, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        second = get_gausslog_content(TEMP_LOG, find_converg=True)
+        self.assertTrue(same_content(expected, first))
+        self.assertTrue(same_content(expected, second))
+
+    def testInvalidateOnChange(self):
+        first = get_gausslog_content(TEMP_LOG, find_converg=True)
+        get_gausslog_content(TEMP_LOG, find_step_converg=True)
+        shutil.copy(OTHER_SOURCE_LOG, TEMP_LOG)
+        second = get_gausslog_content(TEMP_LOG, find_converg=True)
+        self.assertAlmostEqual(second[ENERGY], scan_gausslog_file(OTHER_SOURCE_LOG)[ENERGY])
+        self.assertNotAlmostEqual(first[ENERGY], second[ENERGY])
+        # the entry for the other options was dropped, too
+        self.assertEqual(count_cache_entries(), 1)
+
+    def testWarningReplayed(self):
+        shutil.copy2(NO_CONV_SOURCE_LOG, NO_CONV_TEMP_LOG)
+        with capture_stderr(get_gausslog_content, NO_CONV_TEMP_LOG, find_converg=True) as output:
+            first_warnings = output
+        with capture_stderr(get_gausslog_content, NO_CONV_TEMP_LOG, find_converg=True) as output:
+            self.assertTrue("Did not find final convergence report" in first_warnings)
+            self.assertEqual(first_warnings, output)
+
+    def testEviction(self):
+        get_gausslog_content(TEMP_LOG, find_converg=True)
+        get_gausslog_content(OTHER_TEMP_LOG, find_converg=True)
+        self.assertEqual(count_cache_entries(), 2)
+        # a limit smaller than one entry empties the cache; the parsed content is still returned
+        content = get_gausslog_content(TEMP_LOG, max_mb=0.000001, find_step_converg=True)
+        self.assertEqual(count_cache_entries(), 0)
+        self.assertTrue(ENERGY in content)
+
+    def testNoCache(self):
+        expected = scan_gausslog_file(TEMP_LOG, find_converg=True)
+        found = get_gausslog_content(TEMP_LOG, use_cache=False, find_converg=True)
+        self.assertTrue(same_content(expected, found))
+        self.assertFalse(os.path.isfile(temp_cache_fname()))
+
+    def testUnreadableEntryIgnored(self):
+        # content not written by this module (here, a pickle, which would run code when loaded) is never loaded;
+        #     the file is parsed again instead
+        expected = scan_gausslog_file(TEMP_LOG, find_converg=True)
+        get_gausslog_content(TEMP_LOG, find_converg=True)
+        with sqlite3.connect(temp_cache_fname()) as conn:
+            conn.execute("UPDATE parsed_logs SET content = ?", (b'\x80\x04\x95cos\nsystem\n.',))
+        found = get_gausslog_content(TEMP_LOG, find_converg=True)
+        self.assertTrue(same_content(expected, found))
+
+    def testEncodeContent(self):
+        content = {'a': (1, 2.5, None), 3: collections.OrderedDict([((120.0, -60.5), float('nan')), (2, [True])]),
+                   'b': np.arange(6, dtype=np.int8).reshape(2, 3), 'c': b'\x00\xff', 'd': 1.25,
+                   'e': Geometry(np.ones((2, 3)), [6, 8], atom_labels=['C(Fragment=1)', 'O'])}
+        found = decode_content(encode_content(content))
+        self.assertTrue(same_content(content, found))
+        self.assertIsInstance(found[3], collections.OrderedDict)
+        self.assertEqual(found['b'].dtype, np.int8)
+        self.assertEqual(found['e'], content['e'])
+        self.assertEqual(decode_content(encode_content([np.int64(7), np.bool_(True)])), [7, True])
+        with self.assertRaises(TypeError):
+            encode_content({'a': object()})
+        with self.assertRaises(TypeError):
+            encode_content(np.array([None, 1]))
+        with self.assertRaises(ValueError):
+            decode_content(zlib.compress(b'{"array": ["|O", [1], "AAAAAAAAAAA="]}'))
+
+    def testTerminationStates(self):
+        cache_dir = os.path.abspath(CACHE_TEST_DIR)
+        self.assertEqual(read_termination_states(cache_dir), {})
+        termination = {'Status': 'likely_failed', 'Link': 'l9999', 'Error': None}
+        write_termination_states(cache_dir, {'a.log': (10, 123, termination), 'b.log': (20, 456, {})})
+        self.assertEqual(read_termination_states(cache_dir), {'a.log': (10, 123, termination), 'b.log': (20, 456, {})})
+        # the saved states are replaced, not added to
+        write_termination_states(cache_dir, {'b.log': (30, 789, termination)})
+        self.assertEqual(read_termination_states(cache_dir), {'b.log': (30, 789, termination)})
+
+
+class TestFollowLog(unittest.TestCase):
+    def setUp(self):
+        make_dir(CACHE_TEST_DIR)
+
+    def tearDown(self):
+        silent_remove(CACHE_TEST_DIR, dir_with_files=True, disable=DISABLE_REMOVE)
+        silent_remove(temp_cache_fname(), disable=DISABLE_REMOVE)
+
+    def testFollowSteps(self):
+        num_steps_found = []
+        for _ in write_in_parts(STEPS_SOURCE_LOG, 6):
+            found = follow_gausslog_content(GROWING_LOG, find_step_converg=True)
+            num_steps_found.append(len(found[CONVERG_STEP_DICT]))
+        expected = read_as_growing_log(STEPS_SOURCE_LOG, find_step_converg=True)
+        self.assertTrue(same_content(expected, found))
+        self.assertEqual(sorted(num_steps_found), num_steps_found)
+        self.assertTrue(0 < num_steps_found[2] < num_steps_found[-1])
+
+    def testFollowScan(self):
+        for _ in write_in_parts(SCAN_SOURCE_LOG, 5):
+            found = follow_gausslog_content(GROWING_LOG, collect_scan_steps=True)
+        expected = read_as_growing_log(SCAN_SOURCE_LOG, collect_scan_steps=True)
+        self.assertTrue(len(found[SCAN_DICT]) > 5)
+        self.assertTrue(same_content(expected, found))
+
+    def testRestartedLog(self):
+        # a job that is restarted writes a new log over the old; it must be read from the beginning
+        shutil.copy(STEPS_SOURCE_LOG, GROWING_LOG)
+        follow_gausslog_content(GROWING_LOG, find_step_converg=True)
+        shutil.copy(OTHER_STEPS_SOURCE_LOG, GROWING_LOG)
+        found = follow_gausslog_content(GROWING_LOG, find_step_converg=True)
+        expected = read_as_growing_log(OTHER_STEPS_SOURCE_LOG, find_step_converg=True)
+        self.assertTrue(same_content(expected, found))
+
+    def testFollowWarningsReplayed(self):
+        with capture_stderr(scan_gausslog_file, NO_CONV_SOURCE_LOG, find_converg=True) as output:
+            expected_warnings = output
+        shutil.copy(NO_CONV_SOURCE_LOG, NO_CONV_TEMP_LOG)
+        for _ in range(2):
+            with capture_stderr(follow_gausslog_content, NO_CONV_TEMP_LOG, find_converg=True) as output:
+                self.assertEqual(expected_warnings, output)